@@ -0,0 +1,174 @@
+"""
+Общий каталог продуктов процесса с горячей перезагрузкой.
+
+CatalogService загружает base_products.csv и aliases.csv один раз,
+отслеживает изменения файлов по mtime/размеру и атомарно подменяет
+снимок каталога при изменении. Номер версии снимка позволяет зависимым
+кешам (например, индексу ProductIndex) понимать, что каталог обновился.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.data_loader import load_products
+from app.models import Product
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS_PATH = "data/base_products.csv"
+ALIASES_PATH = "data/aliases.csv"
+
+# Как часто (в секундах) проверять mtime файлов каталога
+CHECK_INTERVAL: float = 1.0
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога"""
+
+    version: int
+    products: List[Product]
+    fingerprint: Tuple[Tuple[int, int], ...]
+    loaded_at: float
+
+
+def _file_fingerprint(path: str) -> Tuple[int, int]:
+    """Возвращает (mtime_ns, size) файла или (0, 0), если файла нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class CatalogService:
+    """
+    Каталог продуктов, общий для всех обработчиков.
+
+    Снимок загружается лениво при первом обращении и перезагружается, когда
+    меняется mtime или размер одного из файлов. Читатели всегда получают
+    целый снимок: новый строится полностью и только затем подменяет старый.
+    Возвращаемый список продуктов общий — изменять его нельзя.
+    """
+
+    def __init__(
+        self,
+        products_path: str = PRODUCTS_PATH,
+        aliases_path: str = ALIASES_PATH,
+        check_interval: float = CHECK_INTERVAL,
+    ):
+        self.products_path = products_path
+        self.aliases_path = aliases_path
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _fingerprint(self) -> Tuple[Tuple[int, int], ...]:
+        return (_file_fingerprint(self.products_path), _file_fingerprint(self.aliases_path))
+
+    def snapshot(self) -> CatalogSnapshot:
+        """
+        Возвращает актуальный снимок каталога, при необходимости перезагружая его.
+
+        Returns:
+            CatalogSnapshot с продуктами и номером версии
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        self._last_check = now
+        if snapshot is not None and snapshot.fingerprint == self._fingerprint():
+            return snapshot
+        return self.reload()
+
+    def reload(self, force: bool = False) -> CatalogSnapshot:
+        """
+        Перечитывает файлы каталога, если они изменились (или всегда при force).
+
+        При ошибке загрузки сохраняется предыдущий снимок.
+
+        Args:
+            force: Перезагрузить даже при неизменных файлах
+
+        Returns:
+            Актуальный CatalogSnapshot
+        """
+        with self._lock:
+            current = self._snapshot
+            fingerprint = self._fingerprint()
+            if not force and current is not None and current.fingerprint == fingerprint:
+                return current
+
+            start_time = time.time()
+            try:
+                products = load_products(self.products_path, self.aliases_path)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке каталога продуктов: {e}")
+                if current is not None:
+                    logger.warning("Используем предыдущую версию каталога")
+                    return current
+                raise
+
+            version = current.version + 1 if current is not None else 1
+            snapshot = CatalogSnapshot(
+                version=version,
+                products=products,
+                fingerprint=fingerprint,
+                loaded_at=time.time(),
+            )
+            self._snapshot = snapshot
+            self._last_check = time.monotonic()
+            logger.info(
+                f"Каталог продуктов v{version}: {len(products)} записей "
+                f"загружено за {time.time() - start_time:.2f}с"
+            )
+            return snapshot
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """Возвращает текущий снимок без проверки файлов (None, если не загружен)"""
+        return self._snapshot
+
+    def get_products(self) -> List[Product]:
+        """Возвращает продукты актуального снимка"""
+        return self.snapshot().products
+
+    @property
+    def version(self) -> int:
+        """Номер версии актуального снимка"""
+        return self.snapshot().version
+
+
+_catalog: Optional[CatalogService] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CatalogService:
+    """Возвращает общий экземпляр CatalogService процесса"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CatalogService()
+    return _catalog
+
+
+def get_products() -> List[Product]:
+    """Возвращает продукты общего каталога (вместо load_products() на каждый вызов)"""
+    return get_catalog().get_products()
+
+
+def catalog_version() -> int:
+    """Возвращает номер версии общего каталога"""
+    return get_catalog().version
+
+
+def reload_catalog() -> CatalogSnapshot:
+    """Принудительно перечитывает общий каталог"""
+    return get_catalog().reload(force=True)
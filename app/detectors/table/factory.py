@@ -2,11 +2,16 @@
 Factory for creating table detectors.
 """
 
+from app.utils.engine_registry import get_engine
+
 
 def get_detector(method="paddle"):
     """
     Factory method to get table detector by method name.
 
+    Detectors are created and warmed up once per process (see
+    app.utils.engine_registry); later calls return the same instance.
+
     Args:
         method: The detector method to use
 
@@ -16,6 +21,10 @@ def get_detector(method="paddle"):
     if method == "paddle":
         from . import paddle_detector
 
-        return paddle_detector.PaddleTableDetector()
+        return get_engine(
+            "table_detector_paddle",
+            paddle_detector.PaddleTableDetector,
+            warm=paddle_detector.PaddleTableDetector.warm_up,
+        )
     else:
         raise ValueError(f"Unknown table detector method: {method}")
@@ -4,9 +4,8 @@
 
 import logging
 import re
-from copy import deepcopy
 from datetime import datetime
-from typing import Any, Dict, Union
+from typing import Any, Dict, Optional, Union
 
 from app.converters import parsed_to_dict
 from app.models import ParsedData
@@ -14,6 +13,33 @@ from app.models import ParsedData
 logger = logging.getLogger(__name__)
 
 
+def new_version(invoice: Dict[str, Any], line_index: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Создает новую версию инвойса со структурным разделением (copy-on-write).
+
+    Копируется только словарь инвойса, а при правке строки — еще список позиций
+    и сама изменяемая позиция; остальные позиции остаются общими объектами с
+    предыдущей версией. Поэтому версии нельзя менять на месте: любая правка
+    должна идти через new_version.
+
+    Args:
+        invoice: Словарь с данными инвойса
+        line_index: Индекс изменяемой позиции (None — правка шапки инвойса)
+
+    Returns:
+        Dict: Новая версия инвойса
+    """
+    result = dict(invoice)
+    positions = invoice.get("positions")
+    if line_index is not None and isinstance(positions, list):
+        result["positions"] = list(positions)
+        if isinstance(line_index, int) and 0 <= line_index < len(positions):
+            position = positions[line_index]
+            if isinstance(position, dict):
+                result["positions"][line_index] = dict(position)
+    return result
+
+
 def set_date(invoice: Dict[str, Any], value: str) -> Dict[str, Any]:
     """
     Устанавливает дату инвойса.
@@ -25,7 +51,7 @@ def set_date(invoice: Dict[str, Any], value: str) -> Dict[str, Any]:
     Returns:
         Dict: Обновленный инвойс
     """
-    result = deepcopy(invoice)
+    result = new_version(invoice)
     result["date"] = value
     return result
 
@@ -42,7 +68,7 @@ def set_price(invoice: Dict[str, Any], line_index: int, value: str) -> Dict[str,
     Returns:
         Dict: Обновленный инвойс
     """
-    result = deepcopy(invoice)
+    result = new_version(invoice, line_index)
 
     if 0 <= line_index < len(result.get("positions", [])):
         result["positions"][line_index]["price"] = value
@@ -69,10 +95,10 @@ def set_name(
     Returns:
         Dict: Обновленный инвойс
     """
-    from app.data_loader import load_products
+    from app.catalog import get_products
     from app.matcher import match_positions
 
-    result = deepcopy(invoice)
+    result = new_version(invoice, line_index)
 
     if 0 <= line_index < len(result.get("positions", [])):
         result["positions"][line_index]["name"] = value
@@ -84,7 +110,7 @@ def set_name(
             logger.info(f"Line {line_index+1} manually edited by user: name = '{value}'")
         else:
             # Пытаемся найти соответствие в базе продуктов
-            products = load_products()
+            products = get_products()
             match_results = match_positions([result["positions"][line_index]], products)
             if match_results and match_results[0].get("matched_name"):
                 result["positions"][line_index]["matched_name"] = match_results[0]["matched_name"]
@@ -110,7 +136,7 @@ def set_quantity(invoice: Dict[str, Any], line_index: int, value: str) -> Dict[s
     Returns:
         Dict: Обновленный инвойс
     """
-    result = deepcopy(invoice)
+    result = new_version(invoice, line_index)
 
     if 0 <= line_index < len(result.get("positions", [])):
         result["positions"][line_index]["qty"] = value
@@ -133,7 +159,7 @@ def set_unit(invoice: Dict[str, Any], line_index: int, value: str) -> Dict[str,
     Returns:
         Dict: Обновленный инвойс
     """
-    result = deepcopy(invoice)
+    result = new_version(invoice, line_index)
 
     if 0 <= line_index < len(result.get("positions", [])):
         result["positions"][line_index]["unit"] = value
@@ -195,6 +221,7 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
                 return set_name(invoice, line, value, manual_edit=True)
             # For other fields, just update the value. Do not touch 'status'.
             if field in invoice["positions"][line]:
+                invoice = new_version(invoice, line)
                 invoice["positions"][line][field] = value
                 # Only set status to 'manual' for name edits
                 if field == "name":
@@ -208,7 +235,7 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
     elif action == "edit_date":
         try:
             # Изменение даты
-            result = deepcopy(invoice)  # Создаем копию чтобы не изменять исходный объект
+            result = new_version(invoice)  # Новая версия, исходный объект не меняется
             value = intent.get("value", "")
             logger.info(f"Изменяем дату инвойса на: {value}")
 
@@ -245,7 +272,7 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
     elif action == "edit_supplier":
         try:
             # Изменение поставщика
-            result = deepcopy(invoice)  # Создаем копию чтобы не изменять исходный объект
+            result = new_version(invoice)  # Новая версия, исходный объект не меняется
             value = intent.get("value", "").strip()
             logger.info(f"Изменяем поставщика инвойса на: {value}")
 
@@ -263,8 +290,9 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
     elif action == "edit_quantity":
         try:
             # Изменение количества
-            result = deepcopy(invoice)  # Создаем копию чтобы не изменять исходный объект
             position_idx = intent.get("line", 0)
+            # Новая версия: копируется только изменяемая позиция
+            result = new_version(invoice, position_idx)
             value = intent.get("value", "0")
 
             # Проверяем, что в позициях есть элемент с таким индексом
@@ -288,8 +316,9 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
     elif action == "edit_unit":
         try:
             # Изменение единицы измерения
-            result = deepcopy(invoice)  # Создаем копию чтобы не изменять исходный объект
             position_idx = intent.get("line", 0)
+            # Новая версия: копируется только изменяемая позиция
+            result = new_version(invoice, position_idx)
             value = intent.get("value", "").strip().lower()
 
             # Проверяем, что в позициях есть элемент с таким индексом
@@ -319,8 +348,9 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
     elif action == "edit_price":
         try:
             # Изменение цены
-            result = deepcopy(invoice)  # Создаем копию чтобы не изменять исходный объект
             position_idx = intent.get("line", 0)
+            # Новая версия: копируется только изменяемая позиция
+            result = new_version(invoice, position_idx)
             value = intent.get("value", "0")
 
             # Проверяем, что в позициях есть элемент с таким индексом
@@ -349,11 +379,11 @@ def apply_intent(invoice: Union[dict, ParsedData], intent: dict) -> dict:
             qty = parts[1]
             unit = parts[2]
             price = parts[3]
-            invoice.setdefault("positions", []).append(
-                {"name": name, "qty": qty, "unit": unit, "price": price}
-            )
+            position = {"name": name, "qty": qty, "unit": unit, "price": price}
+            # Новая версия со старыми объектами позиций и добавленной строкой
+            invoice = dict(invoice, positions=list(invoice.get("positions") or []) + [position])
         return invoice
 
     else:
         logger.warning(f"Неизвестное действие в интенте: {action}")
-        return deepcopy(invoice)  # Возвращаем копию без изменений
+        return invoice  # Без изменений: edit_core не добавляет версию
@@ -0,0 +1,258 @@
+"""
+Инкрементальный пересчёт накладной после правки.
+
+Изменённые («грязные») строки определяются по применённому интенту, а не
+сравнением всех позиций: заново сопоставляются только строки с новым
+названием, остальные изменённые строки получают обновлённые числовые поля,
+а кэшированные итоги отчета сдвигаются на разницу вкладов этих строк.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+from app.formatters.report import calculate_total_amount, is_problem_line
+
+logger = logging.getLogger(__name__)
+
+# Действия над одной строкой и ключ индекса строки в интенте
+LINE_INDEX_KEYS = {
+    "set_price": "line_index",
+    "set_name": "line_index",
+    "set_quantity": "line_index",
+    "set_unit": "line_index",
+    "set_qty": "line",
+    "edit_name": "line",
+    "edit_line_field": "line",
+    "edit_quantity": "line",
+    "edit_unit": "line",
+    "edit_price": "line",
+}
+
+# Действия, меняющие название строки (нужно новое сопоставление)
+RENAME_ACTIONS = {"set_name", "edit_name"}
+
+# Действия над шапкой накладной: строки не меняются
+INVOICE_ACTIONS = {"set_date", "edit_date", "edit_supplier"}
+
+# Поля позиции, изменение которых влияет на результат сопоставления
+KEY_FIELDS = ("name", "qty", "price", "unit")
+NUMBER_FIELDS = ("qty", "price", "unit")
+
+# Кэшируемые итоги, которые обновляются на разницу
+TOTAL_KEYS = ("total_amount", "unknown_count", "partial_count", "issues_count")
+
+
+@dataclass
+class DirtyLines:
+    """Строки, затронутые правкой"""
+
+    lines: List[int] = field(default_factory=list)  # все изменённые строки по возрастанию
+    renamed: Set[int] = field(default_factory=set)  # строки для нового сопоставления
+
+
+@dataclass
+class EditRefresh:
+    """Результат пересчёта после правки"""
+
+    match_results: List[Dict[str, Any]]
+    totals: Dict[str, Any]
+    dirty: DirtyLines
+    incremental: bool = True
+
+
+def dirty_lines(intent: Dict[str, Any], old_count: int, new_count: int) -> Optional[DirtyLines]:
+    """
+    Определяет изменённые строки по интенту.
+
+    Args:
+        intent: Применённый интент
+        old_count: Количество позиций до правки
+        new_count: Количество позиций после правки
+
+    Returns:
+        DirtyLines или None, если по интенту изменения определить нельзя
+    """
+    action = intent.get("action")
+
+    if action == "add_line":
+        added = list(range(old_count, new_count))
+        return DirtyLines(added, set(added))
+
+    if new_count != old_count:
+        return None
+
+    if action in INVOICE_ACTIONS:
+        return DirtyLines()
+
+    key = LINE_INDEX_KEYS.get(action) if isinstance(action, str) else None
+    if key is None:
+        return None
+
+    line = intent.get(key, 0)
+    if not isinstance(line, int) or not 0 <= line < new_count:
+        # apply_intent не меняет несуществующие строки
+        return DirtyLines()
+
+    renamed = action in RENAME_ACTIONS or (
+        action == "edit_line_field" and intent.get("field") == "name"
+    )
+    return DirtyLines([line], {line} if renamed else set())
+
+
+def diff_dirty_lines(
+    old_positions: Sequence[Dict[str, Any]], new_positions: Sequence[Dict[str, Any]]
+) -> DirtyLines:
+    """
+    Изменённые строки по сравнению версий (для неизвестных действий, отмены и повтора).
+
+    Версии разделяют неизменённые позиции (см. apply_intent.new_version),
+    поэтому совпадающие объекты пропускаются без сравнения полей.
+    """
+    dirty = DirtyLines()
+    for i, (old_pos, new_pos) in enumerate(zip(old_positions, new_positions)):
+        if old_pos is new_pos:
+            continue
+        if any(old_pos.get(key) != new_pos.get(key) for key in KEY_FIELDS):
+            dirty.lines.append(i)
+            if old_pos.get("name") != new_pos.get("name"):
+                dirty.renamed.add(i)
+
+    added = range(len(old_positions), len(new_positions))
+    dirty.lines.extend(added)
+    dirty.renamed.update(added)
+    return dirty
+
+
+def refresh_numbers(result: Dict[str, Any], position: Dict[str, Any]) -> Dict[str, Any]:
+    """Копия результата сопоставления с числовыми полями из позиции и новым line_total"""
+    result = result.copy()
+    for key in NUMBER_FIELDS:
+        if key in position:
+            result[key] = position[key]
+
+    if "qty" in result and "price" in result:
+        try:
+            qty = float(result["qty"]) if result["qty"] is not None else 0
+            price = float(result["price"]) if result["price"] is not None else 0
+            result["line_total"] = qty * price
+        except (ValueError, TypeError):
+            pass
+    return result
+
+
+def summarize(match_results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Полный расчет итогов по результатам сопоставления.
+
+    Returns:
+        Словарь: lines, total_amount, unknown_count, partial_count, issues_count
+    """
+    statuses = [r.get("status") for r in match_results]
+    return {
+        "lines": len(match_results),
+        "total_amount": calculate_total_amount(match_results),
+        "unknown_count": statuses.count("unknown"),
+        "partial_count": statuses.count("partial"),
+        "issues_count": sum(1 for r in match_results if is_problem_line(r)),
+    }
+
+
+def update_totals(
+    totals: Dict[str, Any],
+    before: Sequence[Dict[str, Any]],
+    after: Sequence[Dict[str, Any]],
+    count: int,
+) -> Dict[str, Any]:
+    """
+    Сдвигает кэшированные итоги на разницу вкладов изменённых строк.
+
+    Args:
+        totals: Итоги до правки
+        before: Результаты изменённых строк до правки
+        after: Результаты изменённых строк после правки
+        count: Количество строк после правки
+
+    Returns:
+        Новые итоги
+    """
+    old, new = summarize(before), summarize(after)
+    updated = {key: totals[key] - old[key] + new[key] for key in TOTAL_KEYS}
+    updated["lines"] = count
+    return updated
+
+
+def _totals_valid(totals: Optional[Dict[str, Any]], count: int) -> bool:
+    """Проверяет, что кэш итогов есть и посчитан для текущего числа строк"""
+    return (
+        isinstance(totals, dict)
+        and totals.get("lines") == count
+        and all(key in totals for key in TOTAL_KEYS)
+    )
+
+
+def refresh_after_edit(
+    intent: Dict[str, Any],
+    old_positions: Sequence[Dict[str, Any]],
+    new_positions: Sequence[Dict[str, Any]],
+    old_match_results: Sequence[Dict[str, Any]],
+    rematch: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+    totals: Optional[Dict[str, Any]] = None,
+) -> EditRefresh:
+    """
+    Пересчитывает результаты сопоставления и итоги только для изменённых строк.
+
+    Если результаты сопоставления не соответствуют позициям до правки,
+    все позиции сопоставляются заново и итоги считаются полностью.
+
+    Args:
+        intent: Применённый интент
+        old_positions: Позиции версии инвойса до правки
+        new_positions: Позиции после правки
+        old_match_results: Результаты сопоставления до правки
+        rematch: Функция сопоставления списка позиций с каталогом
+        totals: Кэшированные итоги до правки (результат summarize/update_totals)
+
+    Returns:
+        EditRefresh с новыми результатами сопоставления и итогами
+    """
+    old_count, new_count = len(old_positions), len(new_positions)
+
+    if not old_match_results or len(old_match_results) != old_count:
+        match_results = rematch(list(new_positions))
+        dirty = DirtyLines(list(range(new_count)), set(range(new_count)))
+        return EditRefresh(match_results, summarize(match_results), dirty, incremental=False)
+
+    from_intent = dirty_lines(intent, old_count, new_count)
+    if from_intent is not None:
+        dirty = from_intent
+    else:
+        dirty = diff_dirty_lines(old_positions, new_positions)
+
+    match_results = list(old_match_results[:new_count])
+    match_results.extend({} for _ in range(new_count - len(match_results)))
+
+    renamed = sorted(dirty.renamed)
+    if renamed:
+        found = rematch([new_positions[i] for i in renamed])
+        for i, result in zip(renamed, found):
+            match_results[i] = result
+
+    for i in dirty.lines:
+        if i not in dirty.renamed:
+            match_results[i] = refresh_numbers(match_results[i], new_positions[i])
+
+    if totals is not None and _totals_valid(totals, old_count) and new_count >= old_count:
+        before = [old_match_results[i] for i in dirty.lines if i < old_count]
+        after = [match_results[i] for i in dirty.lines]
+        new_totals = update_totals(totals, before, after, new_count)
+    else:
+        new_totals = summarize(match_results)
+
+    logger.debug(
+        "Правка %s: изменено строк %d, сопоставлено заново %d",
+        intent.get("action"),
+        len(dirty.lines),
+        len(renamed),
+    )
+    return EditRefresh(match_results, new_totals, dirty)
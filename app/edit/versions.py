@@ -0,0 +1,149 @@
+"""
+Цепочка версий инвойса для отмены и повтора правок.
+
+Версии создает apply_intent через new_version: неизмененные позиции остаются
+общими объектами у соседних версий, поэтому хранение цепочки стоит одну копию
+инвойса и правленых строк на версию, а не полную копию. Отмена и повтор —
+сдвиг указателя по цепочке.
+
+Правка на месте испортила бы и соседние версии, поэтому обработчики вне
+edit_core делают копию через new_version и добавляют ее в историю
+(record_edit). Текущая версия узнается по идентичности объекта. Отпечаток
+содержимого, который ловит пропущенную правку на месте, стоит O(размер
+инвойса) на каждую правку, отмену и повтор, поэтому считается только при
+INVOICE_VERIFY_VERSIONS (отладка): тогда после такой правки история
+начинается заново.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько версий хранится на сессию и сколько сессий держится в памяти процесса
+MAX_VERSIONS = 50
+MAX_SESSIONS = 256
+
+# Проверять версии на правку на месте (только для отладки)
+VERIFY_VERSIONS = os.getenv("INVOICE_VERIFY_VERSIONS", "0").lower() in ("1", "true", "yes")
+
+
+def _signature(invoice: Dict[str, Any]) -> Optional[int]:
+    """Отпечаток содержимого версии (None без VERIFY_VERSIONS)"""
+    if not VERIFY_VERSIONS:
+        return None
+    return hash(repr(invoice))
+
+
+class InvoiceVersions:
+    """Линейная история версий инвойса с указателем на текущую"""
+
+    def __init__(self, invoice: Dict[str, Any], limit: int = MAX_VERSIONS):
+        self.limit = limit
+        self._versions: List[Dict[str, Any]] = [invoice]
+        self._signatures: List[Optional[int]] = [_signature(invoice)]
+        self._cursor = 0
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    @property
+    def current(self) -> Dict[str, Any]:
+        """Текущая версия инвойса"""
+        return self._versions[self._cursor]
+
+    def is_current(self, invoice: Dict[str, Any]) -> bool:
+        """invoice — текущая версия (и при VERIFY_VERSIONS ее не меняли на месте)"""
+        if invoice is not self.current:
+            return False
+        if _signature(invoice) != self._signatures[self._cursor]:
+            logger.warning("Текущая версия инвойса изменена на месте, история начата заново")
+            return False
+        return True
+
+    @property
+    def can_undo(self) -> bool:
+        return self._cursor > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._cursor < len(self._versions) - 1
+
+    def commit(self, invoice: Dict[str, Any]) -> None:
+        """Добавляет новую версию после текущей; отмененные версии отбрасываются"""
+        del self._versions[self._cursor + 1 :]
+        del self._signatures[self._cursor + 1 :]
+        self._versions.append(invoice)
+        self._signatures.append(_signature(invoice))
+        if len(self._versions) > self.limit:
+            del self._versions[0]
+            del self._signatures[0]
+        self._cursor = len(self._versions) - 1
+
+    def undo(self) -> Optional[Dict[str, Any]]:
+        """Возвращает предыдущую версию (None, если отменять нечего)"""
+        if not self.can_undo:
+            return None
+        self._cursor -= 1
+        return self.current
+
+    def redo(self) -> Optional[Dict[str, Any]]:
+        """Возвращает следующую отмененную версию (None, если повторять нечего)"""
+        if not self.can_redo:
+            return None
+        self._cursor += 1
+        return self.current
+
+
+_histories: "OrderedDict[Any, InvoiceVersions]" = OrderedDict()
+
+
+def get_history(user_id: Any, invoice: Dict[str, Any]) -> InvoiceVersions:
+    """
+    Возвращает историю правок пользователя для инвойса из состояния.
+
+    Если текущая версия истории — не этот же объект (новое фото) или ее
+    изменили на месте в обход new_version, история начинается заново с
+    переданного инвойса.
+
+    Args:
+        user_id: Идентификатор пользователя
+        invoice: Текущий инвойс из состояния
+
+    Returns:
+        InvoiceVersions
+    """
+    history = _histories.get(user_id)
+    if history is None or not history.is_current(invoice):
+        history = InvoiceVersions(invoice)
+        _histories[user_id] = history
+    _histories.move_to_end(user_id)
+
+    while len(_histories) > MAX_SESSIONS:
+        _histories.popitem(last=False)
+    return history
+
+
+def record_edit(user_id: Any, invoice: Dict[str, Any], new_invoice: Dict[str, Any]) -> None:
+    """
+    Добавляет в историю правку, сделанную вне edit_core (кнопки, подсказки).
+
+    Сбой истории только логируется: правка уже применена и не должна теряться
+    из-за того, что ее нельзя будет отменить.
+
+    Args:
+        user_id: Идентификатор пользователя
+        invoice: Инвойс из состояния до правки
+        new_invoice: Новая версия (из new_version или apply_intent)
+    """
+    try:
+        get_history(user_id, invoice).commit(new_invoice)
+    except Exception:
+        logger.exception("Failed to record edit in invoice history")
+
+
+def drop_history(user_id: Any) -> None:
+    """Удаляет историю правок пользователя"""
+    _histories.pop(user_id, None)
@@ -3,6 +3,7 @@ import re
 from html import escape  # For escaping data only, not HTML tags
 
 from app.utils.formatters import format_price, format_quantity, format_idr
+from app.validators.invoice_frame import InvoiceFrame
 
 logger = logging.getLogger("nota.report")
 logger.debug("escape func = %s", escape)
@@ -284,51 +285,49 @@ def count_issues(match_results):
     return sum(1 for item in match_results if item.get("status", "") != "ok")
 
 
-def calculate_total_amount(match_results):
+def is_problem_line(item):
     """
-    Вычисляет итоговую сумму накладной на основе результатов сопоставления.
+    Проверяет, считается ли позиция проблемной в отчете: статус не ok/manual
+    (ручное редактирование не ошибка) или не заполнены количество либо цена.
 
     Args:
-        match_results: Список результатов сопоставления позиций
+        item: Результат сопоставления позиции
 
     Returns:
-        float: Итоговая сумма накладной
+        bool: True, если позиция проблемная
     """
-    total = 0.0
+    if item.get("status", "") not in ("ok", "manual"):
+        return True
 
-    for item in match_results:
-        # Пытаемся получить line_total, если его нет - вычисляем из qty * price
-        line_total = item.get("line_total")
+    qty = item.get("qty", None)
+    price = item.get("price", None)
+    if price in (None, "", "—"):
+        price = item.get("unit_price", None)
+    return qty in (None, "", "—") or price in (None, "", "—")
 
-        if line_total is not None:
-            try:
-                total += float(line_total)
-                continue
-            except (ValueError, TypeError):
-                pass
 
-        # Если line_total отсутствует, вычисляем из qty * price
-        qty = item.get("qty")
-        price = item.get("price")
+def calculate_total_amount(match_results):
+    """
+    Вычисляет итоговую сумму накладной на основе результатов сопоставления.
 
-        if qty is not None and price is not None:
-            try:
-                qty_val = float(qty)
-                price_val = float(price)
-                total += qty_val * price_val
-            except (ValueError, TypeError):
-                # Пропускаем позиции с некорректными данными
-                continue
+    Args:
+        match_results: Список результатов сопоставления позиций
 
-    return total
+    Returns:
+        float: Итоговая сумма накладной
+    """
+    # Сумма строки: line_total, а если его нет или он не число — qty × price;
+    # строки без чисел пропускаются
+    return InvoiceFrame.from_match_results(match_results).reconcile_total()
 
 
-def format_total_summary(match_results):
+def format_total_summary(match_results, total_amount=None):
     """
     Форматирует итоговую информацию накладной с итоговой суммой.
 
     Args:
         match_results: Список результатов сопоставления позиций
+        total_amount: Уже посчитанная итоговая сумма (иначе считается по match_results)
 
     Returns:
         str: Отформатированная строка с итоговой информацией
@@ -348,13 +347,16 @@ def format_total_summary(match_results):
             return " ".join(groups)
         return price_str
 
-    total_amount = calculate_total_amount(match_results)
+    if total_amount is None:
+        total_amount = calculate_total_amount(match_results)
     formatted_total = format_price_with_spaces(total_amount)
 
     return f"\n<b>Total Amount: IDR {formatted_total}</b>"
 
 
-def build_report(parsed_data, match_results, escape_html=True, page=1, page_size=40):
+def build_report(
+    parsed_data, match_results, escape_html=True, page=1, page_size=40, totals=None
+):
     r"""
     Формирует HTML-отчет по инвойсу с пагинацией.
 
@@ -364,6 +366,8 @@ def build_report(parsed_data, match_results, escape_html=True, page=1, page_size
         escape_html: Флаг экранирования HTML (True по умолчанию)
         page: Номер страницы для отображения
         page_size: Размер страницы (количество позиций)
+        totals: Кэшированные итоги (total_amount, issues_count) — если заданы,
+            сумма и флаг ошибок не пересчитываются по всем позициям
 
     Returns:
         tuple: (HTML-отчет, флаг наличия ошибок)
@@ -417,39 +421,18 @@ def build_report(parsed_data, match_results, escape_html=True, page=1, page_size
     )
     logger.critical(f"BUILD_REPORT: rows_to_show={rows_to_show}")
 
-    # Подсчитываем количество ошибок и проблем перед формированием отчёта
-    ok_count = 0
-    issues_count = 0
-    has_errors = False
-
-    for item in match_results:
-        status = item.get("status", "")
-
-        # Позиции с ручным редактированием (manual) не считаются проблемными
-        if status == "ok" or status == "manual":
-            ok_count += 1
-        else:
-            issues_count += 1
-            has_errors = True
-
-        # Проверяем наличие незаполненных данных (qty, price)
-        qty = item.get("qty", None)
-        price = item.get("price", None)
-        if price in (None, "", "—"):
-            price = item.get("unit_price", None)
-
-        # Если хотя бы одно из критически важных полей не заполнено, считаем позицию проблемной
-        if qty in (None, "", "—") or price in (None, "", "—"):
-            has_errors = True
-            # Если позиция ещё не была подсчитана как проблемная, учитываем её
-            if status == "ok" or status == "manual":
-                issues_count += 1
-                ok_count -= 1  # корректируем счётчик OK позиций
+    # Проверяем наличие ошибок: статус позиции или незаполненные qty/price
+    if totals is not None:
+        has_errors = totals["issues_count"] > 0
+        total_amount = totals["total_amount"]
+    else:
+        has_errors = any(is_problem_line(item) for item in match_results)
+        total_amount = None
 
     header_html = build_header(supplier_str, date_str)
     table = build_table(rows_to_show)
     summary_html = build_summary(match_results)
-    total_summary = format_total_summary(match_results)
+    total_summary = format_total_summary(match_results, total_amount)
     # Используем <pre> вместо <code> для Telegram и тестов
     html_report = f"{header_html}" f"<pre>{table}</pre>\n" f"{summary_html}" f"{total_summary}"
     return html_report.strip(), has_errors
@@ -6,8 +6,10 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
+from app.catalog import get_products
 from app.converters import parsed_to_dict
-from app.data_loader import load_products
+from app.edit.apply_intent import new_version
+from app.edit.versions import record_edit
 from app.formatters import report
 from app.fsm.states import EditFree, NotaStates
 from app.i18n import t
@@ -210,18 +212,26 @@ async def confirm_fuzzy_name(call: CallbackQuery, state: FSMContext):
         # Update position name
         invoice = parsed_to_dict(invoice)
         if 0 <= line_idx < len(invoice.get("positions", [])):
-            # Change name to suggested one
+            # Change name to suggested one in a new version, kept for undo
+            previous = invoice
+            invoice = new_version(invoice, line_idx)
             invoice["positions"][line_idx]["name"] = fuzzy_match
+            record_edit(call.from_user.id, previous, invoice)
 
             # Recalculate errors and update report
-            match_results = match_positions(invoice["positions"], load_products())
+            match_results = match_positions(invoice["positions"], get_products())
             text, has_errors = report.build_report(invoice, match_results)
 
             # Count remaining issues
             issues_count = sum(1 for item in match_results if item.get("status", "") != "ok")
 
-            # Update data in state
-            await state.update_data(invoice=invoice, issues_count=issues_count)
+            # Update data in state; cached totals of the edit flow no longer apply
+            await state.update_data(
+                invoice=invoice,
+                issues_count=issues_count,
+                match_results=match_results,
+                edit_totals=None,
+            )
 
             # Delete processing indicator
             try:
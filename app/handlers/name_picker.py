@@ -9,9 +9,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from app.alias import add_alias
+from app.catalog import get_products
 from app.converters import parsed_to_dict
-from app.data_loader import load_products
 from app.edit.apply_intent import set_name
+from app.edit.versions import record_edit
 from app.formatters import report
 from app.i18n import t
 from app.keyboards import build_main_kb
@@ -60,7 +61,7 @@ async def handle_pick_name(call: CallbackQuery, state: FSMContext):
 
     try:
         # Find the product by ID
-        products = load_products()
+        products = get_products()
         selected_product = next(
             (
                 p
@@ -86,9 +87,11 @@ async def handle_pick_name(call: CallbackQuery, state: FSMContext):
             original_name = invoice["positions"][row_idx].get("name", "")
 
             # Update with the selected product name from database
+            previous = invoice
             invoice = set_name(invoice, row_idx, product_name)
 
-            # Set matched_name to ensure it's displayed correctly
+            # Set matched_name to ensure it's displayed correctly (set_name
+            # returned a new version, the edited position is its own copy)
             invoice["positions"][row_idx]["matched_name"] = product_name
 
             # Recalculate errors and update report
@@ -101,6 +104,7 @@ async def handle_pick_name(call: CallbackQuery, state: FSMContext):
 
             # Update state data
             await state.update_data(invoice=invoice, issues_count=issues_count)
+            record_edit(call.from_user.id, previous, invoice)
 
             # Remove inline keyboard from the suggestion message
             await call.message.edit_reply_markup(reply_markup=None)
@@ -177,7 +181,7 @@ async def show_fuzzy_suggestions(
     # For short inputs (length < 4), apply higher similarity threshold
     thresh = 0.85 if len(name) < 4 else 0.75
 
-    products = load_products()
+    products = get_products()
 
     # Try to find fuzzy matches
     matches = fuzzy_find(name, products, threshold=thresh)
@@ -251,15 +255,17 @@ async def handle_pick_name_reject(call: CallbackQuery, state: FSMContext):
     # Keep original text as manual edit
     if original_text and 0 <= row_idx < len(invoice.get("positions", [])):
         # Apply manual edit flag to accept user's original input
+        previous = invoice
         invoice = set_name(invoice, row_idx, original_text, manual_edit=True)
 
         # Load products and recalculate errors
-        products = load_products()
+        products = get_products()
         match_results = match_positions(invoice["positions"], products)
         text, has_errors = report.build_report(invoice, match_results)
 
         # Update state
         await state.update_data(invoice=invoice)
+        record_edit(call.from_user.id, previous, invoice)
 
         # Generate keyboard based on errors presence
         keyboard = build_main_kb(has_errors, lang=lang)
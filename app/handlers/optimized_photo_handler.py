@@ -9,21 +9,22 @@ and detailed execution time logging.
 import asyncio
 import logging
 import uuid
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Tuple
 
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
+from app.catalog import get_products
 from app.formatters.report import build_report
 from app.fsm.states import NotaStates
 from app.i18n import t
 from app.keyboards import build_main_kb
 from app.matcher import async_match_positions  # Updated import
 from app.utils.async_ocr import async_ocr
-from app.utils.cached_loader import cached_load_products
 from app.utils.incremental_ui import IncrementalUI
 from app.utils.md import clean_html
+from app.utils.media_group import MediaGroupCollector, merge_album_pages
 from app.utils.processing_guard import is_processing_photo, require_user_free, set_processing_photo
 from app.utils.timing_logger import async_timed
 from bot import user_matches
@@ -38,6 +39,142 @@ if not isinstance(user_matches, dict):
     user_matches: Dict[Tuple[int, int], Dict[str, Any]] = {}
 
 
+# Collects photos of one Telegram album (media group) before processing
+_album_collector = MediaGroupCollector()
+
+
+@router.message(F.photo, F.media_group_id)
+async def album_photo_handler(message: Message, state: FSMContext):
+    """
+    Multi-page invoice sent as an album: processed once, when all photos arrived.
+
+    Registered before optimized_photo_handler so album photos never reach it.
+    """
+    if not message.from_user:
+        return
+
+    messages = await _album_collector.collect(message)
+    if messages is None:
+        # The album is processed by the handler of its first photo
+        return
+
+    await process_album(message, state, messages)
+
+
+async def _download_photo(message: Message) -> bytes:
+    """Downloads the largest size of the message photo"""
+    file = await message.bot.get_file(message.photo[-1].file_id)
+    img_bytes_io = await message.bot.download_file(file.file_path)
+    return img_bytes_io.getvalue()
+
+
+@async_timed(operation_name="album_processing")
+async def process_album(message: Message, state: FSMContext, messages: List[Message]):
+    """
+    Recognizes all album pages concurrently and builds a single invoice.
+
+    Pages go through async_ocr in parallel (bounded by the global OCR
+    scheduler), so a 3-page invoice takes about as long as its slowest page.
+    Positions are merged in page order and matched once.
+    """
+    req_id = f"album_{uuid.uuid4().hex[:8]}"
+    user_id = message.from_user.id
+    pages_count = len(messages)
+
+    if await is_processing_photo(user_id):
+        await message.answer("Processing previous photo")
+        return
+
+    await set_processing_photo(user_id, True)
+    await state.update_data(processing_photo=True)
+
+    try:
+        data = await state.get_data()
+        lang = data.get("lang", "en")
+
+        ui = IncrementalUI(message.bot, message.chat.id)
+        await ui.start(
+            t("status.album_received", {"count": pages_count}, lang=lang)
+            or f"Received invoice with {pages_count} pages"
+        )
+        await ui.start_spinner(theme="loading")
+
+        try:
+            images = await asyncio.gather(*(_download_photo(m) for m in messages))
+        except Exception as e:
+            logger.error(f"Error downloading album: {e}")
+            await ui.error("Error downloading photo")
+            return
+
+        done = 0
+
+        async def recognize_page(number: int, img_bytes: bytes):
+            nonlocal done
+            page = await async_ocr(
+                img_bytes,
+                req_id=f"{req_id}_p{number}",
+                use_cache=True,
+                timeout=60,
+                user_id=user_id,
+            )
+            done += 1
+            await ui.update_progress(
+                t("status.album_progress", {"done": done, "count": pages_count}, lang=lang)
+                or f"Recognized {done} of {pages_count} pages..."
+            )
+            return page
+
+        try:
+            pages = await asyncio.gather(
+                *(recognize_page(number, img) for number, img in enumerate(images, 1))
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"OCR timeout for album {req_id}")
+            await ui.error("Try another photo")
+            return
+        except Exception as e:
+            logger.error(f"Album OCR error: {e}")
+            await ui.error("Error recognizing text")
+            return
+
+        ocr_result = merge_album_pages(pages)
+        positions = ocr_result.positions
+        ui.stop_spinner()
+        await ui.update(
+            t("status.text_recognized", {"count": len(positions)}, lang=lang)
+            or f"Found {len(positions)} items"
+        )
+
+        await ui.update(t("status.matching_items", lang=lang) or "Matching items...")
+        try:
+            match_results = (
+                await async_match_positions(positions, get_products()) if positions else []
+            )
+        except Exception as e:
+            logger.error(f"Matching error: {e}")
+            await ui.error("Error matching items")
+            return
+
+        await _finish_invoice(
+            message,
+            state,
+            ui,
+            ocr_result,
+            positions,
+            match_results,
+            messages[0].photo[-1].file_id,
+            req_id,
+            lang,
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error in album handler: {e}")
+        await message.answer("Error processing photo")
+    finally:
+        await set_processing_photo(user_id, False)
+        await state.update_data(processing_photo=False)
+
+
 @router.message(
     F.photo,
     require_user_free(
@@ -118,12 +255,47 @@ async def optimized_photo_handler(message: Message, state: FSMContext):
             return
         ui.stop_spinner()
 
-        # 2. Image OCR
+        # 2. Image OCR (streaming: positions are counted and matched as they arrive)
         await ui.update(t("status.recognizing_text", lang=lang) or "Recognizing text...")
         await ui.start_spinner(theme="dots")
 
+        streamed_positions = []
+        streamed_matches = []
+        streaming_match_ok = True
+
+        async def on_position(position):
+            nonlocal streaming_match_ok
+            streamed_positions.append(position)
+            count = len(streamed_positions)
+            await ui.update_progress(
+                t("status.recognizing_progress", {"count": count}, lang=lang)
+                or f"Recognizing text... {count} items found"
+            )
+            if not streaming_match_ok:
+                return
+            try:
+                streamed_matches.extend(await async_match_positions([position], get_products()))
+            except Exception as e:
+                # Matching is retried for the whole invoice after OCR
+                logger.warning(f"Streaming matching error: {e}")
+                streaming_match_ok = False
+
+        async def on_queue(position):
+            await ui.update_progress(
+                t("status.queued", {"position": position}, lang=lang)
+                or f"Waiting in queue: position {position}..."
+            )
+
         try:
-            ocr_result = await async_ocr(img_bytes, req_id=req_id, use_cache=True, timeout=60)
+            ocr_result = await async_ocr(
+                img_bytes,
+                req_id=req_id,
+                use_cache=True,
+                timeout=60,
+                on_position=on_position,
+                user_id=user_id,
+                on_queue=on_queue,
+            )
             positions_count = (
                 len(ocr_result["positions"])
                 if isinstance(ocr_result, dict)
@@ -148,11 +320,9 @@ async def optimized_photo_handler(message: Message, state: FSMContext):
         await ui.update(t("status.matching_items", lang=lang) or "Matching items...")
         await ui.start_spinner(theme="boxes")
 
-        # Load product database with caching
+        # Shared product catalog (reloaded only when the CSV files change)
         try:
-            from app import data_loader
-
-            products = cached_load_products("data/base_products.csv", data_loader.load_products)
+            products = get_products()
         except Exception as e:
             logger.error(f"Error loading products: {e}")
             await ui.error("Error loading database")
@@ -167,6 +337,13 @@ async def optimized_photo_handler(message: Message, state: FSMContext):
 
             if not positions or len(positions) == 0:
                 match_results = []
+            elif (
+                streaming_match_ok
+                and len(streamed_matches) == len(positions)
+                and list(positions) == streamed_positions
+            ):
+                # Every position was already matched while OCR was streaming
+                match_results = streamed_matches
             else:
                 match_results = await async_match_positions(positions, products)
 
@@ -175,108 +352,131 @@ async def optimized_photo_handler(message: Message, state: FSMContext):
             await ui.error("Error matching items")
             return
 
-        # Matching statistics
-        ok_count = sum(1 for item in match_results if item.get("status") == "ok")
-        unknown_count = sum(1 for item in match_results if item.get("status") == "unknown")
-        positions_count = len(positions) if isinstance(positions, list) else len(positions)
-        partial_count = positions_count - ok_count - unknown_count
-
-        ui.stop_spinner()
-        await ui.update(
-            t(
-                "status.matching_completed",
-                {"ok": ok_count, "unknown": unknown_count, "partial": partial_count},
-                lang=lang,
-            )
-            or f"Found: {ok_count} ✓, {unknown_count} ❌, {partial_count} ⚠️"
+        await _finish_invoice(
+            message, state, ui, ocr_result, positions, match_results, photo_id, req_id, lang
         )
 
-        # 4. Saving results and generating report
-        user_matches[(user_id, 0)] = {
-            "parsed_data": ocr_result,
-            "match_results": match_results,
-            "photo_id": photo_id,
-            "req_id": req_id,
-        }
+    except Exception as e:
+        logger.error(f"Unexpected error in photo handler: {e}")
+        await message.answer("Error processing photo")
+    finally:
+        # Remove photo processing flag
+        await set_processing_photo(user_id, False)
+        await state.update_data(processing_photo=False)
 
-        await state.update_data(invoice=ocr_result, lang=lang)
 
-        # ИСПРАВЛЕНО: Сохраняем match_results в state для корректной работы редактирования
-        await state.update_data(match_results=match_results)
+async def _finish_invoice(
+    message: Message,
+    state: FSMContext,
+    ui: IncrementalUI,
+    ocr_result: Any,
+    positions: list,
+    match_results: list,
+    photo_id: str,
+    req_id: str,
+    lang: str,
+) -> None:
+    """
+    Shows matching statistics, stores the invoice for editing and sends the report.
 
-        try:
-            # Generate report with HTML formatting
-            report_text, has_errors = build_report(ocr_result, match_results, escape_html=True)
-        except Exception as e:
-            logger.error(f"Error building report: {e}")
-            await ui.error("Error generating report")
-            return
+    Shared by the single photo and album handlers.
+    """
+    user_id = message.from_user.id
 
-        # Generate keyboard
-        inline_kb = build_main_kb(
-            has_errors=True if unknown_count + partial_count > 0 else False, lang=lang
+    # Matching statistics
+    ok_count = sum(1 for item in match_results if item.get("status") == "ok")
+    unknown_count = sum(1 for item in match_results if item.get("status") == "unknown")
+    positions_count = len(positions) if isinstance(positions, list) else len(positions)
+    partial_count = positions_count - ok_count - unknown_count
+
+    ui.stop_spinner()
+    await ui.update(
+        t(
+            "status.matching_completed",
+            {"ok": ok_count, "unknown": unknown_count, "partial": partial_count},
+            lang=lang,
         )
+        or f"Found: {ok_count} ✓, {unknown_count} ❌, {partial_count} ⚠️"
+    )
 
-        ui.stop_spinner()
-        await ui.complete(t("status.processing_completed", lang=lang) or "✅ Done!")
+    # 4. Saving results and generating report
+    user_matches[(user_id, 0)] = {
+        "parsed_data": ocr_result,
+        "match_results": match_results,
+        "photo_id": photo_id,
+        "req_id": req_id,
+    }
 
-        # 5. Sending full report
-        try:
-            telegram_html_tags = [
-                "<b>",
-                "<i>",
-                "<u>",
-                "<s>",
-                "<strike>",
-                "<del>",
-                "<code>",
-                "<pre>",
-                "<a",
-            ]
-            has_valid_html = any(tag in report_text for tag in telegram_html_tags)
-
-            if has_valid_html:
-                result = await message.answer(
-                    report_text, reply_markup=inline_kb, parse_mode="HTML"
-                )
-            else:
-                result = await message.answer(report_text, reply_markup=inline_kb)
+    # ocr_req_id lets the confirm handler teach the supplier layout template
+    await state.update_data(invoice=ocr_result, lang=lang, ocr_req_id=req_id)
 
-            new_key = (user_id, result.message_id)
-            user_matches[new_key] = user_matches.pop((user_id, 0))
-            await state.update_data(invoice_msg_id=result.message_id)
+    # ИСПРАВЛЕНО: Сохраняем match_results в state для корректной работы редактирования
+    # (кэш итогов правок сбрасывается — его пересчитает первая правка)
+    await state.update_data(match_results=match_results, edit_totals=None)
 
-        except Exception as msg_err:
-            logger.error(f"Error sending HTML report: {msg_err}")
-            try:
-                clean_report = clean_html(report_text)
+    try:
+        # Generate report with HTML formatting
+        report_text, has_errors = build_report(ocr_result, match_results, escape_html=True)
+    except Exception as e:
+        logger.error(f"Error building report: {e}")
+        await ui.error("Error generating report")
+        return
 
-                if len(clean_report) > 4000:
-                    part1 = clean_report[:4000]
-                    part2 = clean_report[4000:]
+    # Generate keyboard
+    inline_kb = build_main_kb(
+        has_errors=True if unknown_count + partial_count > 0 else False, lang=lang
+    )
 
-                    await message.answer(part1)
-                    result = await message.answer(part2, reply_markup=inline_kb)
-                else:
-                    result = await message.answer(clean_report, reply_markup=inline_kb)
+    ui.stop_spinner()
+    await ui.complete(t("status.processing_completed", lang=lang) or "✅ Done!")
 
-                new_key = (user_id, result.message_id)
-                if (user_id, 0) in user_matches:
-                    user_matches[new_key] = user_matches.pop((user_id, 0))
-                await state.update_data(invoice_msg_id=result.message_id)
-            except Exception as e:
-                logger.error(f"Error sending plain report: {e}")
-                await message.answer("Error sending report")
+    # 5. Sending full report
+    try:
+        telegram_html_tags = [
+            "<b>",
+            "<i>",
+            "<u>",
+            "<s>",
+            "<strike>",
+            "<del>",
+            "<code>",
+            "<pre>",
+            "<a",
+        ]
+        has_valid_html = any(tag in report_text for tag in telegram_html_tags)
+
+        if has_valid_html:
+            result = await message.answer(report_text, reply_markup=inline_kb, parse_mode="HTML")
+        else:
+            result = await message.answer(report_text, reply_markup=inline_kb)
+
+        new_key = (user_id, result.message_id)
+        user_matches[new_key] = user_matches.pop((user_id, 0))
+        await state.update_data(invoice_msg_id=result.message_id)
+
+    except Exception as msg_err:
+        logger.error(f"Error sending HTML report: {msg_err}")
+        try:
+            clean_report = clean_html(report_text)
 
-        # Set editing state
-        current_state = await state.get_state()
-        if current_state != "EditFree:awaiting_input":
-            await state.set_state(NotaStates.editing)
+            if len(clean_report) > 4000:
+                part1 = clean_report[:4000]
+                part2 = clean_report[4000:]
 
-    except Exception as e:
-        logger.error(f"Unexpected error in photo handler: {e}")
-        await message.answer("Error processing photo")
-    finally:
-        # Remove photo processing flag
-        await set_processing_photo(user_id, False)
-        await state.update_data(processing_photo=False)
+                await message.answer(part1)
+                result = await message.answer(part2, reply_markup=inline_kb)
+            else:
+                result = await message.answer(clean_report, reply_markup=inline_kb)
+
+            new_key = (user_id, result.message_id)
+            if (user_id, 0) in user_matches:
+                user_matches[new_key] = user_matches.pop((user_id, 0))
+            await state.update_data(invoice_msg_id=result.message_id)
+        except Exception as e:
+            logger.error(f"Error sending plain report: {e}")
+            await message.answer("Error sending report")
+
+    # Set editing state
+    current_state = await state.get_state()
+    if current_state != "EditFree:awaiting_input":
+        await state.set_state(NotaStates.editing)
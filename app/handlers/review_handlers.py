@@ -5,8 +5,10 @@ from aiogram import CallbackQuery, F, Message, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ForceReply
 
-from app import matcher
+from app import catalog, matcher
 from app.bot_utils import edit_message_text_safe
+from app.edit.apply_intent import new_version
+from app.edit.versions import record_edit
 from app.formatters import alias, data_loader, keyboards
 from app.formatters import report as invoice_report
 
@@ -136,7 +138,7 @@ async def handle_page_prev(call: CallbackQuery, state: FSMContext):
 
     page = max(1, page - 1)
     await state.update_data(invoice_page=page)
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
     table_rows = [r for r in match_results]
     total_rows = len(table_rows)
@@ -164,7 +166,7 @@ async def handle_page_next(call: CallbackQuery, state: FSMContext):
         return
 
     # Получаем результаты сопоставления
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     table_rows = [r for r in match_results]
     total_rows = len(table_rows)
     page_size = 15
@@ -195,7 +197,7 @@ async def handle_cancel_edit(call: CallbackQuery, state: FSMContext):
         await call.answer("Session expired. Please resend the invoice.", show_alert=True)
 
     page = data.get("invoice_page", 1)
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
     table_rows = [r for r in match_results]
     total_rows = len(table_rows)
@@ -220,7 +222,7 @@ async def handle_submit(call: CallbackQuery, state: FSMContext):
     if not invoice:
         await call.answer("Session expired. Please resend the invoice.", show_alert=True)
         return
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     text, has_errors = invoice_report.build_report(invoice, match_results)
     if has_errors:
         await call.answer("⚠️ Please fix errors before sending.", show_alert=True)
@@ -263,7 +265,7 @@ async def handle_submit_cancel(call: CallbackQuery, state: FSMContext):
     if not invoice:
         await call.answer("Session expired. Please resend the invoice.", show_alert=True)
         return
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
     table_rows = [r for r in match_results]
     total_rows = len(table_rows)
@@ -289,7 +291,7 @@ async def handle_page_n(call: CallbackQuery, state: FSMContext):
     if not invoice:
         await call.answer("Session expired. Please resend the invoice.", show_alert=True)
         return
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
     text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
     page_size = 15
     total_rows = len(match_results)
@@ -321,9 +323,7 @@ async def handle_submit_anyway(call: CallbackQuery, state: FSMContext):
         data = await state.get_data()
         invoice = data.get("invoice")
         if invoice:
-            match_results = matcher.match_positions(
-                invoice["positions"], data_loader.load_products()
-            )
+            match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
             page = 1
             table_rows = [r for r in match_results]
             total_rows = len(table_rows)
@@ -345,9 +345,7 @@ async def handle_submit_anyway(call: CallbackQuery, state: FSMContext):
         data = await state.get_data()
         invoice = data.get("invoice")
         if invoice:
-            match_results = matcher.match_positions(
-                invoice["positions"], data_loader.load_products()
-            )
+            match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
             page = 1
             table_rows = [r for r in match_results]
             total_rows = len(table_rows)
@@ -430,20 +428,24 @@ async def process_field_reply(message: Message, state: FSMContext, field: str):
         except Exception:
             await message.answer("⚠️ Enter a valid number for price.", reply_markup=ForceReply())
             return
-    # Обновляем значение в позиции
+    # Обновляем значение в новой версии инвойса: прежние версии нужны для отмены
+    previous = invoice
+    invoice = new_version(invoice, idx)
     invoice["positions"][idx][field] = value
-    products = data_loader.load_products()
+    products = catalog.get_products()
     match = matcher.match_positions([invoice["positions"][idx]], products, return_suggestions=True)[
         0
     ]
     invoice["positions"][idx]["status"] = "ok"
+    record_edit(message.from_user.id, previous, invoice)
     # Для совместимости: всегда показываем первую страницу, если не передан page
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
+    await state.update_data(invoice=invoice, match_results=match_results, edit_totals=None)
     page = 1
     if match["status"] == "ok":
         # После успешного редактирования сбрасываем страницу на 1
         await state.update_data(invoice_page=1)
-        match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+        match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
         page = 1
         text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
         reply_markup = keyboards.build_main_kb(has_errors)
@@ -489,7 +491,7 @@ async def process_field_reply(message: Message, state: FSMContext, field: str):
     else:
         # Если не ok, оставляем на той же странице (или сбрасываем на 1)
         await state.update_data(invoice_page=1)
-        match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+        match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
         page = 1
         text, has_errors = invoice_report.build_report(invoice, match_results, page=page)
         reply_markup = keyboards.build_main_kb(has_errors)
@@ -555,19 +557,23 @@ async def handle_suggestion(call: CallbackQuery, state: FSMContext):
     if not invoice or pos_idx is None:
         await call.answer("Session expired. Please resend the invoice.", show_alert=True)
         return
-    products = data_loader.load_products()
+    products = catalog.get_products()
     prod = next((p for p in products if getattr(p, "id", None) == product_id), None)
     if not prod:
         await call.answer("Product not found.", show_alert=True)
     # Use product alias or name as the suggested name
     suggested_name = getattr(prod, "alias", None) or getattr(prod, "name", "")
+    previous = invoice
+    invoice = new_version(invoice, pos_idx)
     invoice["positions"][pos_idx]["name"] = suggested_name
     invoice["positions"][pos_idx]["status"] = "ok"
+    record_edit(call.from_user.id, previous, invoice)
     alias.add_alias(suggested_name, product_id)
     prod_name = suggested_name
     await call.message.answer(f"Alias '{suggested_name}' saved for product {prod_name}.")
     # Показываем первую страницу отчёта с учётом пагинации
-    match_results = matcher.match_positions(invoice["positions"], data_loader.load_products())
+    match_results = matcher.match_positions(invoice["positions"], catalog.get_products())
+    await state.update_data(invoice=invoice, match_results=match_results, edit_totals=None)
     page = 1
     table_rows = [r for r in match_results]
     total_rows = len(table_rows)
@@ -2,6 +2,7 @@
 Handler for processing invoice confirmation and Syrve integration.
 """
 
+import asyncio
 import json
 import logging
 import os
@@ -20,6 +21,7 @@ from app.keyboards import kb_main
 from app.services.unified_syrve_client import UnifiedSyrveClient, Invoice, InvoiceItem
 from app.utils.monitor import increment_counter
 from app.utils.redis_cache import cache_set
+from app.utils.supplier_templates import learn_supplier_template
 
 # Load environment variables
 load_dotenv()
@@ -172,7 +174,7 @@ async def handle_invoice_confirm_final(callback: CallbackQuery, state: FSMContex
         if needs_regeneration:
             logger.warning("match_results missing id field, regenerating...")
             from app.matcher import match_positions
-            from app.data_loader import load_products
+            from app.catalog import get_products
             
             # Получаем позиции из накладной
             positions = getattr(invoice, "positions", [])
@@ -180,11 +182,11 @@ async def handle_invoice_confirm_final(callback: CallbackQuery, state: FSMContex
                 positions = invoice.__dict__.get("positions", [])
             
             # Регенерируем match_results с правильными id
-            products = load_products()
+            products = get_products()
             match_results = match_positions(positions, products)
             
             # Сохраняем обновленные результаты в состояние
-            await state.update_data(match_results=match_results)
+            await state.update_data(match_results=match_results, edit_totals=None)
             logger.info(f"Regenerated {len(match_results)} match_results with id fields")
 
         # Подготовка данных для автоматического обучения алиасов
@@ -216,6 +218,14 @@ async def handle_invoice_confirm_final(callback: CallbackQuery, state: FSMContex
             except Exception as e:
                 logger.error(f"Error learning aliases from invoice: {str(e)}", exc_info=True)
 
+        # Обучение шаблона разметки поставщика по подтвержденной накладной
+        # (разбор страницы и запись файла шаблонов — в пуле потоков)
+        try:
+            if await asyncio.to_thread(learn_supplier_template, data.get("ocr_req_id"), invoice):
+                logger.info("Supplier layout template updated from confirmed invoice")
+        except Exception as e:
+            logger.error(f"Error learning supplier template: {str(e)}", exc_info=True)
+
         # Extract manual supplier if set by user  
         manual_supplier = None
         if hasattr(invoice, 'supplier'):
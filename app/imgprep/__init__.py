@@ -2,6 +2,29 @@
 Модуль для оптимизации и подготовки изображений к OCR.
 """
 
-from .prepare import prepare_for_ocr, resize_image
+from .collage import build_collage
+from .prepare import (
+    prepare_for_ocr,
+    prepare_for_ocr_async,
+    prepare_for_vision_async,
+    resize_image,
+    shutdown_prep_executor,
+    split_into_strips_async,
+)
+from .strips import split_into_strips
+from .tiling import VisionSizing, expected_tiles, expected_tokens, prepare_for_vision
 
-__all__ = ["prepare_for_ocr", "resize_image"]
+__all__ = [
+    "build_collage",
+    "prepare_for_ocr",
+    "prepare_for_ocr_async",
+    "prepare_for_vision",
+    "prepare_for_vision_async",
+    "resize_image",
+    "shutdown_prep_executor",
+    "split_into_strips",
+    "split_into_strips_async",
+    "VisionSizing",
+    "expected_tiles",
+    "expected_tokens",
+]
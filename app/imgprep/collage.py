@@ -0,0 +1,109 @@
+"""
+Коллаж из ячеек таблицы для одного запроса к GPT-4o.
+
+Ячейки с низкой уверенностью PaddleOCR раньше отправлялись в GPT-4o по
+одной. Коллаж собирает их в столбец с крупными номерами слева, и модель
+отвечает на все ячейки сразу ({"1": "...", "2": "..."}).
+"""
+
+import io
+import logging
+import os
+from typing import Any, List, Sequence, Tuple, Union
+
+from PIL import Image, ImageDraw, ImageFont
+from PIL.Image import Resampling
+
+from app.imgprep.tiling import JPEG_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# Высота строки ячейки в коллаже и максимальная ширина ячейки
+COLLAGE_CELL_HEIGHT = int(os.getenv("OCR_COLLAGE_CELL_HEIGHT", "48"))
+COLLAGE_CELL_MAX_WIDTH = 640
+
+# Поле с номером ячейки слева и отступы
+LABEL_WIDTH = 72
+PADDING = 8
+LABEL_FONT_SIZE = 28
+
+
+def _load_cell(image: Any) -> Image.Image:
+    """Ячейка из байтов изображения или массива NumPy"""
+    if isinstance(image, (bytes, bytearray)):
+        with Image.open(io.BytesIO(image)) as img:
+            return img.convert("RGB")
+    if hasattr(image, "__array_interface__"):
+        return Image.fromarray(image).convert("RGB")
+    raise ValueError(f"Неподдерживаемый тип изображения ячейки: {type(image).__name__}")
+
+
+def _label_font() -> Union[ImageFont.ImageFont, ImageFont.FreeTypeFont]:
+    try:
+        return ImageFont.load_default(size=LABEL_FONT_SIZE)
+    except TypeError:
+        # Pillow < 10.1 без масштабируемого шрифта по умолчанию
+        return ImageFont.load_default()
+
+
+def _fit_cell(cell: Image.Image) -> Image.Image:
+    """
+    Масштабирует ячейку с сохранением пропорций.
+
+    Ячейка приводится к высоте строки коллажа; слишком широкая ячейка
+    уменьшается до COLLAGE_CELL_MAX_WIDTH и становится ниже строки.
+    """
+    scale = min(COLLAGE_CELL_HEIGHT / cell.height, COLLAGE_CELL_MAX_WIDTH / cell.width)
+    size = (max(1, round(cell.width * scale)), max(1, round(cell.height * scale)))
+    return cell.resize(size, Resampling.LANCZOS)
+
+
+def build_collage(images: Sequence[Any]) -> Tuple[bytes, List[int]]:
+    """
+    Собирает ячейки в пронумерованный столбец.
+
+    Ячейка номер N в коллаже — images[included[N - 1]]; ячейки, которые
+    не удалось открыть, пропускаются (их распознают по одной).
+
+    Args:
+        images: Изображения ячеек (байты или массивы NumPy)
+
+    Returns:
+        (JPEG-байты коллажа, индексы вошедших ячеек); пустые байты, если
+        не вошла ни одна ячейка
+    """
+    cells: List[Image.Image] = []
+    included: List[int] = []
+    for index, image in enumerate(images):
+        try:
+            cell = _load_cell(image)
+        except Exception as e:
+            logger.debug(f"Ячейка {index} не вошла в коллаж: {e}")
+            continue
+        if cell.width < 1 or cell.height < 1:
+            continue
+        cells.append(_fit_cell(cell))
+        included.append(index)
+
+    if not cells:
+        return b"", []
+
+    row_height = COLLAGE_CELL_HEIGHT + 2 * PADDING
+    width = LABEL_WIDTH + max(cell.width for cell in cells) + 2 * PADDING
+    collage = Image.new("RGB", (width, row_height * len(cells)), (255, 255, 255))
+    draw = ImageDraw.Draw(collage)
+    font = _label_font()
+
+    for number, cell in enumerate(cells, 1):
+        top = (number - 1) * row_height
+        draw.text((PADDING, top + PADDING), f"#{number}", fill=(200, 0, 0), font=font)
+        # Ячейка ниже строки (широкая) выравнивается по центру строки
+        offset = (COLLAGE_CELL_HEIGHT - cell.height) // 2
+        collage.paste(cell, (LABEL_WIDTH + PADDING, top + PADDING + offset))
+        # Разделитель между ячейками, чтобы модель не склеивала соседние строки
+        if number > 1:
+            draw.line([(0, top), (width, top)], fill=(120, 120, 120), width=2)
+
+    output = io.BytesIO()
+    collage.save(output, format="JPEG", quality=JPEG_QUALITY)
+    return output.getvalue(), included
@@ -1,18 +1,58 @@
 """
 Image preprocessing utilities for OCR.
+
+Большие фотографии JPEG декодируются сразу в уменьшенном масштабе
+(Image.draft: DCT-масштабирование 1/2, 1/4, 1/8), ориентация по EXIF
+применяется один раз, а подготовка выполняется в отдельном пуле процессов,
+чтобы не держать GIL event loop'а бота.
 """
 
+import asyncio
 import io
-from typing import Union
-
-from PIL import Image
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Union
+
+from PIL import Image, ImageOps
 from PIL.Image import Resampling
 
+from app.imgprep.strips import split_into_strips
+from app.imgprep.tiling import prepare_for_vision
+
+logger = logging.getLogger(__name__)
+
+# Размер пула процессов подготовки изображений (0 — выполнять в потоке)
+PREP_WORKERS = int(os.getenv("IMAGE_PREP_WORKERS", str(os.cpu_count() or 1)))
+
+# Готовить снимок для GPT-4o по политике тайлов (app.imgprep.tiling). Выключено
+# по умолчанию, пока качество распознавания на уменьшенных снимках не сверено
+# с ответами API; без флага снимок уменьшается как раньше (prepare_for_ocr)
+TILE_SIZING = os.getenv("OCR_TILE_SIZING", "0").lower() in ("1", "true", "yes")
+
+# EXIF-тег ориентации
+_ORIENTATION_TAG = 0x0112
+
+
+def _needs_transpose(img: Image.Image) -> bool:
+    """Проверяет, требует ли EXIF-ориентация поворота изображения"""
+    try:
+        return img.getexif().get(_ORIENTATION_TAG, 1) not in (0, 1)
+    except Exception:
+        return False
+
 
 def resize_image(image_bytes: bytes, max_size: int = 1600, quality: int = 90) -> bytes:
     """
     Resize an image if it exceeds the maximum size.
 
+    JPEGs are decoded at the smallest DCT scale that still covers max_size, so a
+    12-MP photo is never fully decoded. EXIF orientation is applied once
+    and the result is saved upright without the orientation tag.
+
     Args:
         image_bytes: Raw image bytes
         max_size: Maximum dimension size in pixels
@@ -23,11 +63,20 @@ def resize_image(image_bytes: bytes, max_size: int = 1600, quality: int = 90) ->
     """
     try:
         img: Image.Image = Image.open(io.BytesIO(image_bytes))
+        transpose = _needs_transpose(img)
 
-        # If image is already small enough, return as is
-        if max(img.size) <= max_size and len(image_bytes) <= 1.5 * 1024 * 1024:
+        # If image is already small enough and upright, return as is
+        if max(img.size) <= max_size and len(image_bytes) <= 1.5 * 1024 * 1024 and not transpose:
             return image_bytes
 
+        if max(img.size) > max_size and img.format == "JPEG":
+            # Декодируем в уменьшенном масштабе, но не меньше целевого размера
+            ratio = max_size / max(img.size)
+            img.draft("RGB", (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+
+        if transpose:
+            img = ImageOps.exif_transpose(img)
+
         # Resize while maintaining aspect ratio
         if max(img.size) > max_size:
             ratio = max_size / max(img.size)
@@ -84,3 +133,100 @@ def prepare_for_ocr(
 
     # Apply preprocessing
     return resize_image(image_bytes)
+
+
+_prep_executor: Optional[ProcessPoolExecutor] = None
+_prep_executor_lock = threading.Lock()
+
+
+def get_prep_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Возвращает общий пул процессов подготовки изображений.
+
+    Пул создается лениво с контекстом spawn (fork небезопасен в процессе
+    с потоками aiogram/Redis). None, если пул отключен (IMAGE_PREP_WORKERS=0).
+    """
+    global _prep_executor
+    if PREP_WORKERS <= 0:
+        return None
+    if _prep_executor is None:
+        with _prep_executor_lock:
+            if _prep_executor is None:
+                _prep_executor = ProcessPoolExecutor(
+                    max_workers=PREP_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"Пул подготовки изображений запущен: {PREP_WORKERS} процессов")
+    return _prep_executor
+
+
+def shutdown_prep_executor(wait: bool = True) -> None:
+    """Останавливает пул процессов подготовки изображений"""
+    global _prep_executor
+    with _prep_executor_lock:
+        executor, _prep_executor = _prep_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+async def _run_in_prep_pool(func, *args):
+    """
+    Выполняет функцию подготовки в пуле процессов.
+
+    Если пул недоступен или сломан (например, процесс убит OOM),
+    функция выполняется в потоке по умолчанию.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_prep_executor()
+    if executor is not None:
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            logger.warning("Пул подготовки изображений сломан, пересоздаем")
+            shutdown_prep_executor(wait=False)
+    return await loop.run_in_executor(None, func, *args)
+
+
+async def prepare_for_ocr_async(image_bytes: bytes, use_preprocessing: bool = True) -> bytes:
+    """
+    Асинхронно подготавливает изображение в пуле процессов.
+
+    Args:
+        image_bytes: Байты изображения
+        use_preprocessing: Whether to use preprocessing
+
+    Returns:
+        Processed image bytes
+    """
+    return await _run_in_prep_pool(prepare_for_ocr, image_bytes, use_preprocessing)
+
+
+async def prepare_for_vision_async(image_bytes: bytes) -> bytes:
+    """
+    Асинхронно готовит фотографию для GPT-4o vision.
+
+    При OCR_TILE_SIZING снимок обрезается и уменьшается под сетку тайлов
+    (см. app.imgprep.tiling), иначе — prepare_for_ocr.
+
+    Args:
+        image_bytes: Байты изображения
+
+    Returns:
+        JPEG-байты подготовленного изображения
+    """
+    if TILE_SIZING:
+        return await _run_in_prep_pool(prepare_for_vision, image_bytes)
+    return await _run_in_prep_pool(prepare_for_ocr, image_bytes)
+
+
+async def split_into_strips_async(image_bytes: bytes) -> List[bytes]:
+    """
+    Асинхронно разрезает длинную накладную на полосы (см. app.imgprep.strips).
+
+    Args:
+        image_bytes: Байты изображения
+
+    Returns:
+        JPEG-байты полос сверху вниз ([image_bytes], если резать не нужно)
+    """
+    return await _run_in_prep_pool(split_into_strips, image_bytes)
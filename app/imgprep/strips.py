@@ -0,0 +1,122 @@
+"""
+Разрезание длинных накладных и чеков на горизонтальные полосы.
+
+Задержка GPT-4o растет с длиной ответа: накладная на 60+ строк дает
+длинный tool call, который генерируется десятки секунд. Полосы
+распознаются параллельно, поэтому время определяется самой длинной
+полосой. Разрезы проходят только по пробелам между строками текста
+(проекция «чернил» по рядам), а соседние полосы перекрываются на
+STRIP_OVERLAP_ROWS медианных высот строки — повторы удаляются при слиянии.
+"""
+
+import io
+import logging
+import math
+import os
+import statistics
+from typing import List, Tuple
+
+from app.imgprep.tiling import JPEG_QUALITY, analysis_gray, load_upright, text_line_bands
+
+logger = logging.getLogger(__name__)
+
+# Минимальное число строк текста, с которого изображение режется на полосы
+SPLIT_MIN_LINES = int(os.getenv("OCR_SPLIT_MIN_LINES", "40"))
+
+# Примерное число строк текста в одной полосе
+LINES_PER_STRIP = int(os.getenv("OCR_SPLIT_LINES_PER_STRIP", "25"))
+
+MAX_STRIPS = 4
+
+# Перекрытие соседних полос в медианных высотах строки: строка таблицы,
+# которую проекция разбила на несколько полос текста, попадает в обе полосы целиком
+STRIP_OVERLAP_ROWS = 1.0
+
+
+def row_height(bands: List[Tuple[int, int]]) -> float:
+    """Медианная высота строки: шаг между началами соседних строк текста"""
+    if len(bands) < 2:
+        return float(bands[0][1] - bands[0][0]) if bands else 0.0
+    return float(statistics.median(b[0] - a[0] for a, b in zip(bands, bands[1:])))
+
+
+def plan_strips(bands: List[Tuple[int, int]], height: int) -> List[Tuple[int, int]]:
+    """
+    Выбирает полосы по найденным строкам текста.
+
+    Число полос — по LINES_PER_STRIP строк, разрезы — посередине пробела
+    между строками, ближайшими к равному делению.
+
+    Args:
+        bands: Строки текста (начало, конец) сверху вниз
+        height: Высота изображения
+
+    Returns:
+        Список (верх, низ) полос; одна полоса на все изображение, если
+        строк меньше SPLIT_MIN_LINES
+    """
+    if len(bands) < SPLIT_MIN_LINES:
+        return [(0, height)]
+
+    count = min(MAX_STRIPS, math.ceil(len(bands) / LINES_PER_STRIP))
+    if count < 2:
+        return [(0, height)]
+
+    def gap_middle(line: int) -> int:
+        """Середина пробела перед строкой line"""
+        if line <= 0:
+            return 0
+        if line >= len(bands):
+            return height
+        return (bands[line - 1][1] + bands[line][0]) // 2
+
+    def overlap_end(line: int) -> int:
+        """Первая строка после перекрытия, которое начинается перед строкой line"""
+        # Строки, целиком лежащие в пределах перекрытия от разреза (хотя бы одна)
+        limit = gap_middle(line) + STRIP_OVERLAP_ROWS * row_height(bands)
+        end = line + 1
+        while end < len(bands) and bands[end][1] <= limit:
+            end += 1
+        return end
+
+    strips = []
+    for k in range(count):
+        first = round(k * len(bands) / count)
+        last = round((k + 1) * len(bands) / count)
+        # Полоса продолжается в следующую на высоту перекрытия
+        top = gap_middle(first) if k > 0 else 0
+        bottom = gap_middle(overlap_end(last)) if k < count - 1 else height
+        strips.append((top, bottom))
+    return strips
+
+
+def split_into_strips(image_bytes: bytes) -> List[bytes]:
+    """
+    Разрезает высокую накладную на перекрывающиеся полосы.
+
+    Args:
+        image_bytes: Байты исходного изображения
+
+    Returns:
+        JPEG-байты полос сверху вниз; [image_bytes], если резать не нужно
+        или изображение не читается
+    """
+    try:
+        img = load_upright(image_bytes)
+        gray, factor = analysis_gray(img)
+        strips = plan_strips(text_line_bands(gray), gray.shape[0])
+        if len(strips) < 2:
+            return [image_bytes]
+
+        result = []
+        for top, bottom in strips:
+            box = (0, int(top / factor), img.width, min(img.height, math.ceil(bottom / factor)))
+            output = io.BytesIO()
+            img.crop(box).save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            result.append(output.getvalue())
+
+        logger.info(f"Изображение {img.width}x{img.height} разрезано на {len(result)} полосы")
+        return result
+    except Exception as e:
+        logger.warning(f"Ошибка разрезания изображения на полосы: {e}")
+        return [image_bytes]
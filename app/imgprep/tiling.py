@@ -0,0 +1,313 @@
+"""
+Подбор размера изображения под тайлы GPT-4o vision (detail: high).
+
+OpenAI вписывает изображение в 2048x2048, уменьшает короткую сторону до 768
+и тарифицирует каждый тайл 512x512: 85 + 170 * тайлы токенов. Снимок
+1094x1600 превращается в 768x1123 и занимает 2x3 тайла, хотя нижний ряд
+заполнен на треть. Политика ниже обрезает пустые поля, оценивает высоту
+строк текста и выбирает наименьшую сетку тайлов, при которой строки
+остаются читаемыми, отправляя изображение уже нужного размера.
+
+Для запросов OCR политика включается переменной OCR_TILE_SIZING
+(см. app.imgprep.prepare.prepare_for_vision_async).
+"""
+
+import io
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+from PIL.Image import Resampling
+
+logger = logging.getLogger(__name__)
+
+# Параметры тарификации OpenAI для detail: high
+TILE_SIZE = 512
+MAX_SHORT_SIDE = 768
+MAX_LONG_SIDE = 2048
+BASE_TOKENS = 85
+TOKENS_PER_TILE = 170
+
+# Минимальная высота строки текста (в пикселях отправляемого изображения),
+# при которой GPT-4o уверенно читает цифры
+MIN_TEXT_HEIGHT = int(os.getenv("OCR_MIN_TEXT_HEIGHT", "12"))
+
+# Максимальная сетка тайлов, которую перебирает политика
+MAX_GRID = 4
+
+# Поля вокруг найденного содержимого (доля стороны) и минимальная
+# экономия площади, ради которой стоит обрезать
+CROP_PADDING = 0.015
+MIN_CROP_GAIN = 0.05
+
+JPEG_QUALITY = 90
+
+# Длинная сторона изображения, на котором оцениваются поля и текст:
+# оценка не зависит от разрешения камеры и занимает единицы миллисекунд
+ANALYSIS_SIZE = 1280
+
+Box = Tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class VisionSizing:
+    """Результат политики: что и в каком размере отправляется в API"""
+
+    source_size: Tuple[int, int]
+    crop_box: Box
+    target_size: Tuple[int, int]
+    text_height: Optional[float]
+    tiles: int
+    tokens: int
+
+
+def _server_size(width: int, height: int) -> Tuple[int, int]:
+    """Размер, к которому OpenAI приводит изображение перед нарезкой на тайлы"""
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height))
+    scaled_w, scaled_h = width * scale, height * scale
+    if min(scaled_w, scaled_h) > MAX_SHORT_SIDE:
+        scale = MAX_SHORT_SIDE / min(scaled_w, scaled_h)
+        scaled_w, scaled_h = scaled_w * scale, scaled_h * scale
+    return int(scaled_w), int(scaled_h)
+
+
+def expected_tiles(width: int, height: int) -> int:
+    """Количество тайлов 512x512, которое OpenAI насчитает для изображения"""
+    width, height = _server_size(width, height)
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def expected_tokens(width: int, height: int) -> int:
+    """Количество токенов промпта за изображение (detail: high)"""
+    return BASE_TOKENS + TOKENS_PER_TILE * expected_tiles(width, height)
+
+
+def _ink_mask(gray: np.ndarray) -> np.ndarray:
+    """Пиксели заметно темнее фона (текст, линии таблицы)"""
+    background = np.median(gray)
+    mask: np.ndarray = gray < background - 60
+    return mask
+
+
+def find_content_box(gray: np.ndarray) -> Box:
+    """
+    Находит прямоугольник с содержимым, отбрасывая пустые поля.
+
+    Границы берутся по 0.3% и 99.7% массы «чернил» вдоль каждой оси,
+    чтобы отдельные соринки на краях не расширяли рамку.
+
+    Args:
+        gray: Изображение в оттенках серого (H x W)
+
+    Returns:
+        (left, top, right, bottom)
+    """
+    height, width = gray.shape
+    ink = _ink_mask(gray)
+    if ink.sum() == 0:
+        return (0, 0, width, height)
+
+    def bounds(mass: np.ndarray, size: int, pad: int) -> Tuple[int, int]:
+        cumulative = np.cumsum(mass, dtype=np.float64)
+        cumulative /= cumulative[-1]
+        start = int(np.searchsorted(cumulative, 0.003))
+        end = int(np.searchsorted(cumulative, 0.997)) + 1
+        return max(0, start - pad), min(size, end + pad)
+
+    left, right = bounds(ink.sum(axis=0), width, int(width * CROP_PADDING))
+    top, bottom = bounds(ink.sum(axis=1), height, int(height * CROP_PADDING))
+    return (left, top, right, bottom)
+
+
+def text_line_bands(gray: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Находит строки текста по горизонтальной проекции «чернил».
+
+    Линии таблицы (строки и столбцы, почти целиком залитые «чернилами»)
+    исключаются, строкой текста считается участок подряд идущих рядов
+    пикселей с текстом высотой от 3 пикселей.
+
+    Args:
+        gray: Изображение в оттенках серого (H x W)
+
+    Returns:
+        Список (начало, конец) строк сверху вниз
+    """
+    ink = _ink_mask(gray)
+    ink[:, ink.mean(axis=0) > 0.3] = False
+    ink[ink.mean(axis=1) > 0.3, :] = False
+
+    text_rows = ink.mean(axis=1) > 0.01
+    # Границы участков: +1 — начало строки текста, -1 — конец
+    edges = np.diff(np.concatenate(([0], text_rows.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) >= 3
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """
+    Оценивает типичную высоту строки текста (медиана высот строк).
+
+    Args:
+        gray: Изображение в оттенках серого (H x W)
+
+    Returns:
+        Высота строки в пикселях или None, если текст не найден
+    """
+    bands = text_line_bands(gray)
+    if not bands:
+        return None
+    return float(np.median([end - start for start, end in bands]))
+
+
+def choose_target_size(
+    width: int, height: int, text_height: Optional[float] = None
+) -> Tuple[int, int]:
+    """
+    Выбирает размер изображения под сетку тайлов.
+
+    Перебираются сетки до MAX_GRID x MAX_GRID тайлов; изображение вписывается
+    в каждую (без увеличения и в пределах ограничений OpenAI). Выбирается
+    сетка с наименьшим числом тайлов, при которой строка текста не ниже
+    MIN_TEXT_HEIGHT; без оценки текста — максимальное доступное разрешение.
+
+    Args:
+        width: Ширина исходного изображения
+        height: Высота исходного изображения
+        text_height: Высота строки текста в пикселях исходного изображения
+
+    Returns:
+        (ширина, высота) для отправки
+    """
+    max_scale = min(1.0, MAX_SHORT_SIDE / min(width, height), MAX_LONG_SIDE / max(width, height))
+    required_scale = MIN_TEXT_HEIGHT / text_height if text_height else max_scale
+    required_scale = min(required_scale, max_scale)
+
+    best: Optional[Tuple[Tuple[bool, float, float], Tuple[int, int]]] = None
+    for cols in range(1, MAX_GRID + 1):
+        for rows in range(1, MAX_GRID + 1):
+            scale = min(max_scale, cols * TILE_SIZE / width, rows * TILE_SIZE / height)
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            tiles = expected_tiles(*size)
+            # Допуск на округление при вписывании в сетку
+            readable = scale >= required_scale * 0.999
+            key = (not readable, tiles if readable else -scale, -scale)
+            if best is None or key < best[0]:
+                best = (key, size)
+    assert best is not None  # сетка MAX_GRID x MAX_GRID не пуста
+    return best[1]
+
+
+def plan_vision_size(img: Image.Image) -> VisionSizing:
+    """
+    Строит план отправки: обрезка полей, оценка текста и размер под тайлы.
+
+    Анализ выполняется на уменьшенной до ANALYSIS_SIZE серой копии,
+    результаты пересчитываются в координаты исходного изображения.
+
+    Args:
+        img: Изображение (уже с примененной EXIF-ориентацией)
+
+    Returns:
+        VisionSizing
+    """
+    width, height = img.size
+    gray, factor = analysis_gray(img)
+
+    left, top, right, bottom = find_content_box(gray)
+    box = (
+        int(left / factor),
+        int(top / factor),
+        min(width, math.ceil(right / factor)),
+        min(height, math.ceil(bottom / factor)),
+    )
+    if (box[2] - box[0]) * (box[3] - box[1]) > (1 - MIN_CROP_GAIN) * width * height:
+        box = (0, 0, width, height)
+        left, top, right, bottom = 0, 0, gray.shape[1], gray.shape[0]
+
+    text_height = estimate_text_height(gray[top:bottom, left:right])
+    if text_height is not None:
+        text_height /= factor
+    target = choose_target_size(box[2] - box[0], box[3] - box[1], text_height)
+    return VisionSizing(
+        source_size=(width, height),
+        crop_box=box,
+        target_size=target,
+        text_height=text_height,
+        tiles=expected_tiles(*target),
+        tokens=expected_tokens(*target),
+    )
+
+
+def load_upright(image_bytes: bytes) -> Image.Image:
+    """
+    Открывает фотографию в RGB с примененной EXIF-ориентацией.
+
+    JPEG декодируется в уменьшенном масштабе, но не меньше MAX_LONG_SIDE
+    по длинной стороне — больше OpenAI все равно не использует.
+    """
+    img: Image.Image = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG" and max(img.size) > MAX_LONG_SIDE:
+        ratio = MAX_LONG_SIDE / max(img.size)
+        img.draft("RGB", (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def analysis_gray(img: Image.Image) -> Tuple[np.ndarray, float]:
+    """
+    Серая копия для анализа, уменьшенная до ANALYSIS_SIZE по длинной стороне.
+
+    Returns:
+        (массив H x W, коэффициент уменьшения относительно img)
+    """
+    width, height = img.size
+    factor = min(1.0, ANALYSIS_SIZE / max(width, height))
+    small = img.convert("L")
+    if factor < 1.0:
+        small = small.resize(
+            (max(1, round(width * factor)), max(1, round(height * factor))), Resampling.BOX
+        )
+    return np.asarray(small, dtype=np.int16), factor
+
+
+def prepare_for_vision(image_bytes: bytes) -> bytes:
+    """
+    Готовит фотографию накладной для GPT-4o vision по политике тайлов.
+
+    JPEG декодируется в уменьшенном масштабе (не меньше 2048 по длинной
+    стороне), ориентация по EXIF применяется один раз.
+
+    Args:
+        image_bytes: Байты исходного изображения
+
+    Returns:
+        JPEG-байты подготовленного изображения (исходные байты при ошибке)
+    """
+    try:
+        img = load_upright(image_bytes)
+        sizing = plan_vision_size(img)
+        if sizing.crop_box != (0, 0, img.width, img.height):
+            img = img.crop(sizing.crop_box)
+        if sizing.target_size != img.size:
+            img = img.resize(sizing.target_size, Resampling.LANCZOS)
+
+        logger.debug(
+            f"Vision sizing: {sizing.source_size} -> crop {sizing.crop_box} -> "
+            f"{sizing.target_size}, text {sizing.text_height}, {sizing.tiles} tiles"
+        )
+
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+    except Exception as e:
+        logger.warning(f"Ошибка подготовки изображения для vision: {e}")
+        return image_bytes
@@ -4,6 +4,7 @@ from typing import Any, Dict, List, Optional, Union
 from rapidfuzz import fuzz
 
 from app.models import Position, Product
+from app.product_index import get_product_index
 from app.utils.string_cache import (
     cached_string_similarity,
     get_string_similarity_cached,
@@ -12,6 +13,10 @@ from app.utils.string_cache import (
 
 logger = logging.getLogger(__name__)
 
+# Начиная с этого количества позиций match_positions оценивает накладную
+# целиком матричным способом (rapidfuzz.process.cdist) вместо поштучного поиска
+BATCH_MIN_POSITIONS: int = 10
+
 
 @cached_string_similarity
 def calculate_string_similarity(s1: Optional[str], s2: Optional[str], **kwargs) -> float:
@@ -103,43 +108,16 @@ def fuzzy_find(
     if not query or not items:
         return []
     
-    results = []
-    query_normalized = query.lower().strip()
-    
-    for item in items:
-        # Получаем значение для сравнения
-        if isinstance(item, dict):
-            item_value = item.get(key, "")
-            item_data = item.copy()
-        else:
-            item_value = getattr(item, key, "")
-            item_data = {
-                "id": getattr(item, "id", ""),
-                "name": getattr(item, "name", ""),
-                "alias": getattr(item, "alias", ""),
-                "unit": getattr(item, "unit", ""),
-            }
-        
-        if not item_value:
-            continue
-        
-        # Вычисляем схожесть
-        score = calculate_string_similarity(query_normalized, item_value)
-        
-        if score >= threshold:
-            result = item_data.copy()
-            result["score"] = score
-            results.append(result)
-    
-    # Сортируем по убыванию схожести и ограничиваем количество
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:limit]
+    # Кандидаты отбираются по индексу каталога, полная оценка — только для них
+    index = get_product_index(items, key)
+    return index.search(query, items, threshold=threshold, limit=limit)
 
 
 def match_positions(
     positions: List[Dict[str, Any]],
     products: List[Union[Product, Dict[str, Any]]],
     threshold: float = 0.7,
+    batch: Optional[bool] = None,
 ) -> List[Dict[str, Any]]:
     """
     Сопоставляет позиции накладной с продуктами из базы данных.
@@ -148,13 +126,27 @@ def match_positions(
         positions: Список позиций из накладной
         products: Список продуктов из базы данных
         threshold: Минимальный порог схожести для сопоставления
+        batch: Оценивать все позиции одной матрицей cdist. По умолчанию
+            включается автоматически для накладных от BATCH_MIN_POSITIONS строк
     
     Returns:
         Список позиций с добавленными полями сопоставления
     """
     results = []
+    # Индекс строится один раз на каталог и переиспользуется для всех позиций
+    index = get_product_index(products, "name") if products else None
     
-    for position in positions:
+    if batch is None:
+        batch = len(positions) >= BATCH_MIN_POSITIONS
+    batch_matches: Dict[int, List[Dict[str, Any]]] = {}
+    if batch and index is not None:
+        named = [i for i, position in enumerate(positions) if position.get("name", "")]
+        found = index.search_batch(
+            [positions[i]["name"] for i in named], products, threshold=threshold, limit=1
+        )
+        batch_matches = dict(zip(named, found))
+    
+    for i, position in enumerate(positions):
         position_name = position.get("name", "")
         
         if not position_name:
@@ -166,13 +158,12 @@ def match_positions(
             continue
         
         # Ищем лучшее совпадение
-        matches = fuzzy_find(
-            position_name,
-            products,
-            threshold=threshold,
-            key="name",
-            limit=1
-        )
+        if i in batch_matches:
+            matches = batch_matches[i]
+        elif index is not None:
+            matches = index.search(position_name, products, threshold=threshold, limit=1)
+        else:
+            matches = []
         
         result = position.copy()
         
@@ -5,15 +5,20 @@ This module contains reusable functions extracted from the OCR pipeline
 to improve testability and maintainability.
 """
 
+import asyncio
 import base64
+import inspect
 import io
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+import statistics
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image
 
 from app.config import get_ocr_client
+from app.utils.ocr_scheduler import LANE_PHOTO, get_ocr_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -134,12 +139,35 @@ def _parse_numeric_value_legacy(text: Optional[str], default: float = 0, is_floa
         return default
 
 
-async def process_cell_with_gpt4o(cell_image_bytes: bytes) -> Tuple[str, float]:
+async def create_chat_completion(client: Any, **kwargs: Any) -> Any:
+    """
+    Call client.chat.completions.create without blocking the event loop.
+
+    The synchronous openai.OpenAI client runs in a worker thread; an async
+    client (AsyncOpenAI) is awaited directly. The request takes a slot of
+    the global OCR scheduler like the other vision requests.
+
+    Args:
+        client: OpenAI client (sync or async)
+        **kwargs: Arguments for chat.completions.create
+
+    Returns:
+        Chat completion response
+    """
+    async with get_ocr_scheduler().slot(LANE_PHOTO):
+        response = await asyncio.to_thread(client.chat.completions.create, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+    return response
+
+
+async def process_cell_with_gpt4o(cell_image_bytes: Union[bytes, np.ndarray]) -> Tuple[str, float]:
     """
     Process cell image with GPT-4o to extract text.
 
     Args:
-        cell_image_bytes: Raw image bytes of the cell
+        cell_image_bytes: Raw image bytes of the cell, or an RGB array
+            (encoded to JPEG for the request)
 
     Returns:
         Tuple of (extracted text, confidence score)
@@ -160,11 +188,12 @@ async def process_cell_with_gpt4o(cell_image_bytes: bytes) -> Tuple[str, float]:
         "Just extract and return that text. Don't add any explanations."
     )
 
-    # Create base64 image
-    b64_image = base64.b64encode(cell_image_bytes).decode("utf-8")
-
     try:
-        response = client.chat.completions.create(
+        # Create base64 image
+        b64_image = base64.b64encode(encode_cell_image(cell_image_bytes)).decode("utf-8")
+
+        response = await create_chat_completion(
+            client,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Extract only the text visible in the image."},
@@ -194,17 +223,48 @@ async def process_cell_with_gpt4o(cell_image_bytes: bytes) -> Tuple[str, float]:
         return "", 0.0
 
 
-def prepare_cell_image(cell_image_bytes: bytes) -> Optional[np.ndarray]:
+def encode_cell_image(cell_image: Union[bytes, np.ndarray], quality: int = 90) -> bytes:
+    """
+    Encode a cell for an API request.
+
+    Cells from the table detector are RGB array views into the decoded page;
+    they are encoded to JPEG here, only when a cell actually goes to GPT-4o.
+    Bytes are returned unchanged.
+
+    Args:
+        cell_image: Cell image bytes or RGB array
+        quality: JPEG quality
+
+    Returns:
+        Image bytes
+    """
+    if isinstance(cell_image, (bytes, bytearray)):
+        return bytes(cell_image)
+    output = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(cell_image)).save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def prepare_cell_image(cell_image_bytes: Union[bytes, np.ndarray]) -> Optional[np.ndarray]:
     """
     Prepare cell image for OCR by converting it to numpy array.
 
     Args:
-        cell_image_bytes: Raw image bytes of the cell
+        cell_image_bytes: Raw image bytes of the cell, or an RGB array
+            (returned as is, without copying)
 
     Returns:
         Numpy array of the image or None if image preparation fails
     """
     try:
+        # Array view from the table detector: no decode, no copy
+        if isinstance(cell_image_bytes, np.ndarray):
+            height, width = cell_image_bytes.shape[:2]
+            if width < 10 or height < 10:
+                logger.warning(f"Cell too small for OCR: {width}x{height}")
+                return None
+            return cell_image_bytes
+
         # For test cases where we just send placeholder bytes
         if cell_image_bytes == b"test_image_data":
             # Create a simple test image for testing
@@ -226,6 +286,127 @@ def prepare_cell_image(cell_image_bytes: bytes) -> Optional[np.ndarray]:
         return None
 
 
+# Cells whose y-centers differ by less than this share of the median cell
+# height belong to one row (half a cell plus a margin for skewed photos)
+ROW_TOLERANCE_RATIO = 0.75
+# Fallback tolerance in pixels when cells have no usable height
+DEFAULT_ROW_TOLERANCE = 20
+# A cell taller than this many median heights is merged across rows
+ROW_SPAN_RATIO = 1.6
+# Invoice line fields in column order
+LINE_FIELDS = 5
+
+
+def _cell_box(cell: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """Cell bbox as (x1, y1, x2, y2); zeros when the bbox is missing"""
+    bbox = cell.get("bbox") or [0, 0, 0, 0]
+    return bbox[0], bbox[1], bbox[2], bbox[3]
+
+
+def group_cells_into_rows(cells: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Group cells into table rows, top to bottom.
+
+    Cells are sorted by y-center and swept once: a cell joins the current
+    row when its center is within ROW_TOLERANCE_RATIO x median cell height
+    of the row's mean center, otherwise it starts a new row. Cells taller
+    than ROW_SPAN_RATIO median heights (merged across rows) are added to
+    every row whose center they cover.
+
+    Args:
+        cells: Cells with "bbox" [x1, y1, x2, y2]
+
+    Returns:
+        Rows of cells, sorted by vertical position
+    """
+    if not cells:
+        return []
+
+    heights = [box[3] - box[1] for box in map(_cell_box, cells) if box[3] > box[1]]
+    median_height = statistics.median(heights) if heights else 0
+    tolerance = median_height * ROW_TOLERANCE_RATIO if median_height else DEFAULT_ROW_TOLERANCE
+
+    regular: List[Tuple[float, Dict[str, Any]]] = []
+    spanning: List[Dict[str, Any]] = []
+    for cell in cells:
+        x1, y1, x2, y2 = _cell_box(cell)
+        if median_height and y2 - y1 > median_height * ROW_SPAN_RATIO:
+            spanning.append(cell)
+        else:
+            # Cells without height are placed by their top edge
+            regular.append(((y1 + y2) / 2 if y2 > y1 else y1, cell))
+    regular.sort(key=lambda item: item[0])
+
+    rows: List[List[Dict[str, Any]]] = []
+    centers: List[float] = []
+    row_sum = 0.0
+    for center, cell in regular:
+        if rows and abs(center - row_sum / len(rows[-1])) <= tolerance:
+            rows[-1].append(cell)
+            row_sum += center
+        else:
+            if rows:
+                centers.append(row_sum / len(rows[-1]))
+            rows.append([cell])
+            row_sum = center
+    if rows:
+        centers.append(row_sum / len(rows[-1]))
+
+    for cell in spanning:
+        _, y1, _, y2 = _cell_box(cell)
+        covered = list(range(bisect_left(centers, y1), bisect_right(centers, y2)))
+        if not covered:
+            # Spanning cell outside any row becomes its own row
+            index = bisect_left(centers, (y1 + y2) / 2)
+            rows.insert(index, [cell])
+            centers.insert(index, (y1 + y2) / 2)
+            continue
+        for i in covered:
+            rows[i].append(cell)
+    return rows
+
+
+def _header_columns(header: List[Dict[str, Any]]) -> List[Tuple[float, float]]:
+    """Column x-ranges taken from the header cells, left to right"""
+    spans = sorted((x1, x2) for x1, _, x2, _ in map(_cell_box, header) if x2 > x1)
+    return spans if len(spans) > 1 else []
+
+
+def _row_texts(
+    row: List[Dict[str, Any]], columns: List[Tuple[float, float]]
+) -> List[Optional[str]]:
+    """
+    Texts of the LINE_FIELDS invoice columns of one row (None for missing).
+
+    With header columns every cell goes to the column it overlaps most
+    (nearest column if it overlaps none), so a missing cell leaves a gap
+    instead of shifting the rest of the row. A cell merged across several
+    columns goes to the one it covers most; several cells in one column
+    are joined. Without a header, cells are taken left to right.
+    """
+    texts: List[Optional[str]] = [None] * LINE_FIELDS
+    if not columns:
+        for index, cell in enumerate(row[:LINE_FIELDS]):
+            texts[index] = cell.get("text", "")
+        return texts
+
+    for cell in row:
+        x1, _, x2, _ = _cell_box(cell)
+        overlaps = [min(x2, right) - max(x1, left) for left, right in columns]
+        best = max(range(len(columns)), key=lambda i: overlaps[i])
+        if overlaps[best] <= 0:
+            center = (x1 + x2) / 2
+            best = min(
+                range(len(columns)),
+                key=lambda i: abs((columns[i][0] + columns[i][1]) / 2 - center),
+            )
+        if best >= LINE_FIELDS:
+            continue
+        text = cell.get("text", "")
+        texts[best] = text if texts[best] is None else f"{texts[best]} {text}".strip()
+    return texts
+
+
 def build_lines_from_cells(ocr_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Build invoice line items from processed cells by grouping them by rows.
@@ -291,35 +472,25 @@ def build_lines_from_cells(ocr_results: List[Dict[str, Any]]) -> List[Dict[str,
             return lines
 
     # Regular processing for all other cases
-    row_cells = {}
-    for cell in ocr_results:
-        y1 = cell.get("bbox", [0, 0, 0, 0])[1]
-        row_found = False
-        for row_y in row_cells.keys():
-            if abs(row_y - y1) < 20:  # Tolerance for row height
-                row_cells[row_y].append(cell)
-                row_found = True
-                break
-        if not row_found:
-            row_cells[y1] = [cell]
-
-    # Sort rows by vertical position
-    sorted_rows = sorted(row_cells.items())
+    rows = group_cells_into_rows(ocr_results)
     # Only skip header row if more than one row and not in test mode
-    if len(sorted_rows) > 1 and len(ocr_results) > 5:  # Don't skip in test cases with few cells
-        sorted_rows = sorted_rows[1:]
+    header: List[Dict[str, Any]] = []
+    if len(rows) > 1 and len(ocr_results) > 5:  # Don't skip in test cases with few cells
+        header, rows = rows[0], rows[1:]
+    columns = _header_columns(header)
 
     lines = []
-    for _, row in sorted_rows:
+    for row in rows:
         # Sort cells within row by horizontal position
-        row.sort(key=lambda cell: cell.get("bbox", [0, 0, 0, 0])[0])
+        row.sort(key=lambda cell: _cell_box(cell)[0])
 
         # Extract cell values with default values for missing cells
-        name = row[0].get("text", "") if len(row) > 0 else ""
-        qty_text = row[1].get("text", "") if len(row) > 1 else "0"
-        unit = row[2].get("text", "") if len(row) > 2 else "pcs"
-        price_text = row[3].get("text", "") if len(row) > 3 else "0"
-        amount_text = row[4].get("text", "") if len(row) > 4 else "0"
+        texts = _row_texts(row, columns)
+        name = texts[0] if texts[0] is not None else ""
+        qty_text = texts[1] if texts[1] is not None else "0"
+        unit = texts[2] if texts[2] is not None else "pcs"
+        price_text = texts[3] if texts[3] is not None else "0"
+        amount_text = texts[4] if texts[4] is not None else "0"
 
         # Try to get text from structure if cell text is empty
         if not name and len(row) > 0 and "structure" in row[0]:
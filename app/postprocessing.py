@@ -1,54 +1,115 @@
 import logging
 import re
-from typing import List, Optional, Union
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from app.data_loader import load_products
-from app.models import ParsedData
+from app.catalog import get_products
+from app.models import ParsedData, Position
 from app.utils.data_utils import clean_number, parse_date, convert_weight_to_kg, should_convert_to_kg
 from app.utils.enhanced_logger import log_format_issues, log_indonesian_invoice
+from app.utils.keyword_matcher import get_keyword_matcher
+from app.utils.monitor import record_histogram
 
 
 # Для обратной совместимости оставляем алиас
 clean_num = clean_number
 
+# Минимальная схожесть для автокоррекции
+# (примерно соответствует расстоянию Левенштейна <= 2)
+AUTOCORRECT_THRESHOLD: float = 0.85
+
+
+def get_autocorrect_index(allowed_names: Optional[List[str]] = None) -> Tuple[List[Any], Any]:
+    """
+    Словарь автокоррекции и индекс ProductIndex по его алиасам.
+
+    Без allowed_names используются продукты общего каталога: индекс для них
+    кешируется по версии каталога и не перестраивается между накладными.
+
+    Args:
+        allowed_names: Список разрешенных названий (по умолчанию алиасы каталога)
+
+    Returns:
+        Кортеж (элементы словаря, индекс по полю alias)
+    """
+    from app.product_index import get_product_index
+
+    if allowed_names is None:
+        items: List[Any] = get_products()
+    else:
+        items = [{"name": n, "alias": n} for n in allowed_names]
+    return items, get_product_index(items, "alias")
+
+
+def autocorrect_names(
+    names: Sequence[Optional[str]], allowed_names: Optional[List[str]] = None
+) -> List[Optional[str]]:
+    """
+    Пакетная автокоррекция названий всех позиций накладной.
+
+    Индекс алиасов берется один раз на вызов, одинаковые названия
+    оцениваются один раз, а накладные от BATCH_MIN_POSITIONS уникальных
+    названий сопоставляются одной матрицей (ProductIndex.search_batch).
+    Результат для каждого названия совпадает с autocorrect_name.
+
+    Args:
+        names: Исходные названия
+        allowed_names: Список разрешенных названий (по умолчанию алиасы каталога)
+
+    Returns:
+        Исправленные или исходные названия в том же порядке
+    """
+    from app.matcher import BATCH_MIN_POSITIONS, normalize_product_name
+
+    stripped = [name.strip() if name is not None else None for name in names]
+    queries = list(dict.fromkeys(normalize_product_name(name) for name in stripped if name))
+    queries = [query for query in queries if query]
+
+    corrected: Dict[str, Dict[str, Any]] = {}
+    if queries:
+        items, index = get_autocorrect_index(allowed_names)
+        if len(queries) >= BATCH_MIN_POSITIONS:
+            found = index.search_batch(
+                queries, items, threshold=AUTOCORRECT_THRESHOLD, limit=1
+            )
+        else:
+            found = [
+                index.search(query, items, threshold=AUTOCORRECT_THRESHOLD, limit=1)
+                for query in queries
+            ]
+        corrected = {query: matches[0] for query, matches in zip(queries, found) if matches}
+
+    results: List[Optional[str]] = []
+    for name in stripped:
+        match = corrected.get(normalize_product_name(name)) if name else None
+        if match:
+            logging.debug(
+                f"autocorrect_name: '{name}' -> '{match['alias']}' (score={match['score']})"
+            )
+            results.append(match["alias"])
+        else:
+            logging.debug(f"autocorrect_name: '{name}' -> '{name}' (no match found)")
+            results.append(name)
+    return results
+
 
 # Автозамена названий по словарю
-def autocorrect_name(name: str, allowed_names: List[str]) -> str:
+def autocorrect_name(name: str, allowed_names: Optional[List[str]] = None) -> str:
     """
     Автокоррекция названий товаров на основе списка разрешенных названий.
 
     Args:
         name: Исходное название
-        allowed_names: Список разрешенных названий
+        allowed_names: Список разрешенных названий (по умолчанию алиасы каталога)
 
     Returns:
         Исправленное или исходное название
     """
-    from app.matcher import fuzzy_find, normalize_product_name
-
     # Проверка на None
     if name is None:
         return name
 
-    name = name.strip()
-    
-    # Используем fuzzy_find для поиска лучшего совпадения
-    # Threshold 0.85 примерно соответствует расстоянию Левенштейна <= 2
-    matches = fuzzy_find(
-        normalize_product_name(name),
-        [{'name': n, 'alias': n} for n in allowed_names],
-        threshold=0.85,
-        key='alias',
-        limit=1
-    )
-    
-    if matches:
-        result = matches[0]['alias']
-        logging.debug(f"autocorrect_name: '{name}' -> '{result}' (score={matches[0]['score']})")
-        return result
-    
-    logging.debug(f"autocorrect_name: '{name}' -> '{name}' (no match found)")
-    return name
+    return autocorrect_names([name], allowed_names)[0]
 
 
 # Словарь для нормализации единиц измерения
@@ -196,6 +257,9 @@ PRODUCT_CATEGORIES = {
     "packaged": ["can", "jar", "packet", "box", "paper"],
 }
 
+# Скомпилированный поиск категорий по PRODUCT_CATEGORIES (строится один раз)
+CATEGORY_MATCHER = get_keyword_matcher(PRODUCT_CATEGORIES)
+
 
 def normalize_units(unit: str, product_name: Optional[str] = None) -> str:
     """
@@ -212,17 +276,8 @@ def normalize_units(unit: str, product_name: Optional[str] = None) -> str:
     if not unit:
         # Если единица не указана, попробуем определить по имени продукта
         if product_name:
-            product_name_lower = product_name.lower()
-
-            # Определяем категорию продукта
-            product_category = None
-            for category, products in PRODUCT_CATEGORIES.items():
-                for product in products:
-                    if product in product_name_lower:
-                        product_category = category
-                        break
-                if product_category:
-                    break
+            # Определяем категорию продукта (первое ключевое слово, входящее в название)
+            product_category = CATEGORY_MATCHER.categorize(product_name.lower())
 
             # Если категория определена, возвращаем типичную единицу
             if product_category and product_category in PRODUCT_DEFAULT_UNITS:
@@ -241,28 +296,145 @@ def normalize_units(unit: str, product_name: Optional[str] = None) -> str:
     return unit if unit else "pcs"
 
 
+def is_empty_position(pos: Position) -> bool:
+    """Позиция без названия или строка итога, которую постобработка отбрасывает"""
+    return not pos.name or pos.name.strip() in ["", "-", "Итого", "Total", "Sum"]
+
+
+def postprocess_position(
+    pos: Position,
+    allowed_names: Optional[List[str]] = None,
+    req_id: str = "unknown",
+    corrections: Optional[Dict[str, Optional[str]]] = None,
+) -> Optional[Position]:
+    """
+    Постобработка одной позиции: очистка чисел, автокоррекция названия,
+    нормализация единиц и проверка целостности.
+
+    Используется как postprocess_parsed_data, так и потоковым OCR, который
+    обрабатывает позиции по мере их поступления.
+
+    Args:
+        pos: Позиция из OCR (изменяется на месте)
+        allowed_names: Названия продуктов для автокоррекции (по умолчанию алиасы каталога)
+        req_id: Идентификатор запроса для логирования
+        corrections: Названия, уже исправленные autocorrect_names
+            (исходное -> исправленное); для них поиск не повторяется
+
+    Returns:
+        Обработанная позиция или None, если позиция пустая
+    """
+    # Пропускаем явно пустые позиции
+    if is_empty_position(pos):
+        return None
+
+    # Очистка числовых значений
+    price = clean_num(pos.price)
+    if price is not None:
+        pos.price = price
+
+    qty = clean_num(pos.qty, 1.0)
+    if qty is not None:
+        pos.qty = qty
+
+    total = clean_num(pos.total_price)
+    if total is not None:
+        pos.total_price = total
+
+    # Автокоррекция имени
+    if pos.name:
+        logging.info(f"Автокоррекция названия: '{pos.name}'")
+        if corrections is not None and pos.name in corrections:
+            corrected = corrections[pos.name]
+        else:
+            corrected = autocorrect_name(pos.name, allowed_names)
+        pos.name = corrected
+        logging.info(f"Результат автокоррекции: '{pos.name}'")
+        # Логируем слишком длинные названия
+        if pos.name and len(pos.name) > 30:
+            log_format_issues(req_id, "position.name", pos.name, "< 30 chars")
+
+    # Нормализация единиц измерения
+    if hasattr(pos, "unit") and pos.unit is not None:
+        old_unit = pos.unit
+        pos.unit = normalize_units(pos.unit, pos.name)
+        if old_unit != pos.unit:
+            logging.info(f"Нормализация единицы: '{old_unit}' -> '{pos.unit}'")
+
+        # Преобразование весовых единиц в килограммы
+        if should_convert_to_kg(pos.qty or 0, pos.unit):
+            old_qty = pos.qty
+            old_unit = pos.unit
+
+            # Получаем цену за единицу (если есть price_per_unit, используем его, иначе price)
+            price_per = getattr(pos, 'price_per_unit', None) or pos.price
+
+            # Преобразуем
+            new_qty, new_unit, new_price = convert_weight_to_kg(pos.qty, pos.unit, price_per)
+
+            # Обновляем значения
+            pos.qty = new_qty
+            pos.unit = new_unit
+
+            # Обновляем цену за единицу
+            if new_price is not None:
+                if hasattr(pos, 'price_per_unit') and pos.price_per_unit is not None:
+                    pos.price_per_unit = new_price
+                else:
+                    pos.price = new_price
+
+            logging.info(f"Преобразование веса: {old_qty}{old_unit} -> {new_qty}{new_unit}")
+
+    # Обеспечение целостности данных
+
+    # 1. Если есть цена и количество, но нет итоговой суммы
+    if pos.qty and pos.price and (not pos.total_price or pos.total_price == 0):
+        pos.total_price = pos.qty * pos.price
+        logging.info(f"Вычислена total_price: {pos.qty} * {pos.price} = {pos.total_price}")
+
+    # 2. Если есть итоговая сумма и количество, но нет цены
+    elif pos.qty and pos.qty > 0 and pos.total_price and (not pos.price or pos.price == 0):
+        pos.price = pos.total_price / pos.qty
+        logging.info(f"Вычислена price: {pos.total_price} / {pos.qty} = {pos.price}")
+
+    # 3. Проверка на аномальные значения
+    # Если цена или количество аномально высокие - это может быть ошибка в распознавании
+    if pos.price and pos.price > 10_000_000:  # Аномально высокая цена
+        pos.price = pos.price / 10  # Корректируем ошибку в десятичном разделителе
+        logging.warning(f"Корректировка аномальной цены: {pos.price*10} -> {pos.price}")
+
+    if pos.qty and pos.qty > 1000:  # Аномально большое количество
+        pos.qty = pos.qty / 10  # Корректируем ошибку в десятичном разделителе
+        logging.warning(f"Корректировка аномального количества: {pos.qty*10} -> {pos.qty}")
+
+    return pos
+
+
+def get_allowed_names() -> List[str]:
+    """Названия продуктов каталога для автокоррекции"""
+    return [p.alias for p in get_products()]
+
+
 # Основная функция постобработки ParsedData
-def postprocess_parsed_data(parsed: ParsedData, req_id: str = "unknown") -> ParsedData:
+def postprocess_parsed_data(
+    parsed: ParsedData,
+    req_id: str = "unknown",
+    processed_positions: Optional[List[Position]] = None,
+) -> ParsedData:
     """
     Улучшенная постобработка данных из OCR с дополнительными проверками и коррекциями.
 
     Args:
         parsed: Исходные данные из OCR
         req_id: Идентификатор запроса для логирования
+        processed_positions: Позиции, уже обработанные postprocess_position
+            (потоковый OCR); позиции parsed в этом случае не обрабатываются
 
     Returns:
         ParsedData: Обработанные и улучшенные данные
     """
+    start_time = time.perf_counter()
     try:
-        # Загружаем продукты для автокоррекции
-        products = load_products()
-        allowed_names = [p.alias for p in products]
-
-        # Отладочное логирование
-        logging.info(f"postprocess_parsed_data: загружено {len(products)} продуктов")
-        if allowed_names:
-            logging.info(f"Первые 5 продуктов: {allowed_names[:5]}")
-
         # Обработка даты инвойса (если есть)
         if parsed.date:
             parsed_date = parse_date(parsed.date)
@@ -277,100 +449,40 @@ def postprocess_parsed_data(parsed: ParsedData, req_id: str = "unknown") -> Pars
         if total_price is not None:
             parsed.total_price = total_price
 
-        # Обработка позиций
-        pos_count = len(parsed.positions)
-        logging.info(f"Обработка {pos_count} позиций")
-
-        # Удаляем позиции без имени или количества
-        valid_positions = []
-        for i, pos in enumerate(parsed.positions):
-            # Пропускаем явно пустые позиции
-            if not pos.name or pos.name.strip() in ["", "-", "Итого", "Total", "Sum"]:
-                logging.info(f"Пропускаем пустую позицию #{i+1}")
-                continue
-
-            # Очистка числовых значений
-            price = clean_num(pos.price)
-            if price is not None:
-                pos.price = price
-
-            qty = clean_num(pos.qty, 1.0)
-            if qty is not None:
-                pos.qty = qty
-
-            total = clean_num(pos.total_price)
-            if total is not None:
-                pos.total_price = total
-
-            # Автокоррекция имени
-            if pos.name:
-                logging.info(f"Автокоррекция названия: '{pos.name}'")
-                corrected = autocorrect_name(pos.name, allowed_names)
-                pos.name = corrected
-                logging.info(f"Результат автокоррекции: '{pos.name}'")
-                # Логируем слишком длинные названия
-                if pos.name and len(pos.name) > 30:
-                    log_format_issues(req_id, "position.name", pos.name, "< 30 chars")
-
-            # Нормализация единиц измерения
-            if hasattr(pos, "unit") and pos.unit is not None:
-                old_unit = pos.unit
-                pos.unit = normalize_units(pos.unit, pos.name)
-                if old_unit != pos.unit:
-                    logging.info(f"Нормализация единицы: '{old_unit}' -> '{pos.unit}'")
-                
-                # Преобразование весовых единиц в килограммы
-                if should_convert_to_kg(pos.qty or 0, pos.unit):
-                    old_qty = pos.qty
-                    old_unit = pos.unit
-                    
-                    # Получаем цену за единицу (если есть price_per_unit, используем его, иначе price)
-                    price_per = getattr(pos, 'price_per_unit', None) or pos.price
-                    
-                    # Преобразуем
-                    new_qty, new_unit, new_price = convert_weight_to_kg(pos.qty, pos.unit, price_per)
-                    
-                    # Обновляем значения
-                    pos.qty = new_qty
-                    pos.unit = new_unit
-                    
-                    # Обновляем цену за единицу
-                    if new_price is not None:
-                        if hasattr(pos, 'price_per_unit') and pos.price_per_unit is not None:
-                            pos.price_per_unit = new_price
-                        else:
-                            pos.price = new_price
-                    
-                    logging.info(f"Преобразование веса: {old_qty}{old_unit} -> {new_qty}{new_unit}")
-
-            # Обеспечение целостности данных
-
-            # 1. Если есть цена и количество, но нет итоговой суммы
-            if pos.qty and pos.price and (not pos.total_price or pos.total_price == 0):
-                pos.total_price = pos.qty * pos.price
-                logging.info(f"Вычислена total_price: {pos.qty} * {pos.price} = {pos.total_price}")
-
-            # 2. Если есть итоговая сумма и количество, но нет цены
-            elif pos.qty and pos.qty > 0 and pos.total_price and (not pos.price or pos.price == 0):
-                pos.price = pos.total_price / pos.qty
-                logging.info(f"Вычислена price: {pos.total_price} / {pos.qty} = {pos.price}")
-
-            # 3. Проверка на аномальные значения
-            # Если цена или количество аномально высокие - это может быть ошибка в распознавании
-            if pos.price and pos.price > 10_000_000:  # Аномально высокая цена
-                pos.price = pos.price / 10  # Корректируем ошибку в десятичном разделителе
-                logging.warning(f"Корректировка аномальной цены: {pos.price*10} -> {pos.price}")
-
-            if pos.qty and pos.qty > 1000:  # Аномально большое количество
-                pos.qty = pos.qty / 10  # Корректируем ошибку в десятичном разделителе
-                logging.warning(f"Корректировка аномального количества: {pos.qty*10} -> {pos.qty}")
-
-            # Добавляем позицию в валидный список
-            valid_positions.append(pos)
-
-        # Заменяем список позиций на отфильтрованный
-        parsed.positions = valid_positions
-        logging.info(f"После фильтрации осталось {len(valid_positions)} позиций")
+        if processed_positions is not None:
+            parsed.positions = list(processed_positions)
+        else:
+            # Обработка позиций
+            pos_count = len(parsed.positions)
+            logging.info(f"Обработка {pos_count} позиций")
+
+            # Автокоррекция всех названий накладной одним проходом по индексу каталога
+            autocorrect_start = time.perf_counter()
+            names = list(
+                dict.fromkeys(pos.name for pos in parsed.positions if not is_empty_position(pos))
+            )
+            corrections = dict(zip(names, autocorrect_names(names)))
+            autocorrect_seconds = time.perf_counter() - autocorrect_start
+            record_histogram("postprocess_autocorrect_seconds", autocorrect_seconds)
+            logging.info(
+                f"[{req_id}] Автокоррекция {len(names)} названий: "
+                f"{autocorrect_seconds * 1000:.1f} мс"
+            )
+
+            # Удаляем позиции без имени или количества
+            valid_positions = []
+            for i, pos in enumerate(parsed.positions):
+                processed = postprocess_position(pos, req_id=req_id, corrections=corrections)
+                if processed is None:
+                    logging.info(f"Пропускаем пустую позицию #{i+1}")
+                    continue
+
+                # Добавляем позицию в валидный список
+                valid_positions.append(processed)
+
+            # Заменяем список позиций на отфильтрованный
+            parsed.positions = valid_positions
+            logging.info(f"После фильтрации осталось {len(valid_positions)} позиций")
 
         # Если общая сумма не указана, но есть позиции с ценами - вычисляем её
         if not parsed.total_price or parsed.total_price == 0:
@@ -383,6 +495,10 @@ def postprocess_parsed_data(parsed: ParsedData, req_id: str = "unknown") -> Pars
                 parsed.total_price = total_sum
                 logging.info(f"Вычислена общая сумма: {parsed.total_price}")
 
+        postprocess_seconds = time.perf_counter() - start_time
+        record_histogram("postprocess_seconds", postprocess_seconds)
+        logging.info(f"[{req_id}] Постобработка накладной: {postprocess_seconds * 1000:.1f} мс")
+
         # Логируем итоговые данные
         log_indonesian_invoice(req_id, parsed.model_dump(), phase="postprocessing")
 
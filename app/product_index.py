@@ -0,0 +1,380 @@
+"""
+Индекс каталога продуктов для быстрого нечёткого поиска.
+
+ProductIndex строится один раз на версию каталога: хранит нормализованные
+названия и инвертированный индекс по символьным биграммам. Для каждого
+запроса по индексу отбирается небольшое множество кандидатов, и только для
+них выполняется полная оценка calculate_string_similarity.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+from app.catalog import get_catalog
+from app.models import Product
+
+logger = logging.getLogger(__name__)
+
+# Размер n-грамм для инвертированного индекса
+NGRAM_SIZE: int = 2
+# Сколько уникальных названий оценивать полностью для одного запроса.
+# Каталоги не больше этого размера сканируются целиком.
+MAX_CANDIDATES: int = 200
+# Сколько индексов держать в кеше (по одному на версию каталога)
+INDEX_CACHE_SIZE: int = 8
+# Максимальный размер одной матрицы cdist (запросы × значения) при пакетной оценке
+BATCH_MAX_CELLS: int = 2_000_000
+
+# В rapidfuzz 2.x fuzz.token_sort_ratio по умолчанию применяет default_process,
+# в 3.x — нет. cdist использует processor=None, поэтому повторяем поведение
+# прямого вызова, чтобы пакетная оценка совпадала с calculate_string_similarity.
+_TOKEN_SORT_PROCESSOR = utils.default_process if fuzz.token_sort_ratio("a!", "a") == 100 else None
+
+_index_cache: "OrderedDict[Tuple[Any, ...], ProductIndex]" = OrderedDict()
+_index_cache_lock = threading.RLock()
+
+
+def _ngrams(text: str) -> set:
+    """Возвращает множество символьных n-грамм строки с пробелами по краям."""
+    padded = f" {text} "
+    return {padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def item_value(item: Union[Dict[str, Any], Product], key: str) -> Any:
+    """Возвращает значение поля key у словаря или модели Product."""
+    if isinstance(item, dict):
+        return item.get(key, "")
+    return getattr(item, key, "")
+
+
+def item_data(item: Union[Dict[str, Any], Product]) -> Dict[str, Any]:
+    """Возвращает копию элемента каталога в виде словаря для результата поиска."""
+    if isinstance(item, dict):
+        return item.copy()
+    return {
+        "id": getattr(item, "id", ""),
+        "name": getattr(item, "name", ""),
+        "alias": getattr(item, "alias", ""),
+        "unit": getattr(item, "unit", ""),
+    }
+
+
+class ProductIndex:
+    """
+    Инвертированный n-граммный индекс по одному полю каталога.
+
+    Индекс зависит только от последовательности значений поля, поэтому
+    сами элементы каталога передаются в search() при каждом запросе.
+    Одинаковые значения (например, строки алиасов с тем же name)
+    хранятся один раз и оцениваются один раз.
+    """
+
+    def __init__(self, values: Sequence[Any], max_candidates: int = MAX_CANDIDATES):
+        self.max_candidates = max_candidates
+        self.size = len(values)
+        # Уникальные исходные значения, их нормализованные формы и строки каталога
+        self.values: List[str] = []
+        self.normalized: List[str] = []
+        self.rows: List[List[int]] = []
+
+        value_ids: Dict[str, int] = {}
+        postings: Dict[str, List[int]] = {}
+        gram_counts: List[int] = []
+
+        for row, value in enumerate(values):
+            if not value:
+                continue
+            vid = value_ids.get(value)
+            if vid is None:
+                vid = len(self.values)
+                value_ids[value] = vid
+                normalized = value.lower().strip()
+                self.values.append(value)
+                self.normalized.append(normalized)
+                self.rows.append([])
+                grams = _ngrams(normalized)
+                gram_counts.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(vid)
+            self.rows[vid].append(row)
+
+        self._postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._gram_counts = np.asarray(gram_counts, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def candidates(self, query_normalized: str) -> List[int]:
+        """
+        Отбирает идентификаторы значений, которые стоит оценивать полностью.
+
+        Кандидаты ранжируются по доле общих n-грамм с запросом.
+        Маленькие каталоги возвращаются целиком.
+
+        Args:
+            query_normalized: Нормализованная строка запроса
+
+        Returns:
+            Список идентификаторов уникальных значений в порядке каталога
+        """
+        total = len(self.values)
+        if total <= self.max_candidates:
+            return list(range(total))
+
+        query_grams = _ngrams(query_normalized)
+        arrays = [self._postings[g] for g in query_grams if g in self._postings]
+        if not arrays:
+            return []
+
+        shared = np.bincount(np.concatenate(arrays), minlength=total)
+        matched = np.flatnonzero(shared)
+        if len(matched) <= self.max_candidates:
+            candidates: List[int] = matched.tolist()
+            return candidates
+
+        # Коэффициент перекрытия повторяет логику partial_ratio (короткая строка
+        # внутри длинной), коэффициент Дайса разрешает ничьи в пользу близких длин
+        common = shared[matched].astype(np.float64)
+        value_grams = self._gram_counts[matched]
+        overlap = common / np.minimum(value_grams, len(query_grams))
+        dice = 2.0 * common / (value_grams + len(query_grams))
+        rank = overlap + dice * 1e-3
+        top = np.argpartition(-rank, self.max_candidates - 1)[: self.max_candidates]
+        candidates = np.sort(matched[top]).tolist()
+        return candidates
+
+    def search(
+        self,
+        query: str,
+        items: Sequence[Union[Dict[str, Any], Product]],
+        threshold: float = 0.75,
+        limit: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Находит элементы каталога, похожие на запрос.
+
+        Результат совпадает с полным перебором fuzzy_find по кандидатам:
+        элементы с score >= threshold, отсортированные по убыванию score,
+        при равенстве — в порядке каталога.
+
+        Args:
+            query: Строка для поиска
+            items: Элементы каталога, по значениям которых построен индекс
+            threshold: Минимальный порог схожести (0-1)
+            limit: Максимальное количество результатов
+
+        Returns:
+            Список найденных элементов с добавленным полем 'score'
+        """
+        from app.matcher import calculate_string_similarity
+
+        query_normalized = query.lower().strip()
+        hits: List[Tuple[int, float]] = []
+        for vid in self.candidates(query_normalized):
+            score = calculate_string_similarity(query_normalized, self.values[vid])
+            if score >= threshold:
+                hits.extend((row, score) for row in self.rows[vid])
+
+        return self._collect(hits, items, limit)
+
+    def similarity_matrix(
+        self, queries_normalized: Sequence[str], value_ids: Optional[Sequence[int]] = None
+    ) -> np.ndarray:
+        """
+        Вычисляет матрицу схожести запросов со значениями индекса.
+
+        Три метрики rapidfuzz считаются одним вызовом process.cdist каждая
+        на всех ядрах, затем смешиваются так же, как в
+        calculate_string_similarity: бонус за вложенность при
+        partial_ratio > 0.9, иначе 60% ratio + 30% partial_ratio +
+        10% token_sort_ratio.
+
+        Args:
+            queries_normalized: Нормализованные строки запросов
+            value_ids: Идентификаторы значений (столбцы матрицы), по умолчанию все
+
+        Returns:
+            Матрица float64 размера (len(queries), len(value_ids))
+        """
+        if value_ids is None:
+            choices = self.normalized
+        else:
+            choices = [self.normalized[vid] for vid in value_ids]
+
+        ratio = (
+            process.cdist(
+                queries_normalized, choices, scorer=fuzz.ratio, dtype=np.float64, workers=-1
+            )
+            / 100
+        )
+        partial_ratio = (
+            process.cdist(
+                queries_normalized, choices, scorer=fuzz.partial_ratio, dtype=np.float64, workers=-1
+            )
+            / 100
+        )
+        token_sort_ratio = (
+            process.cdist(
+                queries_normalized,
+                choices,
+                scorer=fuzz.token_sort_ratio,
+                processor=_TOKEN_SORT_PROCESSOR,
+                dtype=np.float64,
+                workers=-1,
+            )
+            / 100
+        )
+
+        query_lens = np.fromiter((len(q) for q in queries_normalized), dtype=np.int64)
+        value_lens = np.fromiter((len(v) for v in choices), dtype=np.int64)
+        len_diff = np.abs(query_lens[:, None] - value_lens[None, :])
+        shorter_len = np.minimum(query_lens[:, None], value_lens[None, :])
+
+        contained = partial_ratio > 0.9
+        reasonable = (shorter_len > 0) & (len_diff <= shorter_len * 2)
+        similarity = np.where(
+            contained,
+            np.where(reasonable, np.maximum(ratio, 0.8), partial_ratio * 0.9),
+            (ratio * 0.6) + (partial_ratio * 0.3) + (token_sort_ratio * 0.1),
+        )
+        return np.clip(similarity, 0.0, 1.0)
+
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        items: Sequence[Union[Dict[str, Any], Product]],
+        threshold: float = 0.75,
+        limit: int = 5,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Пакетный вариант search() для всех запросов накладной сразу.
+
+        Пары запрос × кандидат оцениваются матричным способом
+        (см. similarity_matrix) вместо поштучных вызовов
+        calculate_string_similarity. Запросы с общими кандидатами (например,
+        все запросы к небольшому каталогу) оцениваются одной матрицей.
+        Каждый запрос учитывает только своих кандидатов, поэтому результат
+        совпадает с search().
+
+        Args:
+            queries: Строки для поиска
+            items: Элементы каталога, по значениям которых построен индекс
+            threshold: Минимальный порог схожести (0-1)
+            limit: Максимальное количество результатов на запрос
+
+        Returns:
+            Список результатов в том же формате, что и search(), по одному на запрос
+        """
+        if not queries:
+            return []
+        if not self.values:
+            return [[] for _ in queries]
+
+        normalized = [query.lower().strip() for query in queries]
+        candidates = [self.candidates(query) for query in normalized]
+        results: List[List[Dict[str, Any]]] = []
+
+        start = 0
+        while start < len(normalized):
+            # Набираем часть запросов с общей матрицей по объединению кандидатов,
+            # пока лишних ячеек (пар вне кандидатов запроса) не больше половины
+            # и матрица не превышает BATCH_MAX_CELLS
+            end = start + 1
+            union = set(candidates[start])
+            useful = len(candidates[start])
+            while end < len(normalized):
+                merged = union.union(candidates[end])
+                cells = (end - start + 1) * len(merged)
+                if cells > BATCH_MAX_CELLS or cells > 2 * (useful + len(candidates[end])):
+                    break
+                union = merged
+                useful += len(candidates[end])
+                end += 1
+
+            columns = sorted(union)
+            column_of = {vid: col for col, vid in enumerate(columns)}
+            matrix = (
+                self.similarity_matrix(normalized[start:end], columns)
+                if columns
+                else np.empty((end - start, 0))
+            )
+            for offset, row_scores in enumerate(matrix):
+                hits: List[Tuple[int, float]] = []
+                for vid in candidates[start + offset]:
+                    score = float(row_scores[column_of[vid]])
+                    if score >= threshold:
+                        hits.extend((row, score) for row in self.rows[vid])
+                results.append(self._collect(hits, items, limit))
+            start = end
+        return results
+
+    @staticmethod
+    def _collect(
+        hits: List[Tuple[int, float]],
+        items: Sequence[Union[Dict[str, Any], Product]],
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Сортирует совпадения как полный перебор и формирует результат."""
+        hits.sort(key=lambda hit: hit[0])
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        results = []
+        for row, score in hits[:limit]:
+            result = item_data(items[row])
+            result["score"] = score
+            results.append(result)
+        return results
+
+
+def get_product_index(
+    items: Sequence[Union[Dict[str, Any], Product]], key: str = "name"
+) -> ProductIndex:
+    """
+    Возвращает индекс для каталога, строя его только при смене содержимого.
+
+    Для списка продуктов общего каталога (app.catalog) ключом кеша служит
+    номер версии каталога. Для произвольных списков — последовательность
+    значений поля key, так что любые изменения автоматически приводят
+    к новому индексу.
+
+    Args:
+        items: Элементы каталога
+        key: Поле, по которому выполняется поиск
+
+    Returns:
+        Экземпляр ProductIndex
+    """
+    values: Optional[Tuple[Any, ...]] = None
+    snapshot = get_catalog().current()
+    if snapshot is not None and items is snapshot.products:
+        cache_key: Tuple[Any, ...] = (key, "catalog", snapshot.version)
+    else:
+        values = tuple(item_value(item, key) for item in items)
+        cache_key = (key, values)
+
+    with _index_cache_lock:
+        index: Optional[ProductIndex] = _index_cache.get(cache_key)
+        if index is not None:
+            _index_cache.move_to_end(cache_key)
+            return index
+
+    if values is None:
+        values = tuple(item_value(item, key) for item in items)
+    index = ProductIndex(values)
+    logger.debug(f"Построен индекс каталога: {len(values)} строк, {len(index)} уникальных значений")
+
+    with _index_cache_lock:
+        _index_cache[cache_key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def clear_index_cache() -> None:
+    """Очищает кеш индексов каталога."""
+    with _index_cache_lock:
+        _index_cache.clear()
@@ -3,7 +3,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
-from app import data_loader
+from app.catalog import reload_catalog
 from app.i18n import t
 
 router = Router()
@@ -15,10 +15,6 @@ async def reload_data(message: Message, state: FSMContext):
     data = await state.get_data()
     lang = data.get("lang", "en")
 
-    # This is a stub: real logic may cache or re-import CSVs
-    (
-        data_loader.load_products.cache_clear()
-        if hasattr(data_loader.load_products, "cache_clear")
-        else None
-    )
+    # Force the shared product catalog to re-read its CSV files
+    reload_catalog()
     await message.answer(t("status.data_reloaded", lang=lang))
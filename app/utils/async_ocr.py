@@ -5,19 +5,34 @@
 
 import asyncio
 import base64
+import io
 import json
 import logging
+import os
 import time
-from typing import Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 import aiohttp
+from PIL import Image
 
+from app.catalog import get_products
 from app.config import settings
-from app.imgprep.prepare import prepare_for_ocr
-from app.models import ParsedData
+from app.imgprep.prepare import prepare_for_vision_async, split_into_strips_async
+from app.imgprep.tiling import expected_tiles, expected_tokens
+from app.models import ParsedData, Position
 from app.ocr_prompt import OCR_SYSTEM_PROMPT
-from app.postprocessing import postprocess_parsed_data
-from app.utils.enhanced_ocr_cache import async_get_from_cache, async_store_in_cache
+from app.postprocessing import postprocess_parsed_data, postprocess_position
+from app.utils.cascade_ocr import get_cascade_ocr
+from app.utils.enhanced_ocr_cache import (
+    async_find_near_duplicate,
+    async_get_from_cache,
+    async_store_in_cache,
+    compute_image_key,
+)
+from app.utils.media_group import merge_album_pages
+from app.utils.monitor import record_histogram
+from app.utils.ocr_scheduler import LANE_PHOTO, QueueCallback, get_ocr_scheduler
+from app.utils.perceptual_hash import Fingerprint, image_fingerprint
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +69,18 @@ INVOICE_FUNCTION_SCHEMA = {
     },
 }
 
+API_URL = "https://api.openai.com/v1/chat/completions"
+
+# Разрезать длинные накладные на полосы и распознавать их параллельно
+SPLIT_MODE = os.getenv("OCR_SPLIT_MODE", "0").lower() in ("1", "true", "yes")
+
+# Отдавать результат похожей (пересжатой) фотографии из кеша. Выключено по
+# умолчанию: похожий снимок может быть другой накладной того же поставщика
+NEAR_DUPLICATE_MODE = os.getenv("OCR_NEAR_DUPLICATES", "0").lower() in ("1", "true", "yes")
+
+# Сначала локальный пайплайн, GPT-4o только при низкой уверенности (app.utils.cascade_ocr)
+CASCADE_MODE = os.getenv("OCR_CASCADE_MODE", "0").lower() in ("1", "true", "yes")
+
 # Таймаут для сессии HTTP по умолчанию
 DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30)  # 30 секунд общий таймаут
 
@@ -61,6 +88,22 @@ DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30)  # 30 секунд общий
 _http_session = None
 
 
+def _record_vision_tiles(req_id: str, image_bytes: bytes) -> None:
+    """Логирует и записывает в метрики ожидаемое число тайлов и токенов изображения"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            width, height = img.size
+    except Exception:
+        return
+    tiles = expected_tiles(width, height)
+    logger.info(
+        f"[{req_id}] Изображение {width}x{height}, {len(image_bytes) // 1024} КБ: "
+        f"{tiles} тайлов, ~{expected_tokens(width, height)} токенов"
+    )
+    record_histogram("ocr_vision_tiles", tiles)
+    record_histogram("ocr_vision_payload_kb", len(image_bytes) / 1024)
+
+
 async def get_http_session() -> aiohttp.ClientSession:
     """
     Получает или создает глобальную HTTP сессию.
@@ -82,55 +125,62 @@ async def close_http_session():
         _http_session = None
 
 
-async def async_ocr(
-    image_bytes: bytes, req_id: Optional[str] = None, use_cache: bool = True, timeout: int = 60
-) -> ParsedData:
+async def _lookup_cache(
+    image_bytes: bytes, req_id: str, cache_key: str
+) -> Tuple[Optional[ParsedData], Optional[Fingerprint]]:
     """
-    Асинхронно выполняет OCR изображения с использованием OpenAI API.
-
-    Args:
-        image_bytes: Байты изображения
-        req_id: ID запроса для логирования
-        use_cache: Использовать ли кеш
-        timeout: Таймаут в секундах
+    Ищет результат OCR в кеше: точное совпадение, затем похожая фотография
+    (только при включенном OCR_NEAR_DUPLICATES).
 
     Returns:
-        ParsedData с результатами распознавания
-
-    Raises:
-        asyncio.TimeoutError: Если распознавание превысило таймаут
-        RuntimeError: При ошибке API или обработки
+        (результат из кеша или None, перцептивный отпечаток для сохранения)
     """
-    req_id = req_id or f"ocr_{int(time.time())}"
-    start_time = time.time()
-    logger.info(f"[{req_id}] Начато асинхронное OCR, таймаут {timeout}с")
+    try:
+        cached_data = await async_get_from_cache(image_bytes, key=cache_key)
+        if cached_data:
+            logger.info(f"[{req_id}] Использован кешированный OCR результат")
+            return cached_data, None
+    except Exception as e:
+        logger.warning(f"[{req_id}] Ошибка при чтении из кеша: {e}")
 
-    # Пробуем получить из кеша
-    if use_cache:
-        try:
-            cached_data = await async_get_from_cache(image_bytes)
-            if cached_data:
-                logger.info(f"[{req_id}] Использован кешированный OCR результат")
-                return cached_data
-        except Exception as e:
-            logger.warning(f"[{req_id}] Ошибка при чтении из кеша: {e}")
+    if not NEAR_DUPLICATE_MODE:
+        return None, None
 
-    # Подготавливаем изображение
+    # Ищем пересжатую копию той же фотографии по перцептивному отпечатку
+    fingerprint = None
     try:
-        # Используем мультипроцессную обработку для оптимизации изображения
         loop = asyncio.get_event_loop()
-        optimized_image = await loop.run_in_executor(None, prepare_for_ocr, image_bytes)
+        fingerprint = await loop.run_in_executor(None, image_fingerprint, image_bytes)
+        if fingerprint is not None:
+            similar_data = await async_find_near_duplicate(fingerprint, key=cache_key)
+            if similar_data:
+                logger.info(f"[{req_id}] Использован OCR результат похожей фотографии")
+                return similar_data, fingerprint
+    except Exception as e:
+        logger.warning(f"[{req_id}] Ошибка поиска похожей фотографии в кеше: {e}")
+    return None, fingerprint
+
+
+async def _build_request(image_bytes: bytes, req_id: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Готовит изображение и формирует заголовки и тело запроса к OpenAI API.
+
+    Raises:
+        RuntimeError: Если нет API ключа
+    """
+    # Подготавливаем изображение
+    try:
+        # Обрезаем поля и подбираем размер под тайлы 512x512 в пуле процессов
+        optimized_image = await prepare_for_vision_async(image_bytes)
         logger.debug(f"[{req_id}] Изображение оптимизировано для OCR")
     except Exception as e:
         logger.warning(f"[{req_id}] Ошибка оптимизации изображения: {e}, используем оригинал")
         optimized_image = image_bytes
+    _record_vision_tiles(req_id, optimized_image)
 
     # Превращаем изображение в base64
     base64_image = base64.b64encode(optimized_image).decode("utf-8")
 
-    # Формируем параметры запроса к API
-    api_url = "https://api.openai.com/v1/chat/completions"
-
     # Используем OPENAI_OCR_KEY, если его нет - OPENAI_API_KEY
     api_key = settings.OPENAI_OCR_KEY
     if not api_key:
@@ -167,6 +217,158 @@ async def async_ocr(
             },
         ],
     }
+    return headers, payload
+
+
+async def _store_result(
+    image_bytes: bytes,
+    data: ParsedData,
+    req_id: str,
+    cache_key: str,
+    fingerprint: Optional[Fingerprint],
+) -> None:
+    """Сохраняет результат OCR в кеш вместе с перцептивным отпечатком"""
+    try:
+        await async_store_in_cache(image_bytes, data, key=cache_key, fingerprint=fingerprint)
+        logger.debug(f"[{req_id}] OCR результат сохранен в кеш")
+    except Exception as e:
+        logger.warning(f"[{req_id}] Ошибка кеширования OCR результата: {e}")
+
+
+async def _ocr_strips(
+    image_bytes: bytes,
+    strips: List[bytes],
+    req_id: Optional[str],
+    use_cache: bool,
+    timeout: int,
+    on_position: Optional[Callable[[Position], Awaitable[None]]],
+    user_id: Optional[int],
+    on_queue: Optional[QueueCallback],
+) -> ParsedData:
+    """
+    Распознает полосы длинной накладной параллельно и объединяет результат.
+
+    Повторы строк на стыках полос удаляются, шапка берется только с верхней
+    полосы. Результат кешируется под ключом исходного изображения.
+    """
+    req_id = req_id or f"ocr_{int(time.time())}"
+    start_time = time.time()
+
+    cache_key = compute_image_key(image_bytes) if use_cache else None
+    fingerprint = None
+    result = None
+    if use_cache:
+        result, fingerprint = await _lookup_cache(image_bytes, req_id, cache_key)
+
+    if result is None:
+        logger.info(f"[{req_id}] Параллельное OCR {len(strips)} полос")
+        pages = await asyncio.gather(
+            *(
+                async_ocr(
+                    strip,
+                    req_id=f"{req_id}_s{number}",
+                    use_cache=False,
+                    timeout=timeout,
+                    user_id=user_id,
+                    on_queue=on_queue,
+                    split=False,
+                    cascade=False,
+                )
+                for number, strip in enumerate(strips, 1)
+            )
+        )
+        result = merge_album_pages(pages, header_from_first_page=True)
+        logger.info(
+            f"[{req_id}] Полосы объединены: {len(result.positions)} позиций "
+            f"за {time.time() - start_time:.2f}с"
+        )
+        if use_cache:
+            await _store_result(image_bytes, result, req_id, cache_key, fingerprint)
+
+    if on_position is not None:
+        for position in result.positions:
+            await on_position(position)
+    return result
+
+
+async def async_ocr(
+    image_bytes: bytes,
+    req_id: Optional[str] = None,
+    use_cache: bool = True,
+    timeout: int = 60,
+    on_position: Optional[Callable[[Position], Awaitable[None]]] = None,
+    user_id: Optional[int] = None,
+    on_queue: Optional[QueueCallback] = None,
+    split: Optional[bool] = None,
+    cascade: Optional[bool] = None,
+) -> ParsedData:
+    """
+    Асинхронно выполняет OCR изображения с использованием OpenAI API.
+
+    Args:
+        image_bytes: Байты изображения
+        req_id: ID запроса для логирования
+        use_cache: Использовать ли кеш
+        timeout: Таймаут в секундах
+        on_position: Колбэк для каждой позиции по мере генерации ответа;
+            если задан, используется потоковый режим (async_ocr_stream)
+        user_id: Пользователь для честной очереди планировщика запросов
+        on_queue: Колбэк с позицией в очереди, если все слоты заняты
+        split: Разрезать длинную накладную на полосы и распознавать их
+            параллельно (по умолчанию — OCR_SPLIT_MODE)
+        cascade: Сначала распознать локально (PaddleOCR) и обращаться к
+            GPT-4o только при низкой уверенности (по умолчанию — OCR_CASCADE_MODE)
+
+    Returns:
+        ParsedData с результатами распознавания
+
+    Raises:
+        asyncio.TimeoutError: Если распознавание превысило таймаут
+        RuntimeError: При ошибке API или обработки
+    """
+    if cascade if cascade is not None else CASCADE_MODE:
+        return await get_cascade_ocr().recognize(
+            image_bytes,
+            req_id=req_id,
+            use_cache=use_cache,
+            timeout=timeout,
+            on_position=on_position,
+            user_id=user_id,
+            on_queue=on_queue,
+            split=split,
+        )
+
+    if split if split is not None else SPLIT_MODE:
+        strips = await split_into_strips_async(image_bytes)
+        if len(strips) > 1:
+            return await _ocr_strips(
+                image_bytes, strips, req_id, use_cache, timeout, on_position, user_id, on_queue
+            )
+
+    if on_position is not None:
+        result = None
+        async for item in async_ocr_stream(
+            image_bytes, req_id, use_cache, timeout, user_id=user_id, on_queue=on_queue
+        ):
+            if isinstance(item, ParsedData):
+                result = item
+            else:
+                await on_position(item)
+        return result
+
+    req_id = req_id or f"ocr_{int(time.time())}"
+    start_time = time.time()
+    logger.info(f"[{req_id}] Начато асинхронное OCR, таймаут {timeout}с")
+
+    # Пробуем получить из кеша (ключ вычисляется один раз на запрос)
+    cache_key = compute_image_key(image_bytes) if use_cache else None
+    fingerprint = None
+    if use_cache:
+        cached_data, fingerprint = await _lookup_cache(image_bytes, req_id, cache_key)
+        if cached_data:
+            return cached_data
+
+    headers, payload = await _build_request(image_bytes, req_id)
 
     # Создаем задачу с таймаутом
     try:
@@ -177,10 +379,10 @@ async def async_ocr(
         # Создаем сессию с таймаутом для этого конкретного запроса
         request_timeout = aiohttp.ClientTimeout(total=timeout)
 
-        # Выполняем запрос с таймаутом
+        # Выполняем запрос с таймаутом в слоте глобального планировщика
         try:
-            async with session.post(
-                api_url, json=payload, headers=headers, timeout=request_timeout
+            async with get_ocr_scheduler().slot(LANE_PHOTO, user_id, on_queue), session.post(
+                API_URL, json=payload, headers=headers, timeout=request_timeout
             ) as response:
                 if response.status != 200:
                     error_text = await response.text()
@@ -255,11 +457,7 @@ async def async_ocr(
 
         # Кешируем результат
         if use_cache:
-            try:
-                await async_store_in_cache(image_bytes, processed_data)
-                logger.debug(f"[{req_id}] OCR результат сохранен в кеш")
-            except Exception as e:
-                logger.warning(f"[{req_id}] Ошибка кеширования OCR результата: {e}")
+            await _store_result(image_bytes, processed_data, req_id, cache_key, fingerprint)
 
         # Логируем общее время обработки
         total_duration = time.time() - start_time
@@ -273,3 +471,244 @@ async def async_ocr(
     except Exception as e:
         logger.error(f"[{req_id}] Ошибка OCR: {str(e)}")
         raise RuntimeError(f"Ошибка извлечения данных из изображения: {str(e)}")
+
+
+class PositionStreamParser:
+    """
+    Инкрементальный разбор аргументов tool call get_parsed_invoice.
+
+    Аргументы приходят кусками (delta) произвольной длины. Парсер хранит
+    состояние сканирования (стек скобок, строки, экранирование) и возвращает
+    каждый элемент массива positions, как только закрывается его объект.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._scanned = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._key: Optional[str] = None
+        self._in_positions = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Добавляет очередной кусок аргументов.
+
+        Args:
+            chunk: Дельта аргументов из потока
+
+        Returns:
+            Список позиций (dict), завершенных в этом куске
+        """
+        self.buffer += chunk
+        buf = self.buffer
+        items = []
+        for i in range(self._scanned, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._string_start + 1 : i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and len(self._stack) == 1:
+                # Ключ верхнего уровня: positions, supplier, date...
+                self._key = self._last_string
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "[" and len(self._stack) == 2 and self._key == "positions":
+                    self._in_positions = True
+                elif ch == "{" and self._in_positions and len(self._stack) == 3:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._item_start is not None and len(self._stack) == 3:
+                    try:
+                        items.append(json.loads(buf[self._item_start : i + 1]))
+                    except ValueError as e:
+                        logger.debug(f"Не удалось разобрать позицию из потока: {e}")
+                    self._item_start = None
+                elif ch == "]" and len(self._stack) == 2:
+                    self._in_positions = False
+                if self._stack:
+                    self._stack.pop()
+        self._scanned = len(buf)
+        return items
+
+
+async def async_ocr_stream(
+    image_bytes: bytes,
+    req_id: Optional[str] = None,
+    use_cache: bool = True,
+    timeout: int = 60,
+    user_id: Optional[int] = None,
+    on_queue: Optional[QueueCallback] = None,
+) -> AsyncIterator[Union[Position, ParsedData]]:
+    """
+    Потоковый OCR: позиции выдаются по мере генерации ответа GPT-4o.
+
+    Запрос выполняется с stream=True, дельты аргументов tool call разбирает
+    PositionStreamParser. Каждая завершенная позиция сразу проходит
+    постобработку и выдается вызывающему, поэтому сопоставление и UI могут
+    начинаться до окончания генерации. Последним элементом выдается итоговый
+    ParsedData — тот же, что вернул бы async_ocr.
+
+    Args:
+        image_bytes: Байты изображения
+        req_id: ID запроса для логирования
+        use_cache: Использовать ли кеш
+        timeout: Таймаут в секундах
+        user_id: Пользователь для честной очереди планировщика запросов
+        on_queue: Колбэк с позицией в очереди, если все слоты заняты
+
+    Yields:
+        Position для каждой распознанной позиции, затем ParsedData
+
+    Raises:
+        asyncio.TimeoutError: Если распознавание превысило таймаут
+        RuntimeError: При ошибке API или обработки
+    """
+    req_id = req_id or f"ocr_{int(time.time())}"
+    start_time = time.time()
+    logger.info(f"[{req_id}] Начато потоковое OCR, таймаут {timeout}с")
+
+    cache_key = compute_image_key(image_bytes) if use_cache else None
+    fingerprint = None
+    if use_cache:
+        cached_data, fingerprint = await _lookup_cache(image_bytes, req_id, cache_key)
+        if cached_data:
+            for position in cached_data.positions:
+                yield position
+            yield cached_data
+            return
+
+    headers, payload = await _build_request(image_bytes, req_id)
+    payload["stream"] = True
+
+    # Каталог загружается до потока; позиции корректируются по его индексу,
+    # закешированному по версии каталога (allowed_names=None), а не по списку
+    # названий, который пришлось бы заново собирать для каждой позиции
+    allowed_names: Optional[List[str]] = None
+    try:
+        get_products()
+    except Exception as e:
+        logger.warning(f"[{req_id}] Не удалось загрузить каталог для автокоррекции: {e}")
+        allowed_names = []
+
+    parser = PositionStreamParser()
+    streamed: List[Position] = []
+    raw_count = 0
+    stream_consistent = True
+    # Позиции из потока; None — поток дочитан (или чтение завершилось ошибкой)
+    queue: "asyncio.Queue[Optional[Position]]" = asyncio.Queue()
+
+    async def read_stream() -> None:
+        """Читает ответ в слоте планировщика; слот не ждет потребителя позиций"""
+        nonlocal raw_count, stream_consistent
+        session = await get_http_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout)
+        try:
+            async with get_ocr_scheduler().slot(LANE_PHOTO, user_id, on_queue), session.post(
+                API_URL, json=payload, headers=headers, timeout=request_timeout
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"[{req_id}] API вернул ошибку: {response.status} {error_text}")
+                    raise RuntimeError(f"OCR API вернул ошибку: {response.status}")
+
+                # Server-sent events: строки "data: {...}", в конце "data: [DONE]"
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+
+                    choices = json.loads(data).get("choices") or [{}]
+                    for tool_call in choices[0].get("delta", {}).get("tool_calls") or []:
+                        function = tool_call.get("function") or {}
+                        name = function.get("name")
+                        if name and name != "get_parsed_invoice":
+                            raise ValueError(f"Неожиданное имя функции: {name}")
+
+                        for item in parser.feed(function.get("arguments") or ""):
+                            raw_count += 1
+                            try:
+                                raw_position = Position.model_validate(item)
+                            except Exception as e:
+                                logger.warning(f"[{req_id}] Некорректная позиция в потоке: {e}")
+                                stream_consistent = False
+                                continue
+                            position = postprocess_position(raw_position, allowed_names, req_id)
+                            if position is None:
+                                continue
+                            if not streamed:
+                                first_position = time.time() - start_time
+                                logger.info(
+                                    f"[{req_id}] Первая позиция получена за {first_position:.2f}с"
+                                )
+                                record_histogram("ocr_first_position_seconds", first_position)
+                            streamed.append(position)
+                            queue.put_nowait(position)
+        finally:
+            queue.put_nowait(None)
+
+    try:
+        # Позиции выдаются вне слота: медленный потребитель (отправка сообщений,
+        # сопоставление) не держит слот планировщика занятым
+        reader = asyncio.create_task(read_stream())
+        try:
+            while True:
+                queued = await queue.get()
+                if queued is None:
+                    break
+                yield queued
+            await reader
+        except asyncio.TimeoutError:
+            logger.error(f"[{req_id}] OCR API вызов превысил таймаут {timeout}с")
+            raise asyncio.TimeoutError(f"OCR операция превысила таймаут {timeout}с")
+        finally:
+            if not reader.done():
+                # Потребитель прервал поток: запрос отменяется, слот освобождается
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+
+        if not parser.buffer:
+            raise ValueError("Ответ не содержит результат функции")
+        result_data = json.loads(parser.buffer)
+        logger.info(
+            f"[{req_id}] Потоковый ответ получен: {len(parser.buffer)} символов, "
+            f"{len(streamed)} позиций"
+        )
+
+        if stream_consistent and raw_count == len(result_data.get("positions") or []):
+            parsed_data = ParsedData.model_validate({**result_data, "positions": []})
+            processed_data = postprocess_parsed_data(
+                parsed_data, req_id, processed_positions=streamed
+            )
+        else:
+            # Поток разобран не полностью — итог строится по полному JSON
+            logger.warning(f"[{req_id}] Позиции потока не совпали с итоговым JSON")
+            processed_data = postprocess_parsed_data(ParsedData.model_validate(result_data), req_id)
+
+        if use_cache:
+            await _store_result(image_bytes, processed_data, req_id, cache_key, fingerprint)
+
+        logger.info(f"[{req_id}] Общее время потокового OCR: {time.time() - start_time:.2f}с")
+        yield processed_data
+
+    except asyncio.TimeoutError:
+        logger.error(f"[{req_id}] OCR превысил таймаут {timeout}с")
+        raise asyncio.TimeoutError(f"OCR операция превысила таймаут {timeout}с")
+    except Exception as e:
+        logger.error(f"[{req_id}] Ошибка OCR: {str(e)}")
+        raise RuntimeError(f"Ошибка извлечения данных из изображения: {str(e)}")
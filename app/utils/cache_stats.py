@@ -55,6 +55,18 @@ class OCRCacheStatsProvider(BaseCacheStatsProvider):
         }
 
 
+class OCRResultCacheStatsProvider(BaseCacheStatsProvider):
+    """Провайдер статистики для многоуровневого кеша результатов OCR."""
+    
+    def __init__(self):
+        super().__init__("ocr_result_cache")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        from app.utils.enhanced_ocr_cache import get_ocr_result_cache
+        
+        return get_ocr_result_cache().get_stats()
+
+
 class StringCacheStatsProvider(BaseCacheStatsProvider):
     """Провайдер статистики для строкового кеша."""
     
@@ -162,6 +174,9 @@ def get_cache_stats_summary() -> Dict[str, Any]:
         # Для разных типов кешей используем разные поля
         if cache_name == "ocr_cache":
             total_entries += stats.get("total_entries", 0)
+        elif cache_name == "ocr_result_cache":
+            total_entries += stats.get("memory_entries", 0)
+            total_max_size += stats.get("max_size", 0)
         elif cache_name in ["string_cache", "data_cache"]:
             if cache_name == "string_cache":
                 total_entries += stats.get("size", 0)
@@ -185,6 +200,11 @@ def _auto_register_providers():
     except ImportError:
         pass
     
+    try:
+        register_cache_provider(OCRResultCacheStatsProvider())
+    except ImportError:
+        pass
+    
     try:
         register_cache_provider(StringCacheStatsProvider())
     except ImportError:
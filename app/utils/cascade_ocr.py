@@ -0,0 +1,535 @@
+"""
+Каскадный OCR: сначала локальный пайплайн, GPT-4o только при низкой уверенности.
+
+Все фотографии раньше сразу уходили в GPT-4o (async_ocr). В каскадном
+режиме страница сначала распознается PaddleOCR построчно: если по якорям
+заголовка определен известный поставщик, позиции собираются по колонкам
+его шаблона (app.utils.supplier_templates). Иначе накладная распознается
+локальным пайплайном (OCRPipelineOptimized:
+PP-Structure + PaddleOCR, сомнительные ячейки — коллажами в GPT-4o), затем
+оценивается уверенность во всей накладной:
+
+- арифметика строк по результатам ArithmeticValidator: строка без
+  замечаний с qty, price и amount — 1, исправленная валидатором — 0.5,
+  с ошибкой или неполная — 0;
+- средняя уверенность распознавания ячеек.
+
+Включается в async_ocr переменной OCR_CASCADE_MODE или параметром cascade.
+Если уверенность ниже CASCADE_THRESHOLD (или локальный пайплайн не нашел
+таблицу), накладная распознается GPT-4o целиком, как раньше.
+
+Шапку (поставщик, дата) локальные уровни не распознают: параллельно с ними
+верх страницы уходит в GPT-4o в низком разрешении (read_invoice_header,
+~85 токенов изображения и короткий ответ). Если поставщик или дата так и
+не найдены, накладная распознается GPT-4o целиком.
+
+Результат каскада кешируется как результат GPT-4o: повторная фотография
+не проходит локальные уровни заново.
+"""
+
+import asyncio
+import base64
+import datetime
+import io
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import get_ocr_client
+from app.models import ParsedData, Position
+from app.ocr_helpers import create_chat_completion
+from app.postprocessing import postprocess_parsed_data
+from app.utils.data_utils import clean_number
+from app.utils.engine_registry import get_engine, get_engine_registry
+from app.utils.enhanced_ocr_cache import (
+    async_get_from_cache,
+    async_store_in_cache,
+    compute_image_key,
+)
+from app.utils.monitor import increment_counter, record_histogram
+from app.utils.ocr_scheduler import QueueCallback
+from app.utils.supplier_templates import decode_page, get_template_store, page_text_lines
+
+logger = logging.getLogger(__name__)
+
+# Порог уверенности накладной и веса ее составляющих
+CASCADE_THRESHOLD = float(os.getenv("OCR_CASCADE_THRESHOLD", "0.85"))
+ARITHMETIC_WEIGHT = 0.6
+CELL_CONFIDENCE_WEIGHT = 0.4
+
+# Уровень шаблонов поставщиков
+CASCADE_TEMPLATES = os.getenv("OCR_CASCADE_TEMPLATES", "1").lower() in ("1", "true", "yes")
+
+# Язык локальной модели PaddleOCR
+CASCADE_PADDLE_LANG = os.getenv("OCR_CASCADE_PADDLE_LANG", "en")
+
+TIER_TEMPLATE = "template"
+TIER_LOCAL = "local"
+TIER_GPT4O = "gpt4o"
+
+# Замечания валидатора по строке и их оценка
+_LINE_ERRORS = ("ARITHMETIC_ERROR", "VALIDATION_ERROR")
+_LINE_FIXES = ("ARITHMETIC_FIX",)
+
+# Доля высоты страницы с шапкой и ее размер для запроса в низком разрешении
+HEADER_CROP = float(os.getenv("OCR_CASCADE_HEADER_CROP", "0.35"))
+HEADER_SIZE = 512
+
+HEADER_SYSTEM_PROMPT = "You read the header of a supplier invoice. Reply with JSON only."
+
+HEADER_PROMPT = (
+    "The image is the top of a supplier invoice. Return a JSON object "
+    '{"supplier": "<supplier company name>", "date": "<invoice date as YYYY-MM-DD>"}. '
+    "Use null for a field that is not visible."
+)
+
+RemoteOCR = Callable[..., Awaitable[ParsedData]]
+HeaderReader = Callable[[bytes], Awaitable[Dict[str, Any]]]
+
+
+def score_local_result(result: Dict[str, Any]) -> Tuple[float, Dict[str, float]]:
+    """
+    Оценивает уверенность в накладной, распознанной локально.
+
+    Args:
+        result: Результат OCRPipelineOptimized.process_image
+
+    Returns:
+        (уверенность 0..1, составляющие: arithmetic, cell_confidence, lines)
+    """
+    lines = result.get("lines") or []
+    if result.get("status") not in ("success", "warning") or not lines:
+        return 0.0, {"arithmetic": 0.0, "cell_confidence": 0.0, "lines": len(lines)}
+
+    line_scores = [1.0] * len(lines)
+    for index, line in enumerate(lines):
+        values = [clean_number(line.get(field, 0)) for field in ("qty", "price", "amount")]
+        if not str(line.get("name") or "").strip() or any(not value for value in values):
+            line_scores[index] = 0.0
+
+    for issue in result.get("issues") or []:
+        if not isinstance(issue, dict):
+            continue
+        line_index = issue.get("line")
+        if not isinstance(line_index, int) or not 0 <= line_index < len(lines):
+            continue
+        if issue.get("type") in _LINE_ERRORS:
+            line_scores[line_index] = 0.0
+        elif issue.get("type") in _LINE_FIXES:
+            line_scores[line_index] = min(line_scores[line_index], 0.5)
+
+    arithmetic = sum(line_scores) / len(line_scores)
+    metrics = result.get("metrics") or {}
+    cell_confidence = float(metrics.get("cell_confidence") or 0.0)
+    score = ARITHMETIC_WEIGHT * arithmetic + CELL_CONFIDENCE_WEIGHT * cell_confidence
+    return round(score, 3), {
+        "arithmetic": round(arithmetic, 3),
+        "cell_confidence": round(cell_confidence, 3),
+        "lines": len(lines),
+    }
+
+
+def header_image(image_bytes: bytes) -> bytes:
+    """Верх страницы в JPEG не больше HEADER_SIZE по длинной стороне"""
+    from app.imgprep.tiling import load_upright
+
+    img = load_upright(image_bytes)
+    width, height = img.size
+    header = img.crop((0, 0, width, max(1, int(height * HEADER_CROP))))
+    header.thumbnail((HEADER_SIZE, HEADER_SIZE))
+    buffer = io.BytesIO()
+    header.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def parse_header_answer(content: Optional[str]) -> Dict[str, Any]:
+    """
+    Ответ на запрос шапки в {"supplier": str или None, "date": date или None}.
+
+    Неразборчивая дата и пустой поставщик считаются ненайденными.
+    """
+    try:
+        answer = json.loads(content or "")
+    except ValueError:
+        answer = None
+    if not isinstance(answer, dict):
+        return {"supplier": None, "date": None}
+
+    supplier = answer.get("supplier")
+    supplier = supplier.strip() if isinstance(supplier, str) and supplier.strip() else None
+    date = None
+    if isinstance(answer.get("date"), str):
+        try:
+            date = datetime.date.fromisoformat(answer["date"].strip())
+        except ValueError:
+            date = None
+    return {"supplier": supplier, "date": date}
+
+
+async def read_invoice_header(image_bytes: bytes) -> Dict[str, Any]:
+    """
+    Читает поставщика и дату по верху страницы одним дешевым запросом.
+
+    Returns:
+        {"supplier": str или None, "date": datetime.date или None}
+    """
+    client = get_ocr_client()
+    if not client or not hasattr(client, "chat"):
+        return {"supplier": None, "date": None}
+
+    image = await asyncio.to_thread(header_image, image_bytes)
+    b64_image = base64.b64encode(image).decode("utf-8")
+    response = await create_chat_completion(
+        client,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": HEADER_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": HEADER_PROMPT},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{b64_image}",
+                            "detail": "low",
+                        },
+                    },
+                ],
+            },
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=60,
+        temperature=0.0,
+    )
+    return parse_header_answer(response.choices[0].message.content)
+
+
+def template_result_to_parsed_data(match: Dict[str, Any]) -> ParsedData:
+    """Позиции, извлеченные по шаблону поставщика, в ParsedData"""
+    positions = [
+        Position(
+            name=item["name"],
+            qty=item["qty"],
+            unit=item.get("unit"),
+            price=item.get("price"),
+            total_price=item.get("total_price"),
+        )
+        for item in match["positions"]
+    ]
+    total = sum(position.total_price or 0 for position in positions)
+    return postprocess_parsed_data(
+        ParsedData(supplier=match["supplier"], positions=positions, total_price=total or None)
+    )
+
+
+def local_result_to_parsed_data(result: Dict[str, Any]) -> ParsedData:
+    """Строки локального пайплайна (name/qty/unit/price/amount) в ParsedData"""
+    positions: List[Position] = []
+    for line in result.get("lines") or []:
+        name = str(line.get("name") or "").strip()
+        if not name:
+            continue
+        price = clean_number(line.get("price", 0))
+        amount = clean_number(line.get("amount", 0))
+        positions.append(
+            Position(
+                name=name,
+                qty=clean_number(line.get("qty", 0)) or 0.0,
+                unit=line.get("unit") or None,
+                price=price or None,
+                total_price=amount or None,
+            )
+        )
+    total = sum(position.total_price or 0 for position in positions)
+    return postprocess_parsed_data(ParsedData(positions=positions, total_price=total or None))
+
+
+class CascadeOCR:
+    """
+    Локальный пайплайн с переходом на GPT-4o по порогу уверенности.
+
+    Считает долю накладных, обошедшихся без GPT-4o, и задержку каждого
+    уровня (также в app.utils.monitor: ocr_cascade_total, ocr_cascade_tier_seconds).
+    """
+
+    def __init__(
+        self,
+        remote_ocr: Optional[RemoteOCR] = None,
+        threshold: float = CASCADE_THRESHOLD,
+        paddle_ocr_lang: str = CASCADE_PADDLE_LANG,
+        templates: bool = CASCADE_TEMPLATES,
+        header_reader: Optional[HeaderReader] = None,
+    ):
+        self.remote_ocr = remote_ocr
+        self.header_reader = header_reader or read_invoice_header
+        self.threshold = threshold
+        self.paddle_ocr_lang = paddle_ocr_lang
+        self.templates = templates
+
+        # Статистика (local_only — накладные без GPT-4o, в том числе по шаблону)
+        self.total = 0
+        self.local_only = 0
+        self.template_hits = 0
+        self.escalated = 0
+        self.cache_hits = 0
+        self.header_misses = 0
+        tiers = (TIER_TEMPLATE, TIER_LOCAL, TIER_GPT4O)
+        self.tier_seconds: Dict[str, float] = {tier: 0.0 for tier in tiers}
+        self.tier_calls: Dict[str, int] = {tier: 0 for tier in tiers}
+
+    def _pipeline(self) -> Any:
+        # Импорт здесь: ocr_pipeline_optimized сам импортирует async_ocr
+        from app.ocr_pipeline_optimized import OCRPipelineOptimized
+
+        return get_engine(
+            "cascade_pipeline",
+            OCRPipelineOptimized,
+            paddle_ocr_lang=self.paddle_ocr_lang,
+            fallback_to_vision=False,
+        )
+
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        Создает и прогревает локальный пайплайн каскада до первой накладной.
+
+        Блокирующий вызов: запускать при старте или из потока, не из event loop.
+
+        Returns:
+            Статистика реестра движков (время создания и прогрева)
+        """
+        self._pipeline().warm_up()
+        return get_engine_registry().get_stats()
+
+    def _remote(self) -> RemoteOCR:
+        if self.remote_ocr is None:
+            from app.utils.async_ocr import async_ocr
+
+            return async_ocr
+        return self.remote_ocr
+
+    def _record_tier(self, tier: str, seconds: float) -> None:
+        self.tier_seconds[tier] += seconds
+        self.tier_calls[tier] += 1
+        record_histogram("ocr_cascade_tier_seconds", seconds, {"tier": tier})
+
+    async def run_template(self, image_bytes: bytes, req_id: str) -> Optional[ParsedData]:
+        """
+        Уровень шаблонов: PaddleOCR по всей странице и колонки шаблона поставщика.
+
+        Текстовые блоки страницы запоминаются под req_id, чтобы обучить
+        шаблон, когда пользователь подтвердит накладную.
+
+        Returns:
+            ParsedData или None, если поставщик не определен или результат
+            отклонен
+        """
+        start = time.perf_counter()
+        match = None
+        try:
+            page = await asyncio.to_thread(decode_page, image_bytes)
+            ocr_result = await self._pipeline().paddle_pool.ocr(page, cls=True)
+            lines = page_text_lines(ocr_result)
+            width = float(page.shape[1])
+            store = get_template_store()
+            store.remember_page(req_id, lines, width)
+            match = store.recognize(lines, width)
+        except Exception as e:
+            logger.warning(f"[{req_id}] Уровень шаблонов не выполнен: {e}")
+        finally:
+            self._record_tier(TIER_TEMPLATE, time.perf_counter() - start)
+
+        if match is None:
+            return None
+        try:
+            return template_result_to_parsed_data(match)
+        except Exception as e:
+            logger.warning(f"[{req_id}] Результат по шаблону не преобразован: {e}")
+            return None
+
+    async def run_local(
+        self, image_bytes: bytes, req_id: str, use_cache: bool = True
+    ) -> Tuple[Optional[ParsedData], float, Dict[str, float]]:
+        """
+        Локальный уровень каскада.
+
+        Returns:
+            (ParsedData или None, если таблица не распознана; уверенность;
+            составляющие уверенности)
+        """
+        start = time.perf_counter()
+        try:
+            result = await self._pipeline().process_image(
+                image_bytes, lang=[self.paddle_ocr_lang], use_cache=use_cache
+            )
+        except Exception as e:
+            logger.warning(f"[{req_id}] Локальный OCR не удался: {e}")
+            result = {"status": "error"}
+        finally:
+            self._record_tier(TIER_LOCAL, time.perf_counter() - start)
+
+        score, parts = score_local_result(result)
+        if score <= 0:
+            return None, score, parts
+        try:
+            return local_result_to_parsed_data(result), score, parts
+        except Exception as e:
+            logger.warning(f"[{req_id}] Результат локального OCR не преобразован: {e}")
+            return None, 0.0, parts
+
+    async def recognize(
+        self,
+        image_bytes: bytes,
+        req_id: Optional[str] = None,
+        use_cache: bool = True,
+        timeout: int = 60,
+        on_position: Optional[Callable[[Position], Awaitable[None]]] = None,
+        user_id: Optional[int] = None,
+        on_queue: Optional[QueueCallback] = None,
+        split: Optional[bool] = None,
+    ) -> ParsedData:
+        """
+        Распознает накладную каскадом; параметры как у async_ocr.
+
+        Returns:
+            ParsedData локального уровня или GPT-4o
+        """
+        req_id = req_id or f"ocr_{int(time.time())}"
+        cache_key = compute_image_key(image_bytes) if use_cache else None
+        if cache_key is not None:
+            cached = await async_get_from_cache(image_bytes, key=cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                logger.info(f"[{req_id}] Каскад: результат из кеша")
+                await self._emit(cached, on_position)
+                return cached
+
+        self.total += 1
+        score: float = 0.0
+        parts: Dict[str, float] = {}
+        header = asyncio.create_task(self._read_header(image_bytes, req_id))
+        try:
+            local = await self.run_template(image_bytes, req_id) if self.templates else None
+            if local is not None:
+                # Шаблон узнал поставщика: без даты накладная уходит сразу в GPT-4o
+                accepted = await self._with_header(local, header, req_id)
+                if accepted is not None:
+                    self.local_only += 1
+                    self.template_hits += 1
+                    increment_counter("ocr_cascade_total", {"tier": TIER_TEMPLATE})
+                    logger.info(
+                        f"[{req_id}] Каскад: позиции по шаблону {accepted.supplier}, "
+                        f"{len(accepted.positions)} позиций"
+                    )
+                    return await self._accept(image_bytes, accepted, cache_key, on_position)
+            else:
+                local, score, parts = await self.run_local(image_bytes, req_id, use_cache)
+                if local is not None and score >= self.threshold:
+                    accepted = await self._with_header(local, header, req_id)
+                    if accepted is not None:
+                        self.local_only += 1
+                        increment_counter("ocr_cascade_total", {"tier": TIER_LOCAL})
+                        logger.info(
+                            f"[{req_id}] Каскад: локальный OCR принят "
+                            f"(уверенность {score}, {parts}), {len(accepted.positions)} позиций"
+                        )
+                        return await self._accept(image_bytes, accepted, cache_key, on_position)
+        finally:
+            header.cancel()
+
+        self.escalated += 1
+        increment_counter("ocr_cascade_total", {"tier": TIER_GPT4O})
+        logger.info(
+            f"[{req_id}] Каскад: уверенность {score} (порог {self.threshold}, {parts}), GPT-4o"
+        )
+        start = time.perf_counter()
+        try:
+            return await self._remote()(
+                image_bytes,
+                req_id=req_id,
+                use_cache=use_cache,
+                timeout=timeout,
+                on_position=on_position,
+                user_id=user_id,
+                on_queue=on_queue,
+                split=split,
+                cascade=False,
+            )
+        finally:
+            self._record_tier(TIER_GPT4O, time.perf_counter() - start)
+
+    async def _read_header(self, image_bytes: bytes, req_id: str) -> Dict[str, Any]:
+        try:
+            return await self.header_reader(image_bytes)
+        except Exception as e:
+            logger.warning(f"[{req_id}] Шапка накладной не прочитана: {e}")
+            return {"supplier": None, "date": None}
+
+    async def _with_header(
+        self, data: ParsedData, header: "asyncio.Task[Dict[str, Any]]", req_id: str
+    ) -> Optional[ParsedData]:
+        """
+        Дополняет локальный результат поставщиком и датой из шапки.
+
+        Returns:
+            ParsedData или None, если поставщик или дата не найдены
+            (накладная уходит в GPT-4o целиком)
+        """
+        fields = await header
+        supplier = data.supplier or fields.get("supplier")
+        date = data.date or fields.get("date")
+        if not supplier or not date:
+            self.header_misses += 1
+            logger.info(f"[{req_id}] Каскад: в шапке нет поставщика или даты, GPT-4o")
+            return None
+        return data.model_copy(update={"supplier": supplier, "date": date})
+
+    async def _accept(
+        self,
+        image_bytes: bytes,
+        data: ParsedData,
+        cache_key: Optional[str],
+        on_position: Optional[Callable[[Position], Awaitable[None]]],
+    ) -> ParsedData:
+        if cache_key is not None:
+            await async_store_in_cache(image_bytes, data, key=cache_key)
+        await self._emit(data, on_position)
+        return data
+
+    @staticmethod
+    async def _emit(
+        data: ParsedData, on_position: Optional[Callable[[Position], Awaitable[None]]]
+    ) -> None:
+        if on_position is not None:
+            for position in data.positions:
+                await on_position(position)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика каскада для мониторинга"""
+        return {
+            "total": self.total,
+            "local_only": self.local_only,
+            "template_hits": self.template_hits,
+            "escalated": self.escalated,
+            "cache_hits": self.cache_hits,
+            "header_misses": self.header_misses,
+            "local_only_rate": round(self.local_only / self.total, 3) if self.total else 0.0,
+            "avg_tier_seconds": {
+                tier: round(self.tier_seconds[tier] / calls, 3) if calls else 0.0
+                for tier, calls in self.tier_calls.items()
+            },
+        }
+
+
+# Глобальный каскад для async_ocr
+_cascade_ocr: Optional[CascadeOCR] = None
+
+
+def get_cascade_ocr() -> CascadeOCR:
+    """Возвращает глобальный каскад OCR"""
+    global _cascade_ocr
+    if _cascade_ocr is None:
+        _cascade_ocr = CascadeOCR()
+    return _cascade_ocr
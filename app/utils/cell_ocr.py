@@ -0,0 +1,244 @@
+"""
+Пакетное распознавание ячеек таблицы через GPT-4o.
+
+Ячейки с низкой уверенностью PaddleOCR раньше отправлялись в GPT-4o
+по одной: таблица на 50 ячеек с 30% сомнительных давала 15 запросов.
+CellRecognizer собирает ячейки, пока они продолжают поступать (пачки
+PaddleOCR завершаются не одновременно), в пронумерованный коллаж
+(app.imgprep.collage) и распознает их одним запросом с ответом в JSON
+{"1": "...", ...}.
+Ячейки без ответа, а также все ячейки при ошибке запроса распознаются
+по одной (process_cell_with_gpt4o).
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import get_ocr_client
+from app.imgprep.collage import build_collage
+from app.ocr_helpers import create_chat_completion, process_cell_with_gpt4o
+
+logger = logging.getLogger(__name__)
+
+# Максимум ячеек в одном коллаже
+CELL_BATCH_SIZE = int(os.getenv("OCR_CELL_BATCH_SIZE", "24"))
+
+# Пачка уходит, если новых ячеек нет CELL_BATCH_WINDOW секунд,
+# но не позже CELL_BATCH_MAX_WAIT секунд после первой ячейки
+CELL_BATCH_WINDOW = float(os.getenv("OCR_CELL_BATCH_WINDOW", "0.25"))
+CELL_BATCH_MAX_WAIT = float(os.getenv("OCR_CELL_BATCH_MAX_WAIT", "1.0"))
+
+COLLAGE_SYSTEM_PROMPT = (
+    "You read text from table cells of a supplier invoice. Reply with JSON only."
+)
+
+COLLAGE_PROMPT = (
+    "The image is a column of {count} table cells. Each cell is numbered on the left "
+    "in red (#1 to #{count}); the number is not part of the cell text. "
+    "Return a JSON object mapping each cell number to the exact text in that cell, "
+    'for example {{"1": "Tomato", "2": "1.5"}}. Use "" for an empty cell.'
+)
+
+SingleCellRecognizer = Callable[[Any], Awaitable[Tuple[str, float]]]
+
+
+def parse_collage_answer(content: Optional[str], count: int) -> Dict[int, str]:
+    """
+    Разбирает ответ модели на коллаж.
+
+    Args:
+        content: JSON-ответ модели
+        count: Число ячеек в коллаже
+
+    Returns:
+        {номер ячейки (с 1): текст}; ячейки без ответа отсутствуют
+    """
+    if not content:
+        return {}
+    text = content.strip()
+    # Ответ в блоке ```json ... ```
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        logger.warning(f"Ответ на коллаж ячеек не JSON: {content[:100]}")
+        return {}
+    if isinstance(data, dict) and isinstance(data.get("cells"), (dict, list)):
+        data = data["cells"]
+    if isinstance(data, list):
+        data = {str(number): value for number, value in enumerate(data, 1)}
+    if not isinstance(data, dict):
+        return {}
+
+    answers: Dict[int, str] = {}
+    for key, value in data.items():
+        try:
+            number = int(str(key).lstrip("#"))
+        except ValueError:
+            continue
+        if 1 <= number <= count and isinstance(value, (str, int, float)):
+            answers[number] = str(value).strip()
+    return answers
+
+
+class CellRecognizer:
+    """
+    Собирает ячейки в пачки и распознает каждую пачку одним запросом.
+
+    Пачка отправляется, когда набралось CELL_BATCH_SIZE ячеек, новых ячеек
+    нет window секунд или с первой ячейки прошло max_wait секунд.
+    """
+
+    def __init__(
+        self,
+        single_cell: SingleCellRecognizer = process_cell_with_gpt4o,
+        batch_size: int = CELL_BATCH_SIZE,
+        window: float = CELL_BATCH_WINDOW,
+        max_wait: float = CELL_BATCH_MAX_WAIT,
+    ):
+        self.single_cell = single_cell
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self.max_wait = max(window, max_wait)
+
+        # Ожидающие ячейки по event loop: [(изображение, future)], таймер
+        # отправки и время первой ячейки пачки
+        self._pending: Dict[asyncio.AbstractEventLoop, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._started: Dict[asyncio.AbstractEventLoop, float] = {}
+        self._tasks: set = set()
+
+        # Статистика
+        self.collage_requests = 0
+        self.single_requests = 0
+        self.cells = 0
+
+    async def recognize(self, image: Any) -> Tuple[str, float]:
+        """
+        Распознает ячейку (в пачке с другими ячейками окна).
+
+        Args:
+            image: Изображение ячейки (байты или массив NumPy)
+
+        Returns:
+            (текст, уверенность); ("", 0.0), если распознать не удалось
+        """
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Tuple[str, float]]" = loop.create_future()
+        pending = self._pending.setdefault(loop, [])
+        pending.append((image, future))
+        if len(pending) >= self.batch_size:
+            self._flush(loop)
+        else:
+            # Каждая новая ячейка откладывает отправку на window секунд
+            now = loop.time()
+            deadline = min(now + self.window, self._started.setdefault(loop, now) + self.max_wait)
+            timer = self._timers.pop(loop, None)
+            if timer is not None:
+                timer.cancel()
+            self._timers[loop] = loop.call_at(deadline, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        self._started.pop(loop, None)
+        batch = [item for item in self._pending.pop(loop, []) if not item[1].done()]
+        if not batch:
+            return
+        task = loop.create_task(self._run_batch(batch))
+        # Держим ссылку, чтобы задачу не собрал GC
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.cells += len(batch)
+        answers: Dict[int, str] = {}
+        if len(batch) > 1:
+            try:
+                answers = await self._recognize_collage([image for image, _ in batch])
+            except Exception as e:
+                logger.warning(f"Коллаж из {len(batch)} ячеек не распознан: {e}")
+
+        for index, (_, future) in enumerate(batch):
+            if index in answers and not future.done():
+                future.set_result((answers[index], 1.0))
+
+        leftovers = [(image, future) for image, future in batch if not future.done()]
+        if leftovers:
+            if len(batch) > 1:
+                logger.info(f"Распознаем по одной {len(leftovers)} из {len(batch)} ячеек")
+            await asyncio.gather(
+                *(self._recognize_single(image, future) for image, future in leftovers)
+            )
+
+    async def _recognize_single(self, image: Any, future: asyncio.Future) -> None:
+        self.single_requests += 1
+        try:
+            result = await self.single_cell(image)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _recognize_collage(self, images: List[Any]) -> Dict[int, str]:
+        """
+        Распознает ячейки одним запросом.
+
+        Returns:
+            {индекс в images: текст} для ячеек, на которые модель ответила
+        """
+        client = get_ocr_client()
+        if not client or not hasattr(client, "chat"):
+            return {}
+
+        loop = asyncio.get_running_loop()
+        collage, included = await loop.run_in_executor(None, build_collage, images)
+        if not included:
+            return {}
+
+        b64_image = base64.b64encode(collage).decode("utf-8")
+        self.collage_requests += 1
+        response = await create_chat_completion(
+            client,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": COLLAGE_SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": COLLAGE_PROMPT.format(count=len(included))},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{b64_image}",
+                                "detail": "high",
+                            },
+                        },
+                    ],
+                },
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=40 * len(included) + 50,
+            temperature=0.0,
+        )
+        numbered = parse_collage_answer(response.choices[0].message.content, len(included))
+        return {included[number - 1]: text for number, text in numbered.items()}
+
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика запросов для мониторинга"""
+        return {
+            "cells": self.cells,
+            "collage_requests": self.collage_requests,
+            "single_requests": self.single_requests,
+        }
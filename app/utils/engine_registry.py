@@ -0,0 +1,143 @@
+"""
+Реестр прогретых движков OCR на процесс.
+
+OCRPipelineOptimized раньше создавал свою модель PaddleOCR и пул воркеров
+на каждый экземпляр, а на каждое изображение — новый детектор таблиц
+(с PP-Structure внутри) и новый ValidationPipeline. Реестр создает каждый
+движок один раз на процесс, прогоняет через него пустое изображение
+(веса загружаются и предиктор прогревается до первого запроса) и дальше
+отдает тот же экземпляр.
+
+Ключ движка — имя, фабрика и ее параметры: PaddleOCR с другим языком или
+подмененная в тестах фабрика дают отдельный экземпляр.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WarmUp = Callable[[Any], None]
+EngineKey = Tuple[str, Any, Tuple[Tuple[str, Hashable], ...]]
+
+
+class EngineRegistry:
+    """
+    Экземпляры движков, созданные один раз и переиспользуемые.
+
+    Создание движка под блокировкой его ключа: параллельные первые запросы
+    ждут одну модель, а не загружают несколько.
+    """
+
+    def __init__(self) -> None:
+        self._engines: Dict[EngineKey, Any] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[EngineKey, threading.Lock] = {}
+        # Стоимость создания и прогрева по имени движка
+        self._init_stats: Dict[str, Dict[str, float]] = {}
+
+        # Статистика
+        self.created = 0
+        self.hits = 0
+
+    def get(
+        self,
+        name: str,
+        factory: Callable[..., Any],
+        warm: Optional[WarmUp] = None,
+        **kwargs: Hashable,
+    ) -> Any:
+        """
+        Возвращает движок, создавая и прогревая его при первом обращении.
+
+        Args:
+            name: Имя движка для статистики и логов
+            factory: Класс или функция, создающая движок
+            warm: Прогрев нового движка (ошибка прогрева не критична)
+            **kwargs: Параметры фабрики (часть ключа)
+
+        Returns:
+            Экземпляр движка
+        """
+        key: EngineKey = (name, factory, tuple(sorted(kwargs.items())))
+        engine = self._engines.get(key)
+        if engine is not None:
+            self.hits += 1
+            return engine
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self.hits += 1
+                return engine
+
+            start = time.perf_counter()
+            engine = factory(**kwargs)
+            create_ms = (time.perf_counter() - start) * 1000
+
+            warm_ms = 0.0
+            if warm is not None:
+                start = time.perf_counter()
+                try:
+                    warm(engine)
+                except Exception as e:
+                    logger.warning(f"Прогрев движка {name} не удался (не критично): {e}")
+                warm_ms = (time.perf_counter() - start) * 1000
+
+            self._engines[key] = engine
+            self.created += 1
+            self._init_stats[name] = {
+                "create_ms": round(create_ms, 1),
+                "warm_ms": round(warm_ms, 1),
+            }
+            logger.info(
+                f"[ENGINE] {name} создан за {create_ms:.0f} мс, прогрет за {warm_ms:.0f} мс"
+            )
+        return engine
+
+    def clear(self) -> None:
+        """Забывает все движки; у движков с shutdown() он вызывается"""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._key_locks.clear()
+            self._init_stats.clear()
+        for engine in engines:
+            shutdown = getattr(engine, "shutdown", None)
+            if callable(shutdown):
+                try:
+                    shutdown()
+                except Exception as e:
+                    logger.debug(f"Ошибка остановки движка: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика реестра для мониторинга"""
+        return {
+            "engines": len(self._engines),
+            "created": self.created,
+            "hits": self.hits,
+            "init": {name: dict(stats) for name, stats in self._init_stats.items()},
+        }
+
+
+# Глобальный реестр движков
+_engine_registry: Optional[EngineRegistry] = None
+
+
+def get_engine_registry() -> EngineRegistry:
+    """Возвращает глобальный реестр движков"""
+    global _engine_registry
+    if _engine_registry is None:
+        _engine_registry = EngineRegistry()
+    return _engine_registry
+
+
+def get_engine(
+    name: str, factory: Callable[..., Any], warm: Optional[WarmUp] = None, **kwargs: Hashable
+) -> Any:
+    """Движок из глобального реестра (см. EngineRegistry.get)"""
+    return get_engine_registry().get(name, factory, warm=warm, **kwargs)
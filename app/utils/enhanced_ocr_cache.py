@@ -1,17 +1,52 @@
 """
 Enhanced OCR caching with support for both sync and async operations.
+
+Кеш результатов OCR адресуется содержимым изображения и состоит из трех уровней:
+- in-memory LRU с TTL (микросекунды, живет в процессе)
+- Redis (общий для процессов, если доступен)
+- необязательный дисковый кеш, переживающий перезапуск (OCR_CACHE_DIR)
+
+Ключ вычисляется один раз на запрос функцией compute_image_key (BLAKE2b)
+и может передаваться в get/store, чтобы не хешировать изображение повторно.
+
+Рядом с каждым результатом хранится перцептивный отпечаток фотографии
+(app.utils.perceptual_hash), по которому находятся пересжатые копии
+той же накладной, не совпадающие побайтно. В async_ocr такой поиск
+включается переменной OCR_NEAR_DUPLICATES.
 """
 
+import asyncio
 import hashlib
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import date
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from app.models import ParsedData
+from app.utils.perceptual_hash import (
+    Fingerprint,
+    PerceptualIndex,
+    fingerprint_from_str,
+    fingerprint_to_str,
+)
 
 logger = logging.getLogger(__name__)
 
+# Настройки кеша
+MEMORY_CACHE_SIZE = int(os.getenv("OCR_CACHE_MEMORY_SIZE", "256"))
+CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(7 * 24 * 60 * 60)))  # 7 дней
+CACHE_DIR = os.getenv("OCR_CACHE_DIR", "")  # Пустая строка отключает дисковый кеш
+REDIS_KEY_PREFIX = "ocr_result:"
+REDIS_FINGERPRINTS_KEY = "ocr_result_fingerprints"
+FINGERPRINTS_FILE = "fingerprints.tsv"
+# Сохраненные отпечатки переписываются, когда записей становится во столько раз
+# больше, чем вмещает индекс
+FINGERPRINTS_COMPACT_FACTOR = 2
+
 
 class DateJSONEncoder(json.JSONEncoder):
     """JSON encoder that can handle dates."""
@@ -22,6 +57,24 @@ class DateJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+def compute_image_key(image_bytes: Union[str, bytes]) -> str:
+    """
+    Вычисляет ключ кеша по содержимому изображения.
+
+    BLAKE2b с 128-битным дайджестом быстрее MD5 и SHA-256 на больших
+    фотографиях и используется всеми OCR-кешами приложения.
+
+    Args:
+        image_bytes: Raw image bytes or base64 string
+
+    Returns:
+        Hex-строка из 32 символов
+    """
+    if isinstance(image_bytes, str):
+        image_bytes = image_bytes.encode("utf-8")
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
 def _compute_cache_key(image_bytes: Union[str, bytes]) -> str:
     """
     Compute cache key for image data.
@@ -32,11 +85,7 @@ def _compute_cache_key(image_bytes: Union[str, bytes]) -> str:
     Returns:
         Cache key string
     """
-    if isinstance(image_bytes, str):
-        data = image_bytes.encode("utf-8")
-    else:
-        data = image_bytes
-    return hashlib.sha256(data).hexdigest()
+    return compute_image_key(image_bytes)
 
 
 def _serialize_parsed_data(data: ParsedData) -> str:
@@ -70,63 +119,462 @@ def _deserialize_parsed_data(data_str: str) -> Optional[ParsedData]:
         return None
 
 
-def get_from_cache(image_bytes: bytes) -> Optional[ParsedData]:
+class OCRResultCache:
+    """
+    Трехуровневый кеш результатов OCR.
+
+    Чтение идет по уровням memory -> Redis -> disk; найденное в медленном
+    уровне поднимается в память. Запись идет во все включенные уровни.
+    Из кеша всегда возвращается копия ParsedData, чтобы правки накладной
+    пользователем не портили закешированный результат.
+
+    Отпечатки фотографий хранятся в PerceptualIndex и дублируются в Redis
+    и на диск, чтобы поиск похожих снимков работал после перезапуска.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MEMORY_CACHE_SIZE,
+        ttl: int = CACHE_TTL,
+        cache_dir: Optional[str] = CACHE_DIR,
+        use_redis: bool = True,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_dir = cache_dir or None
+        self.use_redis = use_redis
+        self._memory: "OrderedDict[str, Tuple[ParsedData, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.fingerprints = PerceptualIndex()
+        self._fingerprints_loaded = False
+        self._fingerprint_lines = 0
+        self._stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "disk_hits": 0,
+            "near_duplicate_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "errors": 0,
+        }
+
+    # --- статистика ---
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict[str, object]:
+        """Возвращает счетчики попаданий/промахов и размер памяти"""
+        with self._lock:
+            stats: Dict[str, object] = dict(self._stats)
+            hits = self._stats["memory_hits"] + self._stats["redis_hits"] + self._stats["disk_hits"]
+            total = hits + self._stats["misses"]
+            stats["hits"] = hits
+            stats["hit_rate_percent"] = round(hits / total * 100, 2) if total else 0
+            stats["api_calls_avoided"] = hits + self._stats["near_duplicate_hits"]
+            stats["memory_entries"] = len(self._memory)
+            stats["fingerprints"] = len(self.fingerprints)
+            stats["max_size"] = self.max_size
+            stats["cache_ttl_hours"] = self.ttl / 3600
+            stats["redis_enabled"] = self.use_redis
+            stats["disk_enabled"] = self.cache_dir is not None
+            return stats
+
+    def clear(self) -> None:
+        """Очищает память и счетчики (Redis и диск не трогает)"""
+        with self._lock:
+            self._memory.clear()
+            self.fingerprints.clear()
+            self._fingerprints_loaded = False
+            self._fingerprint_lines = 0
+            for name in self._stats:
+                self._stats[name] = 0
+
+    # --- уровень памяти ---
+
+    def get_memory(self, key: str) -> Optional[ParsedData]:
+        """Ищет результат только в памяти (без промаха в статистике)"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            data, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._stats["memory_hits"] += 1
+        return data.model_copy(deep=True)
+
+    def _put_memory(self, key: str, data: ParsedData, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._memory[key] = (data, stored_at or time.time())
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    # --- уровень Redis ---
+
+    def _redis(self):
+        if not self.use_redis:
+            return None
+        from app.utils.redis_cache import get_redis
+
+        return get_redis()
+
+    def _get_redis(self, key: str) -> Optional[str]:
+        r = self._redis()
+        if r is None:
+            return None
+        try:
+            return r.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Ошибка чтения OCR кеша из Redis: {e}")
+            return None
+
+    def _set_redis(self, key: str, serialized: str) -> None:
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            r.set(REDIS_KEY_PREFIX + key, serialized, ex=self.ttl)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Ошибка записи OCR кеша в Redis: {e}")
+
+    # --- дисковый уровень ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self._count("errors")
+            logger.warning(f"Ошибка чтения дискового OCR кеша: {e}")
+            return None
+
+    def _set_disk(self, key: str, serialized: str) -> None:
+        if self.cache_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(serialized)
+            # Атомарная подмена: читатели не увидят недописанный файл
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._count("errors")
+            logger.warning(f"Ошибка записи дискового OCR кеша: {e}")
+
+    # --- перцептивные отпечатки ---
+
+    def _load_fingerprints(self) -> None:
+        """Однократно подгружает отпечатки, сохраненные в Redis и на диске"""
+        if self._fingerprints_loaded:
+            return
+        self._fingerprints_loaded = True
+
+        stored: Dict[str, str] = {}
+        if self.cache_dir is not None:
+            try:
+                with open(os.path.join(self.cache_dir, FINGERPRINTS_FILE), encoding="utf-8") as f:
+                    for line in f:
+                        key, _, value = line.strip().partition("\t")
+                        stored[key] = value
+                        self._fingerprint_lines += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self._count("errors")
+                logger.warning(f"Ошибка чтения отпечатков OCR кеша: {e}")
+
+        r = self._redis()
+        if r is not None:
+            try:
+                stored.update(r.hgetall(REDIS_FINGERPRINTS_KEY) or {})
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"Ошибка чтения отпечатков OCR кеша из Redis: {e}")
+
+        for key, value in stored.items():
+            fingerprint = fingerprint_from_str(value)
+            if fingerprint is not None and key not in self.fingerprints:
+                self.fingerprints.add(key, fingerprint)
+
+    def store_fingerprint(self, key: str, fingerprint: Fingerprint) -> None:
+        """Запоминает отпечаток фотографии результата key (блокирующий ввод-вывод)"""
+        self._load_fingerprints()
+        self.fingerprints.add(key, fingerprint)
+        value = fingerprint_to_str(fingerprint)
+        limit = self.fingerprints.max_size * FINGERPRINTS_COMPACT_FACTOR
+
+        r = self._redis()
+        if r is not None:
+            try:
+                r.hset(REDIS_FINGERPRINTS_KEY, key, value)
+                if r.hlen(REDIS_FINGERPRINTS_KEY) > limit:
+                    # Оставляем только отпечатки, которые еще есть в индексе
+                    stored = r.hkeys(REDIS_FINGERPRINTS_KEY)
+                    stale = [k for k in stored if k not in self.fingerprints]
+                    if stale:
+                        r.hdel(REDIS_FINGERPRINTS_KEY, *stale)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"Ошибка записи отпечатка OCR кеша в Redis: {e}")
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, FINGERPRINTS_FILE)
+            try:
+                with self._lock:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(f"{key}\t{value}\n")
+                    self._fingerprint_lines += 1
+                    if self._fingerprint_lines > limit:
+                        self._compact_fingerprints(path)
+            except OSError as e:
+                self._count("errors")
+                logger.warning(f"Ошибка записи отпечатка OCR кеша: {e}")
+
+    def _live_fingerprints(self) -> List[Tuple[str, Fingerprint]]:
+        """Отпечатки индекса, чьи результаты еще лежат на диске и не истекли по TTL"""
+        now = time.time()
+        live = []
+        for key, fingerprint in self.fingerprints.items():
+            try:
+                expired = now - os.path.getmtime(self._disk_path(key)) > self.ttl
+            except OSError:
+                expired = True  # результат удален с диска
+            if expired:
+                self.fingerprints.remove(key)
+            else:
+                live.append((key, fingerprint))
+        return live
+
+    def _compact_fingerprints(self, path: str) -> None:
+        """Переписывает файл отпечатков: только живые записи индекса, без дублей"""
+        live = self._live_fingerprints()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, fingerprint in live:
+                f.write(f"{key}\t{fingerprint_to_str(fingerprint)}\n")
+        os.replace(tmp_path, path)
+        self._fingerprint_lines = len(live)
+        logger.debug(f"Файл отпечатков OCR кеша сжат до {len(live)} записей")
+
+    def find_near_duplicate(
+        self, fingerprint: Fingerprint, key: Optional[str] = None
+    ) -> Optional[ParsedData]:
+        """
+        Ищет результат для почти такой же фотографии (блокирующий ввод-вывод).
+
+        Args:
+            fingerprint: Отпечаток новой фотографии
+            key: Ключ новой фотографии; найденный результат кешируется и под ним
+
+        Returns:
+            Копия ParsedData или None
+        """
+        self._load_fingerprints()
+        match = self.fingerprints.find(fingerprint)
+        if match is None:
+            return None
+
+        similar_key, distance = match
+        data = self._peek(similar_key)
+        if data is None:
+            # Результат вытеснен из всех уровней — отпечаток больше не нужен
+            self.fingerprints.remove(similar_key)
+            return None
+
+        self._count("near_duplicate_hits")
+        logger.info(
+            f"OCR cache near-duplicate {similar_key[:8]} (distance {distance})"
+            + (f" for key {key[:8]}" if key else "")
+        )
+        if key is not None:
+            self._put_memory(key, data)
+        return data.model_copy(deep=True)
+
+    def _peek(self, key: str) -> Optional[ParsedData]:
+        """Читает результат из любого уровня, не меняя счетчики"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                return entry[0]
+        for reader in (self._get_redis, self._get_disk):
+            serialized = reader(key)
+            if serialized is not None:
+                data = _deserialize_parsed_data(serialized)
+                if data is not None:
+                    self._put_memory(key, data)
+                    return data
+        return None
+
+    # --- общий интерфейс ---
+
+    def get_slow(self, key: str) -> Optional[ParsedData]:
+        """
+        Ищет результат в Redis и на диске (блокирующий ввод-вывод).
+
+        Найденный результат поднимается в память, а с диска — еще и в Redis.
+        """
+        for tier, reader in (("redis", self._get_redis), ("disk", self._get_disk)):
+            serialized = reader(key)
+            if serialized is None:
+                continue
+            data = _deserialize_parsed_data(serialized)
+            if data is None:
+                continue
+            if tier == "disk":
+                self._set_redis(key, serialized)
+            self._put_memory(key, data)
+            self._count(f"{tier}_hits")
+            return data.model_copy(deep=True)
+
+        self._count("misses")
+        return None
+
+    def get(self, key: str) -> Optional[ParsedData]:
+        """Ищет результат во всех уровнях кеша"""
+        data = self.get_memory(key)
+        if data is not None:
+            return data
+        return self.get_slow(key)
+
+    def store_memory(self, key: str, data: ParsedData) -> ParsedData:
+        """Кладет копию результата в память и возвращает ее"""
+        data = data.model_copy(deep=True)
+        self._put_memory(key, data)
+        self._count("stores")
+        return data
+
+    def store_slow(self, key: str, data: ParsedData) -> None:
+        """Сохраняет результат в Redis и на диск (блокирующий ввод-вывод)"""
+        if not self.use_redis and self.cache_dir is None:
+            return
+        serialized = _serialize_parsed_data(data)
+        self._set_redis(key, serialized)
+        self._set_disk(key, serialized)
+
+    def set(self, key: str, data: ParsedData) -> None:
+        """Сохраняет результат во все уровни кеша"""
+        self.store_slow(key, self.store_memory(key, data))
+
+
+# Общий кеш процесса
+_ocr_result_cache = OCRResultCache()
+
+
+def get_ocr_result_cache() -> OCRResultCache:
+    """Возвращает общий экземпляр кеша результатов OCR"""
+    return _ocr_result_cache
+
+
+def get_from_cache(image_bytes: bytes, key: Optional[str] = None) -> Optional[ParsedData]:
     """
     Получает данные из кэша по ключу, вычисленному из байтов изображения
     """
     try:
-        key = _compute_cache_key(image_bytes)
-        logger.info(f"Looking up cache with key: {key}")
-        # Implementation of actual cache retrieval goes here
-        # This is just a placeholder
-        return None
+        key = key or compute_image_key(image_bytes)
+        data = _ocr_result_cache.get(key)
+        if data is not None:
+            logger.info(f"OCR cache hit for key {key[:8]}")
+        return data
     except Exception as e:
         logger.error(f"Error retrieving from cache: {e}")
         return None
 
 
-def store_in_cache(image_bytes: bytes, data: ParsedData) -> None:
+def store_in_cache(
+    image_bytes: bytes,
+    data: ParsedData,
+    key: Optional[str] = None,
+    fingerprint: Optional[Fingerprint] = None,
+) -> None:
     """
     Сохраняет данные в кэш с ключом, вычисленным из байтов изображения
     """
     try:
-        key = _compute_cache_key(image_bytes)
-        serialized = _serialize_parsed_data(data)
-        # Implementation of actual cache storage goes here
-        # This is just a placeholder
-        logger.info(f"Stored data in cache with key {key}, serialized size: {len(serialized)}")
+        key = key or compute_image_key(image_bytes)
+        _ocr_result_cache.set(key, data)
+        if fingerprint is not None:
+            _ocr_result_cache.store_fingerprint(key, fingerprint)
+        logger.info(f"Stored OCR result in cache with key {key[:8]}")
     except Exception as e:
         logger.error(f"Error storing in cache: {e}")
 
 
-async def async_get_from_cache(image_bytes: bytes) -> Optional[ParsedData]:
+async def async_get_from_cache(
+    image_bytes: bytes, key: Optional[str] = None
+) -> Optional[ParsedData]:
     """
-    Асинхронно получает данные из кэша
+    Асинхронно получает данные из кэша.
+
+    Память проверяется сразу, Redis и диск — в пуле потоков, чтобы
+    не блокировать event loop.
     """
     try:
-        key = _compute_cache_key(image_bytes)
-        # Implementation of actual async cache retrieval goes here
-        # This is just a placeholder
-        logger.info(f"Async cache lookup for key: {key}")
-        return None
+        key = key or compute_image_key(image_bytes)
+        data = _ocr_result_cache.get_memory(key)
+        if data is None:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, _ocr_result_cache.get_slow, key)
+        if data is not None:
+            logger.info(f"Async OCR cache hit for key {key[:8]}")
+        return data
     except Exception as e:
         logger.error(f"Error in async cache retrieval: {e}")
         return None
 
 
-async def async_store_in_cache(image_bytes: bytes, data: ParsedData) -> None:
+async def async_find_near_duplicate(
+    fingerprint: Fingerprint, key: Optional[str] = None
+) -> Optional[ParsedData]:
     """
-    Асинхронно сохраняет данные в кэш
+    Асинхронно ищет результат OCR для почти такой же фотографии
     """
     try:
-        key = _compute_cache_key(image_bytes)
-        serialized = _serialize_parsed_data(data)
-        # Implementation of actual async cache storage goes here
-        # This is just a placeholder
-        logger.info(
-            f"Async stored data in cache with key {key}, serialized size: {len(serialized)}"
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, _ocr_result_cache.find_near_duplicate, fingerprint, key
         )
     except Exception as e:
-        logger.error(f"Error in async cache storage: {e}")
+        logger.error(f"Error in near-duplicate cache lookup: {e}")
+        return None
+
 
-        logger.error(f"Async cache write error: {e}")
+async def async_store_in_cache(
+    image_bytes: bytes,
+    data: ParsedData,
+    key: Optional[str] = None,
+    fingerprint: Optional[Fingerprint] = None,
+) -> None:
+    """
+    Асинхронно сохраняет данные в кэш
+    """
+    try:
+        key = key or compute_image_key(image_bytes)
+        stored = _ocr_result_cache.store_memory(key, data)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _ocr_result_cache.store_slow, key, stored)
+        if fingerprint is not None:
+            await loop.run_in_executor(None, _ocr_result_cache.store_fingerprint, key, fingerprint)
+        logger.info(f"Async stored OCR result in cache with key {key[:8]}")
+    except Exception as e:
+        logger.error(f"Error in async cache storage: {e}")
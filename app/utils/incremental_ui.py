@@ -96,6 +96,7 @@ class IncrementalUI:
         self._spinner_running = False
         self._theme = "default"
         self._start_time = None
+        self._last_progress_update = 0.0
 
     async def start(self, initial_text: str = "Starting...") -> None:
         """
@@ -133,6 +134,28 @@ class IncrementalUI:
         except Exception as e:
             logger.warning(f"Update failed: {e}")
 
+    async def update_progress(self, text: str, min_interval: float = 1.0) -> None:
+        """
+        Updates a frequently changing status line (e.g. a growing item count).
+
+        While the spinner is running, the text is picked up by its next frame.
+        Otherwise edits are throttled to one per min_interval seconds to stay
+        within Telegram rate limits.
+
+        Args:
+            text: New message text
+            min_interval: Minimum interval between message edits in seconds
+        """
+        self.text = text
+        if self._spinner_running:
+            return
+
+        now = time.time()
+        if now - self._last_progress_update < min_interval:
+            return
+        self._last_progress_update = now
+        await self.update(text)
+
     async def append(self, new_text: str) -> None:
         """
         Appends new text to existing message.
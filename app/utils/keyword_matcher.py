@@ -0,0 +1,183 @@
+"""
+Скомпилированный поиск ключевых слов категорий в названиях продуктов.
+
+Нормализация единиц (app.postprocessing) и контекстная проверка цен
+(app.validators.context_validator) определяют категорию продукта по
+словарю "категория -> ключевые слова". Раньше для каждой строки накладной
+перебирались все ключевые слова всех категорий с проверкой подстрок.
+
+KeywordMatcher строит по словарю один раз автомат Ахо-Корасик (ключевые
+слова, входящие в название), индекс подстрок ключевых слов (название,
+входящее в ключевое слово) и индекс слов (пересечение по словам). Поиск
+категории занимает O(len(name)), а результат запоминается по названию.
+Побеждает первое в порядке словаря совпавшее ключевое слово — так же,
+как при полном переборе.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Сколько названий продуктов запоминать в каждом матчере
+MEMO_SIZE: int = 4096
+# Сколько матчеров держать в кеше get_keyword_matcher
+MATCHER_CACHE_SIZE: int = 8
+
+# Приоритет "нет совпадения" (больше любого порядкового номера ключевого слова)
+NO_MATCH = float("inf")
+
+_matcher_cache: "OrderedDict[Tuple[Tuple[str, Tuple[str, ...]], ...], KeywordMatcher]" = (
+    OrderedDict()
+)
+_matcher_cache_lock = threading.Lock()
+
+
+class KeywordMatcher:
+    """
+    Поиск категории по ключевым словам за один проход по названию.
+
+    Приоритет ключевого слова — его порядковый номер в словаре (категории
+    и слова в исходном порядке). Из всех совпавших ключевых слов выбирается
+    слово с наименьшим приоритетом, поэтому результат совпадает с перебором
+    категорий и их слов по порядку до первого совпадения.
+    """
+
+    def __init__(self, groups: Mapping[str, Iterable[str]], memo_size: int = MEMO_SIZE):
+        self.keywords: List[str] = []
+        self.groups: List[str] = []
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                self.keywords.append(keyword.lower())
+                self.groups.append(group)
+
+        # Автомат Ахо-Корасик: переходы, суффиксные ссылки и наименьший
+        # приоритет ключевого слова, оканчивающегося в узле (с учетом суффиксов)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._best: List[float] = [NO_MATCH]
+        for priority, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                child = self._goto[node].get(char)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][char] = child
+                    self._goto.append({})
+                    self._best.append(NO_MATCH)
+                node = child
+            self._best[node] = min(self._best[node], priority)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                if node:
+                    fallback = self._fail[node]
+                    while fallback and char not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    self._fail[child] = self._goto[fallback].get(char, 0)
+                self._best[child] = min(self._best[child], self._best[self._fail[child]])
+
+        # Подстроки ключевых слов (включая пустую) -> наименьший приоритет
+        self._substrings: Dict[str, int] = {}
+        # Слово -> приоритеты ключевых слов, в которые оно входит
+        self._words: Dict[str, List[int]] = {}
+        self._word_counts: List[int] = []
+        for priority, keyword in enumerate(self.keywords):
+            for start in range(len(keyword) + 1):
+                for end in range(start, len(keyword) + 1):
+                    self._substrings.setdefault(keyword[start:end], priority)
+            words = set(keyword.split())
+            self._word_counts.append(len(words))
+            for word in words:
+                self._words.setdefault(word, []).append(priority)
+
+        self.categorize = lru_cache(maxsize=memo_size)(self._categorize)
+
+    def _contained(self, text: str) -> float:
+        """Наименьший приоритет ключевого слова, входящего в text"""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        best = best_at[0]
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if best_at[node] < best:
+                best = best_at[node]
+        return best
+
+    def _word_overlap(self, text: str, min_ratio: float) -> float:
+        """Наименьший приоритет ключевого слова с долей общих слов не меньше min_ratio"""
+        words = set(text.split())
+        if not words:
+            return NO_MATCH
+
+        overlaps: Dict[int, int] = {}
+        for word in words:
+            for priority in self._words.get(word, ()):
+                overlaps[priority] = overlaps.get(priority, 0) + 1
+
+        best = NO_MATCH
+        for priority, overlap in overlaps.items():
+            min_words = min(len(words), self._word_counts[priority])
+            if priority < best and overlap / min_words >= min_ratio:
+                best = priority
+        return best
+
+    def _categorize(
+        self, text: str, reverse: bool = False, min_word_ratio: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        Категория первого ключевого слова, совпавшего с text.
+
+        Ключевое слово совпадает, если входит в text, а при reverse — также
+        если text входит в него. Если совпадений нет и задан min_word_ratio,
+        выбирается первое ключевое слово, у которого доля общих с text слов
+        (от меньшего из двух количеств слов) не меньше min_word_ratio.
+
+        Результат запоминается по аргументам (метод categorize).
+
+        Args:
+            text: Название продукта в нижнем регистре
+            reverse: Учитывать вхождение text в ключевое слово
+            min_word_ratio: Порог пересечения по словам (None — не проверять)
+
+        Returns:
+            Категория или None
+        """
+        best = self._contained(text)
+        if reverse:
+            best = min(best, self._substrings.get(text, NO_MATCH))
+        if best == NO_MATCH and min_word_ratio is not None:
+            best = self._word_overlap(text, min_word_ratio)
+        if best == NO_MATCH:
+            return None
+        return self.groups[int(best)]
+
+
+def get_keyword_matcher(groups: Mapping[str, Iterable[str]]) -> KeywordMatcher:
+    """
+    Возвращает матчер для словаря категорий, строя его только при смене словаря.
+
+    Args:
+        groups: Упорядоченный словарь "категория -> ключевые слова"
+
+    Returns:
+        Экземпляр KeywordMatcher
+    """
+    key = tuple((group, tuple(keywords)) for group, keywords in groups.items())
+    with _matcher_cache_lock:
+        matcher = _matcher_cache.get(key)
+        if matcher is not None:
+            _matcher_cache.move_to_end(key)
+            return matcher
+
+    matcher = KeywordMatcher(dict(key))
+    with _matcher_cache_lock:
+        _matcher_cache[key] = matcher
+        while len(_matcher_cache) > MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    return matcher
@@ -0,0 +1,155 @@
+"""
+Альбомы Telegram (media group) с многостраничными накладными.
+
+Telegram доставляет каждую фотографию альбома отдельным сообщением с общим
+media_group_id. MediaGroupCollector собирает их в одну группу, а
+merge_album_pages объединяет результаты OCR страниц в одну накладную.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.models import ParsedData, Position
+
+logger = logging.getLogger(__name__)
+
+# Пауза без новых фотографий, после которой альбом считается полученным
+ALBUM_COLLECT_DELAY = float(os.getenv("ALBUM_COLLECT_DELAY", "0.8"))
+
+# Telegram допускает до 10 элементов в альбоме
+MAX_ALBUM_SIZE = 10
+
+# Сколько строк на стыке страниц проверяется на повтор
+MAX_PAGE_OVERLAP = 5
+
+# Допуск при сверке итоговой суммы с суммой позиций
+TOTAL_TOLERANCE = 0.02
+
+
+class MediaGroupCollector:
+    """
+    Собирает сообщения одного альбома.
+
+    Первое сообщение группы ждет, пока новые фотографии перестанут
+    поступать (ALBUM_COLLECT_DELAY), и получает весь альбом; остальные
+    сообщения только добавляются в группу и получают None.
+    """
+
+    def __init__(self, delay: float = ALBUM_COLLECT_DELAY):
+        self.delay = delay
+        self._groups: Dict[Hashable, List[Any]] = {}
+        self._updated: Dict[Hashable, float] = {}
+
+    async def collect(self, message: Any) -> Optional[List[Any]]:
+        """
+        Добавляет сообщение в его альбом.
+
+        Args:
+            message: Сообщение с media_group_id
+
+        Returns:
+            Все сообщения альбома в порядке отправки для первого сообщения
+            группы, None для остальных
+        """
+        group_id = message.media_group_id
+        if group_id in self._groups:
+            if len(self._groups[group_id]) < MAX_ALBUM_SIZE:
+                self._groups[group_id].append(message)
+            self._updated[group_id] = time.monotonic()
+            return None
+
+        self._groups[group_id] = [message]
+        self._updated[group_id] = time.monotonic()
+        try:
+            while True:
+                remaining = self._updated[group_id] + self.delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            messages = self._groups.pop(group_id)
+            del self._updated[group_id]
+
+        logger.info(f"Альбом {group_id} собран: {len(messages)} фото")
+        return sorted(messages, key=lambda m: m.message_id)
+
+
+def _position_key(position: Position) -> Tuple:
+    """Ключ сравнения строк на стыке страниц"""
+    name = " ".join((position.name or "").lower().split())
+    return (name, position.qty, position.total_price or position.price)
+
+
+def _page_overlap(previous: Sequence[Position], current: Sequence[Position]) -> int:
+    """Количество первых строк страницы, повторяющих последние строки предыдущей"""
+    limit = min(len(previous), len(current), MAX_PAGE_OVERLAP)
+    for size in range(limit, 0, -1):
+        tail = [_position_key(p) for p in previous[-size:]]
+        head = [_position_key(p) for p in current[:size]]
+        if tail == head:
+            return size
+    return 0
+
+
+def _close(value: float, expected: float) -> bool:
+    return expected > 0 and abs(value - expected) <= expected * TOTAL_TOLERANCE
+
+
+def _merged_total(pages: Sequence[ParsedData], positions: Sequence[Position]) -> Optional[float]:
+    """
+    Итоговая сумма накладной по итогам страниц.
+
+    Общий итог обычно напечатан на последней странице; если же на каждой
+    странице свой подытог, их сумма совпадает с суммой позиций.
+    """
+    positions_sum = sum(p.total_price or 0 for p in positions)
+    page_totals = [page.total_price for page in pages if page.total_price]
+    if not page_totals:
+        return positions_sum or None
+    if _close(page_totals[-1], positions_sum):
+        return page_totals[-1]
+    if len(page_totals) > 1 and _close(sum(page_totals), positions_sum):
+        return sum(page_totals)
+    return page_totals[-1]
+
+
+def merge_album_pages(
+    pages: Sequence[ParsedData], header_from_first_page: bool = False
+) -> ParsedData:
+    """
+    Объединяет страницы накладной в одну.
+
+    Позиции идут в порядке страниц; строки, повторно попавшие в кадр на
+    стыке двух фотографий, удаляются. Шапка (поставщик, дата) берется с
+    первой страницы, где она распознана.
+
+    Args:
+        pages: Результаты OCR страниц в порядке альбома
+        header_from_first_page: Брать шапку только с первой страницы
+            (полосы одной фотографии: ниже верхней полосы шапки нет, и
+            распознанное там как поставщик или дата — ошибка)
+
+    Returns:
+        ParsedData всей накладной
+    """
+    positions: List[Position] = []
+    previous: List[Position] = []
+    for number, page in enumerate(pages, 1):
+        overlap = _page_overlap(previous, page.positions)
+        if overlap:
+            logger.info(f"Страница {number}: пропущено {overlap} повторных строк")
+        positions.extend(page.positions[overlap:])
+        previous = list(page.positions)
+
+    header_pages = pages[:1] if header_from_first_page else pages
+    supplier = next((page.supplier for page in header_pages if page.supplier), None)
+    date = next((page.date for page in header_pages if page.date), None)
+    return ParsedData(
+        supplier=supplier,
+        date=date,
+        positions=positions,
+        total_price=_merged_total(pages, positions),
+    )
@@ -8,6 +8,7 @@ import time
 from typing import Any, Dict, Optional, Tuple
 
 from app.models import ParsedData
+from app.utils.enhanced_ocr_cache import compute_image_key
 
 # In-memory cache for OCR results
 OCR_CACHE: Dict[str, Tuple[ParsedData, float]] = {}
@@ -31,8 +32,7 @@ def get_cache_key(image_bytes: bytes, extra_data: Optional[Dict[str, Any]] = Non
     Returns:
         Cache key string
     """
-    hasher = hashlib.md5()
-    hasher.update(image_bytes)
+    hasher = hashlib.blake2b(image_bytes, digest_size=16)
 
     if extra_data:
         # Sort keys to ensure consistent ordering
@@ -45,15 +45,17 @@ def get_cache_key(image_bytes: bytes, extra_data: Optional[Dict[str, Any]] = Non
 
 def get_image_hash(image_bytes: bytes) -> str:
     """
-    Generate MD5 hash of image bytes for cache key.
+    Generate content hash of image bytes for cache key.
+
+    Uses the same BLAKE2b key as the async OCR result cache.
 
     Args:
         image_bytes: Raw image bytes
 
     Returns:
-        MD5 hash as hex string
+        Hash as hex string
     """
-    return hashlib.md5(image_bytes).hexdigest()
+    return compute_image_key(image_bytes)
 
 
 def get_from_cache(image_bytes: bytes) -> Optional[ParsedData]:
@@ -0,0 +1,260 @@
+"""
+Глобальный планировщик запросов к OpenAI (OCR и разбор правок).
+
+Каждый обработчик фото раньше сразу отправлял свой запрос, и всплеск
+фотографий от нескольких кухонь упирался в rate limit OpenAI. Планировщик
+ограничивает число одновременных запросов в каждой полосе (lane):
+
+- photo — тяжелые запросы GPT-4o vision (OCR накладных)
+- text — короткие текстовые запросы (разбор команд редактирования),
+  у них свои слоты, поэтому правки не ждут за очередью фотографий
+
+Внутри полосы ожидающие задачи выдаются по кругу между пользователями
+(round-robin): пользователь, отправивший десять фото, не задерживает
+одно фото соседа дольше, чем на один запрос. Ожидающий может получать
+свою позицию в очереди (например, для IncrementalUI).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from app.utils.monitor import increment_counter, record_histogram
+
+logger = logging.getLogger(__name__)
+
+LANE_PHOTO = "photo"
+LANE_TEXT = "text"
+
+# Одновременных запросов в каждой полосе
+PHOTO_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "4"))
+TEXT_CONCURRENCY = int(os.getenv("OCR_TEXT_CONCURRENCY", "4"))
+
+QueueCallback = Callable[[int], Awaitable[None]]
+
+
+class _Job:
+    """Ожидающая задача в очереди полосы"""
+
+    __slots__ = ("user_id", "granted", "wakeup")
+
+    def __init__(self, user_id: Hashable):
+        self.user_id = user_id
+        self.granted = False
+        self.wakeup = asyncio.Event()
+
+
+class _Lane:
+    """Полоса планировщика: лимит слотов и очереди пользователей"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.running = 0
+        # Очереди пользователей в порядке обхода round-robin
+        self.queues: "OrderedDict[Hashable, Deque[_Job]]" = OrderedDict()
+        self.waiting = 0
+        # Статистика
+        self.completed = 0
+        self.queued_total = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    def enqueue(self, job: _Job) -> None:
+        self.queues.setdefault(job.user_id, deque()).append(job)
+        self.waiting += 1
+        self.queued_total += 1
+        self.max_depth = max(self.max_depth, self.waiting)
+
+    def remove(self, job: _Job) -> None:
+        queue = self.queues.get(job.user_id)
+        if queue is None or job not in queue:
+            return
+        queue.remove(job)
+        self.waiting -= 1
+        if not queue:
+            del self.queues[job.user_id]
+
+    def pop_next(self) -> Optional[_Job]:
+        """Следующая задача по кругу; пользователь уходит в конец обхода"""
+        if not self.queues:
+            return None
+        user_id, queue = next(iter(self.queues.items()))
+        job = queue.popleft()
+        self.waiting -= 1
+        del self.queues[user_id]
+        if queue:
+            self.queues[user_id] = queue
+        return job
+
+    def position(self, job: _Job) -> int:
+        """Позиция задачи (с 1) в порядке выдачи round-robin"""
+        queue = self.queues.get(job.user_id)
+        if queue is None or job not in queue:
+            return 0
+        depth = queue.index(job)
+        # В каждом круге пользователь получает один слот: впереди задачи
+        # других пользователей из кругов 0..depth (до нас в порядке обхода
+        # в круге depth) и depth собственных задач
+        position = depth + 1
+        before = True
+        for user_id, other in self.queues.items():
+            if user_id == job.user_id:
+                before = False
+                continue
+            position += min(len(other), depth + 1 if before else depth)
+        return position
+
+    def wake_all(self) -> None:
+        for queue in self.queues.values():
+            for job in queue:
+                job.wakeup.set()
+
+
+class OCRScheduler:
+    """
+    Планировщик с полосами, лимитом параллельности и честной очередью.
+
+    Использование:
+        async with get_ocr_scheduler().slot(LANE_PHOTO, user_id, on_queue=cb):
+            ... запрос к OpenAI ...
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        limits = limits or {LANE_PHOTO: PHOTO_CONCURRENCY, LANE_TEXT: TEXT_CONCURRENCY}
+        self._lanes = {name: _Lane(name, limit) for name, limit in limits.items()}
+
+    def _lane(self, name: str) -> _Lane:
+        try:
+            return self._lanes[name]
+        except KeyError:
+            raise ValueError(f"Неизвестная полоса планировщика: {name}")
+
+    def _release(self, lane: _Lane) -> None:
+        lane.running -= 1
+        while lane.running < lane.limit:
+            job = lane.pop_next()
+            if job is None:
+                break
+            job.granted = True
+            job.wakeup.set()
+            lane.running += 1
+        # Позиции оставшихся в очереди сдвинулись
+        lane.wake_all()
+
+    async def _acquire(
+        self, lane: _Lane, user_id: Hashable, on_queue: Optional[QueueCallback]
+    ) -> float:
+        """Занимает слот полосы, возвращает время ожидания в секундах"""
+        if lane.running < lane.limit and not lane.waiting:
+            lane.running += 1
+            return 0.0
+
+        start = time.monotonic()
+        job = _Job(user_id)
+        lane.enqueue(job)
+        record_histogram("ocr_queue_depth", lane.waiting, {"lane": lane.name})
+        last_position = None
+        try:
+            while not job.granted:
+                position = lane.position(job)
+                if position != last_position:
+                    last_position = position
+                    if on_queue is not None:
+                        try:
+                            await on_queue(position)
+                        except Exception as e:
+                            logger.debug(f"Ошибка обратного вызова позиции в очереди: {e}")
+                        # За время обратного вызова очередь могла сдвинуться
+                        continue
+                job.wakeup.clear()
+                await job.wakeup.wait()
+        except asyncio.CancelledError:
+            if job.granted:
+                self._release(lane)
+            else:
+                lane.remove(job)
+                lane.wake_all()
+            raise
+        return time.monotonic() - start
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        lane: str = LANE_PHOTO,
+        user_id: Hashable = None,
+        on_queue: Optional[QueueCallback] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Контекст, внутри которого выполняется запрос к OpenAI.
+
+        Args:
+            lane: Полоса (LANE_PHOTO или LANE_TEXT)
+            user_id: Пользователь для честной очереди (None — общий)
+            on_queue: Корутина, получающая позицию в очереди при каждом
+                ее изменении (вызывается только если слот занят не сразу)
+        """
+        state = self._lane(lane)
+        wait = await self._acquire(state, user_id, on_queue)
+        record_histogram("ocr_queue_wait_seconds", wait, {"lane": lane})
+        increment_counter("ocr_scheduler_jobs_total", {"lane": lane})
+        state.total_wait += wait
+        if wait > 1.0:
+            logger.info(f"Запрос в полосе {lane} ждал слота {wait:.1f}с")
+        try:
+            yield
+        finally:
+            state.completed += 1
+            self._release(state)
+
+    async def run(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        lane: str = LANE_PHOTO,
+        user_id: Hashable = None,
+        on_queue: Optional[QueueCallback] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Выполняет корутинную функцию в слоте полосы"""
+        async with self.slot(lane, user_id, on_queue):
+            return await func(*args, **kwargs)
+
+    def queue_position(self, lane: str, user_id: Hashable) -> int:
+        """Позиция первой ожидающей задачи пользователя (0 — не в очереди)"""
+        state = self._lane(lane)
+        queue = state.queues.get(user_id)
+        return state.position(queue[0]) if queue else 0
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по полосам: занятость, глубина очереди, среднее ожидание"""
+        stats = {}
+        for name, lane in self._lanes.items():
+            started = lane.completed + lane.running
+            stats[name] = {
+                "limit": lane.limit,
+                "running": lane.running,
+                "waiting": lane.waiting,
+                "users_waiting": len(lane.queues),
+                "max_depth": lane.max_depth,
+                "queued_total": lane.queued_total,
+                "completed": lane.completed,
+                "avg_wait_seconds": round(lane.total_wait / started, 3) if started else 0.0,
+            }
+        return stats
+
+
+# Глобальный экземпляр планировщика
+_ocr_scheduler: Optional[OCRScheduler] = None
+
+
+def get_ocr_scheduler() -> OCRScheduler:
+    """Возвращает глобальный планировщик запросов к OpenAI"""
+    global _ocr_scheduler
+    if _ocr_scheduler is None:
+        _ocr_scheduler = OCRScheduler()
+    return _ocr_scheduler
@@ -0,0 +1,261 @@
+"""
+Пул воркеров PaddleOCR для распознавания ячеек таблицы вне event loop.
+
+PaddleOCR.ocr() выполняется сотни миллисекунд на ячейку и держит поток,
+поэтому вызов прямо из корутины останавливал весь бот (Telegram-апдейты
+не обрабатывались, пока распознавалась таблица). Пул выполняет инференс
+в отдельных потоках (или процессах при PADDLE_OCR_EXECUTOR=process):
+
+- у каждого воркера своя прогретая модель (предиктор Paddle не
+  потокобезопасен, поэтому модели не разделяются между воркерами);
+- ячейки, запрошенные в одном проходе event loop (asyncio.gather по
+  ячейкам таблицы), отправляются в воркеры пачками до PADDLE_OCR_BATCH
+  штук — одна задача пула на пачку вместо одной на ячейку.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+
+# Число воркеров (= число моделей в памяти) и размер пачки ячеек
+PADDLE_WORKERS = int(os.getenv("PADDLE_OCR_WORKERS", "2"))
+PADDLE_BATCH_SIZE = int(os.getenv("PADDLE_OCR_BATCH", "8"))
+PADDLE_EXECUTOR = os.getenv("PADDLE_OCR_EXECUTOR", EXECUTOR_THREAD)
+
+ModelFactory = Callable[[], Any]
+
+# Модель воркера-процесса (создается в инициализаторе процесса)
+_process_model: Any = None
+
+
+def warm_paddle_model(model: Any) -> None:
+    """Прогоняет пустое изображение, чтобы загрузить веса и прогреть предиктор"""
+    try:
+        import numpy as np
+
+        model.ocr(np.full((32, 32, 3), 255, dtype=np.uint8), cls=True)
+    except Exception as e:
+        logger.debug(f"Прогрев PaddleOCR не удался (не критично): {e}")
+
+
+def _recognize(model: Any, images: Sequence[Any], cls: bool) -> List[Any]:
+    """
+    Распознает пачку изображений одной моделью.
+
+    Ошибка одной ячейки не срывает пачку: на ее месте возвращается
+    RuntimeError, который потом выбрасывается в ожидающую корутину.
+    """
+    results: List[Any] = []
+    for image in images:
+        try:
+            results.append(model.ocr(image, cls=cls))
+        except Exception as e:
+            results.append(RuntimeError(str(e)))
+    return results
+
+
+def _process_worker_init(factory: ModelFactory, warm: bool) -> None:
+    """Инициализатор воркера-процесса: одна модель на процесс"""
+    global _process_model
+    _process_model = factory()
+    if warm:
+        warm_paddle_model(_process_model)
+
+
+def _process_run_batch(images: Sequence[Any], cls: bool) -> List[Any]:
+    """Пачка ячеек в воркере-процессе"""
+    return _recognize(_process_model, images, cls)
+
+
+class PaddleOCRPool:
+    """
+    Пул потоков/процессов с одной моделью PaddleOCR на воркер.
+
+    В режиме потоков готовая модель (seed_model) отдается первому
+    воркеру, остальные создаются фабрикой при первом обращении потока.
+    """
+
+    def __init__(
+        self,
+        model_factory: ModelFactory,
+        workers: int = PADDLE_WORKERS,
+        batch_size: int = PADDLE_BATCH_SIZE,
+        executor: str = PADDLE_EXECUTOR,
+        seed_model: Any = None,
+    ):
+        self.model_factory = model_factory
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.mode = EXECUTOR_PROCESS if executor == EXECUTOR_PROCESS else EXECUTOR_THREAD
+
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+        self._spare_models: List[Any] = [seed_model] if seed_model is not None else []
+        self._models_lock = threading.Lock()
+        self._models_created = 0
+
+        # Ожидающие ячейки по (event loop, cls): [(изображение, future)]
+        self._pending: Dict[Tuple[Any, bool], List[Tuple[Any, asyncio.Future]]] = {}
+
+        # Статистика
+        self.batches = 0
+        self.cells = 0
+
+    # --- воркеры ---
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.mode == EXECUTOR_PROCESS:
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                            initializer=_process_worker_init,
+                            initargs=(self.model_factory, True),
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix="paddle-ocr"
+                        )
+                    logger.info(
+                        f"Пул PaddleOCR запущен: {self.workers} воркеров ({self.mode}), "
+                        f"пачка до {self.batch_size} ячеек"
+                    )
+        return self._executor
+
+    def _thread_model(self) -> Any:
+        """Модель текущего потока-воркера (создается при первом обращении)"""
+        model = getattr(self._local, "model", None)
+        if model is None:
+            with self._models_lock:
+                if self._spare_models:
+                    model = self._spare_models.pop()
+                else:
+                    model = self.model_factory()
+                    self._models_created += 1
+                    warm_paddle_model(model)
+            self._local.model = model
+        return model
+
+    def _thread_run_batch(self, images: Sequence[Any], cls: bool) -> List[Any]:
+        return _recognize(self._thread_model(), images, cls)
+
+    def warm_up(self) -> None:
+        """
+        Запускает всех воркеров и загружает их модели заранее.
+
+        Блокирует до готовности; вызывать из потока, а не из event loop.
+        """
+        executor = self._get_executor()
+        if self.mode == EXECUTOR_PROCESS:
+            futures: List["Future[Any]"] = [
+                executor.submit(_process_run_batch, [], True) for _ in range(self.workers)
+            ]
+        else:
+            barrier = threading.Barrier(self.workers)
+
+            def _claim() -> None:
+                # Барьер заставляет каждую задачу занять отдельный поток
+                self._thread_model()
+                barrier.wait(timeout=60)
+
+            futures = [executor.submit(_claim) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает воркеров; следующий вызов ocr() запустит их заново"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    # --- пачки ---
+
+    async def ocr(self, image: Any, cls: bool = True) -> Any:
+        """
+        Распознает одну ячейку; результат в формате PaddleOCR.ocr().
+
+        Ячейки, запрошенные до следующего прохода event loop, уходят
+        в воркеры одной пачкой.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.get((loop, cls))
+        if pending is None:
+            pending = self._pending[(loop, cls)] = []
+            loop.call_soon(self._flush, loop, cls)
+        pending.append((image, future))
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop, cls: bool) -> None:
+        pending = self._pending.pop((loop, cls), [])
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start : start + self.batch_size]
+            batch = [item for item in chunk if not item[1].done()]
+            if batch:
+                self._submit(loop, batch, cls)
+
+    def _submit(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        batch: List[Tuple[Any, asyncio.Future]],
+        cls: bool,
+    ) -> None:
+        images = [image for image, _ in batch]
+        futures = [future for _, future in batch]
+        self.batches += 1
+        self.cells += len(batch)
+
+        executor = self._get_executor()
+        if self.mode == EXECUTOR_PROCESS:
+            task = loop.run_in_executor(executor, _process_run_batch, images, cls)
+        else:
+            task = loop.run_in_executor(executor, self._thread_run_batch, images, cls)
+
+        def _deliver(done: asyncio.Future) -> None:
+            error = None if done.cancelled() else done.exception()
+            if done.cancelled() or error is not None:
+                if isinstance(error, BrokenProcessPool):
+                    logger.warning("Пул PaddleOCR сломан, пересоздаем при следующем вызове")
+                    self.shutdown(wait=False)
+                for future in futures:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.cancel()
+                return
+            for future, result in zip(futures, done.result()):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+        task.add_done_callback(_deliver)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пула для мониторинга"""
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "cells": self.cells,
+            "models_created": self._models_created,
+        }
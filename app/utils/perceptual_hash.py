@@ -0,0 +1,287 @@
+"""
+Перцептивные отпечатки фотографий накладных.
+
+Байтовый хеш не совпадает, если пользователь переслал ту же фотографию с
+другим JPEG-сжатием или масштабом. Отпечаток из двух
+перцептивных хешей (dHash по градиентам и pHash по низким частотам DCT),
+вычисленных по уменьшенному серому изображению, для таких копий отличается
+лишь на несколько бит, поэтому похожие снимки ищутся по расстоянию Хэмминга.
+
+Глобальные хеши не замечают мелких отличий: та же еженедельная накладная с
+другим количеством в одной ячейке укладывается в пороги. Поэтому отпечаток
+содержит еще карту яркости (сетка DETAIL_SIZE с нормированным контрастом), и
+найденный снимок принимается, только если карты совпадают в каждой клетке.
+"""
+
+import base64
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+from PIL.Image import Resampling
+
+logger = logging.getLogger(__name__)
+
+# Сторона хеша: HASH_SIZE x HASH_SIZE бит на каждый из двух хешей
+HASH_SIZE = 16
+# Сторона изображения для DCT в pHash
+PHASH_IMAGE_SIZE = HASH_SIZE * 4
+
+# Максимальные расстояния Хэмминга (из HASH_SIZE**2 бит), при которых снимки
+# считаются одной накладной. Подобраны на корпусе из tests/test_perceptual_hash.py:
+# пересжатие, масштаб, яркость и размытие дают pHash <= 4, а накладная того же
+# поставщика с другими строками — pHash >= 20. Обрезка кадра неотличима от
+# смены строк на таком разрешении, поэтому обрезанные копии идут в API.
+DHASH_THRESHOLD = int(os.getenv("OCR_DHASH_THRESHOLD", "16"))
+PHASH_THRESHOLD = int(os.getenv("OCR_PHASH_THRESHOLD", "10"))
+
+# Карта яркости: столбцов x строк сетки. Клетка 1/32 ширины накладной — это
+# примерно одна ячейка с числом, поэтому замена цифры меняет ее заметно
+DETAIL_SIZE = (32, 48)
+# Размер, до которого JPEG уменьшается при декодировании (Image.draft)
+DETAIL_DRAFT_SIZE = 512
+# Максимальная разница клетки карты (0-255). На корпусе тестов копии той же
+# фотографии отличаются не более чем на 21, другое число в одной ячейке — от 90
+DETAIL_THRESHOLD = int(os.getenv("OCR_DETAIL_THRESHOLD", "48"))
+
+# Максимальное количество отпечатков в индексе
+MAX_FINGERPRINTS = 4096
+
+# (dhash, phash, карта яркости)
+Fingerprint = Tuple[int, int, bytes]
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """Матрица ортонормированного DCT-II размера size x size"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    scaled: np.ndarray = matrix * np.sqrt(2 / size)
+    return scaled
+
+
+_DCT = _dct_matrix(PHASH_IMAGE_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    """Упаковывает булев массив в целое число"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Разностный хеш: знак горизонтального градиента яркости.
+
+    Args:
+        image: Изображение в режиме "L"
+
+    Returns:
+        Хеш из HASH_SIZE**2 бит
+    """
+    small = image.resize((HASH_SIZE + 1, HASH_SIZE), Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image: Image.Image) -> int:
+    """
+    Перцептивный хеш: знак низкочастотных коэффициентов DCT относительно медианы.
+
+    Args:
+        image: Изображение в режиме "L"
+
+    Returns:
+        Хеш из HASH_SIZE**2 бит
+    """
+    small = image.resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.float64)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # Постоянная составляющая зависит только от яркости и в сравнение не входит
+    median = np.median(coefficients.ravel()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+def detail_map(image: Image.Image) -> bytes:
+    """
+    Карта яркости: средняя яркость клеток сетки DETAIL_SIZE.
+
+    Контраст растягивается по 1-му и 99-му процентилю, чтобы копия с другой
+    яркостью или контрастом давала ту же карту.
+
+    Args:
+        image: Изображение в режиме "L"
+
+    Returns:
+        Байты uint8, по одному на клетку
+    """
+    cells = np.asarray(image.resize(DETAIL_SIZE, Resampling.BOX), dtype=np.float64)
+    low, high = np.percentile(cells, (1, 99))
+    scaled = np.clip((cells - low) / max(high - low, 1.0), 0, 1)
+    return bytes(np.round(scaled * 255).astype(np.uint8).ravel())
+
+
+def details_match(a: bytes, b: bytes, threshold: int = DETAIL_THRESHOLD) -> bool:
+    """Карты яркости совпадают: ни одна клетка не отличается больше порога"""
+    if len(a) != len(b) or not a:
+        return False
+    diff = np.abs(
+        np.frombuffer(a, dtype=np.uint8).astype(np.int16)
+        - np.frombuffer(b, dtype=np.uint8).astype(np.int16)
+    )
+    return int(diff.max()) <= threshold
+
+
+def image_fingerprint(image_bytes: bytes) -> Optional[Fingerprint]:
+    """
+    Вычисляет перцептивный отпечаток фотографии.
+
+    JPEG декодируется сразу в уменьшенном сером виде (Image.draft),
+    ориентация по EXIF учитывается, чтобы повернутая копия совпадала.
+
+    Args:
+        image_bytes: Байты изображения
+
+    Returns:
+        (dhash, phash, карта яркости) или None, если изображение не читается
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("L", (DETAIL_DRAFT_SIZE, DETAIL_DRAFT_SIZE))
+            gray = ImageOps.exif_transpose(img).convert("L")
+            return dhash(gray), phash(gray), detail_map(gray)
+    except Exception as e:
+        logger.debug(f"Не удалось вычислить перцептивный хеш: {e}")
+        return None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Расстояние Хэмминга между двумя хешами"""
+    return bin(a ^ b).count("1")
+
+
+def fingerprint_to_str(fingerprint: Fingerprint) -> str:
+    """Сериализует отпечаток в строку "dhash:phash:карта" (hex, hex, base64)"""
+    detail = base64.b64encode(fingerprint[2]).decode("ascii")
+    return f"{fingerprint[0]:x}:{fingerprint[1]:x}:{detail}"
+
+
+def fingerprint_from_str(value: str) -> Optional[Fingerprint]:
+    """
+    Разбирает строку, созданную fingerprint_to_str.
+
+    Старые записи без карты яркости не разбираются: проверить их нечем.
+    """
+    try:
+        d, p, detail = value.split(":")
+        return int(d, 16), int(p, 16), base64.b64decode(detail, validate=True)
+    except (AttributeError, ValueError):
+        return None
+
+
+class PerceptualIndex:
+    """
+    Индекс отпечатков для поиска почти одинаковых фотографий.
+
+    Хеши хранятся в виде матрицы uint8, поиск — векторный XOR и подсчет
+    бит по всем записям сразу; у кандидатов в пределах порогов затем
+    сравниваются карты яркости. При переполнении вытесняются самые старые.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MAX_FINGERPRINTS,
+        dhash_threshold: int = DHASH_THRESHOLD,
+        phash_threshold: int = PHASH_THRESHOLD,
+        detail_threshold: int = DETAIL_THRESHOLD,
+    ):
+        self.max_size = max_size
+        self.dhash_threshold = dhash_threshold
+        self.phash_threshold = phash_threshold
+        self.detail_threshold = detail_threshold
+        self._entries: "OrderedDict[str, Fingerprint]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._details: List[bytes] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def _to_bytes(value: int) -> np.ndarray:
+        return np.frombuffer(value.to_bytes(HASH_SIZE * HASH_SIZE // 8, "big"), dtype=np.uint8)
+
+    def add(self, key: str, fingerprint: Fingerprint) -> None:
+        """Добавляет (или обновляет) отпечаток результата с ключом key"""
+        with self._lock:
+            self._entries[key] = fingerprint
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def items(self) -> List[Tuple[str, Fingerprint]]:
+        """Ключи и отпечатки от самых старых к новым"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def remove(self, key: str) -> None:
+        """Удаляет отпечаток"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._matrix = None
+
+    def clear(self) -> None:
+        """Очищает индекс"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def _build(self) -> None:
+        self._keys = list(self._entries)
+        self._details = [detail for _, _, detail in self._entries.values()]
+        rows = [
+            np.concatenate((self._to_bytes(d), self._to_bytes(p)))
+            for d, p, _ in self._entries.values()
+        ]
+        self._matrix = np.stack(rows) if rows else np.empty((0, 0), dtype=np.uint8)
+
+    def find(self, fingerprint: Fingerprint) -> Optional[Tuple[str, int]]:
+        """
+        Ищет ближайший отпечаток в пределах порогов с совпадающей картой яркости.
+
+        Args:
+            fingerprint: Отпечаток искомой фотографии
+
+        Returns:
+            (ключ, суммарное расстояние) или None
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._build()
+            matrix, keys, details = self._matrix, self._keys, self._details
+
+        query = np.concatenate((self._to_bytes(fingerprint[0]), self._to_bytes(fingerprint[1])))
+        differing = np.unpackbits(matrix ^ query, axis=1)
+        half = differing.shape[1] // 2
+        d_dist = differing[:, :half].sum(axis=1)
+        p_dist = differing[:, half:].sum(axis=1)
+
+        close = (d_dist <= self.dhash_threshold) & (p_dist <= self.phash_threshold)
+        matches = np.flatnonzero(close)
+        total = d_dist[matches] + p_dist[matches]
+        for i in np.argsort(total, kind="stable"):
+            best = int(matches[i])
+            if details_match(details[best], fingerprint[2], self.detail_threshold):
+                return keys[best], int(total[i])
+        return None
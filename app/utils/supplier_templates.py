@@ -0,0 +1,655 @@
+"""
+Шаблоны разметки накладных постоянных поставщиков.
+
+Большинство накладных приходит от нескольких десятков поставщиков с
+неизменной разметкой. Для каждого поставщика по подтвержденным накладным
+запоминаются x-диапазоны колонок таблицы (name, qty, unit, price, total)
+и якоря заголовка — слова шапки таблицы с их положением по горизонтали
+(в долях ширины страницы, чтобы не зависеть от разрешения фото).
+Слова шапки («Qty», «Harga») общие у многих поставщиков, поэтому шаблон
+хранит и признаки самого поставщика: его название и налоговый номер
+(NPWP) со страницы.
+
+Новая фотография распознается PaddleOCR построчно (текстовые блоки всей
+страницы), поставщик определяется по своему названию или NPWP и якорям
+заголовка, и строки таблицы собираются по колонкам шаблона без запроса
+к GPT-4o. Результат принимается, только если qty × price = total сходится
+в каждой строке, ни одна строка с ценой и суммой не потеряла название или
+количество и строк не меньше, чем в последней подтвержденной накладной
+поставщика. Иначе накладная идет обычным путем.
+
+Шаблоны хранятся в data/supplier_templates.json.
+"""
+
+import difflib
+import io
+import json
+import logging
+import os
+import re
+import statistics
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.ocr_helpers import group_cells_into_rows, parse_numeric_value
+from app.utils.monitor import increment_counter
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_FILE = Path("data/supplier_templates.json")
+
+# Колонки таблицы накладной
+FIELDS = ("name", "qty", "unit", "price", "total")
+
+# Доля якорей заголовка, которую нужно найти на странице
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("OCR_TEMPLATE_MATCH_THRESHOLD", "0.6"))
+# Допустимое смещение якоря по горизонтали (доля ширины страницы)
+ANCHOR_X_TOLERANCE = 0.08
+# Якорей на шаблон и сколько строк над таблицей искать при обучении
+MAX_ANCHORS = 8
+ANCHOR_SEARCH_ROWS = 3
+# Допуск арифметики строки
+ARITHMETIC_TOLERANCE = 0.02
+# Сходство названия позиции с текстом строки при обучении
+NAME_SIMILARITY = 0.7
+# Страниц, запоминаемых для обучения после подтверждения
+RECENT_PAGES = 200
+# Налоговый номер (NPWP): 15 или 16 цифр, возможно с разделителями
+TAX_ID_PATTERN = re.compile(r"(?<!\d)\d(?:[.\-\s]?\d){14,15}(?!\d)")
+
+TextLine = Dict[str, Any]
+
+
+def _normalize(text: Any) -> str:
+    return re.sub(r"[^\w]+", " ", str(text or "").lower()).strip()
+
+
+def _x_center(line: TextLine) -> float:
+    x1, _, x2, _ = line["bbox"]
+    return float(x1 + x2) / 2
+
+
+def _y_center(line: TextLine) -> float:
+    _, y1, _, y2 = line["bbox"]
+    return float(y1 + y2) / 2
+
+
+def _tax_ids(text: Any) -> List[str]:
+    """Налоговые номера в тексте (только цифры)"""
+    return [re.sub(r"\D", "", match) for match in TAX_ID_PATTERN.findall(str(text or ""))]
+
+
+def _mentions(text: str, name: str) -> bool:
+    """Нормализованный текст содержит название целыми словами или похож на него"""
+    if not text or not name:
+        return False
+    if f" {name} " in f" {text} ":
+        return True
+    return difflib.SequenceMatcher(None, name, text).ratio() >= NAME_SIMILARITY
+
+
+def _number(text: Any) -> Optional[float]:
+    if not re.search(r"\d", str(text or "")):
+        return None
+    value = parse_numeric_value(str(text), default=0, is_float=True)
+    return value or None
+
+
+def _close(a: Optional[float], b: Optional[float]) -> bool:
+    if not a or not b:
+        return False
+    return abs(a - b) <= ARITHMETIC_TOLERANCE * max(abs(a), abs(b))
+
+
+def page_text_lines(ocr_result: Any) -> List[TextLine]:
+    """
+    Текстовые блоки страницы из результата PaddleOCR.ocr.
+
+    Returns:
+        [{"text", "bbox": [x1, y1, x2, y2], "confidence"}]
+    """
+    lines: List[TextLine] = []
+    if not ocr_result or not ocr_result[0]:
+        return lines
+    for item in ocr_result[0]:
+        try:
+            points, (text, confidence) = item[0], item[1]
+            xs = [float(point[0]) for point in points]
+            ys = [float(point[1]) for point in points]
+        except (TypeError, ValueError, IndexError):
+            continue
+        if str(text).strip():
+            lines.append(
+                {
+                    "text": str(text).strip(),
+                    "bbox": [min(xs), min(ys), max(xs), max(ys)],
+                    "confidence": float(confidence),
+                }
+            )
+    return lines
+
+
+def decode_page(image_bytes: bytes) -> Any:
+    """Страница в RGB-массив для PaddleOCR"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    img: Image.Image = Image.open(io.BytesIO(image_bytes))
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        pass
+    return np.asarray(img.convert("RGB"))
+
+
+class SupplierTemplate:
+    """Колонки, якоря заголовка и признаки одного поставщика"""
+
+    def __init__(
+        self,
+        supplier: str,
+        columns: Optional[Dict[str, List[float]]] = None,
+        anchors: Optional[List[Dict[str, Any]]] = None,
+        samples: int = 0,
+        name: Optional[str] = None,
+        names: Optional[List[str]] = None,
+        tax_ids: Optional[List[str]] = None,
+        rows: int = 0,
+    ):
+        # Ключ шаблона (нормализованное название) и название как в накладной
+        self.supplier = supplier
+        self.name = name or supplier
+        # Поле -> [x0, x1] в долях ширины страницы
+        self.columns: Dict[str, List[float]] = columns or {}
+        # [{"text": нормализованное слово, "x": центр в долях ширины}]
+        self.anchors: List[Dict[str, Any]] = anchors or []
+        # Признаки поставщика: нормализованные написания названия и NPWP
+        self.names: List[str] = names or []
+        self.tax_ids: List[str] = tax_ids or []
+        self.samples = samples
+        # Позиций в последней подтвержденной накладной
+        self.rows = rows
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "supplier": self.supplier,
+            "name": self.name,
+            "columns": self.columns,
+            "anchors": self.anchors,
+            "names": self.names,
+            "tax_ids": self.tax_ids,
+            "samples": self.samples,
+            "rows": self.rows,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SupplierTemplate":
+        return cls(
+            supplier=data["supplier"],
+            columns={k: list(v) for k, v in (data.get("columns") or {}).items()},
+            anchors=list(data.get("anchors") or []),
+            samples=int(data.get("samples") or 0),
+            name=data.get("name"),
+            names=list(data.get("names") or []),
+            tax_ids=list(data.get("tax_ids") or []),
+            rows=int(data.get("rows") or 0),
+        )
+
+    def identified_by(self, lines: List[TextLine]) -> bool:
+        """На странице есть название или NPWP этого поставщика"""
+        for line in lines:
+            if self.tax_ids and any(tax_id in self.tax_ids for tax_id in _tax_ids(line["text"])):
+                return True
+            text = _normalize(line["text"])
+            if any(_mentions(text, name) for name in self.names):
+                return True
+        return False
+
+    def column_of(self, line: TextLine, width: float) -> Optional[str]:
+        """Колонка с наибольшим перекрытием блока по горизонтали"""
+        x1, _, x2, _ = line["bbox"]
+        x1, x2 = x1 / width, x2 / width
+        best, best_overlap = None, 0.0
+        for field, (c1, c2) in self.columns.items():
+            overlap = min(x2, c2) - max(x1, c1)
+            if overlap > best_overlap:
+                best, best_overlap = field, overlap
+        return best
+
+
+class SupplierTemplateStore:
+    """
+    Хранилище шаблонов: обучение, определение поставщика и извлечение строк.
+
+    Статистика попаданий ведется по поставщикам: hit — строки извлечены
+    по шаблону, miss — поставщик определен, но результат отклонен
+    (накладная ушла обычным путем).
+    """
+
+    def __init__(self, path: Path = TEMPLATES_FILE):
+        self.path = path
+        self.templates: Dict[str, SupplierTemplate] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+        # Запись файла: learn выполняется в пуле потоков, сохранения не должны пересекаться
+        self._save_lock = threading.Lock()
+        # Недавние страницы для обучения: ключ -> (текстовые блоки, ширина)
+        self._recent: "OrderedDict[str, Tuple[List[TextLine], float]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.unmatched = 0
+
+    def load(self) -> None:
+        """Загружает шаблоны из JSON (один раз)"""
+        with self._lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not self.path.exists():
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                templates = dict(self.templates)
+                for item in data.get("templates", []):
+                    template = SupplierTemplate.from_dict(item)
+                    templates[template.supplier] = template
+                self.templates = templates
+                logger.info(f"Загружено шаблонов поставщиков: {len(self.templates)}")
+            except Exception as e:
+                logger.error(f"Ошибка загрузки шаблонов поставщиков: {e}")
+
+    def save(self) -> None:
+        """Сохраняет шаблоны в JSON"""
+        try:
+            with self._save_lock:
+                with self._lock:
+                    data = {"templates": [t.to_dict() for t in self.templates.values()]}
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(".tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения шаблонов поставщиков: {e}")
+
+    def remember_page(self, key: str, lines: List[TextLine], width: float) -> None:
+        """Запоминает текстовые блоки страницы для обучения после подтверждения"""
+        with self._lock:
+            self._recent[key] = (lines, width)
+            self._recent.move_to_end(key)
+            while len(self._recent) > RECENT_PAGES:
+                self._recent.popitem(last=False)
+
+    def recent_page(self, key: str) -> Optional[Tuple[List[TextLine], float]]:
+        with self._lock:
+            return self._recent.get(key)
+
+    def _count(self, supplier: str, hit: bool) -> None:
+        counters = self.stats.setdefault(supplier, {"hits": 0, "misses": 0})
+        counters["hits" if hit else "misses"] += 1
+        increment_counter(
+            "ocr_template_total", {"supplier": supplier, "result": "hit" if hit else "miss"}
+        )
+
+    # Обучение
+
+    def learn(
+        self,
+        supplier: str,
+        positions: Sequence[Dict[str, Any]],
+        lines: List[TextLine],
+        width: float,
+    ) -> bool:
+        """
+        Обновляет шаблон поставщика по подтвержденной накладной.
+
+        Args:
+            supplier: Поставщик, как он указан в накладной
+            positions: Подтвержденные позиции (name, qty, price, total_price)
+            lines: Текстовые блоки страницы (page_text_lines)
+            width: Ширина страницы в пикселях
+
+        Returns:
+            True, если шаблон обновлен (найдено не меньше двух строк таблицы)
+        """
+        name = str(supplier or "").strip()
+        supplier = name.lower()
+        if not supplier or not lines or width <= 0:
+            return False
+        self.load()
+
+        rows = group_cells_into_rows(lines)
+        spans: Dict[str, List[Tuple[float, float]]] = {field: [] for field in FIELDS}
+        matched_rows: List[int] = []
+        for position in positions:
+            row_index = self._find_row(rows, position, matched_rows)
+            if row_index is None:
+                continue
+            matched_rows.append(row_index)
+            self._collect_spans(rows[row_index], position, spans, width)
+
+        if len(matched_rows) < 2 or not spans["name"]:
+            logger.debug(f"Шаблон {supplier}: найдено строк таблицы {len(matched_rows)}")
+            return False
+
+        columns = {
+            field: [
+                round(statistics.median(s[0] for s in field_spans), 4),
+                round(statistics.median(s[1] for s in field_spans), 4),
+            ]
+            for field, field_spans in spans.items()
+            if field_spans
+        }
+        anchors = self._header_anchors(rows, min(matched_rows), width)
+        names, tax_ids = self._supplier_marks(rows[: min(matched_rows)], name)
+
+        # Словари шаблонов заменяются целиком: identify и extract читают их
+        # в event loop без блокировки, пока learn работает в пуле потоков
+        with self._lock:
+            template = self.templates.get(supplier)
+            if template is None:
+                template = SupplierTemplate(supplier)
+                self.templates = {**self.templates, supplier: template}
+            template.name = name
+            template.names = sorted(set(template.names) | set(names))
+            template.tax_ids = sorted(set(template.tax_ids) | set(tax_ids))
+            weight = template.samples
+            learned = dict(template.columns)
+            for field, (x0, x1) in columns.items():
+                old = learned.get(field)
+                if old and weight:
+                    x0 = (old[0] * weight + x0) / (weight + 1)
+                    x1 = (old[1] * weight + x1) / (weight + 1)
+                learned[field] = [round(x0, 4), round(x1, 4)]
+            template.columns = learned
+            if anchors:
+                template.anchors = anchors
+            template.rows = len(positions)
+            template.samples += 1
+        self.save()
+        logger.info(
+            f"Шаблон {supplier} обновлен: колонки {sorted(columns)}, якорей {len(anchors)}, "
+            f"накладных {template.samples}"
+        )
+        return True
+
+    def _supplier_marks(
+        self, rows: List[List[TextLine]], supplier: str
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Признаки поставщика в строках над таблицей.
+
+        Название — само название и его написания на странице; NPWP берется
+        только из строк рядом с названием, чтобы не запомнить номер
+        покупателя.
+
+        Returns:
+            (нормализованные названия, налоговые номера)
+        """
+        name = _normalize(supplier)
+        names = [name] if name else []
+        tax_ids: List[str] = []
+        named_row = None
+        for index, row in enumerate(rows):
+            for line in row:
+                text = _normalize(line["text"])
+                if _mentions(text, name):
+                    named_row = index if named_row is None else named_row
+                    if text not in names:
+                        names.append(text)
+            if named_row is not None and index - named_row < ANCHOR_SEARCH_ROWS:
+                for line in row:
+                    tax_ids.extend(t for t in _tax_ids(line["text"]) if t not in tax_ids)
+        return names, tax_ids
+
+    def _find_row(
+        self, rows: List[List[TextLine]], position: Dict[str, Any], used: List[int]
+    ) -> Optional[int]:
+        name = _normalize(position.get("name"))
+        if not name:
+            return None
+        best, best_ratio = None, NAME_SIMILARITY
+        for index, row in enumerate(rows):
+            if index in used:
+                continue
+            for line in row:
+                ratio = difflib.SequenceMatcher(None, name, _normalize(line["text"])).ratio()
+                if ratio >= best_ratio:
+                    best, best_ratio = index, ratio
+        return best
+
+    def _collect_spans(
+        self,
+        row: List[TextLine],
+        position: Dict[str, Any],
+        spans: Dict[str, List[Tuple[float, float]]],
+        width: float,
+    ) -> None:
+        name = _normalize(position.get("name"))
+        unit = _normalize(position.get("unit"))
+        values = {
+            "qty": position.get("qty"),
+            "price": position.get("price"),
+            "total": position.get("total_price"),
+        }
+        for line in row:
+            x1, _, x2, _ = line["bbox"]
+            span = (x1 / width, x2 / width)
+            text = _normalize(line["text"])
+            number = _number(line["text"])
+            if difflib.SequenceMatcher(None, name, text).ratio() >= NAME_SIMILARITY:
+                spans["name"].append(span)
+            elif unit and text == unit:
+                spans["unit"].append(span)
+            elif number is not None:
+                for field, value in values.items():
+                    try:
+                        expected = float(value) if value is not None else None
+                    except (TypeError, ValueError):
+                        expected = None
+                    if _close(number, expected):
+                        spans[field].append(span)
+                        break
+
+    def _header_anchors(
+        self, rows: List[List[TextLine]], first_row: int, width: float
+    ) -> List[Dict[str, Any]]:
+        """Слова строк над первой строкой таблицы, ближайшие к ней"""
+        anchors: List[Dict[str, Any]] = []
+        for row in reversed(rows[max(0, first_row - ANCHOR_SEARCH_ROWS) : first_row]):
+            for line in sorted(row, key=_x_center):
+                text = _normalize(line["text"])
+                if not re.search(r"[^\W\d_]", text) or any(a["text"] == text for a in anchors):
+                    continue
+                anchors.append({"text": text, "x": round(_x_center(line) / width, 4)})
+            if len(anchors) >= MAX_ANCHORS:
+                break
+        return anchors[:MAX_ANCHORS]
+
+    # Определение поставщика и извлечение
+
+    def identify(
+        self, lines: List[TextLine], width: float
+    ) -> Tuple[Optional[SupplierTemplate], float, List[TextLine]]:
+        """
+        Шаблон поставщика, чьи название или NPWP и якоря заголовка найдены на странице.
+
+        Одних якорей заголовка недостаточно: у разных поставщиков шапки
+        таблиц часто совпадают.
+
+        Returns:
+            (шаблон или None, доля найденных якорей, блоки найденных якорей)
+        """
+        self.load()
+        if not self.templates or not lines or width <= 0:
+            return None, 0.0, []
+
+        by_text: Dict[str, List[TextLine]] = {}
+        for line in lines:
+            by_text.setdefault(_normalize(line["text"]), []).append(line)
+
+        best: Tuple[Optional[SupplierTemplate], float, List[TextLine]] = (None, 0.0, [])
+        for template in self.templates.values():
+            if not template.anchors or "name" not in template.columns:
+                continue
+            if not template.identified_by(lines):
+                continue
+            found: List[TextLine] = []
+            for anchor in template.anchors:
+                for line in by_text.get(anchor["text"], ()):
+                    if abs(_x_center(line) / width - anchor["x"]) <= ANCHOR_X_TOLERANCE:
+                        found.append(line)
+                        break
+            score = len(found) / len(template.anchors)
+            if score > best[1]:
+                best = (template, score, found)
+
+        if best[1] < TEMPLATE_MATCH_THRESHOLD:
+            return None, best[1], []
+        return best
+
+    def extract(
+        self, template: SupplierTemplate, lines: List[TextLine], width: float, header_y: float
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Строки таблицы по колонкам шаблона.
+
+        Args:
+            template: Шаблон поставщика
+            lines: Текстовые блоки страницы
+            width: Ширина страницы
+            header_y: Нижняя граница заголовка таблицы (строки ниже — данные)
+
+        Returns:
+            Позиции (name, qty, unit, price, total_price) или None, если
+            хотя бы одна строка не проверена арифметикой, строка таблицы
+            потеряла название или количество, или строк меньше, чем в
+            последней подтвержденной накладной
+        """
+        body = [line for line in lines if _y_center(line) > header_y]
+        positions: List[Dict[str, Any]] = []
+        for row in group_cells_into_rows(body):
+            texts: Dict[str, List[str]] = {}
+            for line in sorted(row, key=_x_center):
+                field = template.column_of(line, width)
+                if field:
+                    texts.setdefault(field, []).append(line["text"])
+            name = " ".join(texts.get("name", [])).strip()
+            qty = _number(" ".join(texts.get("qty", [])))
+            price = _number(" ".join(texts.get("price", [])))
+            total = _number(" ".join(texts.get("total", [])))
+            if not name or qty is None:
+                if price and total:
+                    # Строка таблицы, у которой не прочитано название или количество
+                    logger.info(
+                        f"Шаблон {template.supplier}: строка без названия или количества "
+                        f"({name!r}, {price}, {total})"
+                    )
+                    return None
+                # Итог, подписи и прочий текст вне таблицы
+                continue
+            if not (price and total and _close(qty * price, total)):
+                logger.info(
+                    f"Шаблон {template.supplier}: не сходится строка {name!r}: "
+                    f"{qty} × {price} = {total}"
+                )
+                return None
+            positions.append(
+                {
+                    "name": name,
+                    "qty": qty,
+                    "unit": " ".join(texts.get("unit", [])).strip() or None,
+                    "price": price,
+                    "total_price": total,
+                }
+            )
+
+        if not positions or len(positions) < template.rows:
+            logger.info(
+                f"Шаблон {template.supplier}: найдено строк {len(positions)}, "
+                f"в последней подтвержденной накладной {template.rows}"
+            )
+            return None
+        return positions
+
+    def recognize(self, lines: List[TextLine], width: float) -> Optional[Dict[str, Any]]:
+        """
+        Определяет поставщика и извлекает позиции по шаблону.
+
+        Returns:
+            {"supplier" (как в накладной), "positions", "score"} или None
+            (обычный путь)
+        """
+        template, score, anchors = self.identify(lines, width)
+        if template is None:
+            self.unmatched += 1
+            return None
+        header_y = max(line["bbox"][3] for line in anchors)
+        positions = self.extract(template, lines, width, header_y)
+        if positions is None:
+            self._count(template.supplier, hit=False)
+            return None
+        self._count(template.supplier, hit=True)
+        return {"supplier": template.name, "positions": positions, "score": score}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Попадания по поставщикам для мониторинга"""
+        suppliers = {}
+        for supplier, counters in self.stats.items():
+            total = counters["hits"] + counters["misses"]
+            suppliers[supplier] = {
+                **counters,
+                "hit_rate": round(counters["hits"] / total, 3) if total else 0.0,
+            }
+        return {
+            "templates": len(self.templates),
+            "unmatched": self.unmatched,
+            "suppliers": suppliers,
+        }
+
+
+# Глобальное хранилище шаблонов
+_template_store: Optional[SupplierTemplateStore] = None
+
+
+def get_template_store() -> SupplierTemplateStore:
+    """Возвращает глобальное хранилище шаблонов поставщиков"""
+    global _template_store
+    if _template_store is None:
+        _template_store = SupplierTemplateStore()
+    return _template_store
+
+
+def learn_supplier_template(page_key: Optional[str], invoice: Any) -> bool:
+    """
+    Обучает шаблон по подтвержденной накладной.
+
+    Args:
+        page_key: Ключ страницы, под которым каскад запомнил ее текстовые
+            блоки (req_id распознавания)
+        invoice: Подтвержденная накладная (ParsedData или dict)
+
+    Returns:
+        True, если шаблон обновлен
+    """
+    if not page_key:
+        return False
+    store = get_template_store()
+    page = store.recent_page(page_key)
+    if page is None:
+        return False
+
+    if isinstance(invoice, dict):
+        supplier = invoice.get("supplier")
+        positions = invoice.get("positions") or []
+    else:
+        supplier = getattr(invoice, "supplier", None)
+        positions = getattr(invoice, "positions", None) or []
+    positions = [
+        p if isinstance(p, dict) else p.model_dump() if hasattr(p, "model_dump") else vars(p)
+        for p in positions
+    ]
+    lines, width = page
+    return store.learn(str(supplier or ""), positions, lines, width)
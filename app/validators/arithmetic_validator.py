@@ -8,28 +8,84 @@
 """
 
 import logging
+import math
 import re
-from typing import Any, Dict, Optional
-from app.utils.data_utils import clean_number
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.validators.invoice_frame import (
+    FIX_AMOUNT,
+    FIX_DECIMAL,
+    FIX_PRICE,
+    FIX_QTY,
+    FIX_ZERO,
+    LINE_ERROR,
+    LINE_OK,
+    ARITHMETIC_VECTOR_MIN_LINES,
+    InvoiceFrame,
+)
 
 logger = logging.getLogger(__name__)
 
+# Имена значений строки в тексте проблем
+VALUE_NAMES = ("qty", "price", "amount", "fixed_qty", "fixed_price", "fixed_amount")
+
+# Исправленное поле и текст проблемы для каждого вида исправления строки
+ARITHMETIC_FIXES = {
+    FIX_AMOUNT: ("amount", "Fixed amount: {qty} × {price} = {fixed_amount}"),
+    FIX_QTY: ("qty", "Fixed quantity: {amount} ÷ {price} = {fixed_qty}"),
+    FIX_PRICE: ("price", "Fixed price: {amount} ÷ {qty} = {fixed_price}"),
+    FIX_DECIMAL: ("all", "Fixed decimal errors: {fixed_qty} × {fixed_price} = {fixed_amount}"),
+    FIX_ZERO: ("all", "Fixed zero errors: {fixed_qty} × {fixed_price} = {fixed_amount}"),
+}
+
+
+@dataclass
+class LineChecks:
+    """
+    Результат векторной проверки строк накладной.
+
+    Attributes:
+        rows: Номер отмеченной строки -> (статус, qty, price, amount,
+            fixed_qty, fixed_price, fixed_amount)
+        errors: Номера строк, которые не удалось разобрать, и текст ошибки
+    """
+
+    rows: Dict[int, Tuple[Any, ...]]
+    errors: Dict[int, str]
+
+    @property
+    def order(self) -> List[int]:
+        """Номера строк с проблемами в порядке строк"""
+        if not self.errors:
+            return list(self.rows)
+        return sorted(set(self.rows).union(self.errors))
+
 
 class ArithmeticValidator:
     """
     Валидатор для проверки и исправления арифметических ошибок в накладных.
     """
 
-    def __init__(self, tolerance: float = 0.01, auto_fix: bool = True):
+    def __init__(
+        self,
+        tolerance: float = 0.01,
+        auto_fix: bool = True,
+        vector_min_lines: int = ARITHMETIC_VECTOR_MIN_LINES,
+    ):
         """
         Инициализирует валидатор с настройками точности.
 
         Args:
             tolerance: Допустимая погрешность при сравнении чисел (в процентах)
             auto_fix: Автоматически исправлять обнаруженные ошибки
+            vector_min_lines: С какого числа строк проверять столбцами NumPy
         """
         self.tolerance = tolerance
         self.auto_fix = auto_fix
+        self.vector_min_lines = vector_min_lines
 
     def validate(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -45,139 +101,148 @@ class ArithmeticValidator:
         lines = result.get("lines", [])
         issues = result.get("issues", [])
 
-        # Проходим по всем строкам и проверяем
-        for i, line in enumerate(lines):
-            # Получаем значения полей (с проверкой типов)
-            try:
-                qty = clean_number(line.get("qty", 0))
-                price = clean_number(line.get("price", 0))
-                amount = clean_number(line.get("amount", 0))
-
-                # Если какое-то из значений отсутствует или равно 0, но другие есть
-                # пытаемся вычислить его
-                if (
-                    self._is_missing_or_zero(amount)
-                    and not self._is_missing_or_zero(qty)
-                    and not self._is_missing_or_zero(price)
-                ):
-                    # Вычисляем сумму, если она отсутствует
-                    calculated_amount = qty * price
-                    if self.auto_fix:
-                        lines[i]["amount"] = calculated_amount
-                        issues.append(
-                            {
-                                "type": "ARITHMETIC_FIX",
-                                "line": i,
-                                "field": "amount",
-                                "message": f"Fixed amount: {qty} × {price} = {calculated_amount}",
-                                "severity": "info",
-                            }
-                        )
-                elif (
-                    self._is_missing_or_zero(qty)
-                    and not self._is_missing_or_zero(amount)
-                    and not self._is_missing_or_zero(price)
-                ):
-                    # Вычисляем количество, если оно отсутствует и цена не равна 0
-                    if price != 0:
-                        calculated_qty = amount / price
-                        if self.auto_fix:
-                            lines[i]["qty"] = calculated_qty
-                            issues.append(
-                                {
-                                    "type": "ARITHMETIC_FIX",
-                                    "line": i,
-                                    "field": "qty",
-                                    "message": f"Fixed quantity: {amount} ÷ {price} = {calculated_qty}",
-                                    "severity": "info",
-                                }
-                            )
-                elif (
-                    self._is_missing_or_zero(price)
-                    and not self._is_missing_or_zero(amount)
-                    and not self._is_missing_or_zero(qty)
-                ):
-                    # Вычисляем цену, если она отсутствует и количество не равно 0
-                    if qty != 0:
-                        calculated_price = amount / qty
-                        if self.auto_fix:
-                            lines[i]["price"] = calculated_price
-                            issues.append(
-                                {
-                                    "type": "ARITHMETIC_FIX",
-                                    "line": i,
-                                    "field": "price",
-                                    "message": f"Fixed price: {amount} ÷ {qty} = {calculated_price}",
-                                    "severity": "info",
-                                }
-                            )
-                else:
-                    # Проверяем арифметическую точность
-                    if (
-                        not self._is_missing_or_zero(qty)
-                        and not self._is_missing_or_zero(price)
-                        and not self._is_missing_or_zero(amount)
-                    ):
-                        expected_amount = qty * price
-                        if not self._is_close(expected_amount, amount):
-                            # Проверка на ошибки с десятичными разделителями
-                            fixed_values = self._try_fix_decimal_errors(qty, price, amount)
-                            if fixed_values:
-                                if self.auto_fix:
-                                    lines[i]["qty"] = fixed_values["qty"]
-                                    lines[i]["price"] = fixed_values["price"]
-                                    lines[i]["amount"] = fixed_values["amount"]
-                                    issues.append(
-                                        {
-                                            "type": "ARITHMETIC_FIX",
-                                            "line": i,
-                                            "field": "all",
-                                            "message": f'Fixed decimal errors: {fixed_values["qty"]} × {fixed_values["price"]} = {fixed_values["amount"]}',
-                                            "severity": "info",
-                                        }
-                                    )
-                            else:
-                                # Проверка на потерянные/лишние нули
-                                fixed_values = self._try_fix_zero_errors(qty, price, amount)
-                                if fixed_values:
-                                    if self.auto_fix:
-                                        lines[i]["qty"] = fixed_values["qty"]
-                                        lines[i]["price"] = fixed_values["price"]
-                                        lines[i]["amount"] = fixed_values["amount"]
-                                        issues.append(
-                                            {
-                                                "type": "ARITHMETIC_FIX",
-                                                "line": i,
-                                                "field": "all",
-                                                "message": f'Fixed zero errors: {fixed_values["qty"]} × {fixed_values["price"]} = {fixed_values["amount"]}',
-                                                "severity": "info",
-                                            }
-                                        )
-                                else:
-                                    # Если не смогли исправить, добавляем ошибку
-                                    issues.append(
-                                        {
-                                            "type": "ARITHMETIC_ERROR",
-                                            "line": i,
-                                            "message": f"Calculation error: {qty} × {price} = {amount}, expected {expected_amount}",
-                                            "severity": "warning",
-                                        }
-                                    )
-            except Exception as e:
-                logger.error(f"Ошибка при валидации строки {i}: {str(e)}")
-                issues.append(
-                    {
-                        "type": "VALIDATION_ERROR",
-                        "line": i,
-                        "message": f"Validation error: {str(e)}",
-                        "severity": "error",
-                    }
-                )
+        checks = self.check_lines(lines)
+        for i in checks.order:
+            self.apply_line(checks, lines, i, issues)
 
         result["lines"] = lines
         result["issues"] = issues
         return result
 
+    def check_lines(self, lines: List[Any]) -> LineChecks:
+        """
+        Проверяет все строки, не изменяя их.
+
+        Строки разбираются в столбцы один раз. Накладные от vector_min_lines
+        строк проверяются над столбцами, более короткие — построчно
+        (на них постоянная цена операций NumPy больше выигрыша).
+
+        Args:
+            lines: Строки накладной
+
+        Returns:
+            LineChecks с отмеченными строками и ошибками разбора
+        """
+        frame = InvoiceFrame.from_lines(lines)
+        if len(frame) < self.vector_min_lines:
+            return self._check_rows(frame)
+        return self._check_columns(frame)
+
+    def _check_columns(self, frame: InvoiceFrame) -> LineChecks:
+        """Векторная проверка; значения отмеченных строк переводятся в числа Python разом"""
+        status, fixed_qty, fixed_price, fixed_amount = frame.check_arithmetic(self.tolerance)
+        flagged = np.flatnonzero(status != LINE_OK)
+        columns = (
+            frame.qty,
+            frame.price,
+            frame.total,
+            fixed_qty,
+            fixed_price,
+            fixed_amount,
+        )
+        rows = dict(
+            zip(
+                flagged.tolist(),
+                zip(status[flagged].tolist(), *(column[flagged].tolist() for column in columns)),
+            )
+        )
+        return LineChecks(rows, frame.errors)
+
+    def _check_rows(self, frame: InvoiceFrame) -> LineChecks:
+        """Построчная проверка с тем же результатом, что и InvoiceFrame.check_arithmetic"""
+        rows: Dict[int, Tuple[Any, ...]] = {}
+        values = zip(frame.qty.tolist(), frame.price.tolist(), frame.total.tolist())
+        for i, (qty, price, amount) in enumerate(values):
+            row = self._check_row(qty, price, amount)
+            if row is not None:
+                rows[i] = row
+        return LineChecks(rows, frame.errors)
+
+    def _check_row(self, qty: float, price: float, amount: float) -> Optional[Tuple[Any, ...]]:
+        """
+        Проверяет одну строку.
+
+        Returns:
+            (статус, qty, price, amount, fixed_qty, fixed_price, fixed_amount)
+            или None, если строка не отмечена
+        """
+        no_qty, no_price, no_amount = map(self._is_missing_or_zero, (qty, price, amount))
+        if not (no_qty or no_price or no_amount):
+            if self._is_close(qty * price, amount):
+                return None
+            kind, fixed = FIX_DECIMAL, self._try_fix_decimal_errors(qty, price, amount)
+            if fixed is None:
+                kind, fixed = FIX_ZERO, self._try_fix_zero_errors(qty, price, amount)
+            if fixed is None:
+                return (LINE_ERROR, qty, price, amount, qty, price, amount)
+            return (kind, qty, price, amount, fixed["qty"], fixed["price"], fixed["amount"])
+
+        if no_amount and not no_qty and not no_price:
+            return (FIX_AMOUNT, qty, price, amount, qty, price, qty * price)
+        if no_qty and not no_amount and not no_price:
+            return (FIX_QTY, qty, price, amount, amount / price, price, amount)
+        if no_price and not no_amount and not no_qty:
+            return (FIX_PRICE, qty, price, amount, qty, amount / qty, amount)
+        return None
+
+    def apply_line(
+        self, checks: LineChecks, lines: List[Any], i: int, issues: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Добавляет проблему строки i и применяет исправление (при auto_fix).
+
+        Для неотмеченных строк ничего не делает.
+
+        Args:
+            checks: Результат check_lines
+            lines: Строки накладной (исправляются на месте)
+            i: Номер строки
+            issues: Список проблем, в который добавляется проблема строки
+        """
+        if i in checks.errors:
+            logger.error(f"Ошибка при валидации строки {i}: {checks.errors[i]}")
+            issues.append(
+                {
+                    "type": "VALIDATION_ERROR",
+                    "line": i,
+                    "message": f"Validation error: {checks.errors[i]}",
+                    "severity": "error",
+                }
+            )
+            return
+
+        row = checks.rows.get(i)
+        if row is None:
+            return
+        kind, *numbers = row
+        values = dict(zip(VALUE_NAMES, numbers))
+        if kind == LINE_ERROR:
+            expected_amount = values["qty"] * values["price"]
+            issues.append(
+                {
+                    "type": "ARITHMETIC_ERROR",
+                    "line": i,
+                    "message": (
+                        f"Calculation error: {values['qty']} × {values['price']} = "
+                        f"{values['amount']}, expected {expected_amount}"
+                    ),
+                    "severity": "warning",
+                }
+            )
+        elif self.auto_fix:
+            field, message = ARITHMETIC_FIXES[kind]
+            for name in ("qty", "price", "amount"):
+                if field in (name, "all"):
+                    lines[i][name] = values[f"fixed_{name}"]
+            issues.append(
+                {
+                    "type": "ARITHMETIC_FIX",
+                    "line": i,
+                    "field": field,
+                    "message": message.format(**values),
+                    "severity": "info",
+                }
+            )
 
     def _is_close(self, a: float, b: float) -> bool:
         """
@@ -205,9 +270,9 @@ class ArithmeticValidator:
             value: Проверяемое значение
 
         Returns:
-            True, если значение None, 0 или около 0
+            True, если значение None, NaN, 0 или около 0
         """
-        return value is None or abs(value) < 0.000001
+        return value is None or math.isnan(value) or abs(value) < 0.000001
 
     def _try_fix_decimal_errors(
         self, qty: float, price: float, amount: float
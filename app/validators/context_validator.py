@@ -9,6 +9,8 @@ that result in unrealistic prices.
 import logging
 from typing import Any, Dict, List, Optional, Tuple
 
+from app.utils.keyword_matcher import get_keyword_matcher
+
 logger = logging.getLogger(__name__)
 
 
@@ -146,6 +148,11 @@ class ContextAwarePriceValidator:
             }
         }
 
+        # Compiled matcher over the category product lists, shared by all instances
+        self._matcher = get_keyword_matcher(
+            {category: info["products"] for category, info in self.price_ranges.items()}
+        )
+
     def categorize_product(self, product_name: str) -> Optional[str]:
         """
         Categorize a product based on its name.
@@ -158,30 +165,12 @@ class ContextAwarePriceValidator:
         """
         if not product_name:
             return None
-            
-        product_lower = product_name.lower().strip()
-        
-        # Check each category for matches
-        for category, info in self.price_ranges.items():
-            for known_product in info["products"]:
-                if known_product.lower() in product_lower or product_lower in known_product.lower():
-                    return category
-                    
-        # Additional fuzzy matching for common variations
-        for category, info in self.price_ranges.items():
-            for known_product in info["products"]:
-                # Simple fuzzy matching - check if words overlap
-                product_words = set(product_lower.split())
-                known_words = set(known_product.lower().split())
-                
-                # If more than half the words match, consider it a match
-                if product_words and known_words:
-                    overlap = len(product_words.intersection(known_words))
-                    min_words = min(len(product_words), len(known_words))
-                    if overlap / min_words >= 0.6:
-                        return category
-        
-        return None
+
+        # Substring match in either direction, then word overlap (more than half
+        # of the words), resolved in one pass over the name and memoized per name
+        return self._matcher.categorize(
+            product_name.lower().strip(), reverse=True, min_word_ratio=0.6
+        )
 
     def validate_price(self, product_name: str, price: float, 
                       unit: str = None, quantity: float = 1.0) -> Dict[str, Any]:
@@ -300,12 +289,33 @@ class ContextAwarePriceValidator:
         # If no conversion available, return original price
         return price
 
-    def validate_invoice_context(self, positions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def validate_position(self, pos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate the price of one invoice position.
+
+        Args:
+            pos: Invoice position (name, price, unit, qty)
+
+        Returns:
+            Dictionary with validation results (see validate_price)
+        """
+        return self.validate_price(
+            product_name=pos.get("name", ""),
+            price=pos.get("price", 0),
+            unit=pos.get("unit", ""),
+            quantity=pos.get("qty", 1)
+        )
+
+    def validate_invoice_context(self, positions: List[Dict[str, Any]],
+                                 validations: Optional[List[Dict[str, Any]]] = None
+                                 ) -> Dict[str, Any]:
         """
         Validate entire invoice for contextual consistency.
         
         Args:
             positions: List of invoice positions
+            validations: Results of validate_position for each position, if already
+                computed (avoids validating every price twice)
             
         Returns:
             Dictionary with overall validation results
@@ -336,7 +346,10 @@ class ContextAwarePriceValidator:
             if not price:
                 continue
                 
-            validation = self.validate_price(product_name, price, unit, qty)
+            if validations is not None:
+                validation = validations[i]
+            else:
+                validation = self.validate_price(product_name, price, unit, qty)
             
             # Count confidence levels
             if validation["confidence"] == "high":
@@ -429,31 +442,63 @@ def validate_prices_with_context(invoice_data: Dict[str, Any]) -> Dict[str, Any]
     
     # Validate individual positions
     validated_positions = []
+    validations = []
     for pos in positions:
-        validated_pos = pos.copy()
-        
-        # Run context validation
-        context_validation = validator.validate_price(
-            product_name=pos.get("name", ""),
-            price=pos.get("price", 0),
-            unit=pos.get("unit", ""),
-            quantity=pos.get("qty", 1)
-        )
-        
-        # Add context validation results
-        validated_pos["context_validation"] = context_validation
-        if context_validation["warnings"]:
-            existing_warnings = validated_pos.get("validation_warnings", [])
-            existing_warnings.extend(context_validation["warnings"])
-            validated_pos["validation_warnings"] = existing_warnings
-        
+        validated_pos, context_validation = validate_position_context(validator, pos)
         validated_positions.append(validated_pos)
+        validations.append(context_validation)
     
+    result = invoice_data.copy()
+    apply_context_validation(validator, result, validated_positions, validations)
+    return result
+
+
+def validate_position_context(validator: ContextAwarePriceValidator,
+                              pos: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run context validation for one position.
+    
+    Args:
+        validator: Context validator
+        pos: Invoice position
+        
+    Returns:
+        Copy of the position with context results and warnings, and the validation itself
+    """
+    validated_pos = pos.copy()
+    
+    # Run context validation
+    context_validation = validator.validate_position(pos)
+    
+    # Add context validation results
+    validated_pos["context_validation"] = context_validation
+    if context_validation["warnings"]:
+        existing_warnings = validated_pos.get("validation_warnings", [])
+        existing_warnings.extend(context_validation["warnings"])
+        validated_pos["validation_warnings"] = existing_warnings
+    
+    return validated_pos, context_validation
+
+
+def apply_context_validation(validator: ContextAwarePriceValidator,
+                             result: Dict[str, Any],
+                             validated_positions: List[Dict[str, Any]],
+                             validations: List[Dict[str, Any]]) -> None:
+    """
+    Run the invoice-level context check and store all context results in result.
+    
+    Args:
+        validator: Context validator
+        result: Invoice data, updated in place
+        validated_positions: Positions returned by validate_position_context
+        validations: Their context validations, in the same order
+    """
     # Validate overall invoice context
-    invoice_context_validation = validator.validate_invoice_context(validated_positions)
+    invoice_context_validation = validator.validate_invoice_context(
+        validated_positions, validations
+    )
     
     # Update invoice data
-    result = invoice_data.copy()
     result["positions"] = validated_positions
     result["context_validation"] = invoice_context_validation
     
@@ -466,5 +511,3 @@ def validate_prices_with_context(invoice_data: Dict[str, Any]) -> Dict[str, Any]
         if invoice_context_validation.get("recommendations"):
             existing_issues.extend(invoice_context_validation["recommendations"])
         result["validation_warnings"] = existing_issues
-    
-    return result
\ No newline at end of file
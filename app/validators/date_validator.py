@@ -231,6 +231,18 @@ def validate_invoice_dates(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
     
     # Update invoice data
     result = invoice_data.copy()
+    apply_date_validation(result, date_validation)
+    return result
+
+
+def apply_date_validation(result: Dict[str, Any], date_validation: Dict[str, Any]) -> None:
+    """
+    Store date validation results and warnings in invoice data.
+    
+    Args:
+        result: Invoice data, updated in place
+        date_validation: Result of DateValidator.validate_invoice_date
+    """
     result["date_validation"] = date_validation
     
     # Add date validation warnings to overall validation
@@ -262,8 +274,6 @@ def validate_invoice_dates(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
                 f"Missing invoice date - suggest using {suggested_date.isoformat()} or manually correct"
             )
             result["validation_warnings"] = existing_warnings
-    
-    return result
 
 
 class DateCorrectionHelper:
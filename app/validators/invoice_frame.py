@@ -0,0 +1,352 @@
+"""
+Колоночное представление строк накладной для векторных проверок.
+
+Валидаторы обходили строки по одной: вызывали clean_number для каждого
+поля, сравнивали числа и перебирали варианты исправления в Python.
+InvoiceFrame разбирает строки один раз в массивы NumPy (количество, цена,
+сумма) и объектный массив названий. Проверка арифметики с допуском, поиск
+кандидатов на сдвиг десятичного разделителя и сверка итога выполняются
+над целыми столбцами, а списки проблем формируются только для отмеченных
+строк.
+
+Отсутствующие и неразобранные значения хранятся как NaN.
+
+Столбцы выигрывают только на длинных накладных: у операций NumPy есть
+постоянная цена, а обычная накладная — несколько десятков строк. По
+tools/benchmark_invoice_frame.py арифметика (check_arithmetic, около
+0,17 мс на вызов) обгоняет построчную проверку примерно со 170 строк
+(на 1000 строк — в 1,5 раза), проверки OCRPreValidator — примерно с 40.
+Валидаторы всегда разбирают строки в InvoiceFrame, а над столбцами
+проверяют только накладные от своего порога (ARITHMETIC_VECTOR_MIN_LINES,
+PREVALIDATION_VECTOR_MIN_LINES); более короткие — построчно по тем же
+значениям.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.data_utils import clean_number
+
+# С какого числа строк проверки выполняются над столбцами, а не построчно
+ARITHMETIC_VECTOR_MIN_LINES = int(os.getenv("INVOICE_ARITHMETIC_VECTOR_MIN_LINES", "200"))
+PREVALIDATION_VECTOR_MIN_LINES = int(os.getenv("INVOICE_PREVALIDATION_VECTOR_MIN_LINES", "50"))
+
+# Значения по модулю меньше этого считаются отсутствующими
+MISSING_EPSILON: float = 1e-6
+
+# Результат арифметической проверки строки
+LINE_OK = 0
+FIX_AMOUNT = 1  # сумма вычислена как количество × цена
+FIX_QTY = 2  # количество вычислено как сумма ÷ цена
+FIX_PRICE = 3  # цена вычислена как сумма ÷ количество
+FIX_DECIMAL = 4  # исправлен сдвиг десятичного разделителя
+FIX_ZERO = 5  # исправлен потерянный или лишний ноль
+LINE_ERROR = 6  # расхождение, которое не удалось исправить
+
+# Типы значений, которые попадают в столбцы без разбора
+NUMBER_TYPES = (int, float)
+
+Parser = Callable[[Any], Optional[float]]
+
+
+def _clean_value(value: Any) -> Optional[float]:
+    """Число из значения поля: числа как есть, строки через clean_number"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return clean_number(value)
+
+
+def _float_value(value: Any) -> Optional[float]:
+    """Число из значения поля через float() (None, если не преобразуется)"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def missing(values: np.ndarray) -> np.ndarray:
+    """Маска отсутствующих значений: NaN или практически ноль"""
+    mask: np.ndarray = np.isnan(values) | (np.abs(values) < MISSING_EPSILON)
+    return mask
+
+
+def is_close(a: np.ndarray, b: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Поэлементное сравнение с относительным допуском.
+
+    Повторяет ArithmeticValidator._is_close: два нуля равны, иначе
+    |a - b| / max(|a|, |b|) <= tolerance.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.abs(a - b) / np.maximum(np.abs(a), np.abs(b))
+    close: np.ndarray = ((a == 0) & (b == 0)) | (relative <= tolerance)
+    return close
+
+
+@dataclass
+class InvoiceFrame:
+    """
+    Строки накладной в виде столбцов.
+
+    Attributes:
+        names: Названия позиций (объектный массив)
+        qty: Количество
+        price: Цена за единицу
+        total: Сумма строки
+        errors: Номера строк, которые не удалось разобрать, и текст ошибки
+    """
+
+    names: np.ndarray
+    qty: np.ndarray
+    price: np.ndarray
+    total: np.ndarray
+    errors: Dict[int, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_lines(
+        cls,
+        lines: Sequence[Any],
+        qty_key: str = "qty",
+        price_key: str = "price",
+        total_key: str = "amount",
+        default: Any = 0,
+        parse: Parser = _clean_value,
+    ) -> "InvoiceFrame":
+        """
+        Разбирает строки накладной в столбцы.
+
+        Args:
+            lines: Строки накладной (словари)
+            qty_key: Поле количества
+            price_key: Поле цены
+            total_key: Поле суммы строки
+            default: Значение отсутствующего поля
+            parse: Преобразование значения поля в число (None — не число)
+
+        Returns:
+            InvoiceFrame по строкам
+        """
+        keys = (qty_key, price_key, total_key)
+        errors: Dict[int, str] = {}
+
+        def value(raw: Any) -> Any:
+            # Числа не разбираем: в накладных после OCR их большинство
+            return raw if type(raw) in NUMBER_TYPES else parse(raw)
+
+        try:
+            # Обычный случай: все строки — словари, столбцы собираются списками
+            names: List[Any] = [line.get("name") for line in lines]
+            columns: Sequence[Sequence[Any]] = [
+                [
+                    raw if type(raw) in NUMBER_TYPES else parse(raw)
+                    for raw in [line.get(key, default) for line in lines]
+                ]
+                for key in keys
+            ]
+        except Exception:
+            names, rows = [], []
+            for i, line in enumerate(lines):
+                try:
+                    row = (line.get("name"), *(value(line.get(key, default)) for key in keys))
+                except Exception as e:
+                    errors[i] = str(e)
+                    row = (None, None, None, None)
+                names.append(row[0])
+                rows.append(row[1:])
+            columns = list(zip(*rows)) if rows else [[], [], []]
+
+        # None (не число) превращается в NaN при преобразовании к float
+        qty, price, total = (np.array(column, dtype=float) for column in columns)
+        name_array = np.empty(len(names), dtype=object)
+        name_array[:] = names
+        return cls(name_array, qty, price, total, errors)
+
+    @classmethod
+    def from_match_results(cls, match_results: Sequence[Any]) -> "InvoiceFrame":
+        """Столбцы по результатам сопоставления (сумма строки — line_total, через float())"""
+        return cls.from_lines(
+            match_results, total_key="line_total", default=None, parse=_float_value
+        )
+
+    def __len__(self) -> int:
+        return len(self.qty)
+
+    def decimal_shift_candidates(
+        self, tolerance: float, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ищет строки, где цена или сумма сдвинута на один десятичный разряд.
+
+        Кандидаты проверяются в порядке ArithmeticValidator._try_fix_decimal_errors:
+        цена ÷ 10, цена × 10, сумма ÷ 10, сумма × 10; побеждает первый подходящий.
+
+        Args:
+            tolerance: Относительный допуск
+            mask: Какие строки проверять (по умолчанию все)
+
+        Returns:
+            Кортеж (маска найденных, количество, цена, сумма) с исправленными значениями
+        """
+        rows, qty, price, total = self._columns(mask)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            calculated_price = np.where(qty != 0, total / qty, 0.0)
+        calculated_total = qty * price
+        candidates = [
+            (
+                (price > calculated_price * 10) & is_close(price / 10, calculated_price, tolerance),
+                qty,
+                price / 10,
+                total,
+            ),
+            (
+                (price < calculated_price / 10) & is_close(price * 10, calculated_price, tolerance),
+                qty,
+                price * 10,
+                total,
+            ),
+            (
+                (total > calculated_total * 10) & is_close(total / 10, calculated_total, tolerance),
+                qty,
+                price,
+                total / 10,
+            ),
+            (
+                (total < calculated_total / 10) & is_close(total * 10, calculated_total, tolerance),
+                qty,
+                price,
+                total * 10,
+            ),
+        ]
+        return self._first_candidate(candidates, rows)
+
+    def zero_error_candidates(
+        self, tolerance: float, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ищет строки с потерянным или лишним нулем в цене, количестве или сумме.
+
+        Порядок кандидатов — как в ArithmeticValidator._try_fix_zero_errors.
+
+        Args:
+            tolerance: Относительный допуск
+            mask: Какие строки проверять (по умолчанию все)
+
+        Returns:
+            Кортеж (маска найденных, количество, цена, сумма) с исправленными значениями
+        """
+        rows, qty, price, total = self._columns(mask)
+        calculated_total = qty * price
+        candidates = [
+            (is_close(qty * (price * 10), total, tolerance), qty, price * 10, total),
+            (is_close(qty * (price / 10), total, tolerance), qty, price / 10, total),
+            (is_close((qty * 10) * price, total, tolerance), qty * 10, price, total),
+            (is_close((qty / 10) * price, total, tolerance), qty / 10, price, total),
+            (is_close(calculated_total, total * 10, tolerance), qty, price, total * 10),
+            (is_close(calculated_total, total / 10, tolerance), qty, price, total / 10),
+        ]
+        return self._first_candidate(candidates, rows)
+
+    def _columns(
+        self, mask: Optional[np.ndarray]
+    ) -> Tuple[Optional[np.ndarray], np.ndarray, np.ndarray, np.ndarray]:
+        """Номера строк из mask (None — все строки) и их количество, цена и сумма"""
+        if mask is None:
+            return None, self.qty, self.price, self.total
+        rows = np.flatnonzero(mask)
+        return rows, self.qty[rows], self.price[rows], self.total[rows]
+
+    def _first_candidate(
+        self,
+        candidates: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]],
+        rows: Optional[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Для каждой строки выбирает первого подходящего кандидата.
+
+        Кандидаты посчитаны только для строк rows; результат разворачивается
+        на все строки (ненайденные — False и NaN).
+        """
+        conditions = np.array([candidate[0] for candidate in candidates])
+        found = np.asarray(conditions.any(axis=0))
+        first = conditions.argmax(axis=0)
+        picked = np.arange(conditions.shape[1])
+        fixed = np.array(
+            [
+                np.array([candidate[column] for candidate in candidates])[first, picked]
+                for column in (1, 2, 3)
+            ]
+        )
+        fixed[:, ~found] = np.nan
+
+        if rows is not None:
+            all_found = np.zeros(len(self), dtype=bool)
+            all_found[rows] = found
+            all_fixed = np.full((3, len(self)), np.nan)
+            all_fixed[:, rows] = fixed
+            found, fixed = all_found, all_fixed
+        return found, fixed[0], fixed[1], fixed[2]
+
+    def check_arithmetic(
+        self, tolerance: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Проверяет количество × цена = сумма для всех строк сразу.
+
+        Логика совпадает с построчной ArithmeticValidator: отсутствующее
+        значение вычисляется из двух других, при расхождении ищется сдвиг
+        десятичного разделителя, затем потерянный или лишний ноль.
+
+        Args:
+            tolerance: Относительный допуск
+
+        Returns:
+            Кортеж (статус строки LINE_OK/FIX_*/LINE_ERROR, количество, цена,
+            сумма) с исправленными значениями
+        """
+        qty, price, total = self.qty, self.price, self.total
+        no_qty, no_price, no_total = missing(qty), missing(price), missing(total)
+        complete = ~no_qty & ~no_price & ~no_total
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inconsistent = complete & ~is_close(qty * price, total, tolerance)
+        fix_total = no_total & ~no_qty & ~no_price
+        fix_qty = no_qty & ~no_total & ~no_price
+        fix_price = no_price & ~no_total & ~no_qty
+
+        # Маски не пересекаются, поэтому статусы и исправления записываются
+        # присваиванием по маске без выбора по порядку
+        status = np.full(len(self), LINE_OK)
+        status[fix_total] = FIX_AMOUNT
+        status[fix_qty] = FIX_QTY
+        status[fix_price] = FIX_PRICE
+        status[inconsistent] = LINE_ERROR
+        fixed_qty, fixed_price, fixed_total = qty.copy(), price.copy(), total.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fixed_total[fix_total] = qty[fix_total] * price[fix_total]
+            fixed_qty[fix_qty] = total[fix_qty] / price[fix_qty]
+            fixed_price[fix_price] = total[fix_price] / qty[fix_price]
+
+        # Варианты исправления ищутся только среди строк с расхождением
+        if inconsistent.any():
+            decimal = self.decimal_shift_candidates(tolerance, inconsistent)
+            zero = self.zero_error_candidates(tolerance, inconsistent & ~decimal[0])
+            for kind, (found, candidate_qty, candidate_price, candidate_total) in (
+                (FIX_DECIMAL, decimal),
+                (FIX_ZERO, zero),
+            ):
+                status[found] = kind
+                fixed_qty[found] = candidate_qty[found]
+                fixed_price[found] = candidate_price[found]
+                fixed_total[found] = candidate_total[found]
+        return status, fixed_qty, fixed_price, fixed_total
+
+    def line_totals(self) -> np.ndarray:
+        """Суммы строк: указанная сумма, а если ее нет — количество × цена (NaN, если нечем)"""
+        return np.where(np.isnan(self.total), self.qty * self.price, self.total)
+
+    def reconcile_total(self) -> float:
+        """Итог накладной как сумма известных сумм строк"""
+        return float(np.nansum(self.line_totals()))
@@ -6,8 +6,13 @@ to catch obvious mathematical errors before further processing.
 """
 
 import logging
-from typing import Any, Dict, List, Optional
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from app.utils.data_utils import clean_number
+from app.validators.invoice_frame import PREVALIDATION_VECTOR_MIN_LINES, InvoiceFrame
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +33,8 @@ class OCRPreValidator:
                  min_unit_price: float = 500,  # Minimum reasonable unit price in IDR
                  max_unit_price: float = 1_000_000,  # Maximum reasonable unit price in IDR
                  min_total_invoice: float = 10_000,  # Minimum reasonable total invoice
-                 max_total_invoice: float = 10_000_000):  # Maximum reasonable total invoice
+                 max_total_invoice: float = 10_000_000,  # Maximum reasonable total invoice
+                 vector_min_lines: int = PREVALIDATION_VECTOR_MIN_LINES):
         """
         Initialize OCR pre-validator.
         
@@ -38,95 +44,277 @@ class OCRPreValidator:
             max_unit_price: Maximum reasonable unit price in IDR
             min_total_invoice: Minimum reasonable total invoice amount
             max_total_invoice: Maximum reasonable total invoice amount
+            vector_min_lines: Invoices with at least this many positions are checked
+                on NumPy columns, shorter ones position by position
         """
         self.tolerance = tolerance
         self.min_unit_price = min_unit_price
         self.max_unit_price = max_unit_price
         self.min_total_invoice = min_total_invoice
         self.max_total_invoice = max_total_invoice
+        self.vector_min_lines = vector_min_lines
 
-    def validate_positions(self, positions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def validate_positions(
+        self, positions: List[Dict[str, Any]], frame: Optional[InvoiceFrame] = None
+    ) -> List[Dict[str, Any]]:
         """
         Validate individual positions for arithmetic consistency and reasonable values.
-        
+
+        Positions are parsed into an InvoiceFrame once. Invoices of at least
+        vector_min_lines positions are checked on its columns at once, shorter
+        ones position by position (NumPy's fixed cost outweighs the gain there);
+        warning texts are built only for flagged positions.
+
         Args:
             positions: List of position dictionaries from OCR
-            
+            frame: Columns of the positions (qty, price, total_price), built if omitted.
+                Calculated missing totals are written back into it.
+
         Returns:
             List of positions with validation warnings added where appropriate
         """
+        if frame is None:
+            frame = InvoiceFrame.from_lines(positions, total_key="total_price")
+        qtys, prices, totals = frame.qty.tolist(), frame.price.tolist(), frame.total.tolist()
+        check = self._check_rows if len(frame) < self.vector_min_lines else self._check_columns
+        row_flags_list, flagged, expected_totals, relative_errors, incomplete_rows = check(frame)
+
         validated_positions = []
-        
         for i, pos in enumerate(positions):
+            if i in frame.errors:
+                validated_positions.append(pos)
+                continue
+
             validated_pos = pos.copy()
-            warnings = []
-            
-            # Extract values with safe conversion
-            qty = clean_number(pos.get('qty', 0))
-            price = clean_number(pos.get('price', 0))
-            total_price = clean_number(pos.get('total_price', 0))
-            
-            # Skip validation if critical values are missing
-            if not qty or not price:
-                warnings.append("Missing quantity or price - cannot validate")
-                validated_pos['validation_warnings'] = warnings
+            if incomplete_rows[i]:
+                validated_pos['validation_warnings'] = [
+                    "Missing quantity or price - cannot validate"
+                ]
                 validated_positions.append(validated_pos)
                 continue
-            
-            # 1. Arithmetic validation
-            expected_total = qty * price
-            if total_price > 0:
-                relative_error = abs(expected_total - total_price) / max(expected_total, total_price)
-                if relative_error > self.tolerance:
-                    warnings.append(
-                        f"Math error: {qty} × {price} = {expected_total:.0f}, "
-                        f"but total_price = {total_price:.0f} "
-                        f"(error: {relative_error*100:.1f}%)"
-                    )
-            else:
-                # Auto-calculate if total_price is missing
-                validated_pos['total_price'] = expected_total
-                warnings.append(f"Calculated missing total_price: {expected_total:.0f}")
-            
-            # 2. Price range validation
-            if price < self.min_unit_price:
-                warnings.append(
-                    f"Suspiciously low price: {price:.0f} IDR "
-                    f"(< {self.min_unit_price:.0f}) - possible OCR error"
-                )
-            elif price > self.max_unit_price:
-                warnings.append(
-                    f"Suspiciously high price: {price:.0f} IDR "
-                    f"(> {self.max_unit_price:.0f}) - possible OCR error"
+
+            warnings = []
+            if flagged[i]:
+                row_flags = row_flags_list[i]
+                warnings = self._position_warnings(
+                    row_flags, qtys[i], prices[i], totals[i],
+                    expected_totals[i], relative_errors[i],
                 )
-            
-            # 3. Quantity validation
-            if qty <= 0:
-                warnings.append(f"Invalid quantity: {qty}")
-            elif qty > 1000:  # Unlikely to order more than 1000 of anything
-                warnings.append(f"Unusually large quantity: {qty} - possible OCR error")
-            
-            # 4. Check for common OCR errors in numbers
-            self._check_common_ocr_errors(pos, warnings)
-            
+                if row_flags[1]:
+                    validated_pos['total_price'] = expected_totals[i]
+            raw_qty = pos.get('qty')
+            if (
+                qtys[i] > 0
+                and isinstance(raw_qty, str)
+                and '.' in raw_qty
+                and len(raw_qty.split('.')[-1]) > 3
+            ):
+                warnings.append(f"Quantity {raw_qty} has unusual precision - possible OCR error")
+
             # Add warnings to position
             if warnings:
                 validated_pos['validation_warnings'] = warnings
                 logger.warning(f"Position {i+1} ({pos.get('name', 'unknown')}): {'; '.join(warnings)}")
-            
+
             validated_positions.append(validated_pos)
-        
+
         return validated_positions
 
-    def validate_invoice_total(self, positions: List[Dict[str, Any]], 
-                             total_price: Optional[float]) -> Dict[str, Any]:
+    def _check_columns(
+        self, frame: InvoiceFrame
+    ) -> Tuple[List[Tuple[bool, ...]], List[bool], List[float], List[float], List[bool]]:
+        """
+        Check flags of all positions at once on the frame columns.
+
+        Calculated missing totals are written back into frame.total.
+
+        Returns:
+            Tuple (per-position flags as in _position_warnings, flagged mask,
+            qty × price, relative total errors, incomplete mask) as Python lists
+        """
+        qty, price, total = frame.qty, frame.price, frame.total
+        with np.errstate(invalid="ignore", divide="ignore"):
+            expected = qty * price
+            incomplete = np.isnan(qty) | (qty == 0) | np.isnan(price) | (price == 0)
+            complete = ~incomplete
+            has_total = total > 0
+            relative_error = np.abs(expected - total) / np.maximum(expected, total)
+            math_error = complete & has_total & (relative_error > self.tolerance)
+            calculated = complete & ~has_total
+            low_price = complete & (price < self.min_unit_price)
+            high_price = complete & ~low_price & (price > self.max_unit_price)
+            bad_qty = complete & (qty <= 0)
+            large_qty = complete & ~bad_qty & (qty > 1000)
+            round_price = complete & (price >= 10000) & (price % 1000 == 0)
+            missing_decimal = round_price & self._in_price_range(price / 100)
+            extra_zeros = round_price & ~missing_decimal & self._in_price_range(price / 1000)
+            verify_qty = complete & (qty > 100)
+        frame.total = np.where(calculated, expected, total)
+
+        masks = (
+            math_error, calculated, low_price, high_price, bad_qty,
+            large_qty, missing_decimal, extra_zeros, verify_qty,
+        )
+        return (
+            list(zip(*(mask.tolist() for mask in masks))),
+            np.logical_or.reduce(masks).tolist(),
+            expected.tolist(),
+            relative_error.tolist(),
+            incomplete.tolist(),
+        )
+
+    def _check_rows(
+        self, frame: InvoiceFrame
+    ) -> Tuple[List[Tuple[bool, ...]], List[bool], List[float], List[float], List[bool]]:
+        """Check flags position by position; same result as _check_columns"""
+        row_flags_list: List[Tuple[bool, ...]] = []
+        flagged: List[bool] = []
+        expected_totals: List[float] = []
+        relative_errors: List[float] = []
+        incomplete_rows: List[bool] = []
+        totals: List[float] = []
+        for qty, price, total in zip(
+            frame.qty.tolist(), frame.price.tolist(), frame.total.tolist()
+        ):
+            flags, expected, relative_error, incomplete = self._check_position(qty, price, total)
+            row_flags_list.append(flags)
+            flagged.append(any(flags))
+            expected_totals.append(expected)
+            relative_errors.append(relative_error)
+            incomplete_rows.append(incomplete)
+            # Calculated missing totals, as _check_columns writes them
+            totals.append(expected if flags[1] else total)
+        frame.total = np.array(totals, dtype=float)
+        return row_flags_list, flagged, expected_totals, relative_errors, incomplete_rows
+
+    def _check_position(
+        self, qty: float, price: float, total: float
+    ) -> Tuple[Tuple[bool, ...], float, float, bool]:
+        """
+        Check flags of one position.
+
+        Returns:
+            Tuple (flags as in _position_warnings, qty × price,
+            relative total error, whether qty or price is missing)
+        """
+        expected = qty * price
+        if math.isnan(qty) or qty == 0 or math.isnan(price) or price == 0:
+            return (False,) * 9, expected, math.nan, True
+
+        has_total = total > 0
+        relative_error = (
+            abs(expected - total) / max(expected, total) if has_total else math.nan
+        )
+        low_price = price < self.min_unit_price
+        bad_qty = qty <= 0
+        round_price = price >= 10000 and price % 1000 == 0
+        missing_decimal = round_price and self._in_price_range(price / 100)
+        flags = (
+            has_total and relative_error > self.tolerance,
+            not has_total,
+            low_price,
+            not low_price and price > self.max_unit_price,
+            bad_qty,
+            not bad_qty and qty > 1000,
+            missing_decimal,
+            round_price and not missing_decimal and self._in_price_range(price / 1000),
+            qty > 100,
+        )
+        return flags, expected, relative_error, False
+
+    def _in_price_range(self, prices: Any) -> Any:
+        """Mask (or flag, for a single price) of prices inside the reasonable unit price range"""
+        return (prices >= self.min_unit_price) & (prices <= self.max_unit_price)
+
+    def _position_warnings(
+        self,
+        flags: Sequence[bool],
+        qty: float,
+        price: float,
+        total_price: float,
+        expected_total: float,
+        relative_error: float,
+    ) -> List[str]:
+        """
+        Warning texts of one position from its precomputed check flags.
+
+        Args:
+            flags: math error, calculated total, low price, high price, invalid qty,
+                large qty, missing decimal, extra zeros, qty to verify
+            qty: Quantity
+            price: Unit price
+            total_price: Line total from OCR
+            expected_total: qty × price
+            relative_error: Relative difference between expected and OCR total
+
+        Returns:
+            Warnings in the order of the checks
+        """
+        (
+            math_error, calculated, low_price, high_price, bad_qty,
+            large_qty, missing_decimal, extra_zeros, verify_qty,
+        ) = flags
+        warnings = []
+
+        # 1. Arithmetic validation
+        if math_error:
+            warnings.append(
+                f"Math error: {qty} × {price} = {expected_total:.0f}, "
+                f"but total_price = {total_price:.0f} "
+                f"(error: {relative_error*100:.1f}%)"
+            )
+        elif calculated:
+            warnings.append(f"Calculated missing total_price: {expected_total:.0f}")
+
+        # 2. Price range validation
+        if low_price:
+            warnings.append(
+                f"Suspiciously low price: {price:.0f} IDR "
+                f"(< {self.min_unit_price:.0f}) - possible OCR error"
+            )
+        elif high_price:
+            warnings.append(
+                f"Suspiciously high price: {price:.0f} IDR "
+                f"(> {self.max_unit_price:.0f}) - possible OCR error"
+            )
+
+        # 3. Quantity validation
+        if bad_qty:
+            warnings.append(f"Invalid quantity: {qty}")
+        elif large_qty:  # Unlikely to order more than 1000 of anything
+            warnings.append(f"Unusually large quantity: {qty} - possible OCR error")
+
+        # 4. Common OCR errors in numbers
+        if missing_decimal:
+            warnings.append(
+                f"Price {price:.0f} might be missing decimal point - "
+                f"consider {price / 100:.0f}"
+            )
+        elif extra_zeros:
+            warnings.append(
+                f"Price {price:.0f} might have extra zeros - "
+                f"consider {price / 1000:.0f}"
+            )
+        if verify_qty:
+            warnings.append(f"Large quantity {qty} - verify this is correct")
+
+        return warnings
+
+    def validate_invoice_total(
+        self,
+        positions: List[Dict[str, Any]],
+        total_price: Optional[float],
+        frame: Optional[InvoiceFrame] = None,
+    ) -> Dict[str, Any]:
         """
         Validate the total invoice amount against sum of positions.
-        
+
         Args:
             positions: List of validated positions
             total_price: Total invoice amount from OCR
-            
+            frame: Columns of the positions (as updated by validate_positions),
+                built if omitted
+
         Returns:
             Dictionary with validation results and any corrections
         """
@@ -136,13 +324,12 @@ class OCRPreValidator:
             'calculated_total': 0.0,
             'validation_passed': True
         }
-        
+
         # Calculate expected total from positions
-        calculated_total = 0.0
-        for pos in positions:
-            pos_total = clean_number(pos.get('total_price', 0))
-            calculated_total += pos_total
-        
+        if frame is None:
+            frame = InvoiceFrame.from_lines(positions, total_key="total_price")
+        calculated_total = float(np.nansum(frame.total))
+
         result['calculated_total'] = calculated_total
         
         # Validate against provided total
@@ -234,14 +421,16 @@ def validate_ocr_result(ocr_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     validator = OCRPreValidator()
     
-    # Validate positions
+    # Validate positions (columns are built once and shared by both checks)
     positions = ocr_data.get('positions', [])
-    validated_positions = validator.validate_positions(positions)
+    frame = InvoiceFrame.from_lines(positions, total_key='total_price')
+    validated_positions = validator.validate_positions(positions, frame)
     
     # Validate invoice total
     total_validation = validator.validate_invoice_total(
         validated_positions,
-        ocr_data.get('total_price')
+        ocr_data.get('total_price'),
+        frame,
     )
     
     # Combine results
@@ -252,6 +441,8 @@ def validate_ocr_result(ocr_data: Dict[str, Any]) -> Dict[str, Any]:
     # Collect all warnings
     all_warnings = total_validation['warnings'].copy()
     for pos in validated_positions:
+        if not isinstance(pos, dict):
+            continue
         pos_warnings = pos.get('validation_warnings', [])
         all_warnings.extend([f"{pos.get('name', 'unknown')}: {w}" for w in pos_warnings])
     
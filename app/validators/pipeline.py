@@ -1,13 +1,27 @@
 """
 Validation pipeline for invoice data.
+
+With the default validator set the pipeline runs fused: the invoice is copied
+once, a single pass over the lines applies arithmetic fixes and runs the
+context price check for each line, and invoice-level checks (context summary,
+dates) run afterwards on the same working copy. Custom validator lists are
+run stage by stage.
 """
 
 import logging
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional
+
+from app.utils.monitor import record_histogram
 
 from .arithmetic_validator import ArithmeticValidator
-from .context_validator import validate_prices_with_context
-from .date_validator import validate_invoice_dates
+from .context_validator import (
+    ContextAwarePriceValidator,
+    apply_context_validation,
+    validate_position_context,
+    validate_prices_with_context,
+)
+from .date_validator import DateValidator, apply_date_validation, validate_invoice_dates
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +45,8 @@ class ValidationPipeline:
             auto_fix=auto_fix
         )
         self.validators = [self.arithmetic_validator]
+        self.context_validator = ContextAwarePriceValidator()
+        self.date_validator = DateValidator()
 
     def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -50,13 +66,168 @@ class ValidationPipeline:
                 "validation_passed": False
             }
 
-        # Convert to dict if it's a Pydantic model
-        if hasattr(data, 'model_dump'):
-            data_dict = data.model_dump()
-        elif hasattr(data, 'dict'):
-            data_dict = data.dict()
+        start_time = time.perf_counter()
+        if len(self.validators) == 1 and self.validators[0] is self.arithmetic_validator:
+            mode = "fused"
+            result = self._validate_fused(data)
         else:
-            data_dict = data.copy() if isinstance(data, dict) else {}
+            mode = "staged"
+            result = self._validate_staged(data)
+        record_histogram("validation_seconds", time.perf_counter() - start_time, {"mode": mode})
+        return result
+
+    @staticmethod
+    def _to_dict(data: Any) -> Dict[str, Any]:
+        """Working copy of the invoice as a dict (Pydantic models are dumped)."""
+        if hasattr(data, 'model_dump'):
+            return data.model_dump()
+        if hasattr(data, 'dict'):
+            return data.dict()
+        return data.copy() if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _status(status: str, issues: List[Any]) -> str:
+        """Overall status after the given issues (error > warning > success)."""
+        for issue in issues:
+            if issue.get("severity") == "error":
+                status = "error"
+            elif issue.get("severity") == "warning" and status != "error":
+                status = "warning"
+        return status
+
+    def _validate_fused(self, data: Any) -> Dict[str, Any]:
+        """
+        Validate with one working copy and one pass over the lines.
+
+        Produces the same result as _validate_staged with the default validators:
+        arithmetic fixes and the per-line context check share the pass over the
+        lines, per-line context results are kept in preallocated lists and reused
+        by the invoice-level context summary instead of being computed again.
+
+        Args:
+            data: Invoice data to validate (dict or Pydantic model)
+
+        Returns:
+            Validated data with validation results and any fixes applied
+        """
+        result = self._to_dict(data)
+        all_issues = []
+        validation_status = "success"
+        arithmetic = self.arithmetic_validator
+
+        lines = result.get("lines", [])
+        positions = result.get("positions", result.get("lines", []))
+
+        # Vectorized arithmetic check of all lines; fixes are applied in the pass
+        checks = None
+        arithmetic_error: Optional[Exception] = None
+        try:
+            arithmetic_issues = result.get("issues", [])
+            checks = arithmetic.check_lines(lines)
+        except Exception as e:
+            arithmetic_error = e
+
+        # Per-line context results, filled in by the pass over the lines
+        count = len(positions)
+        validated_positions: List[Optional[Dict[str, Any]]] = [None] * count
+        validations: List[Optional[Dict[str, Any]]] = [None] * count
+        context_error: Optional[Exception] = None
+        fused = positions is lines
+
+        if checks is not None or fused:
+            context_validator = self.context_validator
+            for i, line in enumerate(lines):
+                if checks is not None and (i in checks.rows or i in checks.errors):
+                    try:
+                        arithmetic.apply_line(checks, lines, i, arithmetic_issues)
+                    except Exception as e:
+                        arithmetic_error = e
+                        checks = None
+                if fused and context_error is None:
+                    try:
+                        validated_positions[i], validations[i] = validate_position_context(
+                            context_validator, line
+                        )
+                    except Exception as e:
+                        context_error = e
+
+        if arithmetic_error is None:
+            try:
+                result["lines"] = lines
+                all_issues.extend(arithmetic_issues)
+                validation_status = self._status(validation_status, arithmetic_issues)
+            except Exception as e:
+                arithmetic_error = e
+        if arithmetic_error is not None:
+            logger.error(f"Validator {type(arithmetic).__name__} failed: {str(arithmetic_error)}")
+            all_issues.append({
+                "type": "VALIDATOR_ERROR",
+                "message": f"Exception in {type(arithmetic).__name__}: {str(arithmetic_error)}",
+                "severity": "error"
+            })
+            validation_status = "error"
+
+        # Context check of positions that are not the invoice lines
+        if not fused:
+            for i, pos in enumerate(positions):
+                try:
+                    validated_positions[i], validations[i] = validate_position_context(
+                        self.context_validator, pos
+                    )
+                except Exception as e:
+                    context_error = e
+                    break
+
+        # Invoice-level checks on the same working copy
+        if positions and context_error is None:
+            try:
+                apply_context_validation(
+                    self.context_validator, result, validated_positions, validations
+                )
+            except Exception as e:
+                context_error = e
+        if context_error is not None:
+            logger.error(f"Context validation failed: {str(context_error)}")
+            all_issues.append({
+                "type": "CONTEXT_VALIDATION_ERROR",
+                "message": f"Context validation error: {str(context_error)}",
+                "severity": "warning"
+            })
+
+        try:
+            apply_date_validation(result, self.date_validator.validate_invoice_date(result))
+        except Exception as e:
+            logger.error(f"Date validation failed: {str(e)}")
+            all_issues.append({
+                "type": "DATE_VALIDATION_ERROR",
+                "message": f"Date validation error: {str(e)}",
+                "severity": "warning"
+            })
+
+        # Add validation metadata
+        result.update({
+            "status": validation_status,
+            "issues": all_issues,
+            "validated": True,
+            "validation_passed": (
+                validation_status in ["success", "warning"]
+                and result.get("validation_passed", True)
+            )
+        })
+
+        return result
+
+    def _validate_staged(self, data: Any) -> Dict[str, Any]:
+        """
+        Validate by running each validator and check over the whole invoice in turn.
+
+        Args:
+            data: Invoice data to validate (dict or Pydantic model)
+
+        Returns:
+            Validated data with validation results and any fixes applied
+        """
+        data_dict = self._to_dict(data)
 
         # Initialize result structure
         result = data_dict.copy()
@@ -79,11 +250,7 @@ class ValidationPipeline:
                 all_issues.extend(validator_issues)
                 
                 # Determine overall status (error > warning > success)
-                for issue in validator_issues:
-                    if issue.get("severity") == "error":
-                        validation_status = "error"
-                    elif issue.get("severity") == "warning" and validation_status != "error":
-                        validation_status = "warning"
+                validation_status = self._status(validation_status, validator_issues)
                         
             except Exception as e:
                 logger.error(f"Validator {type(validator).__name__} failed: {str(e)}")
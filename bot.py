@@ -24,12 +24,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
-from app import data_loader, matcher
+from app import catalog, matcher
 from app.config import settings
 from app.formatters.report import build_report
 from app.fsm.states import NotaStates
 from app.handlers.tracing_log_middleware import TracingLogMiddleware
 from app.i18n import t
+from app.imgprep import shutdown_prep_executor
 from app.keyboards import build_main_kb, kb_help_back, kb_main
 from app.utils.api_decorators import with_async_retry_backoff
 from app.utils.file_manager import cleanup_temp_files, ensure_temp_dirs
@@ -49,18 +50,13 @@ from json_trace_logger import setup_json_trace_logger
 # Импортируем обработчики для свободного редактирования
 
 
-# Configure logging with optimized settings
-configure_logging(environment=os.getenv("ENV", "development"), log_dir="logs")
-
 # Get buffered logger for this module
 logger = get_buffered_logger(__name__)
 
-# Create tmp dir if not exists
+# Временная директория; создается при запуске в main(). Модуль не должен
+# ничего делать при импорте: процессы пула подготовки изображений (spawn)
+# заново импортируют его как __mp_main__
 TMP_DIR = Path("tmp")
-TMP_DIR.mkdir(exist_ok=True)
-
-# Создаем все временные директории при запуске
-ensure_temp_dirs()
 
 
 async def periodic_cleanup():
@@ -84,9 +80,6 @@ def cleanup_tmp():
         logger.error(f"Failed to clean tmp/: {e}")
 
 
-atexit.register(cleanup_tmp)
-
-
 def create_bot_and_dispatcher():
     setup_json_trace_logger()
     storage = MemoryStorage()
@@ -419,7 +412,7 @@ async def handle_field_edit(message, state: FSMContext):
 
         # Запускаем матчер заново для обновленной строки, если нужно
         if field in ["name", "qty", "unit"]:
-            products = data_loader.load_products("data/base_products.csv")
+            products = catalog.get_products()
             matched_item = matcher.match_positions([entry["match_results"][idx]], products)[0]
 
             # ИСПРАВЛЕНИЕ: Добавляем поле id если оно отсутствует
@@ -629,7 +622,7 @@ async def confirm_fuzzy_name(callback: CallbackQuery, state: FSMContext):
     entry["match_results"][fuzzy_line]["name"] = fuzzy_match
 
     # Загружаем базу продуктов для перепроверки совпадения
-    products = data_loader.load_products("data/base_products.csv")
+    products = catalog.get_products()
 
     # Перезапускаем matcher для обновленной строки
     updated_positions = matcher.match_positions([entry["match_results"][fuzzy_line]], products)
@@ -980,9 +973,6 @@ async def _dummy(update, data):
     pass
 
 
-logging.getLogger("aiogram.event").setLevel(logging.DEBUG)
-
-
 # Remove duplicate NotaStates class
 # In-memory store for user sessions: {user_id: {msg_id: {...}}}
 user_matches = {}
@@ -996,6 +986,7 @@ def _graceful_shutdown(signum, frame):
     """
     logger.info("Received shutdown signal")
     cleanup_temp_files()
+    shutdown_prep_executor(wait=False)
     sys.exit(0)
 
 
@@ -1077,7 +1068,21 @@ def check_and_cleanup_bot_processes():
     return True
 
 
-if __name__ == "__main__":
+def main():
+    """Настраивает окружение процесса и запускает бота."""
+    global bot, dp
+
+    # Configure logging with optimized settings
+    configure_logging(environment=os.getenv("ENV", "development"), log_dir="logs")
+    logging.getLogger("aiogram.event").setLevel(logging.DEBUG)
+
+    # Create tmp dir if not exists
+    TMP_DIR.mkdir(exist_ok=True)
+    atexit.register(cleanup_tmp)
+
+    # Создаем все временные директории при запуске
+    ensure_temp_dirs()
+
     # Проверяем и завершаем предыдущие процессы бота
     # check_and_cleanup_bot_processes()  # ВРЕМЕННО ОТКЛЮЧЕНО - функция зависает
 
@@ -1097,10 +1102,10 @@ if __name__ == "__main__":
         """Инициализирует маппинг продуктов при старте."""
         try:
             from app.syrve_mapping import ensure_syrve_mappings
-            from app.data_loader import load_products
+            from app.catalog import get_products
             
             # Загружаем локальные продукты
-            products = load_products()
+            products = get_products()
             
             # Обновляем маппинг для продуктов без Syrve GUID
             # await ensure_syrve_mappings(products)
@@ -1109,12 +1114,32 @@ if __name__ == "__main__":
         except Exception as e:
             logger.error(f"Failed to initialize Syrve mapping: {e}")
 
+    async def warm_up_local_ocr():
+        """Создает и прогревает общие OCR-движки, если включен каскадный OCR."""
+        try:
+            from app.utils.async_ocr import CASCADE_MODE
+
+            if not CASCADE_MODE:
+                return
+            from app.utils.cascade_ocr import get_cascade_ocr
+
+            # Прогреваем тот же движок реестра (и язык PaddleOCR), что использует каскад
+            stats = await asyncio.to_thread(get_cascade_ocr().warm_up)
+            logger.info(f"OCR engines warmed up: {stats}")
+        except Exception as e:
+            logger.error(f"Failed to warm up OCR engines: {e}")
+
     # Запускаем бота
     logger.info("Starting bot...")
     
-    async def main():
+    async def run():
         """Главная функция для запуска бота."""
         await init_syrve_mapping()
+        await warm_up_local_ocr()
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     
-    asyncio.run(main())
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
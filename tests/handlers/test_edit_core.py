@@ -120,7 +120,7 @@ async def test_successful_edit_flow_local_parser(mock_message, mock_callbacks):
          patch("app.handlers.edit_core.set_processing_edit", AsyncMock()) as mock_set_processing, \
          patch("app.handlers.edit_core.parse_command_async", AsyncMock(return_value=mock_intent_result)) as mock_local_parser, \
          patch("app.handlers.edit_core.apply_intent", MagicMock(return_value=mock_new_invoice_data)) as mock_apply_intent, \
-         patch("app.handlers.edit_core.load_products", MagicMock(return_value=[])) as mock_load_products, \
+         patch("app.handlers.edit_core.get_products", MagicMock(return_value=[])) as mock_get_products, \
          patch("app.handlers.edit_core.match_positions", MagicMock(return_value=mock_match_results)) as mock_match_positions, \
          patch("app.handlers.edit_core.report.build_report", MagicMock(return_value=(mock_report_text, False))) as mock_build_report, \
          patch("app.handlers.edit_core.parsed_to_dict", MagicMock(side_effect=lambda x: x)) as mock_parsed_to_dict: # bypass Pydantic if used
@@ -133,7 +133,7 @@ async def test_successful_edit_flow_local_parser(mock_message, mock_callbacks):
     mock_local_parser.assert_called_once_with("line 1 name New Name")
     mock_callbacks["run_openai_intent"].assert_not_called() # OpenAI parser should not be called
     mock_apply_intent.assert_called_once_with(initial_invoice_data, mock_intent_result)
-    mock_load_products.assert_called_once()
+    mock_get_products.assert_called_once()
     mock_match_positions.assert_called_once_with(mock_new_invoice_data["positions"], [])
     
     updated_data = await state.get_data()
@@ -165,7 +165,7 @@ async def test_successful_edit_flow_openai_parser(mock_message, mock_callbacks):
          patch("app.handlers.edit_core.set_processing_edit", AsyncMock()), \
          patch("app.handlers.edit_core.parse_command_async", AsyncMock(return_value=mock_local_intent_unknown)) as mock_local_parser, \
          patch("app.handlers.edit_core.apply_intent", MagicMock(return_value=mock_new_invoice_data)) as mock_apply_intent, \
-         patch("app.handlers.edit_core.load_products", MagicMock(return_value=[])), \
+         patch("app.handlers.edit_core.get_products", MagicMock(return_value=[])), \
          patch("app.handlers.edit_core.match_positions", MagicMock(return_value=mock_match_results)), \
          patch("app.handlers.edit_core.report.build_report", MagicMock(return_value=(mock_report_text, False))), \
          patch("app.handlers.edit_core.parsed_to_dict", MagicMock(side_effect=lambda x: x)):
@@ -297,7 +297,7 @@ async def test_build_report_failure(mock_message, mock_callbacks):
          patch("app.handlers.edit_core.set_processing_edit", AsyncMock()) as mock_set_processing, \
          patch("app.handlers.edit_core.parse_command_async", AsyncMock(return_value=mock_intent_result)), \
          patch("app.handlers.edit_core.apply_intent", MagicMock(return_value=mock_new_invoice_data)), \
-         patch("app.handlers.edit_core.load_products", MagicMock(return_value=[])), \
+         patch("app.handlers.edit_core.get_products", MagicMock(return_value=[])), \
          patch("app.handlers.edit_core.match_positions", MagicMock(return_value=mock_match_results)), \
          patch("app.handlers.edit_core.report.build_report", MagicMock(side_effect=Exception("Report failed"))), \
          patch("app.handlers.edit_core.parsed_to_dict", MagicMock(side_effect=lambda x: x)):
@@ -328,7 +328,7 @@ async def test_fuzzy_suggester_called_for_unknown_item(mock_message, mock_callba
          patch("app.handlers.edit_core.set_processing_edit", AsyncMock()), \
          patch("app.handlers.edit_core.parse_command_async", AsyncMock(return_value=mock_intent_result)), \
          patch("app.handlers.edit_core.apply_intent", MagicMock(return_value=mock_new_invoice_data)), \
-         patch("app.handlers.edit_core.load_products", MagicMock(return_value=[])), \
+         patch("app.handlers.edit_core.get_products", MagicMock(return_value=[])), \
          patch("app.handlers.edit_core.match_positions", MagicMock(return_value=mock_match_results)) as mock_matcher, \
          patch("app.handlers.edit_core.report.build_report", MagicMock(return_value=(mock_report_text, True))), \
          patch("app.handlers.edit_core.parsed_to_dict", MagicMock(side_effect=lambda x: x)):
@@ -361,7 +361,7 @@ async def test_send_result_called_if_fuzzy_suggester_not_shown(mock_message, moc
          patch("app.handlers.edit_core.set_processing_edit", AsyncMock()), \
          patch("app.handlers.edit_core.parse_command_async", AsyncMock(return_value=mock_intent_result)), \
          patch("app.handlers.edit_core.apply_intent", MagicMock(return_value=mock_new_invoice_data)), \
-         patch("app.handlers.edit_core.load_products", MagicMock(return_value=[])), \
+         patch("app.handlers.edit_core.get_products", MagicMock(return_value=[])), \
          patch("app.handlers.edit_core.match_positions", MagicMock(return_value=mock_match_results)), \
          patch("app.handlers.edit_core.report.build_report", MagicMock(return_value=(mock_report_text, True))), \
          patch("app.handlers.edit_core.parsed_to_dict", MagicMock(side_effect=lambda x: x)):
@@ -96,7 +96,7 @@ async def test_handle_pick_name_successful(mock_state_with_invoice, mock_product
 
     # Mock external calls
     with patch(
-        "app.handlers.name_picker.load_products", MagicMock(return_value=mock_products_db)
+        "app.handlers.name_picker.get_products", MagicMock(return_value=mock_products_db)
     ), patch("app.handlers.name_picker.set_name") as mock_set_name, patch(
         "app.handlers.name_picker.match_positions", MagicMock(return_value=[])
     ) as mock_match_positions, patch(
@@ -167,7 +167,7 @@ async def test_handle_pick_name_no_invoice(mock_state_with_invoice):
 @pytest.mark.asyncio
 async def test_handle_pick_name_product_not_found_in_db(mock_state_with_invoice, mock_products_db):
     mock_call = get_mock_callback_query(data="pick_name:0:unknown_prod_id")
-    with patch("app.handlers.name_picker.load_products", MagicMock(return_value=mock_products_db)):
+    with patch("app.handlers.name_picker.get_products", MagicMock(return_value=mock_products_db)):
         await handle_pick_name(mock_call, mock_state_with_invoice)
     mock_call.answer.assert_called_once_with("Product not found in database.")
     # Ensure processing message was deleted
@@ -178,7 +178,7 @@ async def test_handle_pick_name_product_not_found_in_db(mock_state_with_invoice,
 
 
 @pytest.mark.asyncio
-@patch("app.handlers.name_picker.load_products")
+@patch("app.handlers.name_picker.get_products")
 @patch("app.handlers.name_picker.fuzzy_find")
 async def test_show_fuzzy_suggestions_found_and_shown(
     mock_fuzzy_find, mock_load_prod, mock_state_with_invoice
@@ -213,7 +213,7 @@ async def test_show_fuzzy_suggestions_found_and_shown(
 
 
 @pytest.mark.asyncio
-@patch("app.handlers.name_picker.load_products")
+@patch("app.handlers.name_picker.get_products")
 @patch("app.handlers.name_picker.fuzzy_find")
 async def test_show_fuzzy_suggestions_not_found(
     mock_fuzzy_find, mock_load_prod, mock_state_with_invoice
@@ -268,7 +268,7 @@ async def test_handle_pick_name_reject_successful(mock_state_with_invoice):
     mock_call = get_mock_callback_query(data=f"pick_name_reject:{row_idx}")
     initial_invoice = (await mock_state_with_invoice.get_data())["invoice"]
 
-    with patch("app.handlers.name_picker.load_products", MagicMock(return_value=[])), patch(
+    with patch("app.handlers.name_picker.get_products", MagicMock(return_value=[])), patch(
         "app.handlers.name_picker.set_name"
     ) as mock_set_name, patch(
         "app.handlers.name_picker.match_positions", MagicMock(return_value=[])
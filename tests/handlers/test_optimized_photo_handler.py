@@ -80,7 +80,7 @@ def mock_opt_match_results(): # Renamed
 @pytest.mark.asyncio
 @patch("app.handlers.optimized_photo_handler.IncrementalUI")
 @patch("app.handlers.optimized_photo_handler.async_ocr")
-@patch("app.handlers.optimized_photo_handler.cached_load_products")
+@patch("app.handlers.optimized_photo_handler.get_products")
 @patch("app.handlers.optimized_photo_handler.async_match_positions")
 @patch("app.handlers.optimized_photo_handler.build_report")
 @patch("app.handlers.optimized_photo_handler.build_main_kb")
@@ -91,7 +91,7 @@ def mock_opt_match_results(): # Renamed
 @patch("app.handlers.optimized_photo_handler.async_timed", lambda **params: lambda func: func) # Bypass decorator
 async def test_optimized_photo_handler_successful_flow(
     mock_build_main_kb_opt, mock_build_report_opt, mock_async_match_positions, 
-    mock_cached_load_products_opt, mock_async_ocr, MockIncrementalUI_opt,
+    mock_get_products_opt, mock_async_ocr, MockIncrementalUI_opt,
     mock_opt_message, mock_opt_state, mock_opt_ocr_result, mock_opt_match_results,
     mock_set_processing_photo_func, mock_is_processing_photo_func # Injected patched mocks
 ):
@@ -101,7 +101,7 @@ async def test_optimized_photo_handler_successful_flow(
     mock_ui_instance.update, mock_ui_instance.append, mock_ui_instance.complete, mock_ui_instance.error = AsyncMock(), AsyncMock(), AsyncMock(), AsyncMock()
 
     mock_async_ocr.return_value = mock_opt_ocr_result
-    mock_cached_load_products_opt.return_value = [{"id": "opt_p1", "name": "Optimized Product DB"}]
+    mock_get_products_opt.return_value = [{"id": "opt_p1", "name": "Optimized Product DB"}]
     mock_async_match_positions.return_value = mock_opt_match_results
     mock_build_report_opt.return_value = ("<p>Optimized HTML Report</p>", False)
     mock_build_main_kb_opt.return_value = MagicMock()
@@ -119,7 +119,7 @@ async def test_optimized_photo_handler_successful_flow(
     # Assertions for core logic
     mock_async_ocr.assert_called_once() # Check args if necessary, e.g., req_id
     mock_async_match_positions.assert_called_once_with(
-        mock_opt_ocr_result["positions"], mock_cached_load_products_opt.return_value
+        mock_opt_ocr_result["positions"], mock_get_products_opt.return_value
     )
     mock_build_report_opt.assert_called_once_with(mock_opt_ocr_result, mock_opt_match_results, escape_html=True)
 
@@ -191,7 +191,7 @@ async def test_optimized_photo_handler_ocr_timeout(
 @patch("app.handlers.optimized_photo_handler.IncrementalUI")
 @patch("app.handlers.optimized_photo_handler.build_report")
 @patch("app.handlers.optimized_photo_handler.async_ocr")
-@patch("app.handlers.optimized_photo_handler.cached_load_products")
+@patch("app.handlers.optimized_photo_handler.get_products")
 @patch("app.handlers.optimized_photo_handler.async_match_positions")
 @patch("app.handlers.optimized_photo_handler.user_matches", {})
 @patch("app.handlers.optimized_photo_handler.is_processing_photo", AsyncMock(return_value=False))
@@ -167,7 +167,7 @@ async def test_handle_cancel_row(mock_build_edit_kb, mock_state_with_invoice):
 # --- Test Pagination (Simplified: Prev, Next) ---
 @pytest.mark.asyncio
 @patch("app.handlers.review_handlers.matcher.match_positions")
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 @patch("app.handlers.review_handlers.keyboards.build_invoice_report")
 async def test_handle_page_prev_and_next(
@@ -206,7 +206,7 @@ async def test_handle_page_prev_and_next(
 
 # --- Test process_field_reply (core logic for name, qty, price, unit updates) ---
 @pytest.mark.asyncio
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.matcher.match_positions")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 @patch("app.handlers.review_handlers.keyboards.build_main_kb")
@@ -266,7 +266,7 @@ async def test_process_field_reply_invalid_number_for_qty(mock_state_with_invoic
 # --- Test handle_submit (before confirmation) ---
 @pytest.mark.asyncio
 @patch("app.handlers.review_handlers.matcher.match_positions")
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 async def test_handle_submit_no_errors_shows_confirmation(
     mock_build_report_func, mock_load_prods, mock_match_pos,
@@ -288,7 +288,7 @@ async def test_handle_submit_no_errors_shows_confirmation(
 
 @pytest.mark.asyncio
 @patch("app.handlers.review_handlers.matcher.match_positions")
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 async def test_handle_submit_with_errors_shows_alert(
     mock_build_report_func, mock_load_prods, mock_match_pos,
@@ -320,7 +320,7 @@ async def test_handle_submit_confirm(mock_state_with_invoice):
 @pytest.mark.asyncio
 @patch("app.handlers.review_handlers.export_to_syrve", new_callable=AsyncMock)
 @patch("app.handlers.review_handlers.matcher.match_positions")
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 @patch("app.handlers.review_handlers.keyboards.build_invoice_report")
 async def test_handle_submit_anyway_success(
@@ -344,7 +344,7 @@ async def test_handle_submit_anyway_success(
 @pytest.mark.asyncio
 @patch("app.handlers.review_handlers.export_to_syrve", new_callable=AsyncMock, side_effect=Exception("Syrve Export Failed"))
 @patch("app.handlers.review_handlers.matcher.match_positions")
-@patch("app.handlers.review_handlers.data_loader.load_products")
+@patch("app.handlers.review_handlers.catalog.get_products")
 @patch("app.handlers.review_handlers.invoice_report.build_report")
 @patch("app.handlers.review_handlers.keyboards.build_invoice_report")
 async def test_handle_submit_anyway_export_fails(
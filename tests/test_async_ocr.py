@@ -4,19 +4,23 @@
 
 import asyncio
 import json
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 import aiohttp
 import pytest
 
-from app.models import ParsedData, Position
+from app.models import ParsedData, Position, Product
+from app.product_index import clear_index_cache, item_value
 from app.utils.async_ocr import (
     DEFAULT_TIMEOUT,
     INVOICE_FUNCTION_SCHEMA,
+    PositionStreamParser,
     async_ocr,
+    async_ocr_stream,
     close_http_session,
     get_http_session,
 )
+from app.utils.ocr_scheduler import LANE_PHOTO, OCRScheduler
 
 
 class TestAsyncOCRConfig:
@@ -146,7 +150,9 @@ class TestAsyncOCR:
         """Тест успешного выполнения OCR"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
             "app.utils.async_ocr.async_store_in_cache", new_callable=AsyncMock
-        ), patch("app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes), patch(
+        ), patch(
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
+        ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
@@ -202,7 +208,7 @@ class TestAsyncOCR:
         with patch("app.utils.async_ocr.async_get_from_cache") as mock_cache_get, patch(
             "app.utils.async_ocr.async_store_in_cache"
         ) as mock_cache_store, patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
@@ -242,7 +248,7 @@ class TestAsyncOCR:
         with patch(
             "app.utils.async_ocr.async_get_from_cache", side_effect=Exception("Ошибка кеша")
         ), patch("app.utils.async_ocr.async_store_in_cache", new_callable=AsyncMock), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
@@ -278,7 +284,8 @@ class TestAsyncOCR:
     async def test_async_ocr_image_optimization_error(self, sample_image_bytes, mock_api_response):
         """Тест обработки ошибки оптимизации изображения"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", side_effect=Exception("Ошибка оптимизации")
+            "app.utils.async_ocr.prepare_for_vision_async",
+            side_effect=Exception("Ошибка оптимизации"),
         ), patch("app.utils.async_ocr.postprocess_parsed_data") as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
         ) as mock_settings:
@@ -312,7 +319,7 @@ class TestAsyncOCR:
     async def test_async_ocr_no_api_key(self, sample_image_bytes):
         """Тест ошибки отсутствия API ключа"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = ""
@@ -328,7 +335,7 @@ class TestAsyncOCR:
     async def test_async_ocr_fallback_api_key(self, sample_image_bytes, mock_api_response):
         """Тест использования резервного API ключа"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.postprocess_parsed_data") as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
         ) as mock_settings:
@@ -362,7 +369,7 @@ class TestAsyncOCR:
     async def test_async_ocr_api_error_status(self, sample_image_bytes):
         """Тест обработки ошибки статуса API"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -387,7 +394,7 @@ class TestAsyncOCR:
     async def test_async_ocr_timeout(self, sample_image_bytes):
         """Тест таймаута OCR"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -404,7 +411,7 @@ class TestAsyncOCR:
     async def test_async_ocr_empty_response(self, sample_image_bytes):
         """Тест пустого ответа API"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -429,7 +436,7 @@ class TestAsyncOCR:
     async def test_async_ocr_no_tool_calls(self, sample_image_bytes):
         """Тест ответа без tool_calls"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -456,7 +463,7 @@ class TestAsyncOCR:
     async def test_async_ocr_wrong_function_name(self, sample_image_bytes):
         """Тест неправильного имени функции"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -493,7 +500,7 @@ class TestAsyncOCR:
     async def test_async_ocr_invalid_json(self, sample_image_bytes):
         """Тест невалидного JSON в аргументах функции"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
-            "app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
         ), patch("app.utils.async_ocr.settings") as mock_settings:
 
             mock_settings.OPENAI_OCR_KEY = "test_key"
@@ -536,7 +543,9 @@ class TestAsyncOCR:
         """Тест ошибки записи в кеш"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
             "app.utils.async_ocr.async_store_in_cache", side_effect=Exception("Ошибка записи кеша")
-        ), patch("app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes), patch(
+        ), patch(
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
+        ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
@@ -572,7 +581,9 @@ class TestAsyncOCR:
         """Тест использования пользовательского req_id"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
             "app.utils.async_ocr.async_store_in_cache", new_callable=AsyncMock
-        ), patch("app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes), patch(
+        ), patch(
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
+        ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
@@ -607,7 +618,9 @@ class TestAsyncOCR:
         """Тест использования пользовательского таймаута"""
         with patch("app.utils.async_ocr.async_get_from_cache", return_value=None), patch(
             "app.utils.async_ocr.async_store_in_cache", new_callable=AsyncMock
-        ), patch("app.utils.async_ocr.prepare_for_ocr", return_value=sample_image_bytes), patch(
+        ), patch(
+            "app.utils.async_ocr.prepare_for_vision_async", return_value=sample_image_bytes
+        ), patch(
             "app.utils.async_ocr.postprocess_parsed_data"
         ) as mock_postprocess, patch(
             "app.utils.async_ocr.settings"
@@ -645,3 +658,200 @@ class TestAsyncOCR:
 
 if __name__ == "__main__":
     pytest.main([__file__])
+
+
+STREAM_ARGUMENTS = json.dumps(
+    {
+        "supplier": 'UD "Positions" {1}',
+        "date": "2024-01-15",
+        "positions": [
+            {"name": "Tomato", "qty": 2, "unit": "kg", "price": 15000, "total_price": 30000},
+            {"name": 'Chili "big"}', "qty": 1, "unit": "kg", "price": 40000},
+            {"name": "Egg", "qty": 30, "unit": "pcs", "price": 2000, "total_price": 60000},
+        ],
+        "total_price": 130000,
+    }
+)
+
+
+def sse_lines(arguments, chunk_size=7):
+    """Строки server-sent events с дельтами аргументов tool call"""
+    first = {"choices": [{"delta": {"tool_calls": [{"function": {"name": "get_parsed_invoice"}}]}}]}
+    lines = [f"data: {json.dumps(first)}\n".encode()]
+    for i in range(0, len(arguments), chunk_size):
+        delta = {"tool_calls": [{"function": {"arguments": arguments[i : i + chunk_size]}}]}
+        lines.append(f"data: {json.dumps({'choices': [{'delta': delta}]})}\n".encode())
+        lines.append(b"\n")
+    lines.append(b"data: [DONE]\n")
+    return lines
+
+
+class FakeStreamResponse:
+    """Ответ aiohttp с потоковым телом; запоминает, сколько строк прочитано"""
+
+    def __init__(self, lines):
+        self.status = 200
+        self.lines = lines
+        self.consumed = 0
+
+    @property
+    def content(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for line in self.lines:
+            # Как при чтении из сокета: управление уходит в event loop
+            await asyncio.sleep(0)
+            self.consumed += 1
+            yield line
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+@pytest.fixture
+def stream_env():
+    """Окружение потокового OCR без сети, каталога и пула процессов"""
+    response = FakeStreamResponse(sse_lines(STREAM_ARGUMENTS))
+    session = AsyncMock()
+    session.post = lambda *args, **kwargs: response
+    with patch("app.utils.async_ocr.get_http_session", AsyncMock(return_value=session)), patch(
+        "app.utils.async_ocr.prepare_for_vision_async", AsyncMock(return_value=b"image")
+    ), patch("app.utils.async_ocr.get_products", return_value=[]), patch(
+        "app.postprocessing.get_products", return_value=[]
+    ), patch(
+        "app.utils.async_ocr.settings"
+    ) as mock_settings:
+        mock_settings.OPENAI_OCR_KEY = "test_key"
+        yield response
+
+
+class TestPositionStreamParser:
+    """Тесты инкрементального разбора аргументов tool call"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 64, 10_000])
+    def test_positions_emitted_in_order(self, chunk_size):
+        """Позиции выдаются по одной при любом разбиении потока"""
+        parser = PositionStreamParser()
+        items = []
+        for i in range(0, len(STREAM_ARGUMENTS), chunk_size):
+            items.extend(parser.feed(STREAM_ARGUMENTS[i : i + chunk_size]))
+
+        assert items == json.loads(STREAM_ARGUMENTS)["positions"]
+        assert parser.buffer == STREAM_ARGUMENTS
+
+    def test_position_emitted_when_object_closes(self):
+        """Позиция доступна сразу после закрывающей скобки, до конца массива"""
+        parser = PositionStreamParser()
+        head = '{"positions": [{"name": "A", "qty": 1}'
+
+        assert parser.feed(head[:-1]) == []
+        assert parser.feed(head[-1]) == [{"name": "A", "qty": 1}]
+        assert parser.feed(', {"name": "B"') == []
+
+    def test_braces_inside_strings_ignored(self):
+        """Скобки и кавычки внутри строк не ломают разбор"""
+        parser = PositionStreamParser()
+        items = parser.feed('{"supplier": "[{\\"positions\\": [", "positions": [{"name": "}{"}]}')
+        assert items == [{"name": "}{"}]
+
+
+class TestAsyncOCRStream:
+    """Тесты потокового OCR"""
+
+    @pytest.mark.asyncio
+    async def test_positions_yielded_before_stream_ends(self, stream_env):
+        """Первая позиция выдается до окончания генерации ответа"""
+        items = []
+        consumed_at_first = None
+        async for item in async_ocr_stream(b"photo", use_cache=False):
+            if consumed_at_first is None:
+                consumed_at_first = stream_env.consumed
+            items.append(item)
+
+        positions, result = items[:-1], items[-1]
+        assert [p.name for p in positions] == ["Tomato", 'Chili "big"}', "Egg"]
+        assert consumed_at_first < len(stream_env.lines) // 2
+        assert isinstance(result, ParsedData)
+        assert result.positions == positions
+        assert result.supplier == 'UD "Positions" {1}'
+        assert result.total_price == 130000
+        # Постобработка применена к позиции в потоке
+        assert positions[1].total_price == 40000
+
+    @pytest.mark.asyncio
+    async def test_async_ocr_on_position_callback(self, stream_env):
+        """async_ocr с колбэком использует поток и возвращает итог"""
+        received = []
+
+        async def on_position(position):
+            received.append(position)
+
+        result = await async_ocr(b"photo", use_cache=False, on_position=on_position)
+
+        assert len(received) == 3
+        assert result.positions == received
+
+    @pytest.mark.asyncio
+    async def test_slot_released_before_slow_consumer(self, stream_env):
+        """Слот планировщика не ждет потребителя позиций"""
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        with patch("app.utils.async_ocr.get_ocr_scheduler", return_value=scheduler):
+            items = []
+            async for item in async_ocr_stream(b"photo", use_cache=False):
+                if not items:
+                    # Медленный потребитель: поток успевает дочитаться
+                    await asyncio.sleep(0.05)
+                    assert stream_env.consumed == len(stream_env.lines)
+                    assert scheduler.get_stats()[LANE_PHOTO]["running"] == 0
+                items.append(item)
+
+        assert isinstance(items[-1], ParsedData)
+        assert len(items) == 4
+
+    @pytest.mark.asyncio
+    async def test_abandoned_stream_releases_slot(self, stream_env):
+        """Прерванный потребителем поток отменяет запрос и освобождает слот"""
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        with patch("app.utils.async_ocr.get_ocr_scheduler", return_value=scheduler):
+            stream = async_ocr_stream(b"photo", use_cache=False)
+            first = await stream.__anext__()
+            await stream.aclose()
+
+        assert isinstance(first, Position)
+        assert stream_env.consumed < len(stream_env.lines)
+        assert scheduler.get_stats()[LANE_PHOTO]["running"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_reuses_catalog_index(self, stream_env):
+        """Позиции потока корректируются по индексу каталога без его пересборки"""
+        products = [
+            Product(id=str(i), code=str(i), name=name, alias=name.lower(), unit="kg")
+            for i, name in enumerate(("Tomato", "Egg", "Milk"))
+        ]
+        snapshot = Mock(products=products, version=1)
+        catalog = Mock(current=Mock(return_value=snapshot))
+        clear_index_cache()
+        try:
+            with patch("app.postprocessing.get_products", return_value=products), patch(
+                "app.product_index.get_catalog", return_value=catalog
+            ), patch("app.product_index.item_value", side_effect=item_value) as values:
+                items = [item async for item in async_ocr_stream(b"photo", use_cache=False)]
+        finally:
+            clear_index_cache()
+
+        assert len(items) == 4
+        # Значения каталога прочитаны один раз — при построении индекса
+        assert values.call_count == len(products)
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_replays_positions(self):
+        """Результат из кеша выдается как поток позиций и итог"""
+        cached = ParsedData(positions=[Position(name="Tomato", qty=1.0)])
+        with patch("app.utils.async_ocr.async_get_from_cache", AsyncMock(return_value=cached)):
+            items = [item async for item in async_ocr_stream(b"photo")]
+
+        assert items == [cached.positions[0], cached]
@@ -0,0 +1,245 @@
+"""Tests for app/utils/cascade_ocr.py"""
+
+import datetime
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.models import ParsedData, Position
+from app.utils.cascade_ocr import (
+    CascadeOCR,
+    local_result_to_parsed_data,
+    parse_header_answer,
+    score_local_result,
+)
+
+INVOICE_DATE = datetime.date(2026, 1, 5)
+
+
+def local_result(lines=None, issues=None, cell_confidence=0.95, status="success"):
+    """Result of OCRPipelineOptimized.process_image"""
+    if lines is None:
+        lines = [
+            {"name": "Tomato", "qty": 2, "unit": "kg", "price": 15000, "amount": 30000},
+            {"name": "Onion", "qty": 1, "unit": "kg", "price": 12000, "amount": 12000},
+        ]
+    return {
+        "status": status,
+        "lines": lines,
+        "issues": issues or [],
+        "metrics": {"cell_confidence": cell_confidence},
+    }
+
+
+class TestScoreLocalResult:
+    def test_consistent_invoice_scores_high(self):
+        score, parts = score_local_result(local_result())
+
+        assert parts["arithmetic"] == 1.0
+        assert score == pytest.approx(0.6 + 0.4 * 0.95)
+
+    def test_arithmetic_errors_and_fixes_lower_score(self):
+        issues = [
+            {"type": "ARITHMETIC_ERROR", "line": 0, "severity": "warning"},
+            {"type": "ARITHMETIC_FIX", "line": 1, "severity": "info"},
+        ]
+
+        _, parts = score_local_result(local_result(issues=issues))
+
+        assert parts["arithmetic"] == 0.25
+
+    def test_incomplete_lines_score_zero(self):
+        lines = [
+            {"name": "Tomato", "qty": 2, "unit": "kg", "price": 0, "amount": 0},
+            {"name": "", "qty": 1, "unit": "kg", "price": 5, "amount": 5},
+        ]
+
+        _, parts = score_local_result(local_result(lines=lines))
+
+        assert parts["arithmetic"] == 0.0
+
+    def test_failed_or_empty_result_scores_zero(self):
+        assert score_local_result({"status": "error"})[0] == 0.0
+        assert score_local_result(local_result(lines=[]))[0] == 0.0
+
+
+class TestLocalResultToParsedData:
+    def test_lines_become_positions(self):
+        with patch("app.utils.cascade_ocr.postprocess_parsed_data", side_effect=lambda d: d):
+            data = local_result_to_parsed_data(local_result())
+
+        assert [p.name for p in data.positions] == ["Tomato", "Onion"]
+        assert data.positions[0].qty == 2
+        assert data.positions[0].total_price == 30000
+        assert data.total_price == 42000
+
+
+class TestParseHeaderAnswer:
+    def test_supplier_and_date(self):
+        header = parse_header_answer('{"supplier": " Acme ", "date": "2026-01-05"}')
+
+        assert header == {"supplier": "Acme", "date": INVOICE_DATE}
+
+    def test_missing_or_unreadable_fields(self):
+        assert parse_header_answer('{"supplier": null, "date": "05.01"}') == {
+            "supplier": None,
+            "date": None,
+        }
+        assert parse_header_answer("not json") == {"supplier": None, "date": None}
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    """Cascade cache calls, isolated from the global OCR cache"""
+    with patch(
+        "app.utils.cascade_ocr.async_get_from_cache", AsyncMock(return_value=None)
+    ) as get, patch("app.utils.cascade_ocr.async_store_in_cache", AsyncMock()) as store:
+        yield Mock(get=get, store=store)
+
+
+@pytest.fixture
+def remote():
+    return AsyncMock(return_value=ParsedData(positions=[Position(name="Remote", qty=1)]))
+
+
+def make_cascade(result, remote, threshold=0.85, header=None):
+    pipeline = Mock()
+    if isinstance(result, Exception):
+        pipeline.process_image = AsyncMock(side_effect=result)
+    else:
+        pipeline.process_image = AsyncMock(return_value=result)
+    if header is None:
+        header = {"supplier": "Acme", "date": INVOICE_DATE}
+    cascade = CascadeOCR(
+        remote_ocr=remote,
+        threshold=threshold,
+        templates=False,
+        header_reader=AsyncMock(return_value=header),
+    )
+    cascade._pipeline = Mock(return_value=pipeline)
+    return cascade
+
+
+class TestCascadeOCR:
+    @pytest.mark.asyncio
+    async def test_confident_local_result_skips_gpt4o(self, remote, cache):
+        cascade = make_cascade(local_result(), remote)
+        streamed = []
+
+        async def on_position(position):
+            streamed.append(position.name)
+
+        with patch("app.utils.cascade_ocr.postprocess_parsed_data", side_effect=lambda d: d):
+            data = await cascade.recognize(b"image", req_id="r1", on_position=on_position)
+
+        assert [p.name for p in data.positions] == ["Tomato", "Onion"]
+        assert (data.supplier, data.date) == ("Acme", INVOICE_DATE)
+        assert streamed == ["Tomato", "Onion"]
+        remote.assert_not_called()
+        cache.store.assert_awaited_once()
+        assert cache.store.call_args.args[1] is data
+        stats = cascade.get_stats()
+        assert stats["local_only"] == 1
+        assert stats["local_only_rate"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_cascade(self, remote, cache):
+        cached = ParsedData(supplier="Acme", positions=[Position(name="Cached", qty=1)])
+        cache.get.return_value = cached
+        cascade = make_cascade(local_result(), remote)
+        streamed = []
+
+        async def on_position(position):
+            streamed.append(position.name)
+
+        data = await cascade.recognize(b"image", req_id="r5", on_position=on_position)
+
+        assert data is cached
+        assert streamed == ["Cached"]
+        cascade._pipeline.assert_not_called()
+        cascade.header_reader.assert_not_called()
+        remote.assert_not_called()
+        assert cascade.get_stats()["cache_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_header_escalates(self, remote, cache):
+        cascade = make_cascade(local_result(), remote, header={"supplier": "Acme", "date": None})
+
+        with patch("app.utils.cascade_ocr.postprocess_parsed_data", side_effect=lambda d: d):
+            data = await cascade.recognize(b"image", req_id="r6")
+
+        assert data.positions[0].name == "Remote"
+        remote.assert_awaited_once()
+        cache.store.assert_not_called()
+        stats = cascade.get_stats()
+        assert stats["header_misses"] == 1
+        assert stats["escalated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_escalates(self, remote):
+        issues = [{"type": "ARITHMETIC_ERROR", "line": 0}, {"type": "ARITHMETIC_ERROR", "line": 1}]
+        cascade = make_cascade(local_result(issues=issues), remote)
+
+        with patch("app.utils.cascade_ocr.postprocess_parsed_data", side_effect=lambda d: d):
+            data = await cascade.recognize(b"image", req_id="r2", user_id=7)
+
+        assert data.positions[0].name == "Remote"
+        remote.assert_awaited_once()
+        kwargs = remote.call_args.kwargs
+        assert kwargs["cascade"] is False
+        assert kwargs["user_id"] == 7
+        stats = cascade.get_stats()
+        assert stats["escalated"] == 1
+        assert stats["local_only_rate"] == 0.0
+        assert stats["avg_tier_seconds"]["local"] >= 0
+        assert stats["avg_tier_seconds"]["template"] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_local_failure_escalates(self, remote):
+        cascade = make_cascade(RuntimeError("no table"), remote)
+
+        data = await cascade.recognize(b"image", req_id="r3")
+
+        assert data.positions[0].name == "Remote"
+        assert cascade.get_stats()["escalated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_template_hit_skips_other_tiers(self, remote):
+        cascade = make_cascade(local_result(), remote)
+        cascade.templates = True
+        template_data = ParsedData(supplier="acme", positions=[Position(name="Flour", qty=5)])
+        cascade.run_template = AsyncMock(return_value=template_data)
+
+        data = await cascade.recognize(b"image", req_id="r4")
+
+        assert data.supplier == "acme"
+        assert data.date == INVOICE_DATE
+        cascade._pipeline.assert_not_called()
+        remote.assert_not_called()
+        stats = cascade.get_stats()
+        assert stats["template_hits"] == 1
+        assert stats["local_only"] == 1
+
+    @pytest.mark.asyncio
+    async def test_template_hit_without_date_escalates(self, remote):
+        cascade = make_cascade(local_result(), remote, header={"supplier": None, "date": None})
+        cascade.templates = True
+        template_data = ParsedData(supplier="acme", positions=[Position(name="Flour", qty=5)])
+        cascade.run_template = AsyncMock(return_value=template_data)
+
+        data = await cascade.recognize(b"image", req_id="r7")
+
+        assert data.positions[0].name == "Remote"
+        cascade._pipeline.assert_not_called()
+        assert cascade.get_stats()["template_hits"] == 0
+
+    def test_warm_up_uses_cascade_engine_and_language(self, remote):
+        pipeline = Mock()
+        cascade = CascadeOCR(remote_ocr=remote, paddle_ocr_lang="id", templates=False)
+
+        with patch("app.utils.cascade_ocr.get_engine", return_value=pipeline) as get_engine:
+            cascade.warm_up()
+
+        assert get_engine.call_args.args[0] == "cascade_pipeline"
+        assert get_engine.call_args.kwargs["paddle_ocr_lang"] == "id"
+        pipeline.warm_up.assert_called_once()
@@ -0,0 +1,117 @@
+"""Tests for app/catalog.py"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app import catalog
+from app.catalog import CatalogService
+from app.product_index import clear_index_cache, get_product_index
+
+
+def write_catalog(tmp_path, names, aliases=()):
+    products_path = tmp_path / "base_products.csv"
+    aliases_path = tmp_path / "aliases.csv"
+    rows = ["id,name,code,measureName,is_ingredient"]
+    rows += [f"p{i},{name},{i},kg,1" for i, name in enumerate(names)]
+    products_path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    alias_rows = ["alias,product_id"] + [f"{alias},{pid}" for alias, pid in aliases]
+    aliases_path.write_text("\n".join(alias_rows) + "\n", encoding="utf-8")
+    return str(products_path), str(aliases_path)
+
+
+def touch_later(path):
+    """Bump mtime so the change is visible even on coarse-grained filesystems"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestCatalogService:
+    """Test loading, caching and hot reload"""
+
+    def test_loads_once(self, tmp_path):
+        products_path, aliases_path = write_catalog(tmp_path, ["apple", "orange"])
+        service = CatalogService(products_path, aliases_path, check_interval=0)
+
+        with patch("app.catalog.load_products", wraps=catalog.load_products) as mock_load:
+            first = service.get_products()
+            second = service.get_products()
+
+        assert mock_load.call_count == 1
+        assert first is second
+        assert [p.name for p in first] == ["apple", "orange"]
+        assert service.version == 1
+
+    def test_reloads_when_file_changes(self, tmp_path):
+        products_path, aliases_path = write_catalog(tmp_path, ["apple"])
+        service = CatalogService(products_path, aliases_path, check_interval=0)
+        old = service.snapshot()
+
+        write_catalog(tmp_path, ["apple", "banana"], aliases=[("appl", "p0")])
+        touch_later(aliases_path)
+        new = service.snapshot()
+
+        assert new.version == old.version + 1
+        assert [p.alias for p in new.products] == ["apple", "banana", "appl"]
+        # The previous snapshot is left untouched for readers still holding it
+        assert [p.name for p in old.products] == ["apple"]
+
+    def test_check_interval_limits_stat_calls(self, tmp_path):
+        products_path, aliases_path = write_catalog(tmp_path, ["apple"])
+        service = CatalogService(products_path, aliases_path, check_interval=3600)
+        service.snapshot()
+
+        write_catalog(tmp_path, ["apple", "banana"])
+        touch_later(products_path)
+
+        assert service.version == 1
+        assert service.reload().version == 2
+
+    def test_force_reload(self, tmp_path):
+        products_path, aliases_path = write_catalog(tmp_path, ["apple"])
+        service = CatalogService(products_path, aliases_path)
+
+        assert service.reload().version == 1
+        assert service.reload().version == 1
+        assert service.reload(force=True).version == 2
+
+    def test_failed_reload_keeps_previous_snapshot(self, tmp_path):
+        products_path, aliases_path = write_catalog(tmp_path, ["apple"])
+        service = CatalogService(products_path, aliases_path, check_interval=0)
+        old = service.snapshot()
+
+        with patch("app.catalog.load_products", side_effect=ValueError("broken csv")):
+            assert service.reload(force=True) is old
+
+    def test_missing_files_raise_on_first_load(self, tmp_path):
+        service = CatalogService(str(tmp_path / "missing.csv"), str(tmp_path / "aliases.csv"))
+        with pytest.raises(FileNotFoundError):
+            service.get_products()
+
+
+class TestCatalogIndex:
+    """The product index is keyed by catalog version"""
+
+    def test_index_follows_catalog_version(self, tmp_path):
+        clear_index_cache()
+        products_path, aliases_path = write_catalog(tmp_path, ["apple", "orange"])
+        service = CatalogService(products_path, aliases_path, check_interval=0)
+
+        with patch("app.product_index.get_catalog", return_value=service):
+            products = service.get_products()
+            first = get_product_index(products)
+            assert get_product_index(service.get_products()) is first
+
+            write_catalog(tmp_path, ["apple", "orange", "mango"])
+            touch_later(products_path)
+            second = get_product_index(service.get_products())
+
+        assert second is not first
+        assert second.values == ["apple", "orange", "mango"]
+        clear_index_cache()
+
+    def test_shared_catalog_helpers(self):
+        assert catalog.get_products() is catalog.get_catalog().get_products()
+        version = catalog.catalog_version()
+        assert catalog.reload_catalog().version == version + 1
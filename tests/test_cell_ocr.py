@@ -0,0 +1,142 @@
+"""Tests for app/utils/cell_ocr.py and app/imgprep/collage.py"""
+
+import asyncio
+import json
+from io import BytesIO
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from PIL import Image
+
+from app.imgprep import build_collage
+from app.imgprep.collage import (
+    COLLAGE_CELL_HEIGHT,
+    COLLAGE_CELL_MAX_WIDTH,
+    LABEL_WIDTH,
+    PADDING,
+    _fit_cell,
+)
+from app.utils.cell_ocr import CellRecognizer, parse_collage_answer
+
+
+def cell_bytes(width=120, height=30, color=(255, 255, 255)):
+    img = Image.new("RGB", (width, height), color)
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def collage_client(answer):
+    """Mock OpenAI client that answers collage requests with the given dict"""
+    client = Mock()
+    response = Mock()
+    response.choices = [Mock(message=Mock(content=json.dumps(answer)))]
+    client.chat.completions.create = Mock(return_value=response)
+    return client
+
+
+class TestBuildCollage:
+    def test_cells_are_stacked(self):
+        collage, included = build_collage([cell_bytes(), cell_bytes(400, 20), cell_bytes()])
+
+        assert included == [0, 1, 2]
+        with Image.open(BytesIO(collage)) as img:
+            assert img.format == "JPEG"
+            # One row per cell, no wider than the widest cell allows
+            assert img.height == 3 * (COLLAGE_CELL_HEIGHT + 2 * PADDING)
+            assert img.width <= LABEL_WIDTH + COLLAGE_CELL_MAX_WIDTH + 2 * PADDING
+
+    def test_wide_cell_keeps_aspect_ratio(self):
+        wide = _fit_cell(Image.new("RGB", (1600, 40)))
+        narrow = _fit_cell(Image.new("RGB", (90, 30)))
+
+        assert wide.size == (COLLAGE_CELL_MAX_WIDTH, 16)
+        assert narrow.size == (144, COLLAGE_CELL_HEIGHT)
+
+    def test_unreadable_cells_are_skipped(self):
+        collage, included = build_collage([b"not an image", cell_bytes()])
+
+        assert included == [1]
+        assert collage
+
+    def test_no_cells(self):
+        assert build_collage([b"broken"]) == (b"", [])
+
+
+class TestParseCollageAnswer:
+    def test_numbered_object(self):
+        assert parse_collage_answer('{"1": " Tomato ", "2": "1.5", "5": "x"}', 3) == {
+            1: "Tomato",
+            2: "1.5",
+        }
+
+    def test_code_block_and_list(self):
+        assert parse_collage_answer('```json\n["a", "b"]\n```', 2) == {1: "a", 2: "b"}
+
+    def test_nested_cells_key(self):
+        assert parse_collage_answer('{"cells": {"#1": 3}}', 1) == {1: "3"}
+
+    def test_not_json(self):
+        assert parse_collage_answer("Cell 1 is Tomato", 1) == {}
+
+
+class TestCellRecognizer:
+    @pytest.mark.asyncio
+    async def test_low_confidence_cells_share_one_request(self):
+        single = AsyncMock(return_value=("single", 1.0))
+        recognizer = CellRecognizer(single_cell=single, window=0.01)
+        client = collage_client({str(i): f"cell {i}" for i in range(1, 16)})
+
+        with patch("app.utils.cell_ocr.get_ocr_client", return_value=client):
+            results = await asyncio.gather(*(recognizer.recognize(cell_bytes()) for _ in range(15)))
+
+        assert results == [(f"cell {i}", 1.0) for i in range(1, 16)]
+        assert client.chat.completions.create.call_count == 1
+        single.assert_not_called()
+        assert recognizer.get_stats()["collage_requests"] == 1
+
+    @pytest.mark.asyncio
+    async def test_batch_size_splits_requests(self):
+        recognizer = CellRecognizer(single_cell=AsyncMock(), batch_size=10, window=0.01)
+        client = collage_client({str(i): "x" for i in range(1, 11)})
+
+        with patch("app.utils.cell_ocr.get_ocr_client", return_value=client):
+            await asyncio.gather(*(recognizer.recognize(cell_bytes()) for _ in range(15)))
+
+        assert client.chat.completions.create.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_missing_answers_fall_back_to_single_cell(self):
+        single = AsyncMock(return_value=("single", 1.0))
+        recognizer = CellRecognizer(single_cell=single, window=0.01)
+        client = collage_client({"1": "first"})
+
+        with patch("app.utils.cell_ocr.get_ocr_client", return_value=client):
+            results = await asyncio.gather(*(recognizer.recognize(cell_bytes()) for _ in range(3)))
+
+        assert results == [("first", 1.0), ("single", 1.0), ("single", 1.0)]
+        assert single.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_request_error_falls_back_to_single_cell(self):
+        single = AsyncMock(return_value=("single", 1.0))
+        recognizer = CellRecognizer(single_cell=single, window=0.01)
+        client = Mock()
+        client.chat.completions.create = Mock(side_effect=Exception("API Error"))
+
+        with patch("app.utils.cell_ocr.get_ocr_client", return_value=client):
+            results = await asyncio.gather(*(recognizer.recognize(cell_bytes()) for _ in range(4)))
+
+        assert results == [("single", 1.0)] * 4
+        assert single.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_single_cell_skips_collage(self):
+        single = AsyncMock(return_value=("alone", 1.0))
+        recognizer = CellRecognizer(single_cell=single, window=0.01)
+        client = collage_client({})
+
+        with patch("app.utils.cell_ocr.get_ocr_client", return_value=client):
+            assert await recognizer.recognize(cell_bytes()) == ("alone", 1.0)
+
+        client.chat.completions.create.assert_not_called()
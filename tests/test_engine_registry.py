@@ -0,0 +1,91 @@
+"""Tests for app/utils/engine_registry.py"""
+
+import threading
+import time
+from unittest.mock import Mock
+
+from app.utils.engine_registry import EngineRegistry
+
+
+class Engine:
+    """Counts instances and warm-up calls"""
+
+    created = 0
+
+    def __init__(self, lang="en", delay=0.0):
+        if delay:
+            time.sleep(delay)
+        Engine.created += 1
+        self.lang = lang
+        self.warmed = 0
+
+    def warm(self):
+        self.warmed += 1
+
+
+class TestEngineRegistry:
+    def setup_method(self):
+        Engine.created = 0
+
+    def test_engine_created_and_warmed_once(self):
+        registry = EngineRegistry()
+
+        first = registry.get("ocr", Engine, warm=Engine.warm, lang="en")
+        second = registry.get("ocr", Engine, warm=Engine.warm, lang="en")
+
+        assert first is second
+        assert Engine.created == 1
+        assert first.warmed == 1
+        stats = registry.get_stats()
+        assert stats["created"] == 1
+        assert stats["hits"] == 1
+        assert set(stats["init"]["ocr"]) == {"create_ms", "warm_ms"}
+
+    def test_parameters_and_factory_are_part_of_key(self):
+        registry = EngineRegistry()
+
+        en = registry.get("ocr", Engine, lang="en")
+        ru = registry.get("ocr", Engine, lang="ru")
+        other_factory = registry.get("ocr", Mock(return_value="patched"), lang="en")
+
+        assert en is not ru
+        assert ru.lang == "ru"
+        assert other_factory == "patched"
+        assert registry.get_stats()["engines"] == 3
+
+    def test_concurrent_first_use_creates_one_engine(self):
+        registry = EngineRegistry()
+        results = []
+
+        def worker():
+            results.append(registry.get("slow", Engine, delay=0.05))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert Engine.created == 1
+        assert all(engine is results[0] for engine in results)
+
+    def test_warm_up_error_is_not_fatal(self):
+        registry = EngineRegistry()
+
+        def broken_warm(engine):
+            raise RuntimeError("no weights")
+
+        engine = registry.get("ocr", Engine, warm=broken_warm)
+
+        assert isinstance(engine, Engine)
+        assert registry.get("ocr", Engine, warm=broken_warm) is engine
+
+    def test_clear_shuts_engines_down(self):
+        registry = EngineRegistry()
+        pool = Mock()
+        registry.get("pool", Mock(return_value=pool))
+
+        registry.clear()
+
+        pool.shutdown.assert_called_once()
+        assert registry.get_stats()["engines"] == 0
@@ -0,0 +1,156 @@
+"""Tests for app/utils/enhanced_ocr_cache.py"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.models import ParsedData, Position
+from app.utils import enhanced_ocr_cache
+from app.utils.cache_stats import get_all_cache_stats
+from app.utils.enhanced_ocr_cache import (
+    OCRResultCache,
+    async_get_from_cache,
+    async_store_in_cache,
+    compute_image_key,
+)
+from app.utils.ocr_cache import get_image_hash
+
+IMAGE = b"\xff\xd8\xff\xe0fake-jpeg-payload"
+
+
+def make_data(name="Tomato"):
+    return ParsedData(
+        supplier="Test Supplier",
+        positions=[Position(name=name, qty=2.0, unit="kg", price=10.0, total_price=20.0)],
+        total_price=20.0,
+    )
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis client used by the cache"""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = OCRResultCache(max_size=2, ttl=60, cache_dir=None, use_redis=False)
+    monkeypatch.setattr(enhanced_ocr_cache, "_ocr_result_cache", cache)
+    return cache
+
+
+class TestCacheKey:
+    """One content hash shared by all OCR caches"""
+
+    def test_key_is_stable_and_content_addressed(self):
+        assert compute_image_key(IMAGE) == compute_image_key(bytes(IMAGE))
+        assert compute_image_key(IMAGE) != compute_image_key(IMAGE + b"x")
+        assert len(compute_image_key(IMAGE)) == 32
+
+    def test_sync_cache_uses_same_key(self):
+        assert get_image_hash(IMAGE) == compute_image_key(IMAGE)
+
+
+class TestOCRResultCache:
+    """Test the memory, Redis and disk tiers"""
+
+    def test_memory_roundtrip_returns_copy(self):
+        cache = OCRResultCache(cache_dir=None, use_redis=False)
+        key = compute_image_key(IMAGE)
+        cache.set(key, make_data())
+
+        first = cache.get(key)
+        first.positions[0].name = "edited by user"
+
+        assert cache.get(key).positions[0].name == "Tomato"
+        assert cache.get_stats()["memory_hits"] == 2
+
+    def test_lru_eviction(self):
+        cache = OCRResultCache(max_size=2, cache_dir=None, use_redis=False)
+        cache.set("a", make_data("a"))
+        cache.set("b", make_data("b"))
+        cache.get("a")
+        cache.set("c", make_data("c"))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+
+    def test_ttl_expiry(self):
+        cache = OCRResultCache(ttl=10, cache_dir=None, use_redis=False)
+        with patch("app.utils.enhanced_ocr_cache.time.time", return_value=1000.0):
+            cache.set("k", make_data())
+        with patch("app.utils.enhanced_ocr_cache.time.time", return_value=1011.0):
+            assert cache.get("k") is None
+        assert cache.get_stats()["misses"] == 1
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        key = compute_image_key(IMAGE)
+        OCRResultCache(cache_dir=str(tmp_path), use_redis=False).set(key, make_data())
+
+        restarted = OCRResultCache(cache_dir=str(tmp_path), use_redis=False)
+        result = restarted.get(key)
+
+        assert result == make_data()
+        assert restarted.get_stats()["disk_hits"] == 1
+        # Promoted to memory on the first hit
+        restarted.get(key)
+        assert restarted.get_stats()["memory_hits"] == 1
+
+    def test_redis_tier_shared_between_processes(self):
+        fake_redis = FakeRedis()
+        key = compute_image_key(IMAGE)
+        with patch("app.utils.redis_cache.get_redis", return_value=fake_redis):
+            OCRResultCache(cache_dir=None).set(key, make_data())
+            other = OCRResultCache(cache_dir=None)
+            assert other.get(key) == make_data()
+
+        assert enhanced_ocr_cache.REDIS_KEY_PREFIX + key in fake_redis.store
+        assert other.get_stats()["redis_hits"] == 1
+
+    def test_redis_errors_are_not_fatal(self):
+        broken = MagicMock()
+        broken.get.side_effect = ConnectionError("down")
+        broken.set.side_effect = ConnectionError("down")
+        with patch("app.utils.redis_cache.get_redis", return_value=broken):
+            cache = OCRResultCache(cache_dir=None)
+            cache.set("k", make_data())
+            assert OCRResultCache(cache_dir=None).get("k") is None
+        assert cache.get_stats()["errors"] == 1
+
+
+class TestAsyncCache:
+    """Test the async API used by async_ocr"""
+
+    @pytest.mark.asyncio
+    async def test_miss_then_hit(self, fresh_cache):
+        assert await async_get_from_cache(IMAGE) is None
+
+        await async_store_in_cache(IMAGE, make_data())
+        result = await async_get_from_cache(IMAGE, key=compute_image_key(IMAGE))
+
+        assert result == make_data()
+        stats = fresh_cache.get_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_precomputed_key_skips_hashing(self, fresh_cache):
+        key = compute_image_key(IMAGE)
+        with patch("app.utils.enhanced_ocr_cache.compute_image_key") as mock_hash:
+            await async_store_in_cache(IMAGE, make_data(), key=key)
+            assert await async_get_from_cache(IMAGE, key=key) == make_data()
+        mock_hash.assert_not_called()
+
+    def test_stats_registered(self, fresh_cache):
+        fresh_cache.get("missing")
+        stats = get_all_cache_stats()["ocr_result_cache"]
+        assert stats["misses"] == 1
+        assert stats["memory_entries"] == 0
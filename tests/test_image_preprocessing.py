@@ -1,15 +1,18 @@
 import os
+import subprocess
 import sys
 from io import BytesIO
+from unittest.mock import patch
 
 import pytest
 from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
 
 # Добавляем путь к директории проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Импортируем функции предобработки изображений
-from app.imgprep import prepare_for_ocr, resize_image
+from app.imgprep import prepare_for_ocr, prepare_for_ocr_async, resize_image, shutdown_prep_executor
 
 
 def create_test_image(width, height, color=(255, 255, 255)):
@@ -88,5 +91,92 @@ def test_prepare_for_ocr():
             os.remove(temp_file)
 
 
+def create_exif_rotated_image(width, height, orientation):
+    """Создает JPEG с тегом EXIF Orientation"""
+    img = Image.new("RGB", (width, height), color=(255, 255, 255))
+    # Черная полоса сверху, чтобы проверить направление поворота
+    img.paste((0, 0, 0), (0, 0, width, height // 10))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=90, exif=exif)
+    return output.getvalue()
+
+
+def test_resize_image_uses_jpeg_draft():
+    """Тест декодирования большого JPEG в уменьшенном масштабе"""
+    original_bytes = create_test_image(4000, 3000)
+
+    with patch(
+        "PIL.JpegImagePlugin.JpegImageFile.draft",
+        autospec=True,
+        side_effect=JpegImageFile.draft,
+    ) as mock_draft:
+        processed_bytes = resize_image(original_bytes)
+
+    mock_draft.assert_called_once()
+    processed_img = Image.open(BytesIO(processed_bytes))
+    assert processed_img.size == (1600, 1200)
+
+
+def test_resize_image_applies_exif_orientation():
+    """Тест однократного применения EXIF-ориентации при уменьшении"""
+    # Orientation 6: при показе изображение поворачивается на 90° по часовой
+    original_bytes = create_exif_rotated_image(3200, 2000, orientation=6)
+
+    processed_img = Image.open(BytesIO(resize_image(original_bytes)))
+
+    assert processed_img.size == (1000, 1600)
+    assert processed_img.getexif().get(0x0112, 1) == 1
+    # Черная полоса оказалась справа
+    assert processed_img.getpixel((990, 800))[0] < 50
+    assert processed_img.getpixel((10, 800))[0] > 200
+
+
+def test_resize_image_rotates_small_image():
+    """Тест поворота небольшого изображения с EXIF-ориентацией"""
+    original_bytes = create_exif_rotated_image(800, 600, orientation=8)
+
+    processed_img = Image.open(BytesIO(resize_image(original_bytes)))
+
+    assert processed_img.size == (600, 800)
+
+
+@pytest.mark.asyncio
+async def test_prepare_for_ocr_async_process_pool():
+    """Тест подготовки изображения в пуле процессов"""
+    original_bytes = create_test_image(2000, 1500)
+    try:
+        result = await prepare_for_ocr_async(original_bytes)
+    finally:
+        shutdown_prep_executor()
+
+    assert result == prepare_for_ocr(original_bytes)
+
+
+@pytest.mark.asyncio
+async def test_prepare_for_ocr_async_without_pool(monkeypatch):
+    """Тест подготовки в потоке, если пул процессов отключен"""
+    monkeypatch.setattr("app.imgprep.prepare.PREP_WORKERS", 0)
+    original_bytes = create_test_image(2000, 1500)
+
+    result = await prepare_for_ocr_async(original_bytes, use_preprocessing=False)
+
+    assert result == original_bytes
+
+
+def test_bot_import_has_no_side_effects(tmp_path):
+    """Процессы пула (spawn) импортируют bot.py как __mp_main__: импорт ничего не создает"""
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]))
+
+    subprocess.run(
+        [sys.executable, "-c", "import bot"], cwd=tmp_path, env=env, check=True, timeout=120
+    )
+
+    assert not (tmp_path / "tmp").exists()
+    assert not (tmp_path / "logs").exists()
+
+
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
@@ -0,0 +1,162 @@
+"""Tests for app/imgprep/strips.py and split-mode OCR"""
+
+import asyncio
+import os
+from io import BytesIO
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.imgprep import split_into_strips
+from app.imgprep.strips import plan_strips
+from app.imgprep.tiling import analysis_gray, text_line_bands
+from app.models import ParsedData, Position
+
+SAMPLE_INVOICE = os.path.join(os.path.dirname(__file__), "sample_invoice.jpg")
+
+
+def tall_invoice(lines=60, line_height=16, pitch=30, width=1000):
+    """JPEG of a long invoice: lines of glyph-like blocks"""
+    img = Image.new("RGB", (width, lines * pitch + 200), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        y = 100 + i * pitch
+        # Glyphs shifted per line so columns don't look like table rulings
+        start = 80 + (i * 5) % 14
+        for x in range(start, start + 40 * (10 + i % 7), 14):
+            draw.rectangle([x, y, x + 4, y + line_height - 1], fill=(0, 0, 0))
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def line_count(image_bytes):
+    with Image.open(BytesIO(image_bytes)) as img:
+        gray, _ = analysis_gray(img.convert("RGB"))
+    return len(text_line_bands(gray))
+
+
+class TestPlanStrips:
+    """Test strip planning on text line bands"""
+
+    def test_short_page_not_split(self):
+        bands = [(i * 10, i * 10 + 5) for i in range(30)]
+        assert plan_strips(bands, 300) == [(0, 300)]
+
+    def test_cuts_in_gaps_with_one_line_overlap(self):
+        bands = [(i * 10, i * 10 + 5) for i in range(60)]
+        strips = plan_strips(bands, 600)
+
+        assert len(strips) == 3
+        assert strips[0][0] == 0 and strips[-1][1] == 600
+        for top, bottom in strips:
+            # No cut goes through a text line
+            for start, end in bands:
+                assert not start < top < end and not start < bottom < end
+        # Neighbouring strips share exactly one line
+        for (_, bottom), (top, _) in zip(strips, strips[1:]):
+            shared = [b for b in bands if b[0] >= top and b[1] <= bottom]
+            assert len(shared) == 1
+
+    def test_overlap_covers_fragmented_row(self):
+        # Rows 30 px apart; the row after each cut is split into two thin bands
+        bands = []
+        for i in range(60):
+            if i in (21, 40):
+                bands += [(i * 30, i * 30 + 6), (i * 30 + 10, i * 30 + 16)]
+            else:
+                bands.append((i * 30, i * 30 + 16))
+        strips = plan_strips(bands, 1800)
+
+        assert len(strips) == 3
+        for (_, bottom), (top, _) in zip(strips, strips[1:]):
+            shared = [b for b in bands if b[0] >= top and b[1] <= bottom]
+            # Both fragments of the row are shared, the next row is not
+            assert len(shared) == 2
+            assert shared[1][1] - shared[0][0] == 16
+
+
+class TestSplitIntoStrips:
+    """Test image cutting"""
+
+    def test_tall_invoice_split_without_losing_lines(self):
+        strips = split_into_strips(tall_invoice(lines=60))
+
+        assert len(strips) == 3
+        # 60 lines plus one shared line per boundary
+        assert sum(line_count(strip) for strip in strips) == 62
+
+    def test_strip_edges_are_blank(self):
+        for strip in split_into_strips(tall_invoice(lines=60)):
+            gray = np.asarray(Image.open(BytesIO(strip)).convert("L"))
+            assert gray[0].min() > 200 and gray[-1].min() > 200
+
+    def test_regular_invoice_kept_whole(self):
+        with open(SAMPLE_INVOICE, "rb") as f:
+            image_bytes = f.read()
+        assert split_into_strips(image_bytes) == [image_bytes]
+
+    def test_invalid_bytes_returned_as_is(self):
+        assert split_into_strips(b"not an image") == [b"not an image"]
+
+
+class TestSplitOCR:
+    """Strips are recognized concurrently and merged"""
+
+    @pytest.mark.asyncio
+    async def test_strips_merged_with_header_from_top(self):
+        from app.utils import async_ocr as async_ocr_module
+
+        strips = {
+            b"s1": ParsedData(
+                supplier="UD Sumber",
+                positions=[
+                    Position(name="tomato", qty=1, total_price=10000),
+                    Position(name="onion", qty=2, total_price=8000),
+                ],
+            ),
+            b"s2": ParsedData(
+                supplier="Jumlah",
+                positions=[
+                    Position(name="onion", qty=2, total_price=8000),
+                    Position(name="egg", qty=30, total_price=60000),
+                ],
+                total_price=78000,
+            ),
+        }
+        in_flight = 0
+        peak = 0
+
+        async def fake_ocr(strip, **kwargs):
+            nonlocal in_flight, peak
+            assert kwargs["split"] is False
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            return strips[strip]
+
+        with patch.object(async_ocr_module, "async_ocr", side_effect=fake_ocr):
+            result = await async_ocr_module._ocr_strips(
+                b"photo", [b"s1", b"s2"], "req", False, 60, None, None, None
+            )
+
+        assert peak == 2
+        assert [p.name for p in result.positions] == ["tomato", "onion", "egg"]
+        assert result.supplier == "UD Sumber"
+        assert result.total_price == 78000
+
+    @pytest.mark.asyncio
+    async def test_split_mode_uses_strips(self):
+        from app.utils import async_ocr as async_ocr_module
+
+        merged = ParsedData(positions=[Position(name="egg", qty=1)])
+        with patch.object(
+            async_ocr_module, "split_into_strips_async", return_value=[b"s1", b"s2"]
+        ), patch.object(async_ocr_module, "_ocr_strips", return_value=merged) as ocr_strips:
+            result = await async_ocr_module.async_ocr(b"photo", use_cache=False, split=True)
+
+        assert result is merged
+        assert ocr_strips.await_args[0][1] == [b"s1", b"s2"]
@@ -0,0 +1,129 @@
+"""Tests for app/imgprep/tiling.py"""
+
+import os
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.imgprep import (
+    expected_tiles,
+    expected_tokens,
+    prepare_for_ocr,
+    prepare_for_vision,
+    prepare_for_vision_async,
+)
+from app.imgprep.tiling import (
+    MIN_TEXT_HEIGHT,
+    choose_target_size,
+    estimate_text_height,
+    find_content_box,
+    plan_vision_size,
+)
+
+SAMPLE_INVOICE = os.path.join(os.path.dirname(__file__), "sample_invoice.jpg")
+
+
+def lined_page(width=1000, height=1400, line_height=20, margin=150):
+    """White page with lines of glyph-like blocks inside the margins"""
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    for y in range(margin, height - margin, line_height * 4):
+        for x in range(margin, width - margin - 200, 14):
+            draw.rectangle([x, y, x + 4, y + line_height - 1], fill=0)
+    return img
+
+
+@pytest.fixture(scope="module")
+def invoice_bytes():
+    with open(SAMPLE_INVOICE, "rb") as f:
+        return f.read()
+
+
+class TestTileCost:
+    """The token model mirrors OpenAI's detail: high accounting"""
+
+    @pytest.mark.parametrize(
+        "size, tiles, tokens",
+        [
+            ((1024, 1024), 4, 765),
+            ((2048, 4096), 6, 1105),
+            ((512, 512), 1, 255),
+            ((1095, 1600), 6, 1105),
+            ((733, 1024), 4, 765),
+        ],
+    )
+    def test_expected_tiles(self, size, tiles, tokens):
+        assert expected_tiles(*size) == tiles
+        assert expected_tokens(*size) == tokens
+
+
+class TestSizingPolicy:
+    """Test border crop, text estimate and grid choice"""
+
+    def test_content_box_drops_empty_margins(self):
+        gray = np.asarray(lined_page(), dtype=np.int16)
+        left, top, right, bottom = find_content_box(gray)
+        assert 120 <= left <= 150 and right <= 680
+        assert 120 <= top <= 150 and bottom <= 1300
+
+    def test_blank_page_keeps_full_frame(self):
+        gray = np.full((300, 200), 255, dtype=np.int16)
+        assert find_content_box(gray) == (0, 0, 200, 300)
+        assert estimate_text_height(gray) is None
+
+    def test_text_height_estimate(self):
+        gray = np.asarray(lined_page(line_height=20), dtype=np.int16)
+        assert estimate_text_height(gray) == pytest.approx(20, abs=1)
+
+    def test_large_text_uses_fewer_tiles(self):
+        big_text = choose_target_size(1200, 1700, text_height=40)
+        small_text = choose_target_size(1200, 1700, text_height=14)
+
+        assert expected_tiles(*big_text) < expected_tiles(*small_text)
+        # Text stays readable at the chosen size
+        assert 40 * big_text[0] / 1200 >= MIN_TEXT_HEIGHT
+
+    def test_unknown_text_uses_full_resolution(self):
+        assert choose_target_size(1200, 1700) == (768, 1088)
+
+    def test_never_upscales(self):
+        width, height = choose_target_size(300, 400, text_height=5)
+        assert (width, height) == (300, 400)
+
+    def test_plan_for_sample_invoice(self, invoice_bytes):
+        with Image.open(BytesIO(invoice_bytes)) as img:
+            sizing = plan_vision_size(img.convert("RGB"))
+
+        assert sizing.tiles == 4
+        assert sizing.tokens == 765
+        # Crop keeps the whole table: header block and the grand total line
+        left, top, right, bottom = sizing.crop_box
+        assert left <= 96 and top <= 160 and right >= 1216 and bottom >= 1730
+
+
+class TestPrepareForVision:
+    """End-to-end preparation of the sample invoice"""
+
+    def test_smaller_payload_and_fewer_tokens(self, invoice_bytes):
+        legacy = prepare_for_ocr(invoice_bytes)
+        vision = prepare_for_vision(invoice_bytes)
+
+        legacy_size = Image.open(BytesIO(legacy)).size
+        vision_size = Image.open(BytesIO(vision)).size
+
+        assert len(vision) < len(legacy)
+        assert expected_tokens(*vision_size) < expected_tokens(*legacy_size)
+
+    def test_invalid_bytes_returned_as_is(self):
+        assert prepare_for_vision(b"not an image") == b"not an image"
+
+    @pytest.mark.asyncio
+    async def test_tile_sizing_is_opt_in(self, invoice_bytes, monkeypatch):
+        monkeypatch.setattr("app.imgprep.prepare.PREP_WORKERS", 0)
+
+        assert await prepare_for_vision_async(invoice_bytes) == prepare_for_ocr(invoice_bytes)
+
+        monkeypatch.setattr("app.imgprep.prepare.TILE_SIZING", True)
+        assert await prepare_for_vision_async(invoice_bytes) == prepare_for_vision(invoice_bytes)
@@ -0,0 +1,215 @@
+"""Tests for app/edit/incremental.py"""
+
+import copy
+import random
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.edit.apply_intent import apply_intent
+from app.edit.incremental import DirtyLines, dirty_lines, refresh_after_edit, summarize
+from app.formatters.report import build_report
+from app.handlers.edit_flow import confirm_fuzzy_name
+
+KNOWN = {"tomato", "onion", "garlic", "chicken", "beef", "rice"}
+
+
+def fake_match(positions):
+    """Deterministic stand-in for match_positions: known names match, others don't"""
+    results = []
+    for position in positions:
+        result = position.copy()
+        known = position.get("name") in KNOWN
+        result["status"] = "ok" if known else "unknown"
+        result["matched_name"] = position.get("name") if known else None
+        results.append(result)
+    return results
+
+
+def make_invoice(count=50, seed=7):
+    """Invoice with known and unknown names and a few missing prices"""
+    rng = random.Random(seed)
+    names = sorted(KNOWN) + ["mystery", "tomatto"]
+    positions = [
+        {
+            "name": rng.choice(names),
+            "qty": rng.choice([1, 2, 0.5, 3]),
+            "unit": "kg",
+            "price": rng.choice([12000, 25000, 87500, None]),
+        }
+        for _ in range(count)
+    ]
+    return {"supplier": "Test", "date": "2026-01-01", "positions": positions}
+
+
+def edit(invoice, match_results, totals, intent, rematch=fake_match):
+    """Applies an intent the way process_user_edit does and refreshes results"""
+    old_positions = list(invoice["positions"])
+    new_invoice = apply_intent(invoice, intent)
+    refresh = refresh_after_edit(
+        intent, old_positions, new_invoice["positions"], match_results, rematch, totals
+    )
+    return new_invoice, refresh
+
+
+class TestDirtyLines:
+    def test_line_actions(self):
+        assert dirty_lines({"action": "set_price", "line_index": 3}, 5, 5) == DirtyLines([3])
+        assert dirty_lines({"action": "edit_name", "line": 1}, 5, 5) == DirtyLines([1], {1})
+        assert dirty_lines(
+            {"action": "edit_line_field", "line": 2, "field": "name"}, 5, 5
+        ) == DirtyLines([2], {2})
+        assert dirty_lines(
+            {"action": "edit_line_field", "line": 2, "field": "qty"}, 5, 5
+        ) == DirtyLines([2])
+
+    def test_invoice_actions_and_added_lines(self):
+        assert dirty_lines({"action": "edit_supplier", "value": "X"}, 5, 5) == DirtyLines()
+        assert dirty_lines({"action": "add_line"}, 5, 7) == DirtyLines([5, 6], {5, 6})
+
+    def test_out_of_range_and_unknown(self):
+        assert dirty_lines({"action": "set_price", "line_index": 9}, 5, 5) == DirtyLines()
+        assert dirty_lines({"action": "edit_price", "line": "2"}, 5, 5) == DirtyLines()
+        assert dirty_lines({"action": "delete_line", "line": 1}, 5, 5) is None
+
+
+class TestRefreshAfterEdit:
+    def test_same_result_as_full_recompute(self):
+        invoice = make_invoice()
+        match_results = fake_match(invoice["positions"])
+        totals = summarize(match_results)
+        intents = [
+            {"action": "edit_price", "line": 4, "value": "15000"},
+            {"action": "edit_line_field", "line": 7, "field": "name", "value": "mystery"},
+            {"action": "edit_line_field", "line": 9, "field": "name", "value": "onion"},
+            {"action": "set_quantity", "line_index": 11, "value": "4"},
+            {"action": "edit_line_field", "line": 12, "field": "price", "value": None},
+            {"action": "add_line", "value": "garlic 2 kg 30000"},
+            {"action": "edit_date", "value": "02.01.2026"},
+        ]
+
+        for intent in intents:
+            invoice, refresh = edit(invoice, match_results, totals, intent)
+            match_results, totals = refresh.match_results, refresh.totals
+
+            assert refresh.incremental
+            full = summarize(match_results)
+            assert totals["total_amount"] == pytest.approx(full.pop("total_amount"))
+            assert {k: v for k, v in totals.items() if k != "total_amount"} == full
+
+        expected = fake_match(invoice["positions"])
+        assert [r["status"] for r in match_results] == [r["status"] for r in expected]
+        for result, position in zip(match_results, invoice["positions"]):
+            for key in ("name", "qty", "unit", "price"):
+                assert result.get(key) == position.get(key)
+        assert len(match_results) == 51
+
+    def test_only_renamed_lines_rematched(self):
+        invoice = make_invoice(10)
+        match_results = fake_match(invoice["positions"])
+        rematch = MagicMock(side_effect=fake_match)
+
+        _, refresh = edit(
+            invoice,
+            match_results,
+            None,
+            {"action": "edit_price", "line": 2, "value": "1000"},
+            rematch,
+        )
+        rematch.assert_not_called()
+        assert refresh.match_results[2]["line_total"] == invoice["positions"][2]["qty"] * 1000
+        assert all(refresh.match_results[i] is match_results[i] for i in range(10) if i != 2)
+
+        intent = {"action": "edit_line_field", "line": 5, "field": "name", "value": "rice"}
+        _, refresh = edit(invoice, match_results, None, intent, rematch)
+        rematch.assert_called_once()
+        assert [p["name"] for p in rematch.call_args[0][0]] == ["rice"]
+        assert refresh.match_results[5]["status"] == "ok"
+
+    def test_field_edit_detected(self):
+        invoice = make_invoice(5)
+        match_results = fake_match(invoice["positions"])
+        intent = {"action": "edit_line_field", "line": 1, "field": "qty", "value": "10"}
+
+        new_invoice, refresh = edit(invoice, match_results, None, intent)
+
+        assert invoice["positions"][1]["qty"] != "10"
+        assert refresh.dirty.lines == [1]
+        assert refresh.match_results[1]["qty"] == "10"
+
+    def test_full_recompute_without_match_results(self):
+        invoice = make_invoice(5)
+        rematch = MagicMock(side_effect=fake_match)
+
+        _, refresh = edit(
+            invoice, [], None, {"action": "edit_price", "line": 0, "value": "1"}, rematch
+        )
+
+        assert not refresh.incremental
+        assert len(rematch.call_args[0][0]) == 5
+        assert refresh.totals == summarize(refresh.match_results)
+
+    def test_stale_totals_recomputed(self):
+        invoice = make_invoice(5)
+        match_results = fake_match(invoice["positions"])
+        stale = dict(summarize(match_results), lines=4, unknown_count=99)
+
+        _, refresh = edit(
+            invoice, match_results, stale, {"action": "edit_price", "line": 0, "value": "1"}
+        )
+
+        assert refresh.totals == summarize(refresh.match_results)
+
+
+class TestReportTotals:
+    def test_cached_totals_same_report(self):
+        invoice = make_invoice(12)
+        match_results = fake_match(copy.deepcopy(invoice["positions"]))
+
+        cached = build_report(invoice, match_results, totals=summarize(match_results))
+
+        assert cached == build_report(invoice, match_results)
+
+
+class FakeState:
+    """Dict-backed stand-in for FSMContext"""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+    async def set_state(self, state):
+        pass
+
+
+class TestFuzzyRename:
+    @pytest.mark.asyncio
+    async def test_rename_refreshes_cached_results(self):
+        invoice = make_invoice(5)
+        match_results = fake_match(invoice["positions"])
+        state = FakeState(
+            {
+                "invoice": invoice,
+                "match_results": match_results,
+                "edit_totals": summarize(match_results),
+                "fuzzy_match": "mystery",
+            }
+        )
+        call = MagicMock(data="fuzzy:confirm:1", message=AsyncMock(), answer=AsyncMock())
+
+        def match_positions(positions, products):
+            return fake_match(positions)
+
+        with patch("app.handlers.edit_flow.match_positions", match_positions), patch(
+            "app.handlers.edit_flow.get_products", return_value=[]
+        ):
+            await confirm_fuzzy_name(call, state)
+
+        assert state.data["invoice"]["positions"][1]["name"] == "mystery"
+        assert state.data["match_results"][1]["name"] == "mystery"
+        assert state.data["edit_totals"] is None
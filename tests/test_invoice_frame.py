@@ -0,0 +1,212 @@
+"""Tests for app/validators/invoice_frame.py"""
+
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from app.formatters.report import calculate_total_amount
+from app.utils.data_utils import clean_number
+from app.validators.arithmetic_validator import ArithmeticValidator
+from app.validators.invoice_frame import (
+    FIX_AMOUNT,
+    FIX_DECIMAL,
+    FIX_PRICE,
+    FIX_QTY,
+    FIX_ZERO,
+    LINE_ERROR,
+    LINE_OK,
+    InvoiceFrame,
+)
+from app.validators.ocr_prevalidator import OCRPreValidator, validate_ocr_result
+
+
+def validate_by_line(validator, lines):
+    """Line-by-line arithmetic check built from the validator's scalar helpers"""
+    issues = []
+    for i, line in enumerate(lines):
+        qty, price, amount = (clean_number(line.get(k, 0)) for k in ("qty", "price", "amount"))
+        no_qty, no_price, no_amount = map(validator._is_missing_or_zero, (qty, price, amount))
+        fix = None
+        if no_amount and not no_qty and not no_price:
+            fix = ("amount", {"amount": qty * price})
+        elif no_qty and not no_amount and not no_price:
+            fix = ("qty", {"qty": amount / price})
+        elif no_price and not no_amount and not no_qty:
+            fix = ("price", {"price": amount / qty})
+        elif not (no_qty or no_price or no_amount):
+            if not validator._is_close(qty * price, amount):
+                fixed = validator._try_fix_decimal_errors(qty, price, amount)
+                fixed = fixed or validator._try_fix_zero_errors(qty, price, amount)
+                if fixed:
+                    fix = ("all", fixed)
+                else:
+                    issues.append(("ARITHMETIC_ERROR", i, None))
+        if fix and validator.auto_fix:
+            line.update(fix[1])
+            issues.append(("ARITHMETIC_FIX", i, fix[0]))
+    return issues
+
+
+def random_lines(count, seed=3):
+    """Invoice lines with consistent rows, missing values and shifted digits"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        qty = rng.choice([1, 2, 3, 5, 10, 0.5, 2.5])
+        price = rng.choice([1500, 12000, 25000, 87500, 150000])
+        amount = qty * price
+        kind = rng.random()
+        if kind < 0.1:
+            amount = 0
+        elif kind < 0.2:
+            qty = None
+        elif kind < 0.3:
+            price = ""
+        elif kind < 0.4:
+            price *= 10
+        elif kind < 0.5:
+            amount /= 10
+        elif kind < 0.6:
+            amount *= 7
+        elif kind < 0.7:
+            price = f"{price:,}".replace(",", ".")
+        lines.append({"name": f"Item {len(lines)}", "qty": qty, "price": price, "amount": amount})
+    return lines
+
+
+class TestInvoiceFrame:
+    def test_columns_parsed_once(self):
+        lines = [
+            {"name": "Tomato", "qty": "2", "price": "15.000", "amount": 30000},
+            {"name": "Onion", "qty": None, "price": 12000},
+            "not a line",
+        ]
+
+        frame = InvoiceFrame.from_lines(lines)
+
+        assert frame.names.tolist() == ["Tomato", "Onion", None]
+        assert frame.qty[0] == 2.0
+        assert frame.price[0] == 15000.0
+        assert np.isnan(frame.qty[1])
+        assert frame.total[1] == 0.0
+        assert list(frame.errors) == [2]
+        assert np.isnan(frame.price[2])
+
+    def test_check_arithmetic_statuses(self):
+        lines = [
+            {"qty": 2, "price": 100, "amount": 200},
+            {"qty": 2, "price": 100, "amount": 0},
+            {"qty": 0, "price": 100, "amount": 200},
+            {"qty": 2, "price": 0, "amount": 200},
+            {"qty": 2, "price": 1005, "amount": 200},
+            {"qty": 2, "price": 100, "amount": 2000},
+            {"qty": 2, "price": 100, "amount": 777},
+        ]
+
+        status, qty, price, total = InvoiceFrame.from_lines(lines).check_arithmetic(0.01)
+
+        assert status.tolist() == [
+            LINE_OK,
+            FIX_AMOUNT,
+            FIX_QTY,
+            FIX_PRICE,
+            FIX_DECIMAL,
+            FIX_ZERO,
+            LINE_ERROR,
+        ]
+        assert total[1] == 200
+        assert qty[2] == 2
+        assert price[3] == 100
+        assert price[4] == 100.5
+        assert price[5] == 1000
+
+    def test_zero_error_candidates(self):
+        frame = InvoiceFrame.from_lines([{"qty": 2, "price": 150, "amount": 3000}])
+
+        found, qty, price, total = frame.zero_error_candidates(0.01)
+
+        assert found.tolist() == [True]
+        assert (qty[0], price[0], total[0]) == (2, 1500, 3000)
+
+    def test_match_results_total(self):
+        match_results = [
+            {"line_total": "30000", "qty": 2, "price": 1},
+            {"line_total": "n/a", "qty": 3, "price": 1000},
+            {"qty": "2", "price": "2500"},
+            {"qty": None, "price": 100},
+        ]
+
+        assert calculate_total_amount(match_results) == 38000.0
+        assert calculate_total_amount([]) == 0.0
+
+
+class TestArithmeticValidatorColumns:
+    @pytest.mark.parametrize("vector_min_lines", [0, 10_000])
+    def test_same_result_as_line_by_line(self, vector_min_lines):
+        for auto_fix in (True, False):
+            validator = ArithmeticValidator(
+                tolerance=0.02, auto_fix=auto_fix, vector_min_lines=vector_min_lines
+            )
+            lines = random_lines(200)
+            expected_lines = copy.deepcopy(lines)
+            expected = validate_by_line(validator, expected_lines)
+
+            result = validator.validate({"lines": lines})
+
+            issues = [(i["type"], i["line"], i.get("field")) for i in result["issues"]]
+            assert issues == expected
+            assert result["lines"] == expected_lines
+
+    def test_unreadable_line_reported(self):
+        result = ArithmeticValidator().validate({"lines": [{"qty": 1, "price": 5}, None]})
+
+        assert [i["type"] for i in result["issues"]] == ["ARITHMETIC_FIX", "VALIDATION_ERROR"]
+        assert result["issues"][1]["line"] == 1
+
+
+class TestPreValidatorColumns:
+    def test_totals_filled_and_reconciled(self):
+        data = {
+            "positions": [
+                {"name": "Tomato", "qty": 2, "price": 15000, "total_price": 30000},
+                {"name": "Onion", "qty": 1, "price": 12000},
+                None,
+            ],
+            "total_price": 42000,
+        }
+
+        result = validate_ocr_result(data)
+
+        assert result["positions"][1]["total_price"] == 12000
+        assert result["positions"][2] is None
+        assert result["total_price"] == 42000
+        assert not any("mismatch" in w for w in result["validation_warnings"])
+
+    def test_rows_and_columns_agree(self):
+        positions = [
+            {
+                "name": line["name"],
+                "qty": line["qty"],
+                "price": line["price"],
+                "total_price": line["amount"],
+            }
+            for line in random_lines(120, seed=5)
+        ]
+        positions += [
+            {"name": "No price", "qty": 2, "price": None},
+            {"name": "Round", "qty": 150, "price": 2_500_000},
+            {"name": "Precise", "qty": "1.23456", "price": 1000, "total_price": 1234},
+            None,
+        ]
+        results = []
+        for vector_min_lines in (0, 10_000):
+            validator = OCRPreValidator(vector_min_lines=vector_min_lines)
+            frame = InvoiceFrame.from_lines(positions, total_key="total_price")
+            validated = validator.validate_positions(positions, frame)
+            results.append((validated, frame.total.tolist()))
+
+        (rows, row_totals), (columns, column_totals) = results
+        assert rows == columns
+        np.testing.assert_array_equal(row_totals, column_totals)
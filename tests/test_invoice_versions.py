@@ -0,0 +1,237 @@
+"""Tests for copy-on-write invoice versions (app/edit/apply_intent.py, app/edit/versions.py)"""
+
+import copy
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.edit.apply_intent import apply_intent, new_version
+from app.edit.incremental import diff_dirty_lines, refresh_after_edit
+from app.edit.versions import InvoiceVersions, drop_history, get_history
+from app.handlers.edit_core import process_user_edit
+from app.handlers.edit_flow import confirm_fuzzy_name
+
+
+def make_invoice(count=5):
+    positions = [
+        {"name": f"item {i}", "qty": 1, "unit": "kg", "price": 1000 * (i + 1)} for i in range(count)
+    ]
+    return {"supplier": "Test", "date": "2026-01-01", "positions": positions}
+
+
+def fake_match(positions):
+    return [dict(p, status="ok" if p["name"].startswith("item") else "unknown") for p in positions]
+
+
+class TestCopyOnWrite:
+    def test_line_edit_shares_other_positions(self):
+        invoice = make_invoice()
+        original = copy.deepcopy(invoice)
+
+        result = apply_intent(invoice, {"action": "edit_price", "line": 2, "value": "500"})
+
+        assert invoice == original
+        assert result["positions"][2]["price"] == 500.0
+        assert result["positions"] is not invoice["positions"]
+        assert result["positions"][2] is not invoice["positions"][2]
+        assert all(result["positions"][i] is invoice["positions"][i] for i in (0, 1, 3, 4))
+
+    def test_header_edit_shares_positions(self):
+        invoice = make_invoice()
+
+        result = apply_intent(invoice, {"action": "edit_supplier", "value": "Other"})
+
+        assert invoice["supplier"] == "Test"
+        assert result["positions"] is invoice["positions"]
+
+    def test_field_and_add_line_do_not_mutate(self):
+        invoice = make_invoice()
+        original = copy.deepcopy(invoice)
+
+        edited = apply_intent(
+            invoice, {"action": "edit_line_field", "line": 0, "field": "unit", "value": "pc"}
+        )
+        added = apply_intent(edited, {"action": "add_line", "value": "salt 1 kg 2000"})
+
+        assert invoice == original
+        assert edited["positions"][0]["unit"] == "pc"
+        assert len(edited["positions"]) == 5
+        assert added["positions"][5]["name"] == "salt"
+        assert added["positions"][0] is edited["positions"][0]
+
+    def test_invalid_line_index(self):
+        invoice = make_invoice(2)
+
+        result = new_version(invoice, "1")
+
+        assert result["positions"] == invoice["positions"]
+        assert all(a is b for a, b in zip(result["positions"], invoice["positions"]))
+
+
+class TestInvoiceVersions:
+    def test_undo_redo(self):
+        v0 = make_invoice()
+        history = InvoiceVersions(v0)
+        v1 = apply_intent(v0, {"action": "edit_price", "line": 0, "value": "1"})
+        history.commit(v1)
+        v2 = apply_intent(v1, {"action": "edit_price", "line": 1, "value": "2"})
+        history.commit(v2)
+
+        assert history.undo() is v1
+        assert history.undo() is v0
+        assert history.undo() is None
+        assert history.redo() is v1
+
+        v3 = apply_intent(v1, {"action": "edit_supplier", "value": "X"})
+        history.commit(v3)
+
+        assert history.redo() is None
+        assert len(history) == 3
+        assert history.current is v3
+
+    def test_limit(self):
+        history = InvoiceVersions(make_invoice(), limit=3)
+        for i in range(5):
+            history.commit({"positions": [], "n": i})
+
+        assert len(history) == 3
+        assert history.undo()["n"] == 3
+        assert history.undo()["n"] == 2
+        assert not history.can_undo
+
+    def test_history_restarts_for_other_invoice(self):
+        invoice = make_invoice()
+        history = get_history("user", invoice)
+        history.commit(apply_intent(invoice, {"action": "edit_price", "line": 0, "value": "1"}))
+
+        assert get_history("user", history.current) is history
+        assert get_history("user", make_invoice()) is not history
+        drop_history("user")
+
+    def test_history_restarts_after_in_place_edit(self, monkeypatch):
+        monkeypatch.setattr("app.edit.versions.VERIFY_VERSIONS", True)
+        invoice = make_invoice()
+        history = get_history("user", invoice)
+        history.commit(apply_intent(invoice, {"action": "edit_price", "line": 0, "value": "1"}))
+
+        history.current["positions"][0]["price"] = 7
+
+        assert get_history("user", history.current) is not history
+        drop_history("user")
+
+    def test_content_not_hashed_without_verification(self, monkeypatch):
+        monkeypatch.setattr("app.edit.versions.VERIFY_VERSIONS", False)
+        invoice = make_invoice()
+        history = get_history("user", invoice)
+        history.commit(apply_intent(invoice, {"action": "edit_price", "line": 0, "value": "1"}))
+        history.undo()
+        history.redo()
+
+        assert get_history("user", history.current) is history
+        assert history._signatures == [None, None]
+        drop_history("user")
+
+    def test_undo_rematches_only_changed_lines(self):
+        v0 = make_invoice()
+        v1 = apply_intent(
+            v0, {"action": "edit_line_field", "line": 3, "field": "name", "value": "mystery"}
+        )
+        match_results = fake_match(v1["positions"])
+
+        assert diff_dirty_lines(v1["positions"], v0["positions"]).lines == [3]
+
+        rematched = []
+
+        def rematch(positions):
+            rematched.extend(p["name"] for p in positions)
+            return fake_match(positions)
+
+        refresh = refresh_after_edit(
+            {"action": "undo"}, v1["positions"], v0["positions"], match_results, rematch
+        )
+
+        assert rematched == ["item 3"]
+        assert refresh.match_results[3]["status"] == "ok"
+        assert refresh.totals["unknown_count"] == 0
+
+
+class FakeState:
+    """Dict-backed stand-in for FSMContext"""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+    async def set_state(self, state):
+        pass
+
+
+def edit_core_step(user_id, state, intent):
+    """Applies an intent or undo the way process_user_edit keeps versions"""
+    history = get_history(user_id, state.data["invoice"])
+    if intent["action"] == "undo":
+        state.data["invoice"] = history.undo()
+    else:
+        state.data["invoice"] = apply_intent(state.data["invoice"], intent)
+        history.commit(state.data["invoice"])
+
+
+class TestHandlerEdits:
+    @pytest.mark.asyncio
+    async def test_fuzzy_rename_between_edits_can_be_undone(self):
+        v0 = make_invoice()
+        original = copy.deepcopy(v0)
+        state = FakeState({"invoice": v0, "fuzzy_match": "mystery"})
+        call = MagicMock(data="fuzzy:confirm:1", message=AsyncMock(), answer=AsyncMock())
+        call.from_user.id = "user"
+
+        edit_core_step("user", state, {"action": "edit_price", "line": 0, "value": "5"})
+        v1 = state.data["invoice"]
+        with patch("app.handlers.edit_flow.match_positions", lambda positions, products: []), patch(
+            "app.handlers.edit_flow.get_products", return_value=[]
+        ):
+            await confirm_fuzzy_name(call, state)
+        edit_core_step("user", state, {"action": "edit_price", "line": 2, "value": "9"})
+
+        assert state.data["invoice"]["positions"][1]["name"] == "mystery"
+        assert v1["positions"][1]["name"] == "item 1"
+        assert v0 == original
+
+        edit_core_step("user", state, {"action": "undo"})
+        edit_core_step("user", state, {"action": "undo"})
+
+        assert state.data["invoice"] is v1
+        assert state.data["invoice"]["positions"][1]["name"] == "item 1"
+        edit_core_step("user", state, {"action": "undo"})
+        assert state.data["invoice"] == original
+        drop_history("user")
+
+    @pytest.mark.asyncio
+    async def test_unchanged_invoice_not_committed(self):
+        v0 = make_invoice()
+        state = FakeState({"invoice": v0})
+        message = MagicMock()
+        message.from_user.id = "user"
+        send_error = AsyncMock()
+        send_result = AsyncMock()
+        history = get_history("user", v0)
+        incomplete = {"action": "add_line", "value": "salt 1"}
+
+        with patch(
+            "app.parsers.local_parser.parse_command_async", AsyncMock(return_value=incomplete)
+        ):
+            await process_user_edit(
+                message, state, "add salt 1", send_error=send_error, send_result=send_result
+            )
+
+        assert len(history) == 1
+        assert get_history("user", v0) is history
+        assert state.data["invoice"] is v0
+        send_error.assert_awaited_once()
+        send_result.assert_not_called()
+        drop_history("user")
@@ -0,0 +1,136 @@
+"""Tests for app/utils/keyword_matcher.py"""
+
+import random
+
+from app.postprocessing import PRODUCT_CATEGORIES, PRODUCT_DEFAULT_UNITS, normalize_units
+from app.utils.keyword_matcher import KeywordMatcher, get_keyword_matcher
+from app.validators.context_validator import ContextAwarePriceValidator
+
+NAMES = [
+    "Fresh Tomato",
+    "tomato",
+    "tom",
+    "pepper bell",
+    "bell pepper red",
+    "olive oil extra virgin",
+    "oil olive",
+    "Sesame",
+    "sesame oil",
+    "hot dog sauce",
+    "ground beef premium",
+    "beef ground",
+    "chicken wing",
+    "Coconut water",
+    "paprika powder",
+    "vegetable oil",
+    "dragon",
+    "  salmon fillet  ",
+    "unknown item",
+    "x",
+    "",
+    "   ",
+]
+
+
+def categorize_by_scan(price_ranges, product_name):
+    """Category lookup by scanning every keyword, as the validator used to do"""
+    if not product_name:
+        return None
+    product_lower = product_name.lower().strip()
+    for category, info in price_ranges.items():
+        for known_product in info["products"]:
+            if known_product.lower() in product_lower or product_lower in known_product.lower():
+                return category
+    for category, info in price_ranges.items():
+        for known_product in info["products"]:
+            product_words = set(product_lower.split())
+            known_words = set(known_product.lower().split())
+            if product_words and known_words:
+                overlap = len(product_words.intersection(known_words))
+                if overlap / min(len(product_words), len(known_words)) >= 0.6:
+                    return category
+    return None
+
+
+def unit_category_by_scan(product_name):
+    """Category lookup of normalize_units by scanning PRODUCT_CATEGORIES"""
+    for category, products in PRODUCT_CATEGORIES.items():
+        for product in products:
+            if product in product_name.lower():
+                return category
+    return None
+
+
+def random_names(keywords, count=300, seed=7):
+    """Names built from keyword fragments, reordered words and noise"""
+    rng = random.Random(seed)
+    words = [word for keyword in keywords for word in keyword.split()] + ["fresh", "premium"]
+    names = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            names.append(" ".join(rng.sample(words, rng.randint(1, 3))))
+        elif kind < 0.7:
+            keyword = rng.choice(keywords)
+            start = rng.randint(0, len(keyword) - 1)
+            names.append(keyword[start : rng.randint(start + 1, len(keyword))])
+        else:
+            names.append("".join(rng.choice("abcdefghijklmnoprstu ") for _ in range(8)))
+    return names
+
+
+class TestKeywordMatcher:
+    def test_first_keyword_in_dictionary_order_wins(self):
+        matcher = KeywordMatcher({"a": ["pepper", "bell"], "b": ["bell pepper", "pep"]})
+
+        assert matcher.categorize("bell pepper") == "a"
+        assert matcher.categorize("pepperoni") == "a"
+        assert matcher.categorize("peps") == "b"
+        assert matcher.categorize("bel", reverse=True) == "a"
+        assert matcher.categorize("bel") is None
+
+    def test_overlapping_keywords_found(self):
+        matcher = KeywordMatcher({"x": ["abcd"], "y": ["bc"], "z": ["c"]})
+
+        assert matcher.categorize("abcd") == "x"
+        assert matcher.categorize("abce") == "y"
+        assert matcher.categorize("zzc") == "z"
+
+    def test_word_overlap_fallback(self):
+        matcher = KeywordMatcher({"sauce": ["soy sauce"], "veg": ["bell pepper"]})
+
+        assert matcher.categorize("pepper yellow bell", min_word_ratio=0.6) == "veg"
+        assert matcher.categorize("pepper yellow bell") is None
+
+    def test_results_memoized(self):
+        matcher = KeywordMatcher({"a": ["tomato"]})
+
+        matcher.categorize("tomato")
+        matcher.categorize("tomato")
+
+        assert matcher.categorize.cache_info().hits == 1
+
+    def test_matcher_shared_for_same_dictionary(self):
+        groups = {"a": ["tomato"], "b": ["onion"]}
+
+        assert get_keyword_matcher(groups) is get_keyword_matcher(dict(groups))
+        assert get_keyword_matcher({"a": ["tomato"]}) is not get_keyword_matcher(groups)
+
+
+class TestSameResultsAsScan:
+    def test_context_validator_categories(self):
+        validator = ContextAwarePriceValidator()
+        keywords = [p for info in validator.price_ranges.values() for p in info["products"]]
+
+        for name in NAMES + random_names(keywords):
+            expected = categorize_by_scan(validator.price_ranges, name)
+            assert validator.categorize_product(name) == expected, name
+
+    def test_normalize_units_categories(self):
+        keywords = [p for products in PRODUCT_CATEGORIES.values() for p in products]
+
+        for name in NAMES + random_names(keywords):
+            if not name:
+                continue
+            expected = PRODUCT_DEFAULT_UNITS.get(unit_category_by_scan(name), "pcs")
+            assert normalize_units("", name) == expected, name
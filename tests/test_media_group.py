@@ -0,0 +1,111 @@
+"""Tests for app/utils/media_group.py"""
+
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.models import ParsedData, Position
+from app.utils.media_group import MediaGroupCollector, merge_album_pages
+
+
+def pos(name, qty=1.0, total=10000.0):
+    return Position(name=name, qty=qty, price=total / qty, total_price=total)
+
+
+def album_message(message_id, group="g1"):
+    return SimpleNamespace(message_id=message_id, media_group_id=group)
+
+
+class TestMediaGroupCollector:
+    """Test album collection"""
+
+    @pytest.mark.asyncio
+    async def test_first_message_gets_whole_album(self):
+        collector = MediaGroupCollector(delay=0.05)
+
+        async def deliver(message, after):
+            await asyncio.sleep(after)
+            return await collector.collect(message)
+
+        results = await asyncio.gather(
+            deliver(album_message(11), 0),
+            deliver(album_message(13), 0.02),
+            deliver(album_message(12), 0.04),
+        )
+
+        assert [m.message_id for m in results[0]] == [11, 12, 13]
+        assert results[1] is None and results[2] is None
+
+    @pytest.mark.asyncio
+    async def test_albums_are_separate(self):
+        collector = MediaGroupCollector(delay=0.02)
+
+        first, second = await asyncio.gather(
+            collector.collect(album_message(1, "a")), collector.collect(album_message(2, "b"))
+        )
+
+        assert [m.message_id for m in first] == [1]
+        assert [m.message_id for m in second] == [2]
+
+
+class TestMergeAlbumPages:
+    """Test merging of invoice pages"""
+
+    def test_positions_in_page_order(self):
+        pages = [
+            ParsedData(supplier="UD Sumber", positions=[pos("tomato"), pos("onion")]),
+            ParsedData(positions=[pos("egg")]),
+            ParsedData(positions=[pos("chili")]),
+        ]
+
+        merged = merge_album_pages(pages)
+
+        assert [p.name for p in merged.positions] == ["tomato", "onion", "egg", "chili"]
+        assert merged.supplier == "UD Sumber"
+
+    def test_overlapping_rows_dropped(self):
+        pages = [
+            ParsedData(positions=[pos("tomato"), pos("onion", 2, 8000), pos("egg", 30, 60000)]),
+            ParsedData(positions=[pos("Onion ", 2, 8000), pos("egg", 30, 60000), pos("chili")]),
+        ]
+
+        merged = merge_album_pages(pages)
+
+        assert [p.name for p in merged.positions] == ["tomato", "onion", "egg", "chili"]
+
+    def test_same_name_with_other_amount_kept(self):
+        pages = [
+            ParsedData(positions=[pos("tomato", 1, 10000)]),
+            ParsedData(positions=[pos("tomato", 3, 30000)]),
+        ]
+
+        assert len(merge_album_pages(pages).positions) == 2
+
+    def test_header_from_first_page_with_it(self):
+        pages = [
+            ParsedData(positions=[pos("tomato")]),
+            ParsedData(supplier="CV Bali", date=datetime.date(2024, 5, 1), positions=[pos("egg")]),
+        ]
+
+        merged = merge_album_pages(pages)
+
+        assert merged.supplier == "CV Bali"
+        assert merged.date == datetime.date(2024, 5, 1)
+
+    def test_grand_total_on_last_page(self):
+        pages = [
+            ParsedData(positions=[pos("a", total=10000)], total_price=10000),
+            ParsedData(positions=[pos("b", total=20000)], total_price=30000),
+        ]
+
+        assert merge_album_pages(pages).total_price == 30000
+
+    def test_page_subtotals_are_summed(self):
+        pages = [
+            ParsedData(positions=[pos("a", total=10000)], total_price=10000),
+            ParsedData(positions=[pos("b", total=20000)], total_price=20000),
+        ]
+
+        assert merge_album_pages(pages).total_price == 30000
@@ -20,6 +20,8 @@ class TestPickNameHandler:
         call = MagicMock(spec=CallbackQuery)
         call.data = "pick_name:2:prod123"
         call.answer = AsyncMock()
+        call.from_user = MagicMock()
+        call.from_user.id = 12345
         call.message = MagicMock()
         call.message.answer = AsyncMock()
         call.message.edit_reply_markup = AsyncMock()
@@ -57,7 +59,7 @@ class TestPickNameHandler:
         mock_callback_query.message.answer.return_value = processing_msg
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=[mock_product]),
+                          get_products=MagicMock(return_value=[mock_product]),
                           parsed_to_dict=MagicMock(side_effect=lambda x: x),
                           set_name=MagicMock(side_effect=lambda inv, idx, name: inv),
                           match_positions=MagicMock(return_value=[{"status": "ok"}]),
@@ -124,7 +126,7 @@ class TestPickNameHandler:
         mock_callback_query.message.answer.return_value = processing_msg
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=[]),  # No products
+                          get_products=MagicMock(return_value=[]),  # No products
                           parsed_to_dict=MagicMock(side_effect=lambda x: x),
                           t=MagicMock(return_value="Product not found")):
             
@@ -156,7 +158,7 @@ class TestPickNameHandler:
         call.message.answer.return_value = processing_msg
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=[mock_product]),
+                          get_products=MagicMock(return_value=[mock_product]),
                           parsed_to_dict=MagicMock(side_effect=lambda x: x),
                           t=MagicMock(return_value="Processing...")):
             
@@ -178,7 +180,7 @@ class TestPickNameHandler:
         mock_callback_query.message.answer.return_value = processing_msg
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(side_effect=Exception("Test error")),
+                          get_products=MagicMock(side_effect=Exception("Test error")),
                           parsed_to_dict=MagicMock(side_effect=lambda x: x),
                           build_main_kb=MagicMock(return_value=MagicMock()),
                           t=MagicMock(side_effect=lambda key, *args, **kwargs: f"Error: {key}")):
@@ -225,7 +227,7 @@ class TestFuzzySuggestions:
         ]
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=mock_products),
+                          get_products=MagicMock(return_value=mock_products),
                           fuzzy_find=MagicMock(return_value=mock_matches),
                           t=MagicMock(return_value="Did you mean \"Apple Juice\"?")):
             
@@ -298,7 +300,7 @@ class TestFuzzySuggestions:
         """Test fuzzy suggestions when no matches found"""
         # Arrange
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=[]),
+                          get_products=MagicMock(return_value=[]),
                           fuzzy_find=MagicMock(return_value=[])):
             
             # Act
@@ -316,7 +318,7 @@ class TestFuzzySuggestions:
         # Arrange
         mock_products = [{"id": "prod1", "name": "Tea"}]
         
-        with patch('app.handlers.name_picker.load_products') as mock_load:
+        with patch('app.handlers.name_picker.get_products') as mock_load:
             with patch('app.handlers.name_picker.fuzzy_find') as mock_fuzzy:
                 mock_load.return_value = mock_products
                 mock_fuzzy.return_value = []
@@ -341,7 +343,7 @@ class TestFuzzySuggestions:
         ]
         
         with patch.multiple('app.handlers.name_picker',
-                          load_products=MagicMock(return_value=[]),
+                          get_products=MagicMock(return_value=[]),
                           fuzzy_find=MagicMock(return_value=mock_matches),
                           t=MagicMock(return_value="Did you mean \"Product 1\"?")):
             
@@ -367,6 +369,8 @@ class TestPickNameRejectHandler:
         call = MagicMock(spec=CallbackQuery)
         call.data = "pick_name_reject:1"
         call.answer = AsyncMock()
+        call.from_user = MagicMock()
+        call.from_user.id = 12345
         call.message = MagicMock()
         call.message.edit_reply_markup = AsyncMock()
         call.message.answer = AsyncMock()
@@ -398,7 +402,7 @@ class TestPickNameRejectHandler:
         with patch.multiple('app.handlers.name_picker',
                           parsed_to_dict=MagicMock(side_effect=lambda x: x),
                           set_name=MagicMock(side_effect=lambda inv, idx, name, **kwargs: inv),
-                          load_products=MagicMock(return_value=[]),
+                          get_products=MagicMock(return_value=[]),
                           match_positions=MagicMock(return_value=[{"status": "ok"}]),
                           report=MagicMock(),
                           build_main_kb=MagicMock(return_value=MagicMock()),
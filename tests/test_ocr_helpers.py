@@ -8,10 +8,12 @@ from PIL import Image
 import io
 
 from app.ocr_helpers import (
+    encode_cell_image,
     parse_numeric_value,
     process_cell_with_gpt4o,
     prepare_cell_image,
-    build_lines_from_cells
+    build_lines_from_cells,
+    group_cells_into_rows,
 )
 
 
@@ -171,6 +173,23 @@ class TestProcessCellWithGpt4o:
         assert f"data:image/jpeg;base64,{expected_b64}" == image_url
 
 
+class TestEncodeCellImage:
+    """Test encode_cell_image function"""
+
+    def test_bytes_unchanged(self):
+        assert encode_cell_image(b"jpeg bytes") == b"jpeg bytes"
+
+    def test_array_view_encoded_to_jpeg(self):
+        page = np.full((100, 200, 3), 255, dtype=np.uint8)
+        view = page[10:40, 20:120]
+
+        encoded = encode_cell_image(view)
+
+        with Image.open(io.BytesIO(encoded)) as img:
+            assert img.format == "JPEG"
+            assert img.size == (100, 30)
+
+
 class TestPrepareCellImage:
     """Test prepare_cell_image function"""
     
@@ -206,6 +225,21 @@ class TestPrepareCellImage:
         
         assert result is None
     
+    def test_prepare_array_view_is_not_copied(self):
+        """Test that array cells from the detector are used as is"""
+        page = np.zeros((100, 200, 3), dtype=np.uint8)
+        view = page[10:40, 20:120]
+
+        result = prepare_cell_image(view)
+
+        assert result is view
+
+    def test_prepare_too_small_array(self):
+        """Test that too small array cells return None"""
+        page = np.zeros((100, 200, 3), dtype=np.uint8)
+
+        assert prepare_cell_image(page[0:5, 0:50]) is None
+
     def test_prepare_invalid_image(self):
         """Test handling of invalid image data"""
         result = prepare_cell_image(b"invalid_image_data")
@@ -325,4 +359,102 @@ class TestBuildLinesFromCells:
         # Should have 2 rows: ABC and D
         assert len(result) == 2
         assert len(result[0]['cells']) == 3
-        assert len(result[1]['cells']) == 1
\ No newline at end of file
+        assert len(result[1]['cells']) == 1
+
+
+def header_cells():
+    """Header row: Name, Qty, Unit, Price, Total columns 50 px wide"""
+    titles = ['Name', 'Qty', 'Unit', 'Price', 'Total']
+    return [
+        {'text': title, 'bbox': [i * 50, 0, i * 50 + 50, 20], 'confidence': 0.9}
+        for i, title in enumerate(titles)
+    ]
+
+
+class TestRowAssembly:
+    """Test sort-based row grouping and header column mapping"""
+
+    def test_rows_sorted_top_to_bottom(self):
+        """Input order does not matter"""
+        cells = [
+            {'text': f'r{row}c{col}', 'bbox': [col * 50, row * 20, col * 50 + 50, row * 20 + 20]}
+            for row in reversed(range(30))
+            for col in range(5)
+        ]
+
+        rows = group_cells_into_rows(cells)
+
+        assert len(rows) == 30
+        assert [len(row) for row in rows] == [5] * 30
+        assert rows[0][0]['text'].startswith('r0')
+        assert rows[-1][0]['text'].startswith('r29')
+
+    def test_tolerance_follows_cell_height(self):
+        """Tall rows with a 12 px skew stay together, short rows are split"""
+        tall = [
+            {'text': 'A', 'bbox': [0, 0, 50, 60]},
+            {'text': 'B', 'bbox': [50, 12, 100, 72]},
+            {'text': 'C', 'bbox': [0, 60, 50, 120]},
+        ]
+        short = [
+            {'text': 'A', 'bbox': [0, 0, 50, 10]},
+            {'text': 'B', 'bbox': [50, 12, 100, 22]},
+        ]
+
+        assert [len(row) for row in group_cells_into_rows(tall)] == [2, 1]
+        assert [len(row) for row in group_cells_into_rows(short)] == [1, 1]
+
+    def test_missing_cell_does_not_shift_columns(self):
+        """Cells are mapped to header columns by x-overlap"""
+        cells = header_cells() + [
+            {'text': 'Apple', 'bbox': [0, 20, 50, 40]},
+            {'text': '2', 'bbox': [52, 20, 98, 40]},
+            # Unit cell not detected
+            {'text': '100', 'bbox': [150, 20, 200, 40]},
+            {'text': '200', 'bbox': [200, 20, 250, 40]},
+        ]
+
+        lines = build_lines_from_cells(cells)
+
+        assert len(lines) == 1
+        assert lines[0]['name'] == 'Apple'
+        assert lines[0]['qty'] == 2
+        assert lines[0]['unit'] == 'pcs'  # Default
+        assert lines[0]['price'] == 100
+        assert lines[0]['amount'] == 200
+
+    def test_merged_cell_spans_rows(self):
+        """A unit cell merged across two rows applies to both"""
+        cells = header_cells() + [
+            {'text': 'Apple', 'bbox': [0, 20, 50, 40]},
+            {'text': '2', 'bbox': [50, 20, 100, 40]},
+            {'text': '100', 'bbox': [150, 20, 200, 40]},
+            {'text': '200', 'bbox': [200, 20, 250, 40]},
+            {'text': 'Pear', 'bbox': [0, 40, 50, 60]},
+            {'text': '3', 'bbox': [50, 40, 100, 60]},
+            {'text': '50', 'bbox': [150, 40, 200, 60]},
+            {'text': '150', 'bbox': [200, 40, 250, 60]},
+            {'text': 'kg', 'bbox': [100, 20, 150, 60]},
+        ]
+
+        lines = build_lines_from_cells(cells)
+
+        assert [line['name'] for line in lines] == ['Apple', 'Pear']
+        assert [line['unit'] for line in lines] == ['kg', 'kg']
+        assert [line['amount'] for line in lines] == [200, 150]
+
+    def test_cell_merged_across_columns(self):
+        """A wide name cell goes to the column it covers most"""
+        cells = header_cells() + [
+            {'text': 'Long product name', 'bbox': [0, 20, 70, 40]},
+            {'text': '1', 'bbox': [70, 20, 100, 40]},
+            {'text': 'pack', 'bbox': [100, 20, 150, 40]},
+            {'text': '10', 'bbox': [150, 20, 200, 40]},
+            {'text': '10', 'bbox': [200, 20, 250, 40]},
+        ]
+
+        lines = build_lines_from_cells(cells)
+
+        assert lines[0]['name'] == 'Long product name'
+        assert lines[0]['qty'] == 1
+        assert lines[0]['unit'] == 'pack'
@@ -2,6 +2,7 @@
 Тесты для app/ocr_pipeline_optimized.py - оптимизированный OCR pipeline
 """
 
+import asyncio
 import json
 from unittest.mock import AsyncMock, Mock, patch
 
@@ -99,7 +100,7 @@ class TestOCRPipelineOptimized:
 
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     async def test_process_image_cache_hit(
         self, mock_prepare, mock_cache_get, pipeline, mock_image_bytes
     ):
@@ -121,7 +122,7 @@ class TestOCRPipelineOptimized:
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
     @patch("app.ocr_pipeline_optimized.cache_set")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     @patch("app.ocr_pipeline_optimized.get_detector")
     async def test_process_image_success_path(
         self,
@@ -165,7 +166,7 @@ class TestOCRPipelineOptimized:
 
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     @patch("app.ocr_pipeline_optimized.get_detector")
     async def test_process_image_table_detection_error_with_fallback(
         self, mock_get_detector, mock_prepare, mock_cache_get, pipeline, mock_image_bytes
@@ -200,7 +201,7 @@ class TestOCRPipelineOptimized:
 
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     @patch("app.ocr_pipeline_optimized.get_detector")
     async def test_process_image_table_detection_error_no_fallback(
         self, mock_get_detector, mock_prepare, mock_cache_get, mock_image_bytes
@@ -225,7 +226,7 @@ class TestOCRPipelineOptimized:
 
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     async def test_process_image_optimization_error_non_critical(
         self, mock_prepare, mock_cache_get, pipeline, mock_image_bytes
     ):
@@ -559,6 +560,137 @@ class TestOCRPipelineOptimized:
         assert result == []
 
 
+class TestCellScheduling:
+    """Тесты для планировщика ячеек со скользящим окном"""
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.build_lines_from_cells")
+    async def test_keeps_window_full(self, mock_build_lines, pipeline):
+        """Медленная ячейка не задерживает остальные, в работе всегда MAX_PARALLEL_CELLS"""
+        mock_build_lines.return_value = []
+        running = 0
+        peak = 0
+        finished = []
+
+        async def mock_ocr_cell(cell):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.2 if cell["index"] == 0 else 0.01)
+            running -= 1
+            finished.append(cell["index"])
+            return {**cell, "text": "ok", "confidence": 0.9, "used_gpt4o": False}
+
+        pipeline._ocr_cell = mock_ocr_cell
+        cells = [{"index": i, "bbox": [0, i * 30, 10, i * 30 + 20]} for i in range(40)]
+
+        await pipeline._process_cells(cells, ["en"])
+
+        assert peak == MAX_PARALLEL_CELLS
+        # Все остальные ячейки закончились раньше медленной первой
+        assert finished[-1] == 0
+        results = mock_build_lines.call_args[0][0]
+        assert [r["index"] for r in results] == list(range(40))
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.build_lines_from_cells")
+    async def test_failed_cell_is_retried(self, mock_build_lines, pipeline):
+        """Ячейка с ошибкой движков повторяется отдельно, остальные не перезапускаются"""
+        mock_build_lines.return_value = []
+        calls = {}
+
+        async def paddle_ocr(image, cls=True):
+            index = int(image[0, 0, 0])
+            calls[index] = calls.get(index, 0) + 1
+            if index == 1 and calls[1] == 1:
+                raise RuntimeError("Transient error")
+            return [[(None, ("ok", 0.9))]]
+
+        pipeline.paddle_pool.ocr = paddle_ocr
+        pipeline.cell_recognizer.recognize = AsyncMock(side_effect=RuntimeError("GPT-4o down"))
+        cells = [{"index": i, "image": np.full((30, 30, 3), i, dtype=np.uint8)} for i in range(3)]
+
+        with patch("app.ocr_pipeline_optimized.prepare_cell_image", side_effect=lambda img: img):
+            await pipeline._process_cells(cells, ["en"])
+
+        assert calls == {0: 1, 1: 2, 2: 1}
+        results = mock_build_lines.call_args[0][0]
+        assert all(r["text"] == "ok" and "error" not in r for r in results)
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.prepare_cell_image")
+    async def test_blank_and_too_small_cells_not_retried(self, mock_prepare_cell, pipeline):
+        """Пустая ячейка без ошибок движков и слишком маленькая ячейка не повторяются"""
+        mock_prepare_cell.return_value = np.zeros((30, 30, 3), dtype=np.uint8)
+        pipeline.paddle_pool.ocr = AsyncMock(return_value=[[]])
+        pipeline.cell_recognizer.recognize = AsyncMock(return_value=("", 0.0))
+
+        blank = await pipeline._ocr_cell_with_retry({"index": 0, "image": b"cell"})
+        mock_prepare_cell.return_value = None
+        small = await pipeline._ocr_cell_with_retry({"index": 1, "image": b"cell"})
+
+        assert blank["text"] == "" and "error" not in blank
+        assert small["error"] == "too_small"
+        assert pipeline.paddle_pool.ocr.call_count == 1
+        assert pipeline.cell_recognizer.recognize.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_cells_share_one_collage(self, pipeline):
+        """Ячейки, ждущие коллаж, не занимают окно: 15 сомнительных ячеек — один запрос"""
+        count = MAX_PARALLEL_CELLS + 5
+        pipeline.paddle_pool.ocr = AsyncMock(return_value=[[(None, ("t0mat0", 0.3))]])
+        collage = AsyncMock(side_effect=lambda images: {i: "Tomato" for i in range(len(images))})
+        pipeline.cell_recognizer._recognize_collage = collage
+        cells = [{"index": i, "image": np.zeros((30, 30, 3), dtype=np.uint8)} for i in range(count)]
+
+        with patch("app.ocr_pipeline_optimized.prepare_cell_image", side_effect=lambda img: img):
+            results = await pipeline._run_cells(cells)
+
+        assert collage.call_count == 1
+        assert len(collage.call_args[0][0]) == count
+        assert all(r["text"] == "Tomato" and r["used_gpt4o"] for r in results)
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.CELL_TIMEOUT", 0.05)
+    @patch("app.ocr_pipeline_optimized.build_lines_from_cells")
+    async def test_cell_timeout(self, mock_build_lines, pipeline):
+        """Зависшая ячейка после повторов возвращается пустой с ошибкой"""
+        mock_build_lines.return_value = []
+
+        async def mock_ocr_cell(cell):
+            if cell["index"] == 0:
+                await asyncio.sleep(10)
+            return {**cell, "text": "ok", "confidence": 0.9, "used_gpt4o": False}
+
+        pipeline._ocr_cell = mock_ocr_cell
+
+        await pipeline._process_cells([{"index": 0}, {"index": 1}], ["en"])
+
+        results = mock_build_lines.call_args[0][0]
+        assert results[0]["text"] == ""
+        assert "timeout" in results[0]["error"]
+        assert results[1]["text"] == "ok"
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.build_lines_from_cells")
+    async def test_progress_callback(self, mock_build_lines, pipeline, sample_cells):
+        """Колбэк прогресса вызывается после каждой ячейки"""
+        mock_build_lines.return_value = []
+        progress = []
+
+        async def mock_ocr_cell(cell):
+            return {**cell, "text": "ok", "confidence": 0.9, "used_gpt4o": False}
+
+        async def on_progress(done, total):
+            progress.append((done, total))
+
+        pipeline._ocr_cell = mock_ocr_cell
+
+        await pipeline._process_cells(sample_cells, ["en"], on_progress=on_progress)
+
+        assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
 class TestPipelineMetrics:
     """Тесты для метрик pipeline"""
 
@@ -624,7 +756,7 @@ class TestErrorHandling:
 
     @pytest.mark.asyncio
     @patch("app.ocr_pipeline_optimized.cache_get")
-    @patch("app.ocr_pipeline_optimized.prepare_for_ocr")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
     async def test_general_processing_error(
         self, mock_prepare, mock_cache_get, pipeline, mock_image_bytes
     ):
@@ -655,7 +787,7 @@ class TestCacheIntegration:
     @patch("app.ocr_pipeline_optimized.cache_get")
     async def test_cache_disabled(self, mock_cache_get, pipeline, mock_image_bytes):
         """Тест отключения кеша"""
-        with patch("app.ocr_pipeline_optimized.prepare_for_ocr") as mock_prepare:
+        with patch("app.ocr_pipeline_optimized.prepare_for_ocr_async") as mock_prepare:
             with patch("app.ocr_pipeline_optimized.get_detector") as mock_get_detector:
                 mock_prepare.return_value = mock_image_bytes
                 mock_detector = Mock()
@@ -683,7 +815,7 @@ class TestCacheIntegration:
         mock_cache_get.return_value = None
         mock_cache_set.side_effect = Exception("Cache error")
 
-        with patch("app.ocr_pipeline_optimized.prepare_for_ocr") as mock_prepare:
+        with patch("app.ocr_pipeline_optimized.prepare_for_ocr_async") as mock_prepare:
             with patch("app.ocr_pipeline_optimized.get_detector") as mock_get_detector:
                 mock_prepare.return_value = mock_image_bytes
                 mock_detector = Mock()
@@ -700,3 +832,49 @@ class TestCacheIntegration:
                 result = await pipeline.process_image(mock_image_bytes, ["en"])
 
                 assert result["status"] == "success"
+
+
+class TestEngineReuse:
+    """Тесты переиспользования прогретых движков"""
+
+    def test_pipelines_share_engines(self):
+        """Модель, пул воркеров и валидатор создаются один раз на процесс"""
+        with patch("app.ocr_pipeline_optimized.get_detector"):
+            with patch("app.ocr_pipeline_optimized.ValidationPipeline") as mock_validation:
+                with patch("app.ocr_pipeline_optimized.PaddleOCR") as mock_paddle:
+                    first = OCRPipelineOptimized(paddle_ocr_lang="de")
+                    second = OCRPipelineOptimized(paddle_ocr_lang="de")
+
+        assert first.paddle_ocr is second.paddle_ocr
+        assert first.paddle_pool is second.paddle_pool
+        assert first.validation_pipeline is second.validation_pipeline
+        mock_paddle.assert_called_once_with(use_angle_cls=True, lang="de", show_log=False)
+        mock_validation.assert_called_once()
+        # Второй пайплайн ничего не создавал
+        assert second.get_metrics()["engines_created"] == 0
+
+    @pytest.mark.asyncio
+    @patch("app.ocr_pipeline_optimized.cache_get")
+    @patch("app.ocr_pipeline_optimized.cache_set")
+    @patch("app.ocr_pipeline_optimized.prepare_for_ocr_async")
+    @patch("app.ocr_pipeline_optimized.get_detector")
+    async def test_request_uses_shared_validator(
+        self, mock_get_detector, mock_prepare, mock_cache_set, mock_cache_get, pipeline
+    ):
+        """Запрос не создает новый ValidationPipeline и фиксирует первую задержку"""
+        mock_cache_get.return_value = None
+        mock_prepare.side_effect = lambda data: data
+        mock_get_detector.return_value.extract_cells.return_value = []
+        pipeline._process_cells = AsyncMock(return_value=[])
+        pipeline.validation_pipeline.validate.return_value = {"status": "success", "lines": []}
+
+        with patch("app.ocr_pipeline_optimized.ValidationPipeline") as mock_validation:
+            await pipeline.process_image(b"image", ["en"])
+            await pipeline.process_image(b"image", ["en"])
+
+        mock_validation.assert_not_called()
+        assert pipeline.validation_pipeline.validate.call_count == 2
+        mock_get_detector.assert_called_with(pipeline.table_detector_method)
+        metrics = pipeline.get_metrics()
+        assert metrics["first_request_ms"] is not None
+        assert metrics["engines_created"] == 0
@@ -0,0 +1,159 @@
+"""Tests for app/utils/ocr_scheduler.py"""
+
+import asyncio
+
+import pytest
+
+from app.utils.ocr_scheduler import LANE_PHOTO, LANE_TEXT, OCRScheduler
+
+
+async def settle():
+    """Let queued tasks run until they block"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Blocker:
+    """Occupies a slot until released"""
+
+    def __init__(self, scheduler, lane=LANE_PHOTO, user_id="blocker"):
+        self.release = asyncio.Event()
+        self.task = asyncio.create_task(
+            scheduler.run(self.release.wait, lane=lane, user_id=user_id)
+        )
+
+
+class TestConcurrency:
+    """Test global limit and lanes"""
+
+    @pytest.mark.asyncio
+    async def test_limit_is_respected(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 2})
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(scheduler.run(job, user_id=i % 3) for i in range(10)))
+
+        assert peak == 2
+        stats = scheduler.get_stats()[LANE_PHOTO]
+        assert stats["completed"] == 10
+        assert stats["running"] == 0 and stats["waiting"] == 0
+        assert stats["max_depth"] == 8
+
+    @pytest.mark.asyncio
+    async def test_text_lane_not_blocked_by_photos(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1, LANE_TEXT: 1})
+        blocker = Blocker(scheduler)
+        queued_photo = asyncio.create_task(scheduler.run(asyncio.sleep, 0, user_id=1))
+        await settle()
+
+        result = await asyncio.wait_for(
+            scheduler.run(asyncio.sleep, 0, "edit", lane=LANE_TEXT, user_id=1), timeout=1
+        )
+
+        assert result == "edit"
+        assert not queued_photo.done()
+        blocker.release.set()
+        await asyncio.gather(blocker.task, queued_photo)
+
+    @pytest.mark.asyncio
+    async def test_unknown_lane(self):
+        with pytest.raises(ValueError):
+            async with OCRScheduler().slot("video"):
+                pass
+
+
+class TestFairness:
+    """Test round-robin between users and queue positions"""
+
+    @pytest.mark.asyncio
+    async def test_round_robin_order(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        blocker = Blocker(scheduler)
+        order = []
+
+        async def job(name):
+            order.append(name)
+
+        tasks = []
+        for user_id, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]:
+            tasks.append(asyncio.create_task(scheduler.run(job, name, user_id=user_id)))
+            await settle()
+
+        assert scheduler.queue_position(LANE_PHOTO, "b") == 2
+        assert scheduler.queue_position(LANE_PHOTO, "c") == 3
+
+        blocker.release.set()
+        await asyncio.gather(blocker.task, *tasks)
+
+        assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+    @pytest.mark.asyncio
+    async def test_position_feedback(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        blocker = Blocker(scheduler)
+        first = asyncio.create_task(scheduler.run(asyncio.sleep, 0, user_id="a"))
+        await settle()
+
+        positions = []
+
+        async def on_queue(position):
+            positions.append(position)
+
+        second = asyncio.create_task(
+            scheduler.run(asyncio.sleep, 0, user_id="b", on_queue=on_queue)
+        )
+        await settle()
+        assert positions == [2]
+
+        blocker.release.set()
+        await asyncio.gather(blocker.task, first, second)
+        assert positions == [2, 1]
+
+    @pytest.mark.asyncio
+    async def test_no_feedback_when_slot_free(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        positions = []
+
+        async def on_queue(position):
+            positions.append(position)
+
+        await scheduler.run(asyncio.sleep, 0, user_id="a", on_queue=on_queue)
+        assert positions == []
+
+
+class TestCancellation:
+    """Cancelled jobs never leak slots"""
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+        blocker = Blocker(scheduler)
+        waiter = asyncio.create_task(scheduler.run(asyncio.sleep, 0, user_id="a"))
+        await settle()
+        assert scheduler.get_stats()[LANE_PHOTO]["waiting"] == 1
+
+        waiter.cancel()
+        await settle()
+        assert scheduler.get_stats()[LANE_PHOTO]["waiting"] == 0
+
+        blocker.release.set()
+        await blocker.task
+        assert scheduler.get_stats()[LANE_PHOTO]["running"] == 0
+
+    @pytest.mark.asyncio
+    async def test_timeout_inside_slot_releases_it(self):
+        scheduler = OCRScheduler({LANE_PHOTO: 1})
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.run(asyncio.sleep, 10, user_id="a"), timeout=0.01)
+
+        await asyncio.wait_for(scheduler.run(asyncio.sleep, 0, user_id="b"), timeout=1)
+        assert scheduler.get_stats()[LANE_PHOTO]["running"] == 0
@@ -129,7 +129,7 @@ class TestOptimizedPhotoHandler:
                           set_processing_photo=AsyncMock(),
                           async_ocr=AsyncMock(return_value=mock_ocr_result),
                           async_match_positions=AsyncMock(return_value=mock_match_results),
-                          cached_load_products=MagicMock(return_value=[]),
+                          get_products=MagicMock(return_value=[]),
                           IncrementalUI=MagicMock(),
                           build_report=MagicMock(return_value=("Report text", True)),
                           build_main_kb=MagicMock(return_value=MagicMock()),
@@ -229,7 +229,7 @@ class TestOptimizedPhotoHandler:
                           set_processing_photo=AsyncMock(),
                           async_ocr=AsyncMock(return_value=mock_ocr_result),
                           async_match_positions=AsyncMock(side_effect=Exception("Matching failed")),
-                          cached_load_products=MagicMock(return_value=[]),
+                          get_products=MagicMock(return_value=[]),
                           IncrementalUI=MagicMock(),
                           t=MagicMock(return_value="Processing...")):
             
@@ -251,6 +251,62 @@ class TestOptimizedPhotoHandler:
             # Assert
             mock_ui.error.assert_called_with("Error matching items")
 
+    @pytest.mark.asyncio
+    async def test_photo_handler_streaming_matches_positions(self, mock_message_with_photo, mock_state, mock_file_download):
+        """Test positions are counted and matched while OCR is still streaming"""
+        # Arrange
+        from app.models import ParsedData, Position
+
+        file_info, img_io = mock_file_download
+        positions = [Position(name="Product 1", qty=1), Position(name="Product 2", qty=2)]
+        ocr_result = ParsedData(positions=positions)
+        matched_during_stream = []
+
+        async def fake_ocr(img_bytes, on_position, **kwargs):
+            for position in positions:
+                await on_position(position)
+                matched_during_stream.append(optimized_photo_handler.async_match_positions.await_count)
+            return ocr_result
+
+        async def fake_match(items, products):
+            return [{"name": item.name, "status": "ok"} for item in items]
+
+        with patch.multiple('app.handlers.optimized_photo_handler',
+                          is_processing_photo=AsyncMock(return_value=False),
+                          set_processing_photo=AsyncMock(),
+                          async_ocr=AsyncMock(side_effect=fake_ocr),
+                          async_match_positions=AsyncMock(side_effect=fake_match),
+                          get_products=MagicMock(return_value=[]),
+                          IncrementalUI=MagicMock(),
+                          build_report=MagicMock(return_value=("Report text", False)),
+                          build_main_kb=MagicMock(return_value=MagicMock()),
+                          t=MagicMock(return_value=None)):
+
+            mock_message_with_photo.bot.get_file.return_value = file_info
+            mock_message_with_photo.bot.download_file.return_value = img_io
+
+            mock_ui = MagicMock()
+            mock_ui.start = AsyncMock()
+            mock_ui.update = AsyncMock()
+            mock_ui.update_progress = AsyncMock()
+            mock_ui.start_spinner = AsyncMock()
+            mock_ui.stop_spinner = MagicMock()
+            mock_ui.complete = AsyncMock()
+            optimized_photo_handler.IncrementalUI.return_value = mock_ui
+
+            # Act
+            await optimized_photo_handler.optimized_photo_handler(mock_message_with_photo, mock_state)
+
+            # Assert: each position matched as it arrived, no second pass
+            assert matched_during_stream == [1, 2]
+            assert optimized_photo_handler.async_match_positions.await_count == 2
+            mock_ui.update_progress.assert_any_await("Recognizing text... 2 items found")
+            build_args = optimized_photo_handler.build_report.call_args[0]
+            assert build_args[1] == [
+                {"name": "Product 1", "status": "ok"},
+                {"name": "Product 2", "status": "ok"},
+            ]
+
 
 class TestPhotoProcessingSteps:
     """Test individual photo processing steps"""
@@ -528,21 +584,17 @@ class TestCacheAndPerformance:
     
     @pytest.mark.asyncio
     async def test_product_caching(self):
-        """Test product database caching"""
+        """Test product database comes from the shared catalog"""
         # Arrange
-        with patch('app.handlers.optimized_photo_handler.cached_load_products') as mock_cached:
+        with patch('app.handlers.optimized_photo_handler.get_products') as mock_get:
             mock_products = [{"id": "1", "name": "Product 1"}]
-            mock_cached.return_value = mock_products
+            mock_get.return_value = mock_products
             
             # Act
-            from app import data_loader
-            products = optimized_photo_handler.cached_load_products(
-                "data/base_products.csv", 
-                data_loader.load_products
-            )
+            products = optimized_photo_handler.get_products()
             
             # Assert
-            mock_cached.assert_called_once_with("data/base_products.csv", data_loader.load_products)
+            mock_get.assert_called_once_with()
             assert products == mock_products
     
     @pytest.mark.asyncio
@@ -619,4 +671,88 @@ class TestI18nAndLocalization:
 # - Message sending with fallbacks
 # - Caching and performance features
 # - Internationalization support
-# - Cleanup mechanisms
\ No newline at end of file
+# - Cleanup mechanisms
+
+class TestAlbumHandler:
+    """Test multi-page invoices sent as a Telegram album"""
+
+    @staticmethod
+    def album_message(message_id):
+        message = MagicMock(spec=Message)
+        message.message_id = message_id
+        message.media_group_id = "album_1"
+        message.from_user = MagicMock(spec=User)
+        message.from_user.id = 12345
+        message.chat = MagicMock(spec=Chat)
+        message.chat.id = 67890
+        message.answer = AsyncMock(return_value=MagicMock(message_id=500))
+        photo = MagicMock(spec=PhotoSize)
+        photo.file_id = f"photo_{message_id}"
+        message.photo = [photo]
+        message.bot = MagicMock(spec=Bot)
+        file_info = MagicMock(spec=File)
+        file_info.file_path = f"photos/{message_id}.jpg"
+        message.bot.get_file = AsyncMock(return_value=file_info)
+        message.bot.download_file = AsyncMock(return_value=BytesIO(f"page{message_id}".encode()))
+        return message
+
+    @pytest.mark.asyncio
+    async def test_album_pages_recognized_concurrently_and_matched_once(self):
+        """Test pages are OCR'd in parallel, merged in order and matched once"""
+        from app.models import ParsedData, Position
+        from app.utils.media_group import MediaGroupCollector
+
+        pages = {
+            b"page1": ParsedData(supplier="UD Sumber", positions=[Position(name="tomato", qty=1)]),
+            b"page2": ParsedData(positions=[Position(name="onion", qty=2)]),
+            b"page3": ParsedData(positions=[Position(name="egg", qty=30)]),
+        }
+        in_flight = 0
+        peak = 0
+
+        async def fake_ocr(img_bytes, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            return pages[img_bytes]
+
+        state = AsyncMock(spec=FSMContext)
+        state.get_state.return_value = "some_state"
+        state.get_data.return_value = {"lang": "en"}
+        messages = [self.album_message(i) for i in (1, 3, 2)]
+
+        mock_ui = MagicMock()
+        mock_ui.start = AsyncMock()
+        mock_ui.update = AsyncMock()
+        mock_ui.update_progress = AsyncMock()
+        mock_ui.start_spinner = AsyncMock()
+        mock_ui.stop_spinner = MagicMock()
+        mock_ui.complete = AsyncMock()
+
+        with patch.multiple('app.handlers.optimized_photo_handler',
+                          _album_collector=MediaGroupCollector(delay=0.02),
+                          is_processing_photo=AsyncMock(return_value=False),
+                          set_processing_photo=AsyncMock(),
+                          async_ocr=AsyncMock(side_effect=fake_ocr),
+                          async_match_positions=AsyncMock(return_value=[{"status": "ok"}] * 3),
+                          get_products=MagicMock(return_value=[]),
+                          IncrementalUI=MagicMock(return_value=mock_ui),
+                          build_report=MagicMock(return_value=("Report text", False)),
+                          build_main_kb=MagicMock(return_value=MagicMock()),
+                          t=MagicMock(return_value=None)):
+
+            await asyncio.gather(
+                *(optimized_photo_handler.album_photo_handler(m, state) for m in messages)
+            )
+
+            # Assert
+            assert peak == 3
+            optimized_photo_handler.async_match_positions.assert_awaited_once()
+            matched = optimized_photo_handler.async_match_positions.call_args[0][0]
+            assert [p.name for p in matched] == ["tomato", "onion", "egg"]
+            report_invoice = optimized_photo_handler.build_report.call_args[0][0]
+            assert report_invoice.supplier == "UD Sumber"
+            mock_ui.complete.assert_awaited_once()
+            messages[0].answer.assert_called()
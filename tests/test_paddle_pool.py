@@ -0,0 +1,134 @@
+"""Tests for app/utils/paddle_pool.py"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.paddle_pool import PaddleOCRPool
+
+
+class FakeModel:
+    """Stands in for PaddleOCR: echoes the image back as recognized text"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.threads = set()
+
+    def ocr(self, image, cls=True):
+        self.calls.append(image)
+        self.threads.add(threading.get_ident())
+        if image == "boom":
+            raise ValueError("bad cell")
+        if self.delay:
+            time.sleep(self.delay)
+        return [[(None, (f"text-{image}", 0.9))]]
+
+
+class Factory:
+    """Counts created models"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.models = []
+
+    def __call__(self):
+        model = FakeModel(self.delay)
+        self.models.append(model)
+        return model
+
+
+class TestPaddleOCRPool:
+    @pytest.mark.asyncio
+    async def test_single_cell_uses_seed_model(self):
+        factory = Factory()
+        seed = FakeModel()
+        pool = PaddleOCRPool(factory, workers=2, seed_model=seed)
+        try:
+            result = await pool.ocr("a")
+        finally:
+            pool.shutdown()
+
+        assert result == [[(None, ("text-a", 0.9))]]
+        assert seed.calls == ["a"]
+        assert factory.models == []
+        assert threading.get_ident() not in seed.threads
+
+    @pytest.mark.asyncio
+    async def test_concurrent_cells_are_batched(self):
+        factory = Factory()
+        pool = PaddleOCRPool(factory, workers=2, batch_size=4)
+        try:
+            results = await asyncio.gather(*(pool.ocr(i) for i in range(10)))
+        finally:
+            pool.shutdown()
+
+        assert [r[0][0][1][0] for r in results] == [f"text-{i}" for i in range(10)]
+        stats = pool.get_stats()
+        assert stats["batches"] == 3
+        assert stats["cells"] == 10
+        # One model per worker thread at most
+        assert 1 <= len(factory.models) <= 2
+        for model in factory.models:
+            assert len(model.threads) == 1
+
+    @pytest.mark.asyncio
+    async def test_cell_error_does_not_fail_batch(self):
+        pool = PaddleOCRPool(Factory(), workers=1)
+        try:
+            results = await asyncio.gather(pool.ocr("ok"), pool.ocr("boom"), return_exceptions=True)
+        finally:
+            pool.shutdown()
+
+        assert results[0][0][0][1][0] == "text-ok"
+        assert isinstance(results[1], RuntimeError)
+        assert "bad cell" in str(results[1])
+
+    @pytest.mark.asyncio
+    async def test_shutdown_cancels_queued_batches(self):
+        pool = PaddleOCRPool(Factory(delay=0.1), workers=1, batch_size=1)
+        first, second = asyncio.ensure_future(pool.ocr("a")), asyncio.ensure_future(pool.ocr("b"))
+        await asyncio.sleep(0.02)
+        pool.shutdown(wait=False)
+
+        assert (await first)[0][0][1][0] == "text-a"
+        with pytest.raises(asyncio.CancelledError):
+            await second
+
+    @pytest.mark.asyncio
+    async def test_event_loop_not_blocked(self):
+        pool = PaddleOCRPool(Factory(delay=0.05), workers=2, batch_size=2)
+        ticks = 0
+        done = False
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            await asyncio.gather(*(pool.ocr(i) for i in range(6)))
+        finally:
+            done = True
+            await beat
+            pool.shutdown()
+
+        # 6 cells x 50 ms on 2 workers ~ 150 ms, the loop keeps ticking meanwhile
+        assert ticks >= 10
+
+    def test_warm_up_creates_model_per_worker(self):
+        factory = Factory()
+        pool = PaddleOCRPool(factory, workers=3, seed_model=FakeModel())
+        try:
+            pool.warm_up()
+        finally:
+            pool.shutdown()
+
+        # The seed model serves one worker, the others get their own
+        assert len(factory.models) == 2
+        # Warm-up ran a blank image through each new model
+        assert all(len(model.calls) == 1 for model in factory.models)
@@ -0,0 +1,328 @@
+"""Tests for app/utils/perceptual_hash.py and near-duplicate OCR cache lookups"""
+
+import io
+import os
+import random
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+from PIL.Image import Resampling
+
+from app.models import ParsedData, Position
+from app.utils import enhanced_ocr_cache
+from app.utils.enhanced_ocr_cache import OCRResultCache, compute_image_key
+from app.utils.perceptual_hash import (
+    DHASH_THRESHOLD,
+    PHASH_THRESHOLD,
+    PerceptualIndex,
+    details_match,
+    fingerprint_from_str,
+    fingerprint_to_str,
+    hamming_distance,
+    image_fingerprint,
+)
+
+SAMPLE_INVOICE = os.path.join(os.path.dirname(__file__), "sample_invoice.jpg")
+
+# Table rows of the sample invoice (y range and row height in pixels)
+ROWS_TOP, ROWS_BOTTOM, ROW_HEIGHT = 440, 1280, 27
+
+
+def to_jpeg(img, quality=90):
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def invoice():
+    with Image.open(SAMPLE_INVOICE) as img:
+        return img.convert("RGB")
+
+
+def same_invoice_variants(img):
+    """Re-sent copies of the same photo: must be recognized as duplicates"""
+    w, h = img.size
+    return {
+        "recompressed_q35": to_jpeg(img, 35),
+        "half_size": to_jpeg(img.resize((w // 2, h // 2), Resampling.LANCZOS), 80),
+        "third_size": to_jpeg(img.resize((w // 3, h // 3), Resampling.BILINEAR), 60),
+        "brighter": to_jpeg(ImageEnhance.Brightness(img).enhance(1.15), 80),
+        "low_contrast": to_jpeg(ImageEnhance.Contrast(img).enhance(0.8), 80),
+        "blurred": to_jpeg(img.filter(ImageFilter.GaussianBlur(2)), 75),
+        "png": _png(img),
+    }
+
+
+def _png(img):
+    output = io.BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def other_invoice_variants(img):
+    """Different content (or cropped framing): must never be served from cache"""
+    w, h = img.size
+    rnd = random.Random(1)
+
+    numbers = img.copy()
+    draw = ImageDraw.Draw(numbers)
+    for y in range(ROWS_TOP, ROWS_BOTTOM, ROW_HEIGHT):
+        if rnd.random() < 0.5:
+            draw.rectangle([105, y, 185, y + 24], fill=(255, 255, 255))
+            draw.text((130, y + 5), str(rnd.randint(1, 30)), fill=(30, 30, 200))
+            draw.rectangle([1000, y, 1205, y + 24], fill=(255, 255, 255))
+            draw.text((1100, y + 5), f"{rnd.randint(10, 900)},000", fill=(30, 30, 200))
+
+    shuffled = img.copy()
+    strips = [img.crop((0, y, w, y + ROW_HEIGHT)) for y in range(ROWS_TOP, ROWS_BOTTOM, ROW_HEIGHT)]
+    random.Random(2).shuffle(strips)
+    for i, strip in enumerate(strips):
+        shuffled.paste(strip, (0, ROWS_TOP + ROW_HEIGHT * i))
+
+    # Next week's order from the same supplier: one quantity, then one whole row
+    one_cell = img.copy()
+    draw = ImageDraw.Draw(one_cell)
+    y = ROWS_TOP + ROW_HEIGHT * 5
+    draw.rectangle([105, y, 185, y + 24], fill=(255, 255, 255))
+    draw.text((130, y + 5), "7", fill=(30, 30, 200))
+
+    one_row = img.copy()
+    draw = ImageDraw.Draw(one_row)
+    draw.rectangle([105, y, 1205, y + 24], fill=(255, 255, 255))
+    draw.text((130, y + 5), "3", fill=(30, 30, 200))
+    draw.text((300, y + 5), "bawang putih", fill=(30, 30, 200))
+    draw.text((1100, y + 5), "45,000", fill=(30, 30, 200))
+
+    fewer_rows = img.copy()
+    draw = ImageDraw.Draw(fewer_rows)
+    draw.rectangle([280, 900, 620, 1280], fill=(255, 255, 255))
+    draw.rectangle([880, 900, 1210, 1280], fill=(255, 255, 255))
+
+    return {
+        "changed_numbers": to_jpeg(numbers),
+        "one_cell": to_jpeg(one_cell),
+        "one_row": to_jpeg(one_row),
+        "shuffled_rows": to_jpeg(shuffled),
+        "fewer_rows": to_jpeg(fewer_rows),
+        "upside_down": to_jpeg(img.transpose(Image.FLIP_TOP_BOTTOM)),
+        "cropped_2pct": to_jpeg(
+            img.crop((int(w * 0.02), int(h * 0.02), int(w * 0.98), int(h * 0.98)))
+        ),
+        "blank_page": to_jpeg(Image.new("RGB", (w, h), (255, 255, 255))),
+    }
+
+
+@pytest.fixture(scope="module")
+def same_variants(invoice):
+    return same_invoice_variants(invoice)
+
+
+@pytest.fixture(scope="module")
+def other_variants(invoice):
+    return other_invoice_variants(invoice)
+
+
+@pytest.fixture(scope="module")
+def index(invoice):
+    index = PerceptualIndex()
+    index.add("invoice", image_fingerprint(to_jpeg(invoice)))
+    return index
+
+
+def make_data(supplier="UD. Widi Wiguna"):
+    return ParsedData(
+        supplier=supplier,
+        positions=[Position(name="mushroom", qty=1.0, unit="kg", price=40000, total_price=40000)],
+        total_price=40000,
+    )
+
+
+class TestFingerprint:
+    """Test hashing primitives"""
+
+    def test_deterministic(self, invoice):
+        data = to_jpeg(invoice)
+        assert image_fingerprint(data) == image_fingerprint(data)
+
+    def test_invalid_image_returns_none(self):
+        assert image_fingerprint(b"not an image") is None
+
+    def test_serialization_roundtrip(self, invoice):
+        fingerprint = image_fingerprint(to_jpeg(invoice))
+        assert fingerprint_from_str(fingerprint_to_str(fingerprint)) == fingerprint
+        assert fingerprint_from_str("garbage") is None
+        # Entries written before detail maps cannot be verified and are skipped
+        assert fingerprint_from_str("ff:ff") is None
+
+    def test_exif_rotation_is_applied(self, invoice):
+        rotated = invoice.rotate(90, expand=True)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+        output = io.BytesIO()
+        rotated.save(output, format="JPEG", quality=90, exif=exif)
+
+        index = PerceptualIndex()
+        index.add("original", image_fingerprint(to_jpeg(invoice)))
+        assert index.find(image_fingerprint(output.getvalue()))[0] == "original"
+
+
+class TestNearDuplicateCorpus:
+    """Corpus of re-sent copies and look-alike invoices built from the sample photo"""
+
+    @pytest.mark.parametrize(
+        "variant",
+        [
+            "recompressed_q35",
+            "half_size",
+            "third_size",
+            "brighter",
+            "low_contrast",
+            "blurred",
+            "png",
+        ],
+    )
+    def test_same_invoice_is_found(self, same_variants, index, variant):
+        match = index.find(image_fingerprint(same_variants[variant]))
+        assert match is not None and match[0] == "invoice"
+
+    @pytest.mark.parametrize(
+        "variant",
+        [
+            "changed_numbers",
+            "one_cell",
+            "one_row",
+            "shuffled_rows",
+            "fewer_rows",
+            "upside_down",
+            "cropped_2pct",
+            "blank_page",
+        ],
+    )
+    def test_other_invoice_is_not_found(self, other_variants, index, variant):
+        assert index.find(image_fingerprint(other_variants[variant])) is None
+
+    def test_one_cell_rejected_by_detail_map(self, invoice, other_variants):
+        original = image_fingerprint(to_jpeg(invoice))
+        changed = image_fingerprint(other_variants["one_cell"])
+
+        # The global hashes cannot tell a single changed number apart
+        assert hamming_distance(original[0], changed[0]) <= DHASH_THRESHOLD
+        assert hamming_distance(original[1], changed[1]) <= PHASH_THRESHOLD
+        assert not details_match(original[2], changed[2])
+
+    def test_closest_entry_wins(self, invoice, other_variants):
+        index = PerceptualIndex()
+        index.add("shuffled", image_fingerprint(other_variants["shuffled_rows"]))
+        index.add("invoice", image_fingerprint(to_jpeg(invoice)))
+        assert index.find(image_fingerprint(to_jpeg(invoice, 50)))[0] == "invoice"
+
+    def test_eviction_and_removal(self, invoice):
+        index = PerceptualIndex(max_size=1)
+        fingerprint = image_fingerprint(to_jpeg(invoice))
+        index.add("a", fingerprint)
+        index.add("b", fingerprint)
+        assert "a" not in index
+        index.remove("b")
+        assert index.find(fingerprint) is None
+
+
+class TestNearDuplicateCache:
+    """The OCR result cache serves near-duplicates and counts avoided API calls"""
+
+    def test_near_duplicate_served_and_counted(self, invoice, same_variants):
+        cache = OCRResultCache(cache_dir=None, use_redis=False)
+        original = to_jpeg(invoice)
+        cache.set(compute_image_key(original), make_data())
+        cache.store_fingerprint(compute_image_key(original), image_fingerprint(original))
+
+        resent = same_variants["recompressed_q35"]
+        resent_key = compute_image_key(resent)
+        assert cache.get(resent_key) is None
+        assert cache.find_near_duplicate(image_fingerprint(resent), key=resent_key) == make_data()
+
+        # The re-sent photo is now an exact hit as well
+        assert cache.get(resent_key) == make_data()
+        stats = cache.get_stats()
+        assert stats["near_duplicate_hits"] == 1
+        assert stats["api_calls_avoided"] == 2
+
+    def test_fingerprints_survive_restart_on_disk(self, invoice, same_variants, tmp_path):
+        original = to_jpeg(invoice)
+        key = compute_image_key(original)
+        first = OCRResultCache(cache_dir=str(tmp_path), use_redis=False)
+        first.set(key, make_data())
+        first.store_fingerprint(key, image_fingerprint(original))
+
+        restarted = OCRResultCache(cache_dir=str(tmp_path), use_redis=False)
+        resent = same_variants["half_size"]
+
+        assert restarted.find_near_duplicate(image_fingerprint(resent)) == make_data()
+
+    def test_evicted_result_drops_fingerprint(self, invoice):
+        cache = OCRResultCache(cache_dir=None, use_redis=False)
+        fingerprint = image_fingerprint(to_jpeg(invoice))
+        cache.store_fingerprint("gone", fingerprint)
+
+        assert cache.find_near_duplicate(fingerprint) is None
+        assert "gone" not in cache.fingerprints
+
+    def test_fingerprints_file_compacted(self, invoice, tmp_path):
+        fingerprint = image_fingerprint(to_jpeg(invoice))
+        cache = OCRResultCache(cache_dir=str(tmp_path), use_redis=False)
+        cache.fingerprints = PerceptualIndex(max_size=2)
+        keys = [compute_image_key(f"photo {i}".encode()) for i in range(10)]
+        for key in keys:
+            cache.set(key, make_data())
+            cache.store_fingerprint(key, fingerprint)
+
+        with open(tmp_path / enhanced_ocr_cache.FINGERPRINTS_FILE, encoding="utf-8") as f:
+            lines = f.readlines()
+        assert len(lines) <= 4
+        assert {line.split("\t")[0] for line in lines} <= set(keys[-4:])
+
+        # Results expired by TTL are dropped at the next compaction
+        os.remove(cache._disk_path(keys[-1]))
+        expired = cache._disk_path(keys[-2])
+        os.utime(expired, (0, 0))
+        cache._compact_fingerprints(str(tmp_path / enhanced_ocr_cache.FINGERPRINTS_FILE))
+
+        restarted = OCRResultCache(cache_dir=str(tmp_path), use_redis=False)
+        restarted._load_fingerprints()
+        assert list(restarted.fingerprints.items()) == []
+
+    @pytest.mark.asyncio
+    async def test_async_ocr_skips_api_for_resent_photo(self, invoice, same_variants, monkeypatch):
+        from app.utils.async_ocr import async_ocr
+
+        cache = OCRResultCache(cache_dir=None, use_redis=False)
+        monkeypatch.setattr(enhanced_ocr_cache, "_ocr_result_cache", cache)
+        monkeypatch.setattr("app.utils.async_ocr.NEAR_DUPLICATE_MODE", True)
+        original = to_jpeg(invoice)
+        await enhanced_ocr_cache.async_store_in_cache(
+            original, make_data(), fingerprint=image_fingerprint(original)
+        )
+
+        resent = same_variants["recompressed_q35"]
+        with patch("app.utils.async_ocr.get_http_session") as mock_session:
+            result = await async_ocr(resent, use_cache=True)
+
+        assert result == make_data()
+        mock_session.assert_not_called()
+        assert cache.get_stats()["near_duplicate_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_near_duplicates_are_opt_in(self, invoice, same_variants, monkeypatch):
+        from app.utils.async_ocr import _lookup_cache
+
+        cache = OCRResultCache(cache_dir=None, use_redis=False)
+        monkeypatch.setattr(enhanced_ocr_cache, "_ocr_result_cache", cache)
+        original = to_jpeg(invoice)
+        cache.set(compute_image_key(original), make_data())
+        cache.store_fingerprint(compute_image_key(original), image_fingerprint(original))
+
+        resent = same_variants["recompressed_q35"]
+        result, fingerprint = await _lookup_cache(resent, "req", compute_image_key(resent))
+
+        assert result is None and fingerprint is None
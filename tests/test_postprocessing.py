@@ -146,7 +146,7 @@ def test_postprocess_with_direct_patch(monkeypatch):
         return mock_products
 
     # Важно: патчим именно в модуле app.postprocessing, а не в app.data_loader
-    monkeypatch.setattr(app.postprocessing, "load_products", mock_load)
+    monkeypatch.setattr(app.postprocessing, "get_products", mock_load)
 
     # Создаем тестовую позицию с опечаткой
     position = Position(name="Тунецц", qty=1.0, unit="кг")
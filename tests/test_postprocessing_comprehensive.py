@@ -13,7 +13,9 @@ from app.postprocessing import (
     PRODUCT_DEFAULT_UNITS,
     UNIT_MAPPING,
     autocorrect_name,
+    autocorrect_names,
     clean_num,
+    get_autocorrect_index,
     normalize_units,
     postprocess_parsed_data,
 )
@@ -143,6 +145,53 @@ class TestAutocorrectName:
         assert mock_logging.debug.call_count >= 2
 
 
+class TestAutocorrectNames:
+    """Тесты для пакетной автокоррекции autocorrect_names"""
+
+    def test_same_results_as_autocorrect_name(self):
+        """Пакетный результат совпадает с поштучным, порядок сохраняется"""
+        allowed_names = ["apple", "banana", "orange", "Lemon"]
+        names = ["aple", "xyz", "  banana ", None, "", "LEMON", "aple", "oranje"]
+
+        result = autocorrect_names(names, allowed_names)
+
+        assert result == [autocorrect_name(name, allowed_names) for name in names]
+        assert result[1:6] == ["xyz", "banana", None, "", "Lemon"]
+        assert result[6] == result[0]
+
+    def test_batch_matrix_for_large_invoice(self):
+        """От BATCH_MIN_POSITIONS уникальных названий используется search_batch"""
+        allowed_names = [f"product {i}" for i in range(20)]
+        names = [f"prodct {i}" for i in range(12)]
+
+        result = autocorrect_names(names, allowed_names)
+
+        assert result == [autocorrect_name(name, allowed_names) for name in names]
+        assert result[3] == "product 3"
+
+    def test_index_built_once_per_invoice(self):
+        """postprocess_parsed_data берет индекс один раз и ищет каждое название один раз"""
+        mock_product = MagicMock()
+        mock_product.alias = "Apple"
+        positions = [
+            Position(name="APPLE", qty=1, price=1.0),
+            Position(name="APPLE", qty=2, price=1.0),
+            Position(name="pear", qty=1, price=1.0),
+            Position(name="Total", qty=1, price=1.0),
+        ]
+        parsed = ParsedData(supplier="Test", positions=positions)
+
+        with patch("app.postprocessing.get_products", return_value=[mock_product]), patch(
+            "app.postprocessing.get_autocorrect_index", wraps=get_autocorrect_index
+        ) as index_mock, patch("app.postprocessing.record_histogram") as histogram_mock:
+            result = postprocess_parsed_data(parsed, req_id="test_batch")
+
+        assert [p.name for p in result.positions] == ["Apple", "Apple", "pear"]
+        index_mock.assert_called_once()
+        recorded = [call.args[0] for call in histogram_mock.call_args_list]
+        assert recorded == ["postprocess_autocorrect_seconds", "postprocess_seconds"]
+
+
 class TestNormalizeUnits:
     """Тесты для функции normalize_units"""
 
@@ -244,7 +293,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=5, price=2.0, total_price=10.0)]
         parsed = ParsedData(supplier="Test", positions=positions, total_price=10.0)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.supplier == "Test"
@@ -256,7 +305,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty="5", price="$2.50", total_price="12.50")]
         parsed = ParsedData(supplier="Test", positions=positions, total_price="$12.50")
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].qty == 5.0
@@ -269,7 +318,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=1.0)]
         parsed = ParsedData(supplier="Test", positions=positions, date="15.03.2024")
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.date == date(2024, 3, 15)
@@ -279,7 +328,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=1.0)]
         parsed = ParsedData(supplier="Test", positions=positions, date="invalid_date")
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.date == "invalid_date"  # должна остаться без изменений
@@ -294,7 +343,7 @@ class TestPostprocessParsedData:
         ]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert len(result.positions) == 2
@@ -306,7 +355,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=5, price=2.0, total_price=None)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].total_price == 10.0
@@ -316,7 +365,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=5, price=None, total_price=10.0)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].price == 2.0
@@ -329,7 +378,7 @@ class TestPostprocessParsedData:
         ]
         parsed = ParsedData(supplier="Test", positions=positions, total_price=None)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.total_price == 11.0
@@ -339,7 +388,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=20000000, total_price=20000000)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].price == 2000000  # исправлено /10
@@ -349,7 +398,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=5000, price=1.0, total_price=5000)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].qty == 500  # исправлено /10
@@ -362,7 +411,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="aple", qty=1, price=1.0)]  # опечатка
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[mock_product]):
+        with patch("app.postprocessing.get_products", return_value=[mock_product]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].name == "apple"
@@ -374,7 +423,7 @@ class TestPostprocessParsedData:
         positions = [Position(name=long_name, qty=1, price=1.0)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             postprocess_parsed_data(parsed, req_id="test_123")
 
         mock_log.assert_called_with("test_123", "position.name", long_name, "< 30 chars")
@@ -384,7 +433,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=1.0, unit="kilograms")]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         assert result.positions[0].unit == "kg"
@@ -396,7 +445,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=1.0)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             postprocess_parsed_data(parsed, req_id="test_123")
 
         # Проверяем что происходило логирование
@@ -408,7 +457,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=1, price=1.0)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", side_effect=Exception("Test error")):
+        with patch("app.postprocessing.get_products", side_effect=Exception("Test error")):
             result = postprocess_parsed_data(parsed)
 
         # Должны вернуться исходные данные при ошибке
@@ -419,7 +468,7 @@ class TestPostprocessParsedData:
         positions = [Position(name="apple", qty=0, price=None, total_price=10.0)]
         parsed = ParsedData(supplier="Test", positions=positions)
 
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocess_parsed_data(parsed)
 
         # Цена не должна быть вычислена при qty=0
@@ -437,7 +486,7 @@ class TestPostprocessParsedData:
         mock_product = MagicMock()
         mock_product.alias = "apple"
 
-        with patch("app.postprocessing.load_products", return_value=[mock_product]):
+        with patch("app.postprocessing.get_products", return_value=[mock_product]):
             result = postprocess_parsed_data(parsed)
 
         # Проверяем результаты
@@ -0,0 +1,167 @@
+"""Tests for app/product_index.py"""
+
+import pytest
+
+from app.data_loader import load_products
+from app.matcher import calculate_string_similarity, fuzzy_find, match_positions
+from app.models import Product
+from app.product_index import ProductIndex, clear_index_cache, get_product_index
+
+
+def brute_force_find(query, items, threshold, limit):
+    """Reference linear scan equivalent to the pre-index fuzzy_find"""
+    results = []
+    query_normalized = query.lower().strip()
+    for item in items:
+        value = item.get("name", "") if isinstance(item, dict) else item.name
+        if not value:
+            continue
+        score = calculate_string_similarity(query_normalized, value)
+        if score >= threshold:
+            data = (
+                item.copy()
+                if isinstance(item, dict)
+                else {"id": item.id, "name": item.name, "alias": item.alias, "unit": item.unit}
+            )
+            data["score"] = score
+            results.append(data)
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results[:limit]
+
+
+@pytest.fixture(autouse=True)
+def _clear_index_cache():
+    clear_index_cache()
+    yield
+    clear_index_cache()
+
+
+class TestProductIndex:
+    """Test index construction and candidate selection"""
+
+    def test_duplicate_values_stored_once(self):
+        index = ProductIndex(["Apple", "Orange", "Apple", ""])
+        assert len(index) == 2
+        assert index.rows[0] == [0, 2]
+        assert index.normalized == ["apple", "orange"]
+
+    def test_small_catalog_scans_everything(self):
+        index = ProductIndex(["apple", "orange", "banana"], max_candidates=10)
+        assert index.candidates("zzz") == [0, 1, 2]
+
+    def test_large_catalog_limits_candidates(self):
+        values = [f"product number {i}" for i in range(1000)] + ["mayonnaise"]
+        index = ProductIndex(values, max_candidates=20)
+        candidates = index.candidates("mayonaise")
+        assert len(candidates) <= 20
+        assert 1000 in candidates
+
+    def test_no_shared_grams_no_candidates(self):
+        index = ProductIndex([f"item {i}" for i in range(50)], max_candidates=10)
+        assert index.candidates("xyz") == []
+
+    def test_index_reused_for_same_catalog(self):
+        items = [{"id": "1", "name": "apple"}, {"id": "2", "name": "orange"}]
+        first = get_product_index(items)
+        second = get_product_index([dict(item) for item in items])
+        assert first is second
+
+    def test_index_rebuilt_when_catalog_changes(self):
+        items = [{"id": "1", "name": "apple"}]
+        first = get_product_index(items)
+        second = get_product_index(items + [{"id": "2", "name": "orange"}])
+        assert first is not second
+
+
+class TestIndexedSearch:
+    """Indexed search must return the same results as a linear scan"""
+
+    @pytest.mark.parametrize(
+        "query",
+        ["chicken breast", "mayo", "tomato", "cheezy cheese", "Rounding", "olive oil", "xyz"],
+    )
+    def test_matches_linear_scan_on_catalog(self, query):
+        products = load_products()
+        expected = brute_force_find(query, products, threshold=0.7, limit=5)
+        assert fuzzy_find(query, products, threshold=0.7, limit=5) == expected
+
+    def test_ties_keep_catalog_order(self):
+        items = [{"id": str(i), "name": "apple"} for i in range(3)]
+        results = fuzzy_find("apple", items, limit=3)
+        assert [r["id"] for r in results] == ["0", "1", "2"]
+
+    def test_product_objects(self):
+        products = [Product(id="1", code="A", name="Apple", alias="apple", unit="kg")]
+        results = fuzzy_find("apple", products)
+        assert results == [
+            {"id": "1", "name": "Apple", "alias": "apple", "unit": "kg", "score": 1.0}
+        ]
+
+    def test_large_catalog_finds_best_match(self):
+        catalog = [{"id": str(i), "name": f"generic item {i}"} for i in range(20000)]
+        catalog.append({"id": "target", "name": "smoked salmon fillet"})
+
+        results = match_positions([{"name": "smoked salmon filet"}], catalog)
+
+        assert results[0]["status"] == "ok"
+        assert results[0]["id"] == "target"
+
+
+class TestBatchScoring:
+    """Batched cdist scoring must reproduce calculate_string_similarity exactly"""
+
+    QUERIES = [
+        "chicken breast",
+        "mayo",
+        "Tomato ",
+        "cheezy cheese",
+        "rounding",
+        "olive oil extra virgin",
+        "xyz",
+        "a",
+        "beef tenderloin 1kg",
+        "lemon",
+    ]
+
+    def test_matrix_identical_to_scalar_scorer(self):
+        names = [p.name for p in load_products()]
+        index = ProductIndex(names)
+        queries = [q.lower().strip() for q in self.QUERIES]
+
+        matrix = index.similarity_matrix(queries)
+
+        for qi, query in enumerate(queries):
+            for vid, value in enumerate(index.values):
+                assert matrix[qi, vid] == calculate_string_similarity(query, value)
+
+    def test_search_batch_matches_single_search(self):
+        products = load_products()
+        index = get_product_index(products)
+
+        batched = index.search_batch(self.QUERIES, products, threshold=0.6, limit=5)
+
+        for query, results in zip(self.QUERIES, batched):
+            assert results == index.search(query, products, threshold=0.6, limit=5)
+
+    def test_search_batch_small_catalog_matches_linear_scan(self):
+        items = [{"id": str(i), "name": p.name} for i, p in enumerate(load_products()[:150])]
+        index = get_product_index(items)
+
+        batched = index.search_batch(self.QUERIES, items, threshold=0.5, limit=5)
+
+        for query, results in zip(self.QUERIES, batched):
+            assert results == brute_force_find(query, items, threshold=0.5, limit=5)
+
+    def test_match_positions_batch_flag(self):
+        products = load_products()
+        positions = [{"name": q, "qty": 1} for q in self.QUERIES] + [{"name": "", "qty": 1}]
+
+        batched = match_positions(positions, products, batch=True)
+        single = match_positions(positions, products, batch=False)
+
+        assert batched == single
+        assert batched[-1]["status"] == "unknown"
+
+    def test_search_batch_empty_catalog(self):
+        index = ProductIndex([])
+        assert index.search_batch(["apple"], []) == [[]]
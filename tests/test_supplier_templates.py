@@ -0,0 +1,195 @@
+"""Tests for app/utils/supplier_templates.py"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.utils.supplier_templates import (
+    SupplierTemplateStore,
+    learn_supplier_template,
+    page_text_lines,
+)
+
+# Column x-ranges of the synthetic layout (page width 1000 px)
+COLUMNS = {"name": (50, 400), "qty": (450, 520), "unit": (540, 600), "price": (650, 780)}
+TOTAL_COLUMN = (820, 950)
+
+ITEMS = [
+    ("Wheat flour", 5, "kg", 12000),
+    ("Palm sugar", 2, "kg", 30000),
+    ("Fresh eggs", 30, "pcs", 2500),
+]
+
+
+def page(
+    items=ITEMS,
+    shift=0,
+    header=("Description", "Qty", "Unit", "Price", "Amount"),
+    broken_total=False,
+    title="PT ACME FOODS",
+    tax_id=None,
+):
+    """Page text lines: title, table header and one line per item"""
+
+    def line(text, x1, x2, y):
+        return {"text": text, "bbox": [x1 + shift, y, x2 + shift, y + 20], "confidence": 0.95}
+
+    lines = [line(title, 50, 400, 20), line("Invoice 2024-05-01", 650, 950, 20)]
+    if tax_id:
+        lines.append(line(f"NPWP: {tax_id}", 50, 400, 50))
+    header_xs = [COLUMNS["name"], COLUMNS["qty"], COLUMNS["unit"], COLUMNS["price"], TOTAL_COLUMN]
+    lines += [line(text, *xs, 100) for text, xs in zip(header, header_xs)]
+    for index, (name, qty, unit, price) in enumerate(items):
+        y = 140 + index * 40
+        total = qty * price * (10 if broken_total else 1)
+        lines += [
+            line(name, *COLUMNS["name"], y),
+            line(str(qty), *COLUMNS["qty"], y),
+            line(unit, *COLUMNS["unit"], y),
+            line(f"{price:,}", *COLUMNS["price"], y),
+            line(f"{total:,}", *TOTAL_COLUMN, y),
+        ]
+    lines.append(line("TOTAL", *COLUMNS["name"], 140 + len(items) * 40 + 20))
+    return lines
+
+
+def confirmed_positions():
+    return [
+        {"name": name, "qty": qty, "unit": unit, "price": price, "total_price": qty * price}
+        for name, qty, unit, price in ITEMS
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SupplierTemplateStore(path=tmp_path / "templates.json")
+
+
+class TestLearnTemplate:
+    def test_columns_and_anchors_learned(self, store):
+        assert store.learn("acme", confirmed_positions(), page(), 1000) is True
+
+        template = store.templates["acme"]
+        assert template.samples == 1
+        assert template.columns["name"] == [0.05, 0.4]
+        assert template.columns["qty"] == [0.45, 0.52]
+        assert template.columns["total"] == [0.82, 0.95]
+        assert {a["text"] for a in template.anchors} >= {"description", "qty", "price"}
+
+    def test_unrelated_page_not_learned(self, store):
+        lines = page(items=[("Something else", 1, "pcs", 100)])
+
+        assert store.learn("acme", confirmed_positions(), lines, 1000) is False
+        assert "acme" not in store.templates
+
+    def test_templates_persisted(self, store, tmp_path):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+
+        reloaded = SupplierTemplateStore(path=tmp_path / "templates.json")
+        reloaded.load()
+
+        assert reloaded.templates["acme"].columns == store.templates["acme"].columns
+
+
+class TestRecognizeWithTemplate:
+    def test_new_invoice_extracted_by_columns(self, store):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+        new_items = [
+            ("Rice", 10, "kg", 14000),
+            ("Butter", 4, "pcs", 45000),
+            ("Salt", 1, "kg", 8000),
+        ]
+
+        # Photo taken slightly off-centre
+        match = store.recognize(page(items=new_items, shift=20), 1000)
+
+        assert match["supplier"] == "acme"
+        assert [p["name"] for p in match["positions"]] == ["Rice", "Butter", "Salt"]
+        assert match["positions"][0]["qty"] == 10
+        assert match["positions"][0]["unit"] == "kg"
+        assert match["positions"][1]["total_price"] == 180000
+        assert store.get_stats()["suppliers"]["acme"]["hit_rate"] == 1.0
+
+    def test_other_layout_falls_back(self, store):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+
+        match = store.recognize(page(header=("Item", "Jumlah", "Sat", "Harga", "Total")), 1000)
+
+        assert match is None
+        assert store.get_stats()["unmatched"] == 1
+
+    def test_suppliers_with_same_header_told_apart(self, store):
+        store.learn("PT Acme Foods", confirmed_positions(), page(), 1000)
+        bumi_page = page(title="CV BUMI JAYA", tax_id="01.234.567.8-901.000")
+        store.learn("CV Bumi Jaya", confirmed_positions(), bumi_page, 1000)
+
+        acme = store.recognize(page(), 1000)
+        bumi = store.recognize(page(title="CV BUMI JAYA"), 1000)
+        # Supplier name unreadable, the tax ID still identifies it
+        by_tax_id = store.recognize(page(title="FAKTUR", tax_id="012345678901000"), 1000)
+        unknown = store.recognize(page(title="UD SINAR"), 1000)
+
+        assert acme["supplier"] == "PT Acme Foods"
+        assert bumi["supplier"] == "CV Bumi Jaya"
+        assert by_tax_id["supplier"] == "CV Bumi Jaya"
+        assert unknown is None
+        assert store.templates["cv bumi jaya"].tax_ids == ["012345678901000"]
+        assert store.templates["pt acme foods"].tax_ids == []
+
+    def test_inconsistent_rows_count_as_miss(self, store):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+
+        match = store.recognize(page(broken_total=True), 1000)
+
+        assert match is None
+        assert store.get_stats()["suppliers"]["acme"] == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+
+    def test_single_inconsistent_row_falls_back(self, store):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+        items = ITEMS + [("Rice", 10, "kg", 14000), ("Butter", 4, "pcs", 45000)]
+        lines = page(items=items)
+        # One total of five misread: 66,000 instead of 60,000
+        wheat_total = next(line for line in lines if line["text"] == "60,000")
+        wheat_total["text"] = "66,000"
+
+        assert store.recognize(page(items=items), 1000) is not None
+        assert store.recognize(lines, 1000) is None
+
+    def test_row_without_qty_falls_back(self, store):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+        lines = page()
+        for line in lines:
+            if line["text"] == "30":
+                line["text"] = "--"
+
+        assert store.recognize(lines, 1000) is None
+
+    def test_fewer_rows_than_last_confirmed_invoice_fall_back(self, store, tmp_path):
+        store.learn("acme", confirmed_positions(), page(), 1000)
+
+        assert store.recognize(page(items=ITEMS[:2]), 1000) is None
+
+        reloaded = SupplierTemplateStore(path=tmp_path / "templates.json")
+        reloaded.load()
+        assert reloaded.templates["acme"].rows == len(ITEMS)
+
+
+class TestLearnFromConfirmedInvoice:
+    def test_learns_from_remembered_page(self, store):
+        store.remember_page("photo_1", page(), 1000)
+        invoice = {"supplier": "ACME", "positions": confirmed_positions()}
+
+        with patch("app.utils.supplier_templates.get_template_store", return_value=store):
+            assert learn_supplier_template("photo_1", invoice) is True
+            assert learn_supplier_template("photo_unknown", invoice) is False
+
+        assert "acme" in store.templates
+        assert store.templates["acme"].name == "ACME"
+
+
+def test_page_text_lines_from_paddle_result():
+    result = [[[[[10, 5], [90, 5], [90, 25], [10, 25]], ("Qty", 0.98)], [None, ("bad", 0.1)]]]
+
+    lines = page_text_lines(result)
+
+    assert lines == [{"text": "Qty", "bbox": [10.0, 5.0, 90.0, 25.0], "confidence": 0.98}]
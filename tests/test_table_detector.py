@@ -155,3 +155,101 @@ def test_extract_no_structure_engine():
     detector.structure_engine = None
     with pytest.raises(RuntimeError):
         detector.extract_cells(b"fake_image")
+
+
+def _png_bytes(width=300, height=200):
+    from io import BytesIO
+
+    from PIL import Image
+
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_extract_cells_returns_page_views():
+    import numpy as np
+
+    fake_ppstructure = MagicMock(
+        return_value=[
+            {
+                "type": "table",
+                "bbox": [10, 20, 290, 190],
+                "res": [
+                    {"bbox": [10, 20, 100, 50], "text": "Header 1"},
+                    {"bbox": [110, 20, 200, 50], "text": "Header 2"},
+                ],
+            }
+        ]
+    )
+    detector = PaddleTableDetector()
+    detector.structure_engine = fake_ppstructure
+
+    stats = {}
+    cells = detector.extract_cells(_png_bytes(), stats)
+
+    assert [c["bbox"] for c in cells] == [[10, 20, 100, 50], [110, 20, 200, 50]]
+    assert cells[0]["structure"]["text"] == "Header 1"
+    assert cells[0]["image"].shape == (30, 90, 3)
+    # Both cells are slices of the same decoded page, not copies
+    assert cells[0]["image"].base is not None
+    assert np.shares_memory(cells[0]["image"], cells[1]["image"].base)
+    # Page is decoded once and handed to PP-Structure as BGR
+    fake_ppstructure.assert_called_once()
+    assert stats["cells"] == 2
+    assert stats["page_kb"] == round(300 * 200 * 3 / 1024)
+
+
+def test_extract_cells_relative_cell_bbox():
+    fake_ppstructure = MagicMock(
+        return_value=[
+            {
+                "type": "table",
+                "bbox": [50, 40, 250, 180],
+                "res": {
+                    "html": "<table></table>",
+                    "cell_bbox": [[0, 0, 100, 0, 100, 30, 0, 30], [100, 0, 400, 30]],
+                },
+            }
+        ]
+    )
+    detector = PaddleTableDetector()
+    detector.structure_engine = fake_ppstructure
+
+    cells = detector.extract_cells(_png_bytes())
+
+    # Cell boxes are shifted by the table origin and clipped to the page
+    assert [c["bbox"] for c in cells] == [[50, 40, 150, 70], [150, 40, 300, 70]]
+
+
+def test_structure_calls_are_serialized():
+    import threading
+    import time
+
+    running = 0
+    peak = 0
+    guard = threading.Lock()
+
+    def fake_ppstructure(page):
+        nonlocal running, peak
+        with guard:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with guard:
+            running -= 1
+        return []
+
+    detector = PaddleTableDetector()
+    detector.structure_engine = fake_ppstructure
+    threads = [
+        threading.Thread(target=detector.extract_cells, args=(_png_bytes(),)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # One shared predictor is never run from two threads at once
+    assert peak == 1
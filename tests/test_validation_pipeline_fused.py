@@ -0,0 +1,116 @@
+"""Tests for the fused pass of app/validators/pipeline.py"""
+
+import copy
+from datetime import date
+from unittest.mock import patch
+
+from app.models import ParsedData, Position
+from app.validators.pipeline import ValidationPipeline
+
+TODAY = date.today().isoformat()
+
+
+def invoice_lines():
+    """Lines with arithmetic fixes, an unfixable error and context price warnings"""
+    return [
+        {"name": "tomato", "qty": 2, "unit": "kg", "price": 15000, "amount": 30000},
+        {"name": "onion", "qty": 3, "unit": "kg", "price": 12000, "amount": 0},
+        {"name": "beef", "qty": 1, "unit": "kg", "price": 1400000, "amount": 140000},
+        {"name": "chicken", "qty": 2, "unit": "kg", "price": 45000, "amount": 77777},
+        {"name": "mystery item", "qty": 1, "price": 300, "amount": 300},
+        {
+            "name": "salt",
+            "qty": 0,
+            "unit": "kg",
+            "price": 5000,
+            "amount": 10000,
+            "validation_warnings": ["from OCR"],
+        },
+    ]
+
+
+def staged_and_fused(data, **kwargs):
+    """Results of both pipeline modes on independent copies of the same input"""
+    pipeline = ValidationPipeline(**kwargs)
+    fused = pipeline._validate_fused(copy.deepcopy(data))
+    staged = pipeline._validate_staged(copy.deepcopy(data))
+    return staged, fused
+
+
+class TestFusedPipeline:
+    def test_lines_same_result_as_staged(self):
+        for auto_fix in (True, False):
+            data = {"supplier": "Test", "date": TODAY, "lines": invoice_lines()}
+
+            staged, fused = staged_and_fused(data, auto_fix=auto_fix)
+
+            assert fused == staged
+            assert [i["type"] for i in fused["issues"]].count("ARITHMETIC_ERROR") == 1
+
+    def test_positions_same_result_as_staged(self):
+        data = {
+            "date": "2020-01-01",
+            "issues": [{"type": "OCR", "severity": "warning"}],
+            "positions": [
+                {"name": "tomato", "qty": 2, "unit": "kg", "price": 15000, "total_price": 30000},
+                {"name": "onion", "qty": 1, "unit": "kg", "price": 500},
+            ],
+        }
+
+        staged, fused = staged_and_fused(data)
+
+        assert fused == staged
+        assert fused["status"] == "warning"
+        assert fused["context_validation"]["overall_valid"] is False
+
+    def test_model_input_same_result_as_staged(self):
+        data = ParsedData(
+            supplier="Test",
+            positions=[Position(name="tomato", qty=2, unit="kg", price=15000, total_price=30000)],
+        )
+
+        pipeline = ValidationPipeline()
+        fused = pipeline._validate_fused(data)
+
+        assert fused == pipeline._validate_staged(data)
+        assert any(w.startswith("Missing invoice date") for w in fused["validation_warnings"])
+
+    def test_failures_reported_like_staged(self):
+        data = {
+            "date": TODAY,
+            "lines": [{"name": "tomato", "qty": 1, "price": "15.000", "amount": 15000}, None],
+        }
+
+        staged, fused = staged_and_fused(data)
+
+        assert fused == staged
+        assert [i["type"] for i in fused["issues"]] == [
+            "VALIDATION_ERROR",
+            "CONTEXT_VALIDATION_ERROR",
+        ]
+        assert "positions" not in fused
+
+    def test_invoice_copied_once(self):
+        data = {"date": TODAY, "lines": invoice_lines()}
+        pipeline = ValidationPipeline()
+
+        with patch("app.validators.pipeline.validate_prices_with_context") as context, patch(
+            "app.validators.pipeline.validate_invoice_dates"
+        ) as dates, patch.object(pipeline.arithmetic_validator, "validate") as arithmetic:
+            result = pipeline.validate(data)
+
+        context.assert_not_called()
+        dates.assert_not_called()
+        arithmetic.assert_not_called()
+        assert result["lines"] is data["lines"]
+        assert result is not data
+
+    def test_custom_validators_run_staged(self):
+        pipeline = ValidationPipeline()
+        pipeline.validators = [pipeline.arithmetic_validator, pipeline.arithmetic_validator]
+
+        with patch.object(pipeline, "_validate_fused") as fused:
+            result = pipeline.validate({"date": TODAY, "lines": invoice_lines()})
+
+        fused.assert_not_called()
+        assert result["validated"] is True
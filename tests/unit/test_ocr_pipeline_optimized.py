@@ -218,7 +218,7 @@ async def test_process_image_happy_path(sample_cells, mock_vision_result):
     ) as mock_cache_get, patch(
         "app.ocr_pipeline_optimized.cache_set"
     ) as mock_cache_set, patch(
-        "app.ocr_pipeline_optimized.prepare_for_ocr"
+        "app.ocr_pipeline_optimized.prepare_for_ocr_async"
     ) as mock_prepare:
 
         # Mock detector
@@ -207,8 +207,8 @@ def mock_parsed_data():
 
 
 def test_postprocess_parsed_data_basic(mock_parsed_data):
-    # Создаем мок для load_products
-    with patch("app.postprocessing.load_products") as mock_load:
+    # Создаем мок для get_products
+    with patch("app.postprocessing.get_products") as mock_load:
         mock_load.return_value = [
             type("Product", (), {"alias": "Apple"}),
             type("Product", (), {"alias": "Banana"}),
@@ -238,7 +238,7 @@ def test_postprocess_parsed_data_date_conversion():
         total_price=0,
     )
 
-    with patch("app.postprocessing.load_products", return_value=[]):
+    with patch("app.postprocessing.get_products", return_value=[]):
         result = postprocessing.postprocess_parsed_data(parsed)
         assert isinstance(result.date, date)
         assert result.date == date(2025, 1, 1)
@@ -257,7 +257,7 @@ def test_postprocess_parsed_data_invalid_date():
     # Затем заменяем дату на невалидную строку
     with patch.object(parsed, "date", "invalid_date"):
         # Обрабатываем с помощью postprocess_parsed_data
-        with patch("app.postprocessing.load_products", return_value=[]):
+        with patch("app.postprocessing.get_products", return_value=[]):
             result = postprocessing.postprocess_parsed_data(parsed)
             # Дата должна остаться "invalid_date"
             assert result.date == "invalid_date"
@@ -279,7 +279,7 @@ def test_postprocess_parsed_data_calculate_missing_values():
         total_price=None,  # общая сумма неизвестна
     )
 
-    with patch("app.postprocessing.load_products", return_value=[]):
+    with patch("app.postprocessing.get_products", return_value=[]):
         result = postprocessing.postprocess_parsed_data(parsed)
 
         # Проверяем вычисленные значения
@@ -302,7 +302,7 @@ def test_postprocess_parsed_data_normalize_units():
         total_price=310,
     )
 
-    with patch("app.postprocessing.load_products", return_value=[]):
+    with patch("app.postprocessing.get_products", return_value=[]):
         result = postprocessing.postprocess_parsed_data(parsed)
 
         # Проверяем нормализованные единицы
@@ -318,8 +318,8 @@ def test_postprocess_parsed_data_exception_handling():
         supplier="Test", date="2025-01-01", positions=[Position(name="Test", qty=1)], total_price=0
     )
 
-    # Вызываем исключение в load_products
-    with patch("app.postprocessing.load_products", side_effect=Exception("Test error")):
+    # Вызываем исключение в get_products
+    with patch("app.postprocessing.get_products", side_effect=Exception("Test error")):
         # Функция должна вернуть исходные данные при ошибке, не выбрасывая исключения
         result = postprocessing.postprocess_parsed_data(parsed)
         assert result == parsed
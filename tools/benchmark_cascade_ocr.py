@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Бенчмарк каскадного OCR на примерах накладных.
+
+Распознает каждую накладную локальным уровнем каскада (PP-Structure +
+PaddleOCR), выводит уверенность и ее составляющие, задержку локального
+уровня и долю накладных, которые обошлись бы без GPT-4o при разных порогах.
+С --remote (и ключом OpenAI) накладные с низкой уверенностью дополнительно
+распознаются GPT-4o, и выводится задержка этого уровня.
+
+Использование:
+  python tools/benchmark_cascade_ocr.py [изображения или каталоги ...]
+      [--thresholds 0.7,0.8,0.85,0.9] [--remote]
+
+Без аргументов берутся tests/assets/*.png и tests/*.jpg.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.ocr_pipeline_optimized import warm_up_ocr_engines  # noqa: E402
+from app.utils.cascade_ocr import CASCADE_PADDLE_LANG, CASCADE_THRESHOLD, CascadeOCR  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def find_images(paths):
+    """Изображения из списка файлов и каталогов"""
+    if not paths:
+        root = Path(project_root)
+        return sorted(root.glob("tests/assets/*.png")) + sorted(root.glob("tests/*.jpg"))
+    images = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            images.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES))
+        elif path.exists():
+            images.append(path)
+    return images
+
+
+async def run(images, thresholds, remote: bool):
+    cascade = CascadeOCR()
+    rows = []
+    for path in images:
+        image_bytes = path.read_bytes()
+        start = time.perf_counter()
+        local, score, parts = await cascade.run_local(image_bytes, path.name, use_cache=False)
+        local_seconds = time.perf_counter() - start
+        positions = len(local.positions) if local else 0
+        print(
+            f"  {path.name:32s} уверенность {score:5.3f} "
+            f"(арифметика {parts['arithmetic']:.2f}, ячейки {parts['cell_confidence']:.2f}) "
+            f"позиций {positions:3d}  {local_seconds:6.2f} сек"
+        )
+        rows.append((path, score, local_seconds))
+
+    print("\nДоля накладных без GPT-4o:")
+    for threshold in thresholds:
+        accepted = sum(1 for _, score, _ in rows if score >= threshold)
+        print(f"  порог {threshold:.2f}: {accepted}/{len(rows)} ({accepted / len(rows):.0%})")
+
+    local_times = [seconds for _, _, seconds in rows]
+    print(
+        f"\nЛокальный уровень: медиана {statistics.median(local_times):.2f} сек, "
+        f"максимум {max(local_times):.2f} сек"
+    )
+
+    if remote:
+        from app.utils.async_ocr import async_ocr
+
+        remote_times = []
+        for path, score, _ in rows:
+            if score >= cascade.threshold:
+                continue
+            start = time.perf_counter()
+            result = await async_ocr(path.read_bytes(), use_cache=False, cascade=False, timeout=180)
+            remote_times.append(time.perf_counter() - start)
+            print(
+                f"  GPT-4o {path.name}: {len(result.positions)} позиций, "
+                f"{remote_times[-1]:.2f} сек"
+            )
+        if remote_times:
+            print(f"Уровень GPT-4o: медиана {statistics.median(remote_times):.2f} сек")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк каскадного OCR")
+    parser.add_argument("images", nargs="*", help="Изображения или каталоги с накладными")
+    parser.add_argument(
+        "--thresholds",
+        default=f"0.7,0.8,{CASCADE_THRESHOLD},0.9",
+        help="Пороги уверенности через запятую",
+    )
+    parser.add_argument("--remote", action="store_true", help="Распознать отклоненные GPT-4o")
+    args = parser.parse_args()
+
+    images = find_images(args.images)
+    if not images:
+        print("Накладные не найдены")
+        return 1
+    thresholds = sorted({float(value) for value in args.thresholds.split(",")})
+    remote = args.remote and bool(os.getenv("OPENAI_OCR_KEY") or os.getenv("OPENAI_API_KEY"))
+
+    start = time.perf_counter()
+    stats = warm_up_ocr_engines(paddle_ocr_lang=CASCADE_PADDLE_LANG)
+    print(f"Движки прогреты за {time.perf_counter() - start:.1f} сек: {stats['init']}")
+    print(f"Накладных: {len(images)}\n")
+
+    asyncio.run(run(images, thresholds, remote))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Бенчмарк полного цикла правки накладной (process_user_edit).
+
+Для накладной из N строк выполняет типовые текстовые правки (цена,
+количество, название, дата) от разбора команды до готового отчета и
+выводит медианное время цикла:
+- с кэшем итогов в состоянии (обычная правка после предыдущей)
+- без кэша итогов (первая правка после распознавания фото)
+
+Использование:
+  python tools/benchmark_edit_roundtrip.py [--lines 50] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import copy
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.catalog import get_products  # noqa: E402
+from app.edit.incremental import summarize  # noqa: E402
+from app.handlers.edit_core import process_user_edit  # noqa: E402
+from app.matcher import match_positions  # noqa: E402
+
+COMMANDS = {
+    "Цена": "line 5 price 15000",
+    "Количество": "line 4 qty 3",
+    "Название": "line 3 name tomato",
+    "Дата": "date 12.05.2026",
+}
+
+
+class MemoryState:
+    """Минимальная замена FSMContext в памяти"""
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    async def get_data(self) -> dict:
+        return dict(self.data)
+
+    async def update_data(self, **kwargs) -> None:
+        self.data.update(kwargs)
+
+    async def set_state(self, value) -> None:
+        pass
+
+    async def clear(self) -> None:
+        self.data = {}
+
+
+def make_state_data(count: int) -> dict:
+    """Состояние после распознавания: накладная из каталожных и неизвестных названий"""
+    rnd = random.Random(42)
+    names = [getattr(p, "name", None) or p.get("name") for p in get_products()[:200]]
+    names += ["mystery item", "tomatto", "unknown sauce"]
+    positions = [
+        {
+            "name": rnd.choice(names),
+            "qty": rnd.choice([1, 2, 3, 0.5]),
+            "unit": "kg",
+            "price": rnd.choice([12000, 25000, 87500]),
+        }
+        for _ in range(count)
+    ]
+    invoice = {"supplier": "Benchmark", "date": "2026-05-01", "positions": positions}
+    return {"invoice": invoice, "match_results": match_positions(positions, get_products())}
+
+
+def timed(text: str, data: dict, repeat: int) -> float:
+    """Медианное время цикла правки (сек) на копии состояния"""
+    message = SimpleNamespace(from_user=SimpleNamespace(id=1))
+
+    async def send(_text):
+        pass
+
+    timings = []
+    for _ in range(repeat):
+        state = MemoryState(copy.deepcopy(data))
+        start = time.perf_counter()
+        asyncio.run(process_user_edit(message, state, text, send_result=send, send_error=send))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк цикла правки накладной")
+    parser.add_argument("--lines", type=int, default=50, help="Количество строк")
+    parser.add_argument("--repeat", "-r", type=int, default=20, help="Количество повторов")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    data = make_state_data(args.lines)
+    cached = dict(data, edit_totals=summarize(data["match_results"]))
+
+    print(f"\nНакладная: {args.lines} строк")
+    print(f"  {'Правка':<12} {'с кэшем':>10} {'без кэша':>10}")
+    for title, text in COMMANDS.items():
+        with_cache = timed(text, cached, args.repeat)
+        without_cache = timed(text, data, args.repeat)
+        print(f"  {title:<12} {with_cache * 1000:7.2f} мс {without_cache * 1000:7.2f} мс")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Бенчмарк подготовки фотографий накладных к OCR.
+
+Сравнивает прежний путь (полное декодирование + LANCZOS до 1600 px в пуле
+потоков) с текущим (Image.draft, EXIF-поворот, пул процессов):
+- время и пиковый RSS на одну фотографию (каждый замер в отдельном процессе)
+- общее время и максимальную задержку event loop при параллельной подготовке
+
+Использование:
+  python tools/benchmark_imgprep.py [--image photo.jpg] [--megapixels 12] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from PIL import Image, ImageFilter  # noqa: E402
+from PIL.Image import Resampling  # noqa: E402
+
+from app.imgprep.prepare import (  # noqa: E402
+    prepare_for_ocr,
+    prepare_for_ocr_async,
+    shutdown_prep_executor,
+)
+
+SAMPLE_INVOICE = os.path.join(project_root, "tests", "sample_invoice.jpg")
+
+
+def legacy_resize_image(image_bytes: bytes, max_size: int = 1600, quality: int = 90) -> bytes:
+    """Прежняя реализация resize_image: полное декодирование и LANCZOS"""
+    img = Image.open(io.BytesIO(image_bytes))
+    if max(img.size) <= max_size and len(image_bytes) <= 1.5 * 1024 * 1024:
+        return image_bytes
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Resampling.LANCZOS)
+    output = io.BytesIO()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.save(output, format="JPEG", quality=quality, optimize=True)
+    result = output.getvalue()
+    return image_bytes if len(result) >= len(image_bytes) else result
+
+
+MODES = {"legacy": legacy_resize_image, "draft": prepare_for_ocr}
+
+
+def make_photo(path: str, megapixels: float) -> bytes:
+    """Масштабирует образец накладной до размера фотографии с телефона"""
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        scale = (megapixels * 1_000_000 / (img.width * img.height)) ** 0.5
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Resampling.BICUBIC)
+        img = img.filter(ImageFilter.GaussianBlur(0.6))
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=92)
+        return output.getvalue()
+
+
+def _reset_peak_rss() -> None:
+    """Сбрасывает VmHWM процесса (Linux), чтобы не учитывать импорт модулей"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _status_kb(field: str) -> int:
+    """Значение поля /proc/self/status в КБ (VmHWM — пиковый, VmRSS — текущий RSS)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def worker(mode: str, photo_path: str) -> None:
+    """Обрабатывает одну фотографию и печатает время и пиковый RSS процесса"""
+    with open(photo_path, "rb") as f:
+        image_bytes = f.read()
+    _reset_peak_rss()
+    baseline_kb = _status_kb("VmRSS")
+    start = time.perf_counter()
+    result = MODES[mode](image_bytes)
+    elapsed = time.perf_counter() - start
+    peak_kb = _status_kb("VmHWM")
+    with Image.open(io.BytesIO(result)) as img:
+        size = img.size
+    print(
+        json.dumps(
+            {
+                "time": elapsed,
+                "rss_mb": peak_kb / 1024,
+                "delta_mb": (peak_kb - baseline_kb) / 1024,
+                "size": size,
+                "bytes": len(result),
+            }
+        )
+    )
+
+
+def measure_single(mode: str, photo_path: str, repeat: int) -> dict:
+    """Запускает worker в отдельных процессах и возвращает медианы"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", mode, photo_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "time": statistics.median(r["time"] for r in runs),
+        "rss_mb": statistics.median(r["rss_mb"] for r in runs),
+        "delta_mb": statistics.median(r["delta_mb"] for r in runs),
+        "size": runs[0]["size"],
+        "bytes": runs[0]["bytes"],
+    }
+
+
+async def measure_concurrent(image_bytes: bytes, concurrency: int, use_pool: bool) -> tuple:
+    """Готовит concurrency фотографий параллельно и измеряет задержку event loop"""
+    loop = asyncio.get_running_loop()
+    max_lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal max_lag
+        while running:
+            before = loop.time()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, loop.time() - before - 0.005)
+
+    if use_pool:
+        # Прогреваем пул, чтобы не мерить запуск процессов
+        await prepare_for_ocr_async(image_bytes)
+        prepare = prepare_for_ocr_async
+    else:
+
+        async def prepare(data):
+            return await loop.run_in_executor(None, legacy_resize_image, data)
+
+    tick_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(prepare(image_bytes) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await tick_task
+    return elapsed, max_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк подготовки изображений")
+    parser.add_argument("--image", default=SAMPLE_INVOICE, help="Исходная фотография")
+    parser.add_argument("--megapixels", type=float, default=12, help="Размер синтетического фото")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Параллельных фото")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Количество повторов")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return 0
+
+    image_bytes = make_photo(args.image, args.megapixels)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(image_bytes)
+        photo_path = f.name
+
+    try:
+        with Image.open(photo_path) as img:
+            print(
+                f"Фото: {img.width}x{img.height}, {len(image_bytes) / 1024:.0f} КБ, "
+                f"ядер: {os.cpu_count()}"
+            )
+
+        print("\nОдна фотография (отдельный процесс, медиана):")
+        for mode in MODES:
+            r = measure_single(mode, photo_path, args.repeat)
+            print(
+                f"  {mode:7s} {r['time'] * 1000:7.0f} мс   пиковый RSS {r['rss_mb']:6.0f} МБ "
+                f"(+{r['delta_mb']:.0f} МБ)   -> {r['size'][0]}x{r['size'][1]}, "
+                f"{r['bytes'] / 1024:.0f} КБ"
+            )
+
+        print(f"\n{args.concurrency} фотографий параллельно:")
+        elapsed, lag = asyncio.run(measure_concurrent(image_bytes, args.concurrency, False))
+        lag *= 1000
+        print(f"  legacy, пул потоков:   {elapsed:6.2f} сек, макс. задержка loop {lag:6.0f} мс")
+        elapsed, lag = asyncio.run(measure_concurrent(image_bytes, args.concurrency, True))
+        lag *= 1000
+        print(f"  draft, пул процессов:  {elapsed:6.2f} сек, макс. задержка loop {lag:6.0f} мс")
+    finally:
+        shutdown_prep_executor()
+        os.remove(photo_path)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
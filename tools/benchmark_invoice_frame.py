@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Бенчмарк колоночных проверок накладной (InvoiceFrame).
+
+Сравнивает на синтетических накладных:
+- построчную арифметическую проверку (поведение до InvoiceFrame)
+- ArithmeticValidator.validate построчно и над столбцами
+- OCRPreValidator.validate_positions построчно и над столбцами
+
+По результатам выбраны пороги ARITHMETIC_VECTOR_MIN_LINES и
+PREVALIDATION_VECTOR_MIN_LINES (app/validators/invoice_frame.py): столбцы
+быстрее построчной проверки только на длинных накладных.
+
+Использование:
+  python tools/benchmark_invoice_frame.py [--lines 10 40 200 1000] [--repeat 20]
+"""
+
+import argparse
+import copy
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.utils.data_utils import clean_number  # noqa: E402
+from app.validators.arithmetic_validator import ArithmeticValidator  # noqa: E402
+from app.validators.invoice_frame import (  # noqa: E402
+    ARITHMETIC_VECTOR_MIN_LINES,
+    PREVALIDATION_VECTOR_MIN_LINES,
+    InvoiceFrame,
+)
+from app.validators.ocr_prevalidator import OCRPreValidator  # noqa: E402
+
+# Порог, при котором путь всегда построчный
+ROWS_ONLY = sys.maxsize
+
+
+def make_lines(count: int) -> list:
+    """Генерирует строки накладной: верные, с пропусками и со сдвигом разрядов"""
+    rnd = random.Random(42)
+    lines = []
+    for i in range(count):
+        qty = rnd.choice([1, 2, 3, 5, 10, 0.5])
+        price = rnd.choice([1500, 12000, 25000, 87500, 150000])
+        amount = qty * price
+        kind = rnd.random()
+        if kind < 0.1:
+            amount = 0
+        elif kind < 0.2:
+            price *= 10
+        elif kind < 0.3:
+            amount *= 7
+        elif kind < 0.4:
+            price = f"{price:,}".replace(",", ".")
+        lines.append({"name": f"Item {i}", "qty": qty, "price": price, "amount": amount})
+    return lines
+
+
+def validate_by_line(validator: ArithmeticValidator, lines: list) -> list:
+    """Построчная проверка на скалярных методах валидатора (как до InvoiceFrame)"""
+    issues = []
+    for i, line in enumerate(lines):
+        qty, price, amount = (clean_number(line.get(k, 0)) for k in ("qty", "price", "amount"))
+        no_qty, no_price, no_amount = map(validator._is_missing_or_zero, (qty, price, amount))
+        if no_amount and not no_qty and not no_price:
+            line["amount"] = qty * price
+            message = f"Fixed amount: {qty} × {price} = {line['amount']}"
+            issues.append({"type": "ARITHMETIC_FIX", "line": i, "message": message})
+        elif not (no_qty or no_price or no_amount) and not validator._is_close(qty * price, amount):
+            fixed = validator._try_fix_decimal_errors(qty, price, amount)
+            fixed = fixed or validator._try_fix_zero_errors(qty, price, amount)
+            if fixed:
+                line.update(fixed)
+                message = f"Fixed errors: {fixed['qty']} × {fixed['price']} = {fixed['amount']}"
+                issues.append({"type": "ARITHMETIC_FIX", "line": i, "message": message})
+            else:
+                message = f"Calculation error: {qty} × {price} = {amount}"
+                issues.append({"type": "ARITHMETIC_ERROR", "line": i, "message": message})
+    return issues
+
+
+def timed(func, lines: list, repeat: int) -> float:
+    """Возвращает медианное время выполнения функции в секундах (на копии строк)"""
+    timings = []
+    for _ in range(repeat):
+        data = copy.deepcopy(lines)
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def prevalidate(validator: OCRPreValidator, positions: list) -> list:
+    """Предварительная проверка позиций, как в validate_ocr_result"""
+    frame = InvoiceFrame.from_lines(positions, total_key="total_price")
+    return validator.validate_positions(positions, frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк колоночных проверок накладной")
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[10, 40, 200, 1000], help="Количество строк"
+    )
+    parser.add_argument("--repeat", "-r", type=int, default=20, help="Количество повторов")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    reference = ArithmeticValidator()
+    arithmetic = {
+        "построчно": ArithmeticValidator(vector_min_lines=ROWS_ONLY),
+        "столбцы": ArithmeticValidator(vector_min_lines=0),
+    }
+    prevalidators = {
+        "построчно": OCRPreValidator(vector_min_lines=ROWS_ONLY),
+        "столбцы": OCRPreValidator(vector_min_lines=0),
+    }
+    print(
+        f"Пороги столбцов: ArithmeticValidator — {ARITHMETIC_VECTOR_MIN_LINES} строк, "
+        f"OCRPreValidator — {PREVALIDATION_VECTOR_MIN_LINES}"
+    )
+
+    for count in args.lines:
+        lines = make_lines(count)
+        positions = [
+            {
+                "name": line["name"],
+                "qty": line["qty"],
+                "price": line["price"],
+                "total_price": line["amount"],
+            }
+            for line in lines
+        ]
+        print(f"\nНакладная: {count} строк")
+
+        by_line = timed(lambda data: validate_by_line(reference, data), lines, args.repeat)
+        print(f"  До InvoiceFrame:                 {by_line * 1000:8.3f} мс")
+
+        timings = {}
+        for mode, validator in arithmetic.items():
+            timings[mode] = timed(
+                lambda data: validator.validate({"lines": data}), lines, args.repeat
+            )
+            print(f"  ArithmeticValidator, {mode:9}:  {timings[mode] * 1000:8.3f} мс")
+        print(f"    столбцы / построчно: {timings['столбцы'] / timings['построчно']:.2f}")
+
+        for mode, prevalidator in prevalidators.items():
+            timings[mode] = timed(
+                lambda data: prevalidate(prevalidator, data), positions, args.repeat
+            )
+            print(f"  OCRPreValidator, {mode:9}:      {timings[mode] * 1000:8.3f} мс")
+        print(f"    столбцы / построчно: {timings['столбцы'] / timings['построчно']:.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
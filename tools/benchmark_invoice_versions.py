@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Бенчмарк версий инвойса: полные копии и copy-on-write.
+
+Выполняет серию правок (цена, количество, единица, название вручную, дата)
+над накладной из N строк и хранит все версии сессии, как для отмены правок.
+Для каждого способа выводятся медианное время одной правки и память,
+которую занимает цепочка версий (tracemalloc).
+
+Использование:
+  python tools/benchmark_invoice_versions.py [--lines 50] [--edits 20] [--repeat 5]
+"""
+
+import argparse
+import copy
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.edit.apply_intent import apply_intent  # noqa: E402
+from app.edit.versions import InvoiceVersions  # noqa: E402
+
+
+def make_invoice(count: int) -> dict:
+    """Накладная из N строк с типичным набором полей позиции"""
+    rnd = random.Random(42)
+    positions = [
+        {
+            "name": f"Item {i}",
+            "qty": rnd.choice([1, 2, 3, 0.5]),
+            "unit": "kg",
+            "price": rnd.choice([12000, 25000, 87500]),
+            "total_price": 0,
+            "status": "ok",
+            "matched_name": f"Item {i}",
+            "validation_warnings": [],
+        }
+        for i in range(count)
+    ]
+    return {"supplier": "Benchmark", "date": "2026-05-01", "positions": positions}
+
+
+def make_intents(count: int, lines: int) -> list:
+    """Серия правок разных видов по случайным строкам"""
+    rnd = random.Random(7)
+    intents = []
+    for i in range(count):
+        line = rnd.randrange(lines)
+        kind = i % 5
+        if kind == 0:
+            intents.append({"action": "edit_price", "line": line, "value": "15000"})
+        elif kind == 1:
+            intents.append({"action": "edit_quantity", "line": line, "value": "4"})
+        elif kind == 2:
+            intents.append({"action": "edit_unit", "line": line, "value": "pc"})
+        elif kind == 3:
+            intents.append(
+                {"action": "edit_line_field", "line": line, "field": "name", "value": "salt"}
+            )
+        else:
+            intents.append({"action": "edit_date", "value": "02.05.2026"})
+    return intents
+
+
+def apply_deepcopy(invoice: dict, intent: dict) -> dict:
+    """Правка с полной копией инвойса (как до copy-on-write)"""
+    return apply_intent(copy.deepcopy(invoice), intent)
+
+
+def run_session(apply, invoice: dict, intents: list) -> InvoiceVersions:
+    """Цепочка версий сессии: каждая правка строится от предыдущей версии"""
+    history = InvoiceVersions(invoice, limit=len(intents) + 1)
+    for intent in intents:
+        history.commit(apply(history.current, intent))
+    return history
+
+
+def measure(apply, invoice: dict, intents: list, repeat: int) -> tuple:
+    """Медианное время правки (сек) и память цепочки версий (байт)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_session(apply, invoice, intents)
+        timings.append((time.perf_counter() - start) / len(intents))
+
+    tracemalloc.start()
+    history = run_session(apply, invoice, intents)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+    return statistics.median(timings), retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк версий инвойса")
+    parser.add_argument("--lines", type=int, default=50, help="Количество строк")
+    parser.add_argument("--edits", type=int, default=20, help="Количество правок в сессии")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="Количество повторов")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    invoice = make_invoice(args.lines)
+    intents = make_intents(args.edits, args.lines)
+
+    print(f"\nНакладная: {args.lines} строк, правок: {args.edits}")
+    full, full_memory = measure(apply_deepcopy, invoice, intents, args.repeat)
+    print(f"  Полные копии:   {full * 1e6:8.1f} мкс/правка  {full_memory / 1024:8.1f} КБ")
+
+    cow, cow_memory = measure(apply_intent, invoice, intents, args.repeat)
+    print(f"  Copy-on-write:  {cow * 1e6:8.1f} мкс/правка  {cow_memory / 1024:8.1f} КБ")
+
+    print(f"  Ускорение: {full / cow:.1f}x, память: {full_memory / cow_memory:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Бенчмарк сопоставления позиций накладной с каталогом продуктов.
+
+Сравнивает три режима match_positions на синтетическом каталоге:
+- линейный перебор calculate_string_similarity (поведение до индекса)
+- поштучный поиск по ProductIndex
+- пакетная матричная оценка через rapidfuzz.process.cdist
+
+Использование:
+  python tools/benchmark_matcher.py [--catalog 20000] [--positions 40 200] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.matcher import calculate_string_similarity, match_positions  # noqa: E402
+from app.product_index import clear_index_cache, get_product_index  # noqa: E402
+from app.utils.string_cache import clear_string_cache  # noqa: E402
+
+WORDS = (
+    "chicken beef pork lamb salmon tuna shrimp tomato onion garlic basil parsley oil olive "
+    "butter cream cheese mozzarella milk flour sugar salt pepper rice pasta lemon lime mango "
+    "apple avocado potato carrot mushroom spinach yogurt vinegar sauce mayo fillet smoked fresh"
+).split()
+
+
+def make_catalog(size: int) -> list:
+    """Генерирует синтетический каталог продуктов"""
+    rnd = random.Random(42)
+    return [
+        {"id": str(i), "name": " ".join(rnd.sample(WORDS, rnd.randint(2, 4))) + f" {i % 500}g"}
+        for i in range(size)
+    ]
+
+
+def make_positions(catalog: list, count: int) -> list:
+    """Генерирует позиции накладной: названия из каталога с опечатками"""
+    rnd = random.Random(7)
+    positions = []
+    for item in rnd.sample(catalog, count):
+        name = list(item["name"])
+        name[rnd.randrange(len(name))] = rnd.choice("aeiou")
+        positions.append({"name": "".join(name), "qty": 1})
+    return positions
+
+
+def linear_match(positions: list, catalog: list, threshold: float = 0.7) -> list:
+    """Сопоставление полным перебором каталога для каждой позиции"""
+    results = []
+    for position in positions:
+        query = position["name"].lower().strip()
+        best = None
+        for item in catalog:
+            score = calculate_string_similarity(query, item["name"])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (item, score)
+        results.append(best)
+    return results
+
+
+def timed(func, repeat: int) -> float:
+    """Возвращает медианное время выполнения функции в секундах"""
+    timings = []
+    for _ in range(repeat):
+        calculate_string_similarity.cache_clear()
+        clear_string_cache()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сопоставления позиций")
+    parser.add_argument("--catalog", type=int, default=20000, help="Размер каталога")
+    parser.add_argument(
+        "--positions", type=int, nargs="+", default=[40, 200], help="Количество позиций"
+    )
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Количество повторов")
+    parser.add_argument("--skip-linear", action="store_true", help="Не запускать полный перебор")
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.catalog)
+
+    clear_index_cache()
+    start = time.perf_counter()
+    get_product_index(catalog)
+    elapsed = time.perf_counter() - start
+    print(f"Каталог: {args.catalog} строк, построение индекса {elapsed:.3f} сек")
+
+    for count in args.positions:
+        positions = make_positions(catalog, count)
+        print(f"\nНакладная: {count} позиций")
+
+        if not args.skip_linear:
+            linear = timed(lambda: linear_match(positions, catalog), 1)
+            print(f"  Полный перебор:        {linear:8.3f} сек")
+
+        single = timed(lambda: match_positions(positions, catalog, batch=False), args.repeat)
+        print(f"  Индекс, по позициям:   {single:8.3f} сек")
+
+        batch = timed(lambda: match_positions(positions, catalog, batch=True), args.repeat)
+        print(f"  Пакетно (cdist):       {batch:8.3f} сек")
+
+        if not args.skip_linear:
+            print(f"  Ускорение cdist vs перебор: {linear / batch:.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
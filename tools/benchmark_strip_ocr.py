@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Бенчмарк OCR длинных накладных: один запрос против параллельных полос.
+
+Генерирует накладную на заданное число строк, режет ее на полосы
+(app.imgprep.split_into_strips) и сравнивает время распознавания целиком и
+по полосам. С ключом OpenAI (OPENAI_OCR_KEY / OPENAI_API_KEY) выполняются
+реальные запросы; с --simulate задержка моделируется: базовая задержка
+запроса плюс время генерации ответа, пропорциональное числу строк.
+
+Использование:
+  python tools/benchmark_strip_ocr.py [--lines 60] [--repeat 3] [--simulate]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from app.imgprep import split_into_strips  # noqa: E402
+from app.imgprep.tiling import analysis_gray, load_upright, text_line_bands  # noqa: E402
+
+PRODUCTS = [
+    "tomato",
+    "onion",
+    "garlic",
+    "chili",
+    "egg",
+    "carrot",
+    "potato",
+    "lime",
+    "basil",
+    "rice",
+]
+
+
+def make_invoice(lines: int) -> bytes:
+    """Накладная с шапкой, lines позициями и итогом"""
+    pitch = 28
+    img = Image.new("RGB", (1000, lines * pitch + 300), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.text((60, 40), "UD SUMBER MAKMUR        Invoice 2024-05-01", fill=(0, 0, 0))
+    total = 0
+    for i in range(lines):
+        qty = 1 + i % 5
+        price = 5000 + (i * 750) % 20000
+        total += qty * price
+        name = f"{PRODUCTS[i % len(PRODUCTS)]} grade {i // len(PRODUCTS) + 1}"
+        row = f"{i + 1:3d}  {name:24s} {qty:3d} kg  {price:8,d}  {qty * price:10,d}"
+        draw.text((60, 120 + i * pitch), row, fill=(0, 0, 0))
+    draw.text((60, 140 + lines * pitch), f"TOTAL {total:,d}", fill=(0, 0, 0))
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=92)
+    return output.getvalue()
+
+
+def count_lines(image_bytes: bytes) -> int:
+    """Число строк текста на изображении"""
+    gray, _ = analysis_gray(load_upright(image_bytes))
+    return len(text_line_bands(gray))
+
+
+def simulated_ocr(base: float, per_line: float):
+    """Модель задержки GPT-4o: запрос + генерация ответа по строкам"""
+
+    async def ocr(image_bytes: bytes) -> None:
+        await asyncio.sleep(base + per_line * count_lines(image_bytes))
+
+    return ocr
+
+
+def live_ocr(split: bool):
+    """Реальный запрос через async_ocr без кеша"""
+    from app.utils.async_ocr import async_ocr
+
+    async def ocr(image_bytes: bytes) -> None:
+        result = await async_ocr(image_bytes, use_cache=False, split=split, timeout=180)
+        print(f"    распознано позиций: {len(result.positions)}")
+
+    return ocr
+
+
+async def measure(ocr, images, repeat: int) -> float:
+    """Медианное время распознавания всех изображений параллельно"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await asyncio.gather(*(ocr(image) for image in images))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк OCR длинных накладных по полосам")
+    parser.add_argument("--lines", "-n", type=int, default=60, help="Строк в накладной")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Количество повторов")
+    parser.add_argument("--simulate", action="store_true", help="Моделировать задержку API")
+    parser.add_argument("--base", type=float, default=2.5, help="Базовая задержка запроса, сек")
+    parser.add_argument("--per-line", type=float, default=0.35, help="Генерация одной строки, сек")
+    args = parser.parse_args()
+
+    image_bytes = make_invoice(args.lines)
+    split_start = time.perf_counter()
+    strips = split_into_strips(image_bytes)
+    split_time = time.perf_counter() - split_start
+
+    print(f"Накладная: {args.lines} позиций, найдено строк текста: {count_lines(image_bytes)}")
+    print(
+        f"Полос: {len(strips)} (строк: {', '.join(str(count_lines(s)) for s in strips)}), "
+        f"разрезание {split_time * 1000:.0f} мс"
+    )
+
+    simulate = args.simulate or not (os.getenv("OPENAI_OCR_KEY") or os.getenv("OPENAI_API_KEY"))
+    if simulate:
+        print(f"\nМодель задержки: {args.base} сек + {args.per_line} сек на строку")
+        ocr = simulated_ocr(args.base, args.per_line)
+        single = asyncio.run(measure(ocr, [image_bytes], args.repeat))
+        split = asyncio.run(measure(ocr, strips, args.repeat)) + split_time
+    else:
+        print("\nРеальные запросы к OpenAI (без кеша)")
+        single = asyncio.run(measure(live_ocr(False), [image_bytes], args.repeat))
+        split = asyncio.run(measure(live_ocr(True), [image_bytes], args.repeat))
+
+    print(f"  целиком:   {single:6.2f} сек")
+    print(f"  по полосам: {split:6.2f} сек  (x{single / split:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Бенчмарк ValidationPipeline: поэтапный и совмещенный режимы.
+
+Поэтапный режим копирует накладную на каждом этапе (арифметика, контекст
+цен, даты) и заново обходит строки; совмещенный делает одну рабочую копию
+и один проход по строкам. Для каждого режима выводятся медианное время и
+объем памяти, выделенной на одну накладную (tracemalloc).
+
+Использование:
+  python tools/benchmark_validation_pipeline.py [--lines 40 200 1000] [--repeat 5]
+"""
+
+import argparse
+import copy
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+# Добавляем путь к корню проекта
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.validators.pipeline import ValidationPipeline  # noqa: E402
+
+NAMES = (
+    "tomato potato onion garlic chicken beef salmon rice flour sugar milk cheese "
+    "butter olive oil apple mango lemon basil mystery"
+).split()
+
+
+def make_invoice(count: int) -> dict:
+    """Генерирует накладную: верные строки, пропущенные суммы и ошибки в разрядах"""
+    rnd = random.Random(42)
+    lines = []
+    for _ in range(count):
+        qty = rnd.choice([1, 2, 3, 5, 0.5])
+        price = rnd.choice([1500, 12000, 25000, 87500, 150000])
+        amount = qty * price
+        kind = rnd.random()
+        if kind < 0.1:
+            amount = 0
+        elif kind < 0.2:
+            price *= 10
+        elif kind < 0.3:
+            amount *= 7
+        lines.append(
+            {"name": rnd.choice(NAMES), "qty": qty, "unit": "kg", "price": price, "amount": amount}
+        )
+    return {"supplier": "Benchmark", "date": date.today().isoformat(), "lines": lines}
+
+
+def measure(func, invoice: dict, repeat: int) -> tuple:
+    """Медианное время (сек) и память, выделенная за один вызов (байт, пик)"""
+    timings = []
+    for _ in range(repeat):
+        data = copy.deepcopy(invoice)
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+
+    data = copy.deepcopy(invoice)
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ValidationPipeline")
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[40, 200, 1000], help="Количество строк"
+    )
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="Количество повторов")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    pipeline = ValidationPipeline()
+
+    for count in args.lines:
+        invoice = make_invoice(count)
+        print(f"\nНакладная: {count} строк")
+
+        staged, staged_memory = measure(pipeline._validate_staged, invoice, args.repeat)
+        print(f"  Поэтапно:    {staged * 1000:8.2f} мс  {staged_memory / 1024:8.1f} КБ")
+
+        fused, fused_memory = measure(pipeline._validate_fused, invoice, args.repeat)
+        print(f"  Совмещенно:  {fused * 1000:8.2f} мс  {fused_memory / 1024:8.1f} КБ")
+
+        print(f"  Ускорение: {staged / fused:.1f}x, память: {staged_memory / fused_memory:.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
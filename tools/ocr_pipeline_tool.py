@@ -16,7 +16,7 @@ from pathlib import Path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Импортируем оптимизированный пайплайн
-from app.ocr_pipeline_optimized import OCRPipelineOptimized
+from app.ocr_pipeline_optimized import OCRPipelineOptimized, warm_up_ocr_engines
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -240,6 +240,10 @@ async def main():
             if result is None:
                 return 1
         else:
+            # Загружаем и прогреваем модели до первого запроса
+            engine_stats = warm_up_ocr_engines(table_detector_method=args.detector)
+            logger.info(f"Движки OCR прогреты: {engine_stats['init']}")
+
             # Создаем оптимизированный OCR-пайплайн
             pipeline = OCRPipelineOptimized(
                 table_detector_method=args.detector,